@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AsistenciaProject.settings')
+# Con ASGI cada petición síncrona corre en un hilo distinto y las conexiones
+# persistentes se quedarían abiertas en cada uno: sin CONN_MAX_AGE (o con DB_POOL)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+os.environ.setdefault('NOMINA_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+from asistencia import checks  # noqa: E402
+
+checks.exigir()
@@ -42,15 +42,30 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'asistencia.estaticos.ServirEstaticosMiddleware',
+    'asistencia.metricas.MetricasMiddleware',
+    'asistencia.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'asistencia.perfilado.PerfiladoMiddleware',
+    'asistencia.middleware.PrimariaTrasEscrituraMiddleware',
+    'asistencia.middleware.AutorCambiosMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Medición por petición (asistencia/instrumentacion.py)
+INSTRUMENTACION = {
+    'SAMPLE_RATE': float(os.getenv('INSTRUMENTACION_SAMPLE_RATE', '0.01')),  # fracción medida; 1.0 para medirlas todas
+    'BUDGET_MS': float(os.getenv('INSTRUMENTACION_BUDGET_MS', '1000')),
+    'BUDGET_QUERIES': int(os.getenv('INSTRUMENTACION_BUDGET_QUERIES', '100')),
+    'TOP_SQL': 5,
+    'SERVER_TIMING': os.getenv('INSTRUMENTACION_SERVER_TIMING', 'True') == 'True',
+}
+
 ROOT_URLCONF = 'AsistenciaProject.urls'
 
 TEMPLATES = [
@@ -78,29 +93,80 @@ WSGI_APPLICATION = 'AsistenciaProject.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'asistencia',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': '127.0.0.1',
-        'PORT': '5432',
+        'NAME': os.getenv('DB_NAME', 'asistencia'),
+        'USER': os.getenv('DB_USER', 'postgres'),
+        'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
+        'HOST': os.getenv('DB_HOST', '127.0.0.1'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Conexiones persistentes: se reutilizan entre peticiones durante CONN_MAX_AGE
+        # segundos y se verifican antes de usarse tras un periodo de inactividad.
+        # asgi.py las desactiva (0) salvo que DB_CONN_MAX_AGE se fije explícitamente.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
         'OPTIONS': {
             'client_encoding': 'UTF8',
         }
     },
     'sqlserver': {  # SQL Server - base de datos existente
         'ENGINE': 'mssql',
-        'NAME': 'NOMINA',
-        'USER': 'ldap-export',
-        'PASSWORD': 'ldap-export',
-        'HOST': '10.6.240.132',
-        'PORT': '1433',
+        'NAME': os.getenv('NOMINA_DB_NAME', 'NOMINA'),
+        'USER': os.getenv('NOMINA_DB_USER', 'ldap-export'),
+        'PASSWORD': os.getenv('NOMINA_DB_PASSWORD', 'ldap-export'),
+        'HOST': os.getenv('NOMINA_DB_HOST', '10.6.240.132'),
+        'PORT': os.getenv('NOMINA_DB_PORT', '1433'),
+        'CONN_MAX_AGE': int(os.getenv('NOMINA_CONN_MAX_AGE', '300')),
+        'CONN_HEALTH_CHECKS': os.getenv('NOMINA_CONN_HEALTH_CHECKS', 'True') == 'True',
         'OPTIONS': {
             'driver': 'ODBC Driver 17 for SQL Server',
+            # Sin esto mssql-django espera indefinidamente y reintenta 5 veces cada 5s
+            'connection_timeout': int(os.getenv('NOMINA_CONNECTION_TIMEOUT', '5')),
+            'connection_retries': int(os.getenv('NOMINA_CONNECTION_RETRIES', '1')),
+            'connection_retry_backoff_time': int(os.getenv('NOMINA_CONNECTION_RETRY_BACKOFF', '1')),
+            'query_timeout': int(os.getenv('NOMINA_QUERY_TIMEOUT', '60')),
         },
     }
 }
 
-# DATABASE_ROUTERS = ['asistencia.routers.DatabaseRouter']
+# Pool de psycopg 3 (requiere psycopg[pool]); sustituye a las conexiones persistentes
+if os.getenv('DB_POOL', 'False') == 'True':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
+
+# Pool propio de pyodbc para las consultas directas a NOMINA (asistencia/nomina.py)
+NOMINA_POOL = {
+    'MAX_SIZE': int(os.getenv('NOMINA_POOL_MAX_SIZE', '4')),
+    'TIMEOUT': float(os.getenv('NOMINA_POOL_TIMEOUT', '10')),  # espera máxima por una conexión libre
+    'MAX_IDLE': float(os.getenv('NOMINA_POOL_MAX_IDLE', '30')),  # inactividad tras la que se verifica
+    'MAX_AGE': float(os.getenv('NOMINA_POOL_MAX_AGE', '1800')),  # vida máxima de una conexión
+}
+
+# Exportación de ausencias de meses cerrados a NOMINA (asistencia/ausencias_nomina.py)
+NOMINA_AUSENCIAS = {
+    'TABLA': os.getenv('NOMINA_TABLA_AUSENCIAS', 'SisGA_Ausencias'),
+    'LOTE': int(os.getenv('NOMINA_AUSENCIAS_LOTE', '1000')),  # filas por executemany
+}
+
+# Réplica de lectura opcional para reportes y exportaciones (ver asistencia/routers.py)
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DB_REPLICA = {
+    'MAX_LAG': float(os.getenv('DB_REPLICA_MAX_LAG', '30')),  # segundos de retraso tolerados
+    'LAG_CHECK_INTERVAL': float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', '5')),
+    'STICKY_SECONDS': int(os.getenv('DB_REPLICA_STICKY_SECONDS', '15')),  # lecturas a la primaria tras un POST
+}
+
+DATABASE_ROUTERS = ['asistencia.routers.DatabaseRouter']
 
 
 
@@ -147,6 +213,109 @@ STATICFILES_DIRS = [
 # En producción
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic concatena los paquetes, añade hash al nombre y genera .gz/.br (asistencia/estaticos.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'asistencia.estaticos.EstaticosStorage'},
+}
+
+# Paquetes que carga base.html; los JSON se incluyen como variable global
+STATIC_BUNDLES = {
+    'bundles/base.css': [
+        'styles/bootstrap.min.css',
+        'styles/icons/bootstrap-icons.css',
+        'styles/datatables/dataTables.bootstrap5.min.css',
+        'styles/responsive.bootstrap5.min.css',
+    ],
+    'bundles/base.js': [
+        'js/jquery-3.7.1.min.js',
+        'js/bootstrap.bundle.min.js',
+        'js/datatables/dataTables.bootstrap5.min.js',
+        ('js/datatables/es-ES.json', 'DATATABLES_ES'),
+    ],
+}
+STATIC_BUNDLES_ENABLED = os.getenv('STATIC_BUNDLES_ENABLED', str(not DEBUG)).lower() == 'true'
+
+# Importación de incidencias desde relojes/biométricos (asistencia/importacion.py)
+IMPORTACION_MAX_MB = int(os.getenv('IMPORTACION_MAX_MB', '20'))
+
+# Asignación de un estado por rango de fechas (asistencia/rangos.py)
+RANGOS = {
+    'MAX_TRABAJADORES': int(os.getenv('RANGOS_MAX_TRABAJADORES', '50')),
+    'MAX_CELDAS': int(os.getenv('RANGOS_MAX_CELDAS', '20000')),  # trabajadores x días por operación
+    # Festivos separados por comas: MM-DD se repite cada año, AAAA-MM-DD es un día concreto
+    'FESTIVOS': [f.strip() for f in os.getenv(
+        'FESTIVOS', '01-01,01-02,05-01,07-25,07-26,07-27,10-10,12-25,12-31').split(',') if f.strip()],
+}
+
+# Registro de cambios de incidencias (asistencia/cambios.py)
+CAMBIOS = {
+    'LIMITE_LECTURA': int(os.getenv('CAMBIOS_LIMITE_LECTURA', '1000')),  # filas por llamada a /api/cambios/
+    'RETENCION_DIAS': int(os.getenv('CAMBIOS_RETENCION_DIAS', '730')),  # historial que conserva podar_cambios
+}
+
+# Difusión en vivo de cambios a las tablas abiertas (asistencia/difusion.py); requiere ASGI
+DIFUSION = {
+    # local | postgres | ninguno; local solo ve los cambios de su proceso
+    'BROKER': os.getenv('DIFUSION_BROKER', 'postgres' if DATABASES['default']['ENGINE'].endswith('postgresql')
+                        else 'local'),
+    'CANAL_PG': os.getenv('DIFUSION_CANAL_PG', 'sisga_celdas'),  # canal de LISTEN/NOTIFY
+    'MAX_CELDAS': int(os.getenv('DIFUSION_MAX_CELDAS', '100')),  # más celdas por canal: se pide recargar
+    'COLA': int(os.getenv('DIFUSION_COLA', '50')),  # mensajes pendientes por cliente
+    'KEEPALIVE': int(os.getenv('DIFUSION_KEEPALIVE', '20')),  # segundos entre comentarios SSE
+}
+
+# Peticiones condicionales (ETag/Last-Modified, 304) en tabla_incidencias y vistas JSON (asistencia/condicional.py)
+CONDICIONAL = {
+    'ACTIVO': os.getenv('CONDICIONAL_ACTIVO', 'True') == 'True',
+    'VERSION': os.getenv('APP_VERSION', ''),  # cambiarla en cada despliegue invalida los ETag emitidos
+}
+
+# Tareas en segundo plano (tareas.py, manage.py run_workers)
+TAREAS = {
+    'PROCESOS': int(os.getenv('TAREAS_PROCESOS', '1')),
+    'HILOS': int(os.getenv('TAREAS_HILOS', '2')),  # por proceso
+    'ESPERA': float(os.getenv('TAREAS_ESPERA', '2')),  # segundos entre consultas con la cola vacía
+    'MAX_INTENTOS': int(os.getenv('TAREAS_MAX_INTENTOS', '3')),
+    'RETRASO_REINTENTO': int(os.getenv('TAREAS_RETRASO_REINTENTO', '30')),  # se duplica en cada intento
+    'LATIDO': int(os.getenv('TAREAS_LATIDO', '30')),  # segundos entre latidos de las tareas en curso
+    'HUERFANA': int(os.getenv('TAREAS_HUERFANA', '300')),  # sin latido tanto tiempo: el proceso murió
+    'DIRECTORIO': os.getenv('TAREAS_DIRECTORIO', os.path.join(BASE_DIR, 'tareas')),  # archivos subidos
+}
+
+# Métricas en formato de Prometheus (metricas.py, /metrics)
+METRICAS = {
+    # Un archivo por proceso vivo más terminados.json (local de la máquina: los pids se comprueban
+    # con os.kill); vacío: cada worker expone solo sus propias métricas
+    'DIRECTORIO': os.getenv('METRICAS_DIRECTORIO', os.path.join(BASE_DIR, 'metricas')),
+    'INTERVALO': float(os.getenv('METRICAS_INTERVALO', '5')),  # segundos entre volcados de cada proceso
+    'TOKEN': os.getenv('METRICAS_TOKEN', ''),  # Bearer exigido a /metrics; sin él, solo las IPS
+    'IPS': [ip.strip() for ip in os.getenv('METRICAS_IPS', '127.0.0.1,::1').split(',') if ip.strip()],
+    # Proxies inversos de confianza: detrás de uno, REMOTE_ADDR es la suya (127.0.0.1 si está en la misma
+    # máquina, que está en IPS) y la del cliente se toma de X-Forwarded-For. Sin proxies de confianza
+    # y detrás de uno, usar TOKEN
+    'PROXIES': [ip.strip() for ip in os.getenv('METRICAS_PROXIES', '').split(',') if ip.strip()],
+}
+
+# Perfilado bajo demanda de peticiones de staff (perfilado.py, /perfiles/)
+PERFILADO = {
+    'DIRECTORIO': os.getenv('PERFILADO_DIRECTORIO', os.path.join(BASE_DIR, 'perfiles')),
+    'MAXIMO': int(os.getenv('PERFILADO_MAXIMO', '50')),  # perfiles conservados; se descartan los más antiguos
+    'PARAMETRO': '_perfilar',  # ?_perfilar=1 (cProfile) o ?_perfilar=muestreo
+    'CABECERA': 'HTTP_X_PERFILAR',  # X-Perfilar: 1 | muestreo
+    'INTERVALO_MUESTREO': float(os.getenv('PERFILADO_INTERVALO_MUESTREO', '0.005')),  # segundos
+    'MAX_SQL': 5000,  # consultas guardadas por perfil
+}
+
+# Informes mensuales imprimibles (reportes.py); se generan con la tarea reporte_mensual
+REPORTES = {
+    'DIRECTORIO': os.getenv('REPORTES_DIRECTORIO', os.path.join(BASE_DIR, 'reportes')),
+    'PDF': os.getenv('REPORTES_PDF', 'True') == 'True',  # además del HTML, si WeasyPrint está instalado
+}
+
+# Servir STATIC_ROOT desde Django (sin nginx delante) con caché inmutable
+SERVIR_ESTATICOS = os.getenv('SERVIR_ESTATICOS', 'False').lower() == 'true'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -161,9 +330,26 @@ LDAP_CONFIG = {
     'BIND_PASSWORD': os.getenv('LDAP_BIND_PASSWORD', 'killdirectory'),
     'USER_BASE': os.getenv('LDAP_USER_BASE', 'ou=Trabajadores,dc=uh,dc=cu'),
     'GROUP_BASE': os.getenv('LDAP_GROUP_BASE', 'ou=Trabajadores,dc=uh,dc=cu'),
+    'USER_DN_TEMPLATE': os.getenv('LDAP_USER_DN_TEMPLATE', 'uid={username},ou=Trabajadores,dc=uh,dc=cu'),
+    # Timeouts en segundos para abrir la conexión y esperar cada respuesta
+    'CONNECT_TIMEOUT': float(os.getenv('LDAP_CONNECT_TIMEOUT', '5')),
+    'RECEIVE_TIMEOUT': float(os.getenv('LDAP_RECEIVE_TIMEOUT', '10')),
+    # Circuit breaker: fallos seguidos antes de abrir y segundos hasta probar de nuevo
+    'FAILURE_THRESHOLD': int(os.getenv('LDAP_FAILURE_THRESHOLD', '5')),
+    'RECOVERY_TIMEOUT': float(os.getenv('LDAP_RECOVERY_TIMEOUT', '30')),
+    # Caché negativa: usuarios desconocidos y credenciales rechazadas
+    'UNKNOWN_USER_TTL': int(os.getenv('LDAP_UNKNOWN_USER_TTL', '60')),
+    'FAILED_LOGIN_TTL': int(os.getenv('LDAP_FAILED_LOGIN_TTL', '300')),
+    # Caché de búsquedas (directorio.py): segundos fresca, segundos más sirviéndose
+    # mientras se refresca en segundo plano y número máximo de búsquedas guardadas
+    'QUERY_CACHE_TTL': float(os.getenv('LDAP_QUERY_CACHE_TTL', '300')),
+    'QUERY_CACHE_STALE': float(os.getenv('LDAP_QUERY_CACHE_STALE', '3600')),
+    'QUERY_CACHE_SIZE': int(os.getenv('LDAP_QUERY_CACHE_SIZE', '256')),
 }
 
 
+# Si LDAP rechaza o no responde se prueba ModelBackend (cuentas locales); LDAP3Backend
+# solo corta la cadena (PermissionDenied) en los aciertos de su caché negativa
 AUTHENTICATION_BACKENDS = [
     'asistencia.authentication_backends.LDAP3Backend',
     'django.contrib.auth.backends.ModelBackend',
@@ -176,6 +362,18 @@ LOGIN_REDIRECT_URL = '/dashboard/'  # Ajusta según tu aplicación
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 
 
+# Caché (por defecto en memoria del proceso, solo válida con DEBUG: fuera de él la
+# comprobación asistencia.E001 exige una caché compartida, Redis o Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'sisga'),
+    }
+}
+
+
 # Configuración de sesión
+# SESSION_BACKEND: cached_db (por defecto), signed_cookies, cache o db
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.getenv('SESSION_BACKEND', 'cached_db')
 SESSION_COOKIE_AGE = 3600  # 1 hora en segundos
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AsistenciaProject.settings')
 
 application = get_wsgi_application()
+
+from asistencia import checks  # noqa: E402
+
+checks.exigir()
@@ -6,7 +6,7 @@ import django
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AsistenciaProject.settings')
 django.setup()
-from ldap3 import Server, Connection, ALL
+from asistencia import ldap_client
 from asistencia.models import Area
 
 def obtener_areas():
@@ -15,22 +15,18 @@ def obtener_areas():
     ldap_config = settings.LDAP_CONFIG
 
     try:
-        server = Server(ldap_config['SERVER_URI'], get_info=ALL)
-        conn = Connection(server,
-                          user=ldap_config['BIND_DN'],
-                          password=ldap_config['BIND_PASSWORD'],
-                          auto_bind=True)
-
         base_dn = ldap_config['USER_BASE']
         filtro = f"(&(objectClass=Trabajador))"
 
         atributos = ['Area', 'CodigoDeDependencia', 'CodigoDelArea', 'Assets']
         #
 
-        conn.search(base_dn, filtro, attributes=atributos)
+        with ldap_client.conexion() as conn:
+            conn.search(base_dn, filtro, attributes=atributos)
+            entries = conn.entries
 
         areas = []
-        for entry in conn.entries:
+        for entry in entries:
             area_entry = {
                 'codarea': str(entry.CodigoDelArea) if entry.CodigoDelArea else '',
                 'nombre': str(entry.Area) if entry.Area else '',
@@ -1,3 +1,249 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-# Register your models here.
+from . import edicion, instantaneas, sesion
+from .models import (Area, CambioIncidencia, CierreArea, CierreMes, ClaveAusenciaNomina, EmpleadoNomina,
+                     EntradaDirectorio, Estado, Incidencia, ResponsableArea, Tarea, Trabajador,
+                     UnidadOrganizativaNomina)
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginador para tablas grandes: en PostgreSQL, por encima de ``UMBRAL`` filas
+    el total es la estimación del planificador (``pg_class.reltuples`` sin
+    filtros, ``EXPLAIN`` con filtros) en lugar de un ``COUNT(*)`` que recorre la
+    tabla. Por debajo del umbral, o en otros motores, cuenta de verdad.
+    """
+    UMBRAL = 10000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        conexion = connections[qs.db]
+        if conexion.vendor != 'postgresql':
+            return super().count
+        estimado = self._estimar(qs, conexion)
+        if estimado is None or estimado < self.UMBRAL:
+            return super().count
+        return estimado
+
+    @staticmethod
+    def _estimar(qs, conexion):
+        with conexion.cursor() as cursor:
+            if not qs.query.where:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [qs.model._meta.db_table])
+                fila = cursor.fetchone()
+                # -1: tabla aún sin ANALYZE
+                return fila[0] if fila and fila[0] >= 0 else None
+            sql, params = qs.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class AdminTablaGrande(admin.ModelAdmin):
+    """Listado sin ``COUNT(*)`` completos: total estimado y sin contar la tabla entera"""
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def get_actions(self, request):
+        # delete_selected carga y lista cada fila antes de borrar: inviable con millones
+        acciones = super().get_actions(request)
+        acciones.pop('delete_selected', None)
+        return acciones
+
+
+class SoloLectura:
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Area)
+class AreaAdmin(admin.ModelAdmin):
+    list_display = ['cod_area', 'nombre', 'unidad_padre']
+    search_fields = ['=cod_area', 'nombre']
+    ordering = ['cod_area']
+
+
+@admin.register(Estado)
+class EstadoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'clave_id', 'clave']
+    search_fields = ['clave_id', 'clave']
+
+
+@admin.register(Trabajador)
+class TrabajadorAdmin(AdminTablaGrande):
+    list_display = ['ci', 'nombre', 'apellidos', 'area', 'es_baja']
+    list_select_related = ['area']
+    list_filter = ['es_baja']
+    search_fields = ['=ci', '^apellidos']
+    autocomplete_fields = ['area']
+    actions = ['dar_baja', 'dar_alta']
+
+    @admin.action(description='Dar de baja a los trabajadores seleccionados')
+    def dar_baja(self, request, queryset):
+        n = queryset.order_by().update(es_baja=True)
+        sesion.invalidar_trabajadores()  # update() no emite post_save
+        self.message_user(request, f"{n} trabajadores dados de baja")
+
+    @admin.action(description='Dar de alta a los trabajadores seleccionados')
+    def dar_alta(self, request, queryset):
+        n = queryset.order_by().update(es_baja=False)
+        sesion.invalidar_trabajadores()
+        self.message_user(request, f"{n} trabajadores dados de alta")
+
+
+@admin.register(ResponsableArea)
+class ResponsableAreaAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'area', 'activo', 'fecha_asignacion', 'fecha_actualizacion']
+    list_select_related = ['usuario', 'area']
+    list_filter = ['activo']
+    search_fields = ['usuario__username', '=area__cod_area']
+    autocomplete_fields = ['usuario', 'area']
+    actions = ['activar', 'desactivar']
+
+    def _activo(self, request, queryset, activo):
+        usuarios = set(queryset.values_list('usuario_id', flat=True))
+        n = queryset.order_by().update(activo=activo, fecha_actualizacion=timezone.now())
+        # update() no emite post_save: se invalidan aquí las áreas en sesión
+        for usuario_id in usuarios:
+            sesion.invalidar_responsable(usuario_id)
+        return n
+
+    @admin.action(description='Activar las asignaciones seleccionadas')
+    def activar(self, request, queryset):
+        self.message_user(request, f"{self._activo(request, queryset, True)} asignaciones activadas")
+
+    @admin.action(description='Desactivar las asignaciones seleccionadas')
+    def desactivar(self, request, queryset):
+        self.message_user(request, f"{self._activo(request, queryset, False)} asignaciones desactivadas")
+
+
+class IncidenciaAdminForm(forms.ModelForm):
+    class Meta:
+        model = Incidencia
+        fields = ['trabajador', 'area', 'estado', 'fecha_asistencia']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        fechas = [cleaned_data.get('fecha_asistencia')]
+        if self.instance.pk:
+            fechas.append(self.instance.fecha_asistencia)
+        try:
+            instantaneas.comprobar_abierto([f for f in fechas if f])
+        except instantaneas.MesCerrado as e:
+            raise forms.ValidationError(str(e))
+        return cleaned_data
+
+
+@admin.register(Incidencia)
+class IncidenciaAdmin(AdminTablaGrande):
+    form = IncidenciaAdminForm
+    list_display = ['fecha_asistencia', 'trabajador', 'area', 'estado', 'version', 'actualizado']
+    list_select_related = ['trabajador', 'area', 'estado']
+    list_filter = ['estado']
+    search_fields = ['=trabajador__ci']
+    autocomplete_fields = ['trabajador', 'area', 'estado']
+    date_hierarchy = 'fecha_asistencia'
+    readonly_fields = ['version', 'actualizado']
+    ordering = ['-fecha_asistencia']
+    actions = ['restablecer_por_defecto']
+
+    @admin.action(description='Restablecer el estado por defecto (asistencia, sábado o domingo)')
+    def restablecer_por_defecto(self, request, queryset):
+        cambiadas, cerradas = edicion.restablecer_por_defecto(queryset)
+        self.message_user(request, f"{cambiadas} incidencias restablecidas")
+        if cerradas:
+            self.message_user(request, f"{cerradas} incidencias de meses cerrados no se modificaron",
+                              messages.WARNING)
+
+
+@admin.register(CambioIncidencia)
+class CambioIncidenciaAdmin(SoloLectura, AdminTablaGrande):
+    """Historial de cambios de incidencias (auditoría); solo lectura"""
+    list_display = ['id', 'seq', 'registrado', 'usuario_id', 'trabajador_id', 'fecha', 'estado_anterior_id', 'estado_nuevo_id']
+    list_filter = ['registrado']
+    search_fields = ['=incidencia_id', '=trabajador_id', '=usuario_id']
+
+
+class CierreAreaInline(admin.TabularInline):
+    model = CierreArea
+    fields = ['area', 'trabajadores', 'creadas', 'sin_estado', 'terminado']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(CierreMes)
+class CierreMesAdmin(admin.ModelAdmin):
+    """Cierres mensuales hechos con ``manage.py cerrar_mes``"""
+    list_display = ['mes', 'estado', 'exportado', 'iniciado', 'cerrado']
+    list_filter = ['estado']
+    readonly_fields = ['mes', 'exportado', 'iniciado', 'cerrado']
+    inlines = [CierreAreaInline]
+    actions = ['reabrir']
+
+    @admin.action(description='Reabrir los meses seleccionados (admiten cambios hasta el próximo cierre)')
+    def reabrir(self, request, queryset):
+        reabiertos = [m for m in queryset.values_list('mes', flat=True) if instantaneas.reabrir(m)]
+        self.message_user(request, f"{len(reabiertos)} meses reabiertos")
+
+
+@admin.register(EntradaDirectorio)
+class EntradaDirectorioAdmin(SoloLectura, AdminTablaGrande):
+    """Copia local del directorio LDAP (``manage.py sincronizar_directorio``); solo lectura"""
+    list_display = ['uid', 'cn', 'sn', 'ci', 'cod_area', 'es_baja', 'modificado', 'sincronizado']
+    list_filter = ['es_baja']
+    search_fields = ['^uid', '^ci', '^busqueda']
+
+
+@admin.register(Tarea)
+class TareaAdmin(AdminTablaGrande):
+    """Cola de tareas en segundo plano (``manage.py run_workers``)"""
+    list_display = ['id', 'tipo', 'estado', 'progreso', 'intentos', 'usuario', 'creada', 'terminada']
+    list_filter = ['estado', 'tipo']
+    list_select_related = ['usuario']
+    readonly_fields = ['tipo', 'parametros', 'estado', 'usuario', 'intentos', 'progreso', 'mensaje', 'resultado',
+                       'error', 'trabajador', 'latido', 'creada', 'iniciada', 'terminada']
+    fields = readonly_fields + ['prioridad', 'max_intentos', 'disponible']
+    actions = ['reintentar']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Volver a encolar las tareas fallidas seleccionadas')
+    def reintentar(self, request, queryset):
+        n = queryset.filter(estado=Tarea.FALLIDA).order_by().update(
+            estado=Tarea.PENDIENTE, intentos=0, disponible=timezone.now(), terminada=None, trabajador='')
+        self.message_user(request, f"{n} tareas encoladas de nuevo")
+
+
+# Tablas de NOMINA (solo lectura, alias 'sqlserver')
+
+@admin.register(UnidadOrganizativaNomina)
+class UnidadOrganizativaNominaAdmin(SoloLectura, admin.ModelAdmin):
+    list_display = ['id_direccion', 'desc_direccion', 'grupo_nomina']
+    search_fields = ['=id_direccion', 'desc_direccion']
+
+
+@admin.register(EmpleadoNomina)
+class EmpleadoNominaAdmin(SoloLectura, AdminTablaGrande):
+    list_display = ['no_ci', 'nombre', 'apellido_1', 'apellido_2', 'id_direccion', 'baja']
+    list_filter = ['baja']
+    search_fields = ['=no_ci', '^apellido_1']
+
+
+@admin.register(ClaveAusenciaNomina)
+class ClaveAusenciaNominaAdmin(SoloLectura, admin.ModelAdmin):
+    list_display = ['id_clave', 'desc_clave']
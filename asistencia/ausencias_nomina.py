@@ -0,0 +1,192 @@
+# ausencias_nomina.py
+"""
+Escritura en NOMINA de las ausencias de un mes cerrado.
+
+Las excepciones del mes son las ``Incidencia`` cuyo ``Estado.clave_id`` es una
+clave de ``RH_Claves_Ausencias``. Se comparan con lo que SisGA ya escribió en
+la tabla de destino (``NOMINA_AUSENCIAS['TABLA']``, clave ``(No_CI, Fecha)``,
+filas con ``Origen = 'SisGA'``) y solo se envían las diferencias: inserciones,
+cambios de clave y eliminaciones. Repetir la exportación no duplica nada. Las
+filas cargadas a mano en NOMINA no se modifican; si difieren se reportan.
+
+Las escrituras van en lotes con ``executemany`` parametrizado; con pyodbc se
+activa ``fast_executemany`` (un solo viaje por lote).
+
+Para pruebas basta con apuntar el alias ``sqlserver`` a SQLite o PostgreSQL y
+crear la tabla con ``crear_tabla()`` (``manage.py exportar_ausencias --crear-tabla``).
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connections
+
+from . import instantaneas, nomina
+from .models import Area, Incidencia, Estado, Trabajador
+
+logger = logging.getLogger(__name__)
+
+ORIGEN = 'SisGA'
+ESTADOS_POR_DEFECTO = Estado.POR_DEFECTO
+
+
+@dataclass
+class Diferencias:
+    insertar: list = field(default_factory=list)    # (ci, fecha, clave)
+    actualizar: list = field(default_factory=list)  # (ci, fecha, clave_anterior, clave_nueva)
+    eliminar: list = field(default_factory=list)    # (ci, fecha, clave)
+    conflictos: list = field(default_factory=list)  # (ci, fecha, clave_en_nomina, clave_sisga): cargadas a mano
+    sin_cambios: int = 0
+
+    @property
+    def vacia(self):
+        return not (self.insertar or self.actualizar or self.eliminar)
+
+
+def tabla():
+    return settings.NOMINA_AUSENCIAS['TABLA']
+
+
+def marcador():
+    """Marcador de parámetros del driver del alias (pyodbc y sqlite3: ``?``; psycopg: ``%s``)"""
+    return '?' if connections[nomina.ALIAS].Database.paramstyle == 'qmark' else '%s'
+
+
+def normalizar_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    return valor
+
+
+def crear_tabla():
+    """Crea la tabla de destino en una base de pruebas (en NOMINA la crean sus administradores)"""
+    with nomina.pool().conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"CREATE TABLE {tabla()} ("
+            "No_CI VARCHAR(11) NOT NULL, Fecha DATE NOT NULL, Id_Clave VARCHAR(10) NOT NULL, "
+            "Origen VARCHAR(10) NOT NULL, PRIMARY KEY (No_CI, Fecha))"
+        )
+        conn.commit()
+
+
+def claves_ausencia():
+    """Claves de ausencia de NOMINA (``RH_Claves_Ausencias.Id_Clave``) ordenadas"""
+    return sorted({str(c).strip() for (c,) in nomina.consultar("SELECT Id_Clave FROM RH_Claves_Ausencias;")})
+
+
+def excepciones_mes(inicio, cod_area=None):
+    """``{(ci, fecha): clave_id}`` de las ausencias del mes en SisGA"""
+    claves = claves_ausencia()
+    if instantaneas.completo(inicio):
+        return _excepciones_instantaneas(inicio, claves, cod_area)
+    qs = (Incidencia.objects
+          .filter(fecha_asistencia__gte=inicio, fecha_asistencia__lt=inicio + relativedelta(months=1),
+                  estado__clave_id__in=claves)
+          .exclude(estado_id__in=ESTADOS_POR_DEFECTO))
+    if cod_area:
+        qs = qs.filter(area__cod_area__in=Area.codigos_subarbol(cod_area))
+    return {
+        (ci, fecha): clave_id
+        for ci, fecha, clave_id in qs.values_list('trabajador__ci', 'fecha_asistencia', 'estado__clave_id').iterator()
+    }
+
+
+def _excepciones_instantaneas(inicio, claves, cod_area=None):
+    """Como ``excepciones_mes`` pero leyendo las instantáneas de un mes cerrado"""
+    area_ids = None
+    if cod_area:
+        area_ids = list(Area.objects.filter(cod_area__in=Area.codigos_subarbol(cod_area)).values_list('id', flat=True))
+    ausencias = dict(Estado.objects.filter(clave_id__in=claves).exclude(id__in=ESTADOS_POR_DEFECTO)
+                     .values_list('id', 'clave_id'))
+    congeladas = instantaneas.leer(inicio, area_ids)
+    cis = dict(Trabajador.objects.filter(pk__in={t for i in congeladas for t in i.trabajadores})
+               .values_list('id', 'ci'))
+    excepciones = {}
+    perdidos = set()
+    for instantanea in congeladas:
+        for trabajador_id, fecha, estado_id in instantanea.celdas():
+            if estado_id not in ausencias:
+                continue
+            if trabajador_id not in cis:
+                # Borrado después del cierre: sin CI no se puede exportar
+                perdidos.add(trabajador_id)
+                continue
+            excepciones[(cis[trabajador_id], fecha)] = ausencias[estado_id]
+    if perdidos:
+        logger.warning(f"Ausencias de {inicio:%Y-%m} omitidas: trabajadores borrados {sorted(perdidos)}")
+    return excepciones
+
+
+def registradas_mes(inicio):
+    """``{(ci, fecha): (clave, origen)}`` presentes en la tabla de NOMINA para el mes"""
+    m = marcador()
+    filas = nomina.consultar(
+        f"SELECT No_CI, Fecha, Id_Clave, Origen FROM {tabla()} WHERE Fecha >= {m} AND Fecha < {m}",
+        (inicio, inicio + relativedelta(months=1)),
+    )
+    return {(ci.strip(), normalizar_fecha(fecha)): (clave.strip(), origen.strip()) for ci, fecha, clave, origen in filas}
+
+
+def diferencias(inicio, cod_area=None):
+    deseadas = excepciones_mes(inicio, cod_area)
+    existentes = registradas_mes(inicio)
+    if cod_area:
+        # Solo se comparan los trabajadores del subárbol; el resto del mes no se toca
+        cis = set(Trabajador.objects.filter(area__cod_area__in=Area.codigos_subarbol(cod_area))
+                  .values_list('ci', flat=True))
+        existentes = {k: v for k, v in existentes.items() if k[0] in cis}
+
+    dif = Diferencias()
+    for (ci, fecha), clave in deseadas.items():
+        actual, origen = existentes.get((ci, fecha), (None, None))
+        if actual is None:
+            dif.insertar.append((ci, fecha, clave))
+        elif origen != ORIGEN:
+            if actual != clave:
+                dif.conflictos.append((ci, fecha, actual, clave))
+            else:
+                dif.sin_cambios += 1
+        elif actual != clave:
+            dif.actualizar.append((ci, fecha, actual, clave))
+        else:
+            dif.sin_cambios += 1
+    dif.eliminar = [
+        (ci, fecha, clave) for (ci, fecha), (clave, origen) in existentes.items()
+        if origen == ORIGEN and (ci, fecha) not in deseadas
+    ]
+    return dif
+
+
+def _ejecutar_lotes(cursor, sql, filas, lote):
+    for i in range(0, len(filas), lote):
+        cursor.executemany(sql, filas[i:i + lote])
+
+
+def aplicar(dif, lote=None):
+    """Escribe ``dif`` en NOMINA en una sola transacción"""
+    if dif.vacia:
+        return
+    lote = lote or settings.NOMINA_AUSENCIAS['LOTE']
+    m = marcador()
+    destino = tabla()
+    with nomina.pool().conexion() as conn:
+        cursor = conn.cursor()
+        if hasattr(cursor, 'fast_executemany'):
+            cursor.fast_executemany = True
+        try:
+            _ejecutar_lotes(cursor, f"DELETE FROM {destino} WHERE No_CI = {m} AND Fecha = {m} AND Origen = {m}",
+                            [(ci, fecha, ORIGEN) for ci, fecha, _ in dif.eliminar], lote)
+            _ejecutar_lotes(cursor, f"UPDATE {destino} SET Id_Clave = {m} WHERE No_CI = {m} AND Fecha = {m} AND Origen = {m}",
+                            [(nueva, ci, fecha, ORIGEN) for ci, fecha, _, nueva in dif.actualizar], lote)
+            _ejecutar_lotes(cursor, f"INSERT INTO {destino} (No_CI, Fecha, Id_Clave, Origen) VALUES ({m}, {m}, {m}, {m})",
+                            [(ci, fecha, clave, ORIGEN) for ci, fecha, clave in dif.insertar], lote)
+            conn.commit()
+        finally:
+            cursor.close()
+    logger.info(f"NOMINA: {len(dif.insertar)} insertadas, {len(dif.actualizar)} actualizadas, "
+                f"{len(dif.eliminar)} eliminadas")
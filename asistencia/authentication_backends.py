@@ -2,10 +2,15 @@
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
-from ldap3 import Server, Connection, ALL
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from ldap3.core.exceptions import LDAPException
+from ldap3.utils.conv import escape_filter_chars
 import logging
 
+from . import ldap_client, sesion
+from .ldap_client import LDAPNoDisponible
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,18 +18,32 @@ class LDAP3Backend(BaseBackend):
     """
     Backend de autenticación personalizado usando ldap3
     Solo permite login a usuarios que existan en la base de datos Django
+
+    Si LDAP rechaza las credenciales o no responde se devuelve ``None`` y se
+    prueba el siguiente backend (cuentas locales de ``ModelBackend``). Solo los
+    aciertos de la caché negativa lanzan ``PermissionDenied``, que corta la
+    cadena: se recuerdan los usuarios que no existen en la BD y los rechazos de
+    usuarios sin contraseña local, que ``ModelBackend`` tampoco aceptaría.
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
         if not username or not password:
             return None
 
+        # Usuarios desconocidos o credenciales que acaban de fallar no llegan ni a la BD ni a LDAP
+        if ldap_client.es_usuario_desconocido(username):
+            logger.warning(f"Usuario {username} no encontrado (caché)")
+            raise PermissionDenied
+        if ldap_client.es_credencial_fallida(username, password):
+            logger.warning(f"Falló autenticación LDAP para usuario {username} (caché)")
+            raise PermissionDenied
+
         # PRIMERO: Verificar si el usuario existe en la base de datos Django
         try:
             UserModel = get_user_model()
             user = UserModel.objects.get(username=username)
 
-            # Verificar si el usuario está activo
+            # Verificar si el usuario está activo (no se recuerda: al reactivarlo debe poder entrar enseguida)
             if not user.is_active:
                 logger.warning(f"Usuario {username} intentó login pero está inactivo")
                 return None
@@ -32,11 +51,14 @@ class LDAP3Backend(BaseBackend):
         except UserModel.DoesNotExist:
             # Usuario no existe en la base de datos
             logger.warning(f"Usuario {username} no encontrado")
+            ldap_client.marcar_usuario_desconocido(username)
             return None
 
         # SEGUNDO: Autenticar contra LDAP
         ldap_authenticated = self._authenticate_ldap(username, password)
 
+        if ldap_authenticated is None:
+            return None
         if ldap_authenticated:
             # Actualizar información del usuario desde LDAP
             self._update_user_from_ldap(user, username)
@@ -44,86 +66,70 @@ class LDAP3Backend(BaseBackend):
             return user
         else:
             logger.warning(f"Falló autenticación LDAP para usuario {username}")
+            # Con contraseña local puede entrar por ModelBackend: su rechazo no se recuerda
+            if not user.has_usable_password():
+                ldap_client.marcar_credencial_fallida(username, password)
             return None
 
     def _authenticate_ldap(self, username, password):
         """
         Autentica al usuario contra el servidor LDAP
+
+        ``True`` si acepta las credenciales, ``False`` si las rechaza y ``None``
+        si no se pudo consultar.
         """
         try:
-            # Configuración del servidor LDAP - AJUSTA ESTOS VALORES
-            server = Server(
-                'ldap.uh.cu',
-                port=389,
-                get_info=ALL,
-                use_ssl=False  # Cambia a True si usas LDAPS
-            )
-
-            # Construir el DN del usuario - AJUSTA ESTO SEGÚN TU ESTRUCTURA LDAP
-            user_dn = f"uid={username},ou=Trabajadores,dc=uh,dc=cu"
-
-            # Intentar autenticación
-            conn = Connection(
-                server,
-                user=user_dn,
-                password=password,
-                auto_bind=True  # Se autobindea para autenticar
-            )
-
-            # Si llegamos aquí, la autenticación fue exitosa
-            conn.unbind()
-            return True
+            return ldap_client.autenticar(username, password)
 
+        except LDAPNoDisponible as e:
+            logger.error(f"LDAP no disponible para usuario {username}: {str(e)}")
+            return None
         except LDAPException as e:
             logger.error(f"Error LDAP para usuario {username}: {str(e)}")
-            return False
+            return None
         except Exception as e:
             logger.error(f"Error inesperado en LDAP para {username}: {str(e)}")
-            return False
+            return None
 
     def _update_user_from_ldap(self, user, username):
         """
         Actualiza la información del usuario desde LDAP
         """
         try:
-            server = Server('ldap.uh.cu', get_info=ALL)
-
-            # Conexión con credenciales de administrador para buscar - AJUSTA ESTO
-            admin_conn = Connection(
-                server,
-                'cn=admin,dc=uh,dc=cu',
-                'killdirectory',
-                auto_bind=True
-            )
-
-            # Buscar información del usuario
-            search_base = 'ou=Trabajadores,dc=uh,dc=cu'
-            search_filter = f'(uid={username})'
-            attributes = ['cn', 'sn', 'mail', 'displayName']
-
-            admin_conn.search(
-                search_base=search_base,
-                search_filter=search_filter,
-                attributes=attributes
-            )
-
-            if admin_conn.entries:
-                entry = admin_conn.entries[0]
+            with ldap_client.conexion() as admin_conn:
+                # Buscar información del usuario
+                search_base = settings.LDAP_CONFIG['USER_BASE']
+                search_filter = f'(uid={escape_filter_chars(username)})'
+                attributes = ['cn', 'sn', 'Correo']
+
+                admin_conn.search(
+                    search_base=search_base,
+                    search_filter=search_filter,
+                    attributes=attributes
+                )
+                entries = admin_conn.entries
+
+            if entries:
+                entry = entries[0]
+                campos = {}
 
                 # Actualizar campos del usuario
                 if 'cn' in entry and entry.cn.value:
-                    user.first_name = entry.cn.value
+                    campos['first_name'] = entry.cn.value
 
                 if 'sn' in entry and entry.sn.value:
-                    user.last_name = entry.sn.value
+                    campos['last_name'] = entry.sn.value
 
                 if 'Correo' in entry and entry.Correo.value:
-                    user.email = entry.Correo.value
-
-                user.save()
-                logger.info(f"Información actualizada desde LDAP para {username}")
+                    campos['email'] = entry.Correo.value
 
-            admin_conn.unbind()
+                # Solo se escribe si algo cambió
+                cambiados = [campo for campo, valor in campos.items() if getattr(user, campo) != valor]
+                if cambiados:
+                    for campo in cambiados:
+                        setattr(user, campo, campos[campo])
+                    user.save(update_fields=cambiados)
+                    logger.info(f"Información actualizada desde LDAP para {username}")
 
         except Exception as e:
             logger.warning(f"No se pudo actualizar información LDAP para {username}: {str(e)}")
@@ -132,8 +138,8 @@ class LDAP3Backend(BaseBackend):
         """
         Obtiene un usuario por su ID
         """
+        UserModel = get_user_model()
         try:
-            UserModel = get_user_model()
-            return UserModel.objects.get(pk=user_id)
+            return sesion.obtener_usuario(user_id)
         except UserModel.DoesNotExist:
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,183 @@
+# cambios.py
+"""
+Registro de cambios de incidencias ("outbox").
+
+Cada creación o cambio de estado de una ``Incidencia`` añade una fila a
+``CambioIncidencia`` en la misma transacción: ``Incidencia.save`` lo hace para
+las ediciones sueltas y los caminos masivos (``bulk_create``, ``update``) deben
+llamar a ``registrar_lote``. El autor se toma del usuario de la petición en
+curso (``AutorCambiosMiddleware``) o del bloque ``with autor(usuario)``.
+
+Los consumidores (resúmenes, exportaciones, escritura a NOMINA) leen con
+``leer(desde)`` o ``GET /api/cambios/?since=<seq>`` y guardan el último
+``seq`` procesado. El ``seq`` se asigna al confirmarse cada transacción que
+registra cambios, solo a las filas ya confirmadas y bajo un lock (``numerar``):
+sigue el orden de confirmación, de modo que una transacción larga que confirma
+tarde recibe un ``seq`` mayor que el cursor de los consumidores en lugar de
+quedar por detrás de él. Si un proceso muere entre la confirmación y la
+numeración, sus filas las numera la siguiente confirmación o el hilo de
+mantenimiento de ``run_workers``; la lectura no escribe nada.
+``manage.py podar_cambios`` elimina el historial antiguo.
+Al confirmarse la transacción los cambios se difunden además a las tablas de
+incidencias abiertas (``difusion.py``).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+from . import difusion
+from .models import CambioIncidencia
+
+_autor = ContextVar('autor_cambios', default=None)
+
+# Clave del advisory lock de PostgreSQL que serializa la numeración
+LOCK_NUMERACION = 0x5153_4341  # 'SISGA'
+
+CAMPOS = ('seq', 'incidencia', 'trabajador', 'area', 'fecha', 'estado_anterior', 'estado_nuevo',
+          'usuario', 'registrado')
+
+
+def fijar_autor(usuario):
+    return _autor.set(usuario)
+
+
+def liberar_autor(token):
+    _autor.reset(token)
+
+
+@contextmanager
+def autor(usuario):
+    """Atribuye a ``usuario`` los cambios registrados dentro del bloque"""
+    token = fijar_autor(usuario)
+    try:
+        yield
+    finally:
+        liberar_autor(token)
+
+
+def autor_id():
+    """Id del usuario al que se atribuyen los cambios en curso (``None`` si no hay)"""
+    usuario = _autor.get()
+    if callable(usuario):  # AutorCambiosMiddleware
+        usuario = usuario()
+    if usuario is None or not getattr(usuario, 'is_authenticated', False):
+        return None
+    return usuario.pk
+
+
+def _fila(incidencia, estado_anterior_id, usuario_id):
+    return CambioIncidencia(
+        incidencia_id=incidencia.pk,
+        trabajador_id=incidencia.trabajador_id,
+        area_id=incidencia.area_id,
+        fecha=incidencia.fecha_asistencia,
+        estado_anterior_id=estado_anterior_id,
+        estado_nuevo_id=incidencia.estado_id,
+        usuario_id=usuario_id,
+    )
+
+
+def _celda(incidencia):
+    return (incidencia.pk, incidencia.trabajador_id, incidencia.area_id, incidencia.fecha_asistencia,
+            incidencia.estado_id, incidencia.version)
+
+
+def registrar(incidencia, estado_anterior_id):
+    """Registra un cambio; llamar dentro de la transacción que guarda ``incidencia``"""
+    _fila(incidencia, estado_anterior_id, autor_id()).save(using=incidencia._state.db)
+    numerar_al_confirmar(incidencia._state.db)
+    difusion.al_confirmar([_celda(incidencia)], using=incidencia._state.db)
+
+
+def registrar_lote(cambios, using=None, batch_size=1000):
+    """
+    Registra en bloque ``cambios``: pares ``(incidencia, estado_anterior_id)``
+    con ``estado_anterior_id=None`` para las creadas. Las incidencias deben
+    tener ``pk``. Devuelve el número de filas escritas.
+    """
+    usuario_id = autor_id()
+    filas = [_fila(incidencia, anterior, usuario_id) for incidencia, anterior in cambios]
+    if filas:
+        CambioIncidencia.objects.using(using or 'default').bulk_create(filas, batch_size=batch_size)
+        numerar_al_confirmar(using)
+        difusion.al_confirmar([_celda(incidencia) for incidencia, _ in cambios], using=using)
+    return len(filas)
+
+
+def numerar(using=None, lote=10000):
+    """
+    Asigna ``seq`` consecutivos, en orden de ``id``, a los cambios confirmados
+    que aún no lo tienen (como mucho ``lote``); devuelve cuántos numeró.
+
+    Las filas de transacciones sin confirmar no son visibles y se numeran en una
+    llamada posterior. La numeración se serializa (advisory lock en PostgreSQL;
+    SQLite ya serializa las escrituras), así que los ``seq`` se confirman en orden.
+    """
+    alias = using or router.db_for_write(CambioIncidencia)
+    qs = CambioIncidencia.objects.using(alias)
+    with transaction.atomic(using=alias):
+        if connections[alias].vendor == 'postgresql':
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOCK_NUMERACION])
+        pendientes = list(qs.filter(seq__isnull=True).order_by('id')[:lote].only('id'))
+        if not pendientes:
+            return 0
+        ultimo = qs.aggregate(m=Max('seq'))['m'] or 0
+        for n, cambio in enumerate(pendientes, ultimo + 1):
+            cambio.seq = n
+        qs.bulk_update(pendientes, ['seq'], batch_size=1000)
+    return len(pendientes)
+
+
+def numerar_al_confirmar(using=None):
+    """Numera los cambios de la transacción en curso cuando se confirme (al momento si no hay)"""
+    alias = using or router.db_for_write(CambioIncidencia)
+
+    def numerar_pendientes():
+        while numerar(alias):
+            pass
+
+    # robust: un fallo al numerar se registra en el log y no afecta a la transacción ya confirmada
+    transaction.on_commit(numerar_pendientes, using=alias, robust=True)
+
+
+def leer(desde=0, limite=None, area_ids=None):
+    """
+    Cambios con ``seq > desde`` en orden. Devuelve ``(filas, siguiente, hay_mas, podado)``:
+    ``filas`` como tuplas en el orden de ``CAMPOS``; ``siguiente`` es el cursor para la
+    próxima llamada; ``podado`` indica que se eliminaron cambios posteriores a ``desde``
+    y el consumidor debe reconstruir su estado completo antes de continuar.
+    """
+    limite = limite or settings.CAMBIOS['LIMITE_LECTURA']
+    todos = CambioIncidencia.objects.all()
+    qs = todos.filter(seq__gt=desde)
+    if area_ids is not None:
+        qs = qs.filter(area_id__in=area_ids)
+    filas = list(qs.order_by('seq').values_list(
+        'seq', 'incidencia_id', 'trabajador_id', 'area_id', 'fecha',
+        'estado_anterior_id', 'estado_nuevo_id', 'usuario_id', 'registrado',
+    )[:limite + 1])
+
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    siguiente = filas[-1][0] if filas else desde
+
+    podado = False
+    if desde:
+        primero = todos.filter(seq__isnull=False).order_by('seq').values_list('seq', flat=True).first()
+        podado = primero is not None and primero > desde + 1
+    return filas, siguiente, hay_mas, podado
+
+
+def podar(hasta_seq, lote=10000):
+    """Elimina los cambios con ``seq <= hasta_seq`` en tramos de ``lote``; devuelve cuántos"""
+    total = 0
+    inicio = CambioIncidencia.objects.filter(seq__isnull=False).order_by('seq').values_list('seq', flat=True).first()
+    while inicio is not None and inicio <= hasta_seq:
+        fin = min(inicio + lote - 1, hasta_seq)
+        total += CambioIncidencia.objects.filter(seq__gte=inicio, seq__lte=fin).delete()[0]
+        inicio = fin + 1
+    return total
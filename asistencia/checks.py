@@ -0,0 +1,60 @@
+# checks.py
+"""
+Comprobaciones de configuración de SisGA.
+
+Se ejecutan con las de Django (``manage.py check``, ``runserver``, ``migrate``);
+las de despliegue solo con ``manage.py check --deploy`` (``manage.py test``
+desactiva DEBUG antes de comprobar) y, como gunicorn y uvicorn no las
+ejecutan, también al cargar ``wsgi.py`` y ``asgi.py`` (``exigir``): un worker
+mal configurado no llega a arrancar.
+"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+from django.core.exceptions import ImproperlyConfigured
+
+# Cachés cuyo contenido vive en cada proceso: cada worker vería sus propias versiones
+CACHES_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(deploy=True)
+def cache_compartida(app_configs, **kwargs):
+    """
+    Las versiones de ``sesion.py`` (usuarios, responsables, áreas) deben ser las
+    mismas en todos los workers: con una caché por proceso cada uno acuña las
+    suyas, los claims de sesión no coinciden y una revocación no llega a los
+    demás hasta que caduca su copia. Fuera de DEBUG se exige una caché compartida.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in CACHES_LOCALES:
+        return []
+    return [Error(
+        f"La caché por defecto ({backend}) es local del proceso",
+        hint='Configurar CACHE_BACKEND/CACHE_LOCATION con Redis o Memcached (o '
+             'django.core.cache.backends.db.DatabaseCache)',
+        id='asistencia.E001',
+    )]
+
+
+@register()
+def difusion_local(app_configs, **kwargs):
+    """El broker ``local`` de ``difusion.py`` solo reparte los cambios del propio proceso"""
+    from . import difusion
+
+    if settings.DIFUSION['BROKER'] != 'local' or not difusion.varios_procesos():
+        return []
+    return [Warning(
+        "DIFUSION['BROKER'] es 'local' con WEB_CONCURRENCY > 1: los cambios hechos en otros "
+        "procesos no llegan a las tablas abiertas",
+        hint="DIFUSION_BROKER=postgres",
+        id='asistencia.W001',
+    )]
+
+
+def exigir():
+    """Lanza ``ImproperlyConfigured`` si falla alguna comprobación de SisGA"""
+    errores = cache_compartida(None)
+    if errores:
+        raise ImproperlyConfigured('; '.join(f"{e.id}: {e.msg}. {e.hint}" for e in errores))
@@ -0,0 +1,199 @@
+# cierre.py
+"""
+Cierre mensual en paralelo por subárboles de áreas (``manage.py cerrar_mes``).
+
+Para cada área del árbol:
+
+1. materializa la tabla del mes: crea la incidencia por defecto (asistencia,
+   sábado o domingo) de cada trabajador activo y día que aún no la tenga,
+2. valida: cuenta las incidencias sin estado,
+3. resume: incidencias por clave de estado,
+
+y lo guarda en ``CierreArea`` en la misma transacción. Ese registro es el punto
+de control: si la ejecución se interrumpe, al repetirla se saltan las áreas ya
+terminadas. ``Area.subarboles`` reparte el árbol en conjuntos independientes que
+se procesan en un pool de procesos, cada uno con su propia conexión. Cuando
+todas las áreas están listas el mes queda cerrado (ya no admite cambios), se
+exportan sus ausencias a NOMINA una sola vez y cada área se congela en una
+instantánea comprimida (ver instantaneas.py), también en paralelo. Si la
+exportación falla el mes vuelve a quedar en curso y el cierre puede repetirse.
+"""
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from dateutil.relativedelta import relativedelta
+from django.db import connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import ausencias_nomina, cambios, instantaneas
+from .models import Area, CierreArea, CierreMes, Estado, Incidencia, Trabajador
+
+logger = logging.getLogger(__name__)
+
+LOTE = 2000
+
+
+class MesNoValidado(Exception):
+    """Quedan incidencias sin estado en el mes; no se exporta ni se cierra"""
+
+
+def dias_mes(inicio):
+    fin = inicio + relativedelta(months=1)
+    return [inicio + timedelta(days=n) for n in range((fin - inicio).days)]
+
+
+def crear_incidencias(nuevas):
+    """
+    Inserta en bloque las incidencias ``nuevas`` y registra su creación en
+    ``CambioIncidencia``; llamar dentro de una transacción.
+    """
+    if not nuevas:
+        return
+    Incidencia.objects.bulk_create(nuevas, batch_size=LOTE)
+    if any(i.pk is None for i in nuevas):
+        # Motores que no devuelven los ids del INSERT
+        fechas = [i.fecha_asistencia for i in nuevas]
+        ids = {
+            (t, f): pk for pk, t, f in Incidencia.objects
+            .filter(trabajador_id__in={i.trabajador_id for i in nuevas},
+                    fecha_asistencia__gte=min(fechas), fecha_asistencia__lte=max(fechas))
+            .order_by().values_list('id', 'trabajador_id', 'fecha_asistencia')
+        }
+        for i in nuevas:
+            i.pk = ids[(i.trabajador_id, i.fecha_asistencia)]
+    cambios.registrar_lote([(i, None) for i in nuevas])
+
+
+def procesar_area(cierre, area, dias):
+    """Materializa, valida y resume ``area``; devuelve el ``CierreArea`` creado"""
+    inicio, fin = dias[0], dias[-1]
+    with transaction.atomic():
+        trabajadores = list(Trabajador.objects.filter(area_id=area.pk, es_baja=False).values_list('id', flat=True))
+        existentes = set(
+            Incidencia.objects.filter(trabajador_id__in=trabajadores, fecha_asistencia__gte=inicio,
+                                      fecha_asistencia__lte=fin)
+            .order_by().values_list('trabajador_id', 'fecha_asistencia')
+        )
+        nuevas = [
+            Incidencia(trabajador_id=t, fecha_asistencia=dia, area_id=area.pk, estado_id=Estado.id_por_defecto(dia))
+            for t in trabajadores for dia in dias if (t, dia) not in existentes
+        ]
+        crear_incidencias(nuevas)
+
+        del_area = Incidencia.objects.filter(area_id=area.pk, fecha_asistencia__gte=inicio, fecha_asistencia__lte=fin)
+        resumen = dict(del_area.filter(estado__isnull=False).order_by().values('estado__clave_id')
+                       .annotate(n=Count('id')).values_list('estado__clave_id', 'n'))
+        return CierreArea.objects.create(
+            cierre=cierre, area=area, trabajadores=len(trabajadores), creadas=len(nuevas),
+            sin_estado=del_area.filter(estado__isnull=True).count(), resumen=resumen,
+        )
+
+
+def procesar_subarbol(cierre_id, codigos):
+    """
+    Tarea de un proceso del pool: procesa las áreas pendientes de ``codigos``.
+    Devuelve ``(areas, creadas, sin_estado, segundos)``.
+    """
+    comienzo = time.monotonic()
+    cierre = CierreMes.objects.get(pk=cierre_id)
+    dias = dias_mes(cierre.mes)
+    hechas = set(CierreArea.objects.filter(cierre=cierre).values_list('area_id', flat=True))
+    areas = creadas = sin_estado = 0
+    for area in Area.objects.filter(cod_area__in=codigos).exclude(pk__in=hechas).order_by():
+        punto = procesar_area(cierre, area, dias)
+        areas += 1
+        creadas += punto.creadas
+        sin_estado += punto.sin_estado
+    return areas, creadas, sin_estado, time.monotonic() - comienzo
+
+
+def congelar_subarbol(cierre_id, codigos):
+    """Tarea del pool: crea las instantáneas que faltan de las áreas de ``codigos``; devuelve cuántas"""
+    qs = (instantaneas.pendientes(CierreMes.objects.get(pk=cierre_id))
+          .filter(area__cod_area__in=codigos).select_related('cierre'))
+    n = 0
+    for cierre_area in qs:
+        instantaneas.congelar(cierre_area)
+        n += 1
+    return n
+
+
+def _en_paralelo(procesos, tarea, cierre, partes):
+    """Ejecuta ``tarea(cierre.pk, codigos)`` por cada parte en un pool; generador de resultados"""
+    if not partes:
+        return
+    # Los procesos hijos no deben heredar conexiones abiertas: cada uno abre la suya
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=procesos, initializer=django.setup) as pool:
+        tareas = [pool.submit(tarea, cierre.pk, codigos) for codigos in partes]
+        for tarea_hecha in as_completed(tareas):
+            yield tarea_hecha.result()
+
+
+def pendientes(cierre):
+    """Subárboles con alguna área sin punto de control, los más grandes primero"""
+    hechas = set(CierreArea.objects.filter(cierre=cierre).values_list('area__cod_area', flat=True))
+    tamanos = dict(Trabajador.objects.filter(es_baja=False).order_by().values('area__cod_area')
+                   .annotate(n=Count('id')).values_list('area__cod_area', 'n'))
+    partes = [codigos for codigos in Area.subarboles() if codigos - hechas]
+    return sorted(partes, key=lambda codigos: -sum(tamanos.get(c, 0) for c in codigos))
+
+
+def cerrar(inicio, procesos=None, exportar=True, progreso=None):
+    """
+    Cierra el mes que empieza en ``inicio``; reanuda desde los puntos de control
+    si una ejecución anterior quedó a medias. ``progreso(hechos, total, resultado)``
+    se llama al terminar cada subárbol. Devuelve el ``CierreMes``.
+    """
+    cierre, _ = CierreMes.objects.get_or_create(mes=inicio)
+    if cierre.estado == CierreMes.CERRADO:
+        # Puede faltar alguna instantánea si la ejecución anterior se cortó al congelar
+        _congelar(cierre, procesos)
+        return cierre
+
+    partes = pendientes(cierre)
+    for hechos, resultado in enumerate(_en_paralelo(procesos, procesar_subarbol, cierre, partes), 1):
+        if progreso:
+            progreso(hechos, len(partes), resultado)
+
+    desde, hasta = inicio, inicio + relativedelta(months=1)
+    sin_estado = Incidencia.objects.filter(fecha_asistencia__gte=desde, fecha_asistencia__lt=hasta,
+                                           estado__isnull=True).count()
+    if sin_estado:
+        raise MesNoValidado(f"{sin_estado} incidencias sin estado en {inicio:%Y-%m}")
+
+    # Primero se cierra: desde aquí se rechazan las ediciones y lo exportado es definitivo
+    cierre.estado = CierreMes.CERRADO
+    cierre.cerrado = timezone.now()
+    cierre.save(update_fields=['estado', 'cerrado'])
+
+    if exportar and not cierre.exportado:
+        try:
+            ausencias_nomina.aplicar(ausencias_nomina.diferencias(inicio))
+        except Exception:
+            # Un mes cerrado está exportado: se reabre (conservando los puntos de control) para repetir el cierre
+            cierre.estado = CierreMes.EN_CURSO
+            cierre.cerrado = None
+            cierre.save(update_fields=['estado', 'cerrado'])
+            logger.error(f"Mes {inicio:%Y-%m}: falló la exportación a NOMINA; el mes sigue en curso")
+            raise
+        cierre.exportado = True
+        cierre.save(update_fields=['exportado'])
+
+    logger.info(f"Mes {inicio:%Y-%m} cerrado")
+    _congelar(cierre, procesos)
+    return cierre
+
+
+def _congelar(cierre, procesos):
+    """Instantáneas de las áreas que aún no la tienen; el mes ya está cerrado y no cambia"""
+    faltan = set(instantaneas.pendientes(cierre).values_list('area__cod_area', flat=True))
+    if not faltan:
+        return
+    partes = [codigos & faltan for codigos in Area.subarboles() if codigos & faltan]
+    total = sum(_en_paralelo(procesos, congelar_subarbol, cierre, partes))
+    logger.info(f"Mes {cierre.mes:%Y-%m}: {total} instantáneas creadas")
@@ -0,0 +1,209 @@
+# conciliacion.py
+"""
+Conciliación mensual de ausencias entre SisGA y NOMINA por resúmenes.
+
+En lugar de comparar fila a fila, cada lado calcula en su propia base de datos
+un resumen por trabajador y mes: el MD5 de la cadena canónica de sus ausencias,
+``AAAA-MM-DD:CLAVE`` separadas por comas y ordenadas por fecha y clave
+(``md5(string_agg(...))`` en PostgreSQL, ``HASHBYTES('MD5', STRING_AGG(...))``
+en SQL Server). Solo viaja una fila por trabajador con ausencias. Los
+trabajadores cuyo resumen difiere se comparan después día a día (solo esos)
+para construir el informe de discrepancias.
+
+En otros motores (SQLite en desarrollo) la cadena se arma y se resume en Python
+con las filas ordenadas; el resultado es el mismo.
+
+El lado SisGA se calcula por subárboles de áreas en paralelo (un hilo y una
+conexión por subárbol); el de NOMINA es una sola consulta agrupada por mes.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.postgres.aggregates import StringAgg
+from django.db import connections
+from django.db.models import CharField, F, Func, Value
+from django.db.models.functions import MD5, Concat, Trim
+
+from . import ausencias_nomina, nomina
+from .models import Area, Incidencia, Trabajador
+
+logger = logging.getLogger(__name__)
+
+LOTE_DETALLE = 500  # CIs por consulta de detalle (SQL Server admite 2100 parámetros)
+
+# Resumen por CI calculado en NOMINA, según el motor del alias sqlserver ({m}: marcador, {t}: tabla)
+RESUMEN_SQL = {
+    'microsoft': (
+        "SELECT RTRIM(No_CI), LOWER(CONVERT(VARCHAR(32), HASHBYTES('MD5', CAST(STRING_AGG("
+        "CAST(CONVERT(VARCHAR(10), Fecha, 23) + ':' + RTRIM(Id_Clave) AS VARCHAR(MAX)), ',') "
+        "WITHIN GROUP (ORDER BY Fecha, RTRIM(Id_Clave)) AS VARCHAR(MAX))), 2)) "
+        "FROM {t} WHERE Fecha >= {m} AND Fecha < {m} GROUP BY RTRIM(No_CI)"
+    ),
+    'postgresql': (
+        "SELECT RTRIM(No_CI), md5(string_agg(to_char(Fecha, 'YYYY-MM-DD') || ':' || RTRIM(Id_Clave), ',' "
+        "ORDER BY Fecha, RTRIM(Id_Clave))) "
+        "FROM {t} WHERE Fecha >= {m} AND Fecha < {m} GROUP BY RTRIM(No_CI)"
+    ),
+}
+
+
+def digesto(ausencias):
+    """MD5 de la cadena canónica de ``[(fecha, clave), ...]``: el mismo que calculan las bases de datos"""
+    cadena = ','.join(f"{fecha:%Y-%m-%d}:{clave}" for fecha, clave in sorted((f, c.strip()) for f, c in ausencias))
+    return hashlib.md5(cadena.encode()).hexdigest()
+
+
+def _digestos(filas):
+    """``{ci: digesto}`` de filas ``(ci, fecha, clave)``"""
+    por_ci = {}
+    for ci, fecha, clave in filas:
+        por_ci.setdefault(ci.strip(), []).append((ausencias_nomina.normalizar_fecha(fecha), clave))
+    return {ci: digesto(ausencias) for ci, ausencias in por_ci.items()}
+
+
+@dataclass
+class Discrepancia:
+    cod_area: str  # None: CI presente en NOMINA pero no en SisGA
+    ci: str
+    fecha: object
+    clave_sisga: str
+    clave_nomina: str
+
+
+@dataclass
+class Informe:
+    trabajadores: int = 0
+    coincidentes: int = 0
+    discrepancias: list = field(default_factory=list)
+
+    @property
+    def trabajadores_con_diferencias(self):
+        return len({d.ci for d in self.discrepancias})
+
+    def por_area(self):
+        conteo = {}
+        for d in self.discrepancias:
+            conteo.setdefault(d.cod_area, set()).add(d.ci)
+        return {cod: len(cis) for cod, cis in sorted(conteo.items(), key=lambda x: x[0] or '')}
+
+
+def _rango(inicio):
+    return inicio, inicio + relativedelta(months=1)
+
+
+def resumenes_nomina(inicio):
+    """``{ci: digesto}`` calculado por NOMINA para todo el mes"""
+    m = ausencias_nomina.marcador()
+    sql = RESUMEN_SQL.get(connections[nomina.ALIAS].vendor)
+    if sql is None:
+        filas = nomina.consultar(
+            f"SELECT No_CI, Fecha, Id_Clave FROM {ausencias_nomina.tabla()} WHERE Fecha >= {m} AND Fecha < {m}",
+            _rango(inicio),
+        )
+        return _digestos(filas)
+    filas = nomina.consultar(sql.format(m=m, t=ausencias_nomina.tabla()), _rango(inicio))
+    return {ci.strip(): resumen.lower() for ci, resumen in filas}
+
+
+def _excepciones(inicio, claves):
+    desde, hasta = _rango(inicio)
+    return (Incidencia.objects
+            .filter(fecha_asistencia__gte=desde, fecha_asistencia__lt=hasta, estado__clave_id__in=claves)
+            .exclude(estado_id__in=ausencias_nomina.ESTADOS_POR_DEFECTO))
+
+
+def resumenes_sisga(inicio, claves, codigos):
+    """``{ci: digesto}`` de los trabajadores del conjunto de áreas ``codigos``"""
+    qs = _excepciones(inicio, claves).filter(area__cod_area__in=codigos)
+    if connections[qs.db].vendor != 'postgresql':
+        return _digestos(qs.values_list('trabajador__ci', 'fecha_asistencia', 'estado__clave_id'))
+    elemento = Concat(
+        Func(F('fecha_asistencia'), Value('YYYY-MM-DD'), function='to_char', output_field=CharField()),
+        Value(':'), Trim('estado__clave_id'), output_field=CharField(),
+    )
+    filas = (qs.values('trabajador__ci')
+             .annotate(d=MD5(StringAgg(elemento, ',', ordering=('fecha_asistencia', Trim('estado__clave_id')))))
+             .values_list('trabajador__ci', 'd'))
+    return {ci.strip(): d for ci, d in filas}
+
+
+def detalle_sisga(inicio, claves, cis):
+    detalle = {}
+    cis = list(cis)
+    for i in range(0, len(cis), LOTE_DETALLE):
+        filas = (_excepciones(inicio, claves).filter(trabajador__ci__in=cis[i:i + LOTE_DETALLE])
+                 .values_list('trabajador__ci', 'fecha_asistencia', 'estado__clave_id'))
+        for ci, fecha, clave in filas:
+            detalle[(ci, fecha)] = clave
+    return detalle
+
+
+def detalle_nomina(inicio, cis):
+    m = ausencias_nomina.marcador()
+    detalle = {}
+    cis = list(cis)
+    for i in range(0, len(cis), LOTE_DETALLE):
+        lote = cis[i:i + LOTE_DETALLE]
+        filas = nomina.consultar(
+            f"SELECT No_CI, Fecha, Id_Clave FROM {ausencias_nomina.tabla()} "
+            f"WHERE Fecha >= {m} AND Fecha < {m} AND No_CI IN ({', '.join([m] * len(lote))})",
+            (*_rango(inicio), *lote),
+        )
+        for ci, fecha, clave in filas:
+            detalle[(ci.strip(), ausencias_nomina.normalizar_fecha(fecha))] = clave.strip()
+    return detalle
+
+
+def _comparar(inicio, claves, codigos, en_nomina, cis_area):
+    """Compara un subárbol; devuelve (trabajadores, coincidentes, discrepancias)"""
+    try:
+        en_sisga = resumenes_sisga(inicio, claves, codigos)
+        cis = set(en_sisga) | (set(en_nomina) & set(cis_area))
+        distintos = {ci for ci in cis if en_sisga.get(ci) != en_nomina.get(ci)}
+        discrepancias = []
+        if distintos:
+            sisga = detalle_sisga(inicio, claves, distintos)
+            nom = detalle_nomina(inicio, distintos)
+            for ci, fecha in sorted(set(sisga) | set(nom)):
+                if sisga.get((ci, fecha)) != nom.get((ci, fecha)):
+                    discrepancias.append(Discrepancia(cis_area.get(ci), ci, fecha,
+                                                      sisga.get((ci, fecha)), nom.get((ci, fecha))))
+        return len(cis), len(cis) - len(distintos), discrepancias
+    finally:
+        # Cada hilo abre su propia conexión; se cierra al terminar el subárbol
+        connections.close_all()
+
+
+def conciliar(inicio, cod_area=None, paralelo=4):
+    """Concilia el mes que empieza en ``inicio`` (todo el árbol o el subárbol de ``cod_area``)"""
+    claves = ausencias_nomina.claves_ausencia()
+    en_nomina = resumenes_nomina(inicio)
+    subarboles = Area.subarboles(cod_area)
+    cis_area = dict(Trabajador.objects.filter(area__cod_area__in=set().union(*subarboles))
+                    .values_list('ci', 'area__cod_area'))
+
+    informe = Informe()
+    with ThreadPoolExecutor(max_workers=paralelo) as pool:
+        tareas = [pool.submit(_comparar, inicio, claves, codigos, en_nomina,
+                              {ci: cod for ci, cod in cis_area.items() if cod in codigos})
+                  for codigos in subarboles]
+        for tarea in tareas:
+            trabajadores, coincidentes, discrepancias = tarea.result()
+            informe.trabajadores += trabajadores
+            informe.coincidentes += coincidentes
+            informe.discrepancias.extend(discrepancias)
+
+    if cod_area is None:
+        # CIs con ausencias en NOMINA que no corresponden a ningún trabajador de SisGA
+        huerfanos = set(en_nomina) - set(cis_area)
+        if huerfanos:
+            for (ci, fecha), clave in sorted(detalle_nomina(inicio, huerfanos).items()):
+                informe.discrepancias.append(Discrepancia(None, ci, fecha, None, clave))
+            informe.trabajadores += len(huerfanos)
+
+    logger.info(f"Conciliación {inicio:%Y-%m}: {informe.trabajadores} trabajadores, "
+                f"{informe.trabajadores_con_diferencias} con diferencias")
+    return informe
@@ -0,0 +1,89 @@
+# condicional.py
+"""
+Peticiones condicionales (``ETag`` / ``Last-Modified``) para las vistas que se
+refrescan a menudo.
+
+Antes de construir la respuesta se calcula un token barato de los datos que la
+determinan; si coincide con el ``If-None-Match`` del navegador se responde 304
+sin consultar ni renderizar nada más. Para la tabla de incidencias el token es
+``(máximo de Incidencia.actualizado, número de filas)`` del subárbol y el rango
+de fechas, que sale de un solo recorrido del índice ``(area, fecha, actualizado)``,
+más los trabajadores de las áreas y los meses cerrados. El número de filas
+detecta los borrados, que no mueven el máximo. Los nombres de trabajadores y
+áreas y las claves de los estados que muestra la tabla no tocan
+``Incidencia``: el token lleva también sus versiones (``sesion.version_*``),
+que se renuevan al guardarlos (ver signals.py).
+
+El ETag incluye también al usuario y su token CSRF (la página lleva formularios)
+y ``CONDICIONAL['VERSION']``, que debe cambiar en cada despliegue para que una
+plantilla nueva no se quede oculta tras un 304.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import metricas, sesion
+from .models import CierreMes, Incidencia, ResponsableArea, Trabajador
+
+
+def etag(request, *partes):
+    """ETag (entre comillas) de ``partes`` para el usuario de ``request``"""
+    usuario = request.user
+    get_token(request)  # el secreto CSRF existe ya en la primera visita, no solo tras renderizar
+    clave = '|'.join(str(p) for p in (
+        settings.CONDICIONAL['VERSION'], usuario.pk, usuario.is_staff, usuario.is_superuser,
+        request.META.get('CSRF_COOKIE', ''), *partes,
+    ))
+    return f'"{hashlib.blake2b(clave.encode(), digest_size=16).hexdigest()}"'
+
+
+def responder(request, etiqueta, ultima=None):
+    """
+    Respuesta 304 (o 412) si el cliente ya tiene la versión ``etiqueta``; ``None``
+    si hay que construir la página. Con mensajes pendientes siempre se construye.
+    """
+    if not settings.CONDICIONAL['ACTIVO'] or request.method not in ('GET', 'HEAD'):
+        return None
+    if len(getattr(request, '_messages', ())):
+        return None
+    respuesta = get_conditional_response(request, etag=etiqueta,
+                                         last_modified=int(ultima.timestamp()) if ultima else None)
+    metricas.incrementar('sisga_cache_total', cache='condicional',
+                         resultado='fallos' if respuesta is None else 'aciertos')
+    return respuesta
+
+
+def marcar(respuesta, etiqueta, ultima=None):
+    """Añade los validadores a ``respuesta`` y obliga al navegador a revalidar en cada uso"""
+    if not settings.CONDICIONAL['ACTIVO'] or respuesta.status_code != 200:
+        return respuesta
+    respuesta['ETag'] = etiqueta
+    if ultima:
+        respuesta['Last-Modified'] = http_date(ultima.timestamp())
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+def token_incidencias(area_ids, desde, hasta):
+    """``(partes, último cambio)`` de lo que muestra la tabla de incidencias"""
+    incidencias = (Incidencia.objects.filter(area_id__in=area_ids, fecha_asistencia__range=[desde, hasta])
+                   .order_by().aggregate(ultima=Max('actualizado'), n=Count('id')))
+    trabajadores = (Trabajador.objects.filter(area_id__in=area_ids).order_by()
+                    .aggregate(n=Count('id'), maximo=Max('id')))
+    cerrados = sorted(CierreMes.objects.filter(estado=CierreMes.CERRADO, mes__gte=desde.replace(day=1),
+                                               mes__lte=hasta).values_list('mes', flat=True))
+    partes = (sorted(area_ids), desde, hasta, incidencias['ultima'], incidencias['n'],
+              trabajadores['n'], trabajadores['maximo'], cerrados,
+              sesion.version_trabajadores(), sesion.version_areas(), sesion.version_estados())
+    return partes, incidencias['ultima']
+
+
+def token_responsables(**filtros):
+    """``(partes, último cambio)`` de las asignaciones de responsables que cumplen ``filtros``"""
+    datos = (ResponsableArea.objects.filter(**filtros).order_by()
+             .aggregate(ultima=Max('fecha_actualizacion'), n=Count('id')))
+    return (datos['ultima'], datos['n']), datos['ultima']
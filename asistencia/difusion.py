@@ -0,0 +1,208 @@
+# difusion.py
+"""
+Difusión en vivo de los cambios de celdas a las tablas de incidencias abiertas.
+
+Cada cambio registrado por ``cambios.registrar``/``registrar_lote`` se publica,
+al confirmarse la transacción, en el canal ``<area_id>:<AAAA-MM>``. La vista
+``eventos_incidencias`` (Server-Sent Events, servida por ASGI) suscribe la
+tabla a los canales de su área y meses y le envía mensajes pequeños:
+
+    {"celdas": [[incidencia_id, trabajador_id, "AAAA-MM-DD", estado_id, version], ...]}
+
+o ``{"recargar": true}`` cuando el lote es demasiado grande para enviarlo celda
+a celda (materializaciones, importaciones) o el cliente se quedó atrás.
+
+``DIFUSION['BROKER']``:
+
+- ``local``: en el propio proceso; basta con un único proceso ASGI (con más,
+  ``WEB_CONCURRENCY`` > 1, se avisa: los cambios hechos en otros procesos no
+  llegan). Es el predeterminado si la base de datos no es PostgreSQL.
+- ``postgres`` (predeterminado con PostgreSQL): ``pg_notify`` al publicar y un
+  hilo por proceso con ``LISTEN`` que reparte los avisos a sus suscriptores;
+  funciona con varios procesos y servidores sin ningún servicio adicional.
+- ``ninguno``: desactivada.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+RECARGAR = json.dumps({'recargar': True})
+
+
+def canal(area_id, fecha):
+    return f"{area_id}:{fecha:%Y-%m}"
+
+
+class Broker:
+    """Reparte mensajes a las colas ``asyncio`` suscritas en este proceso"""
+
+    def __init__(self):
+        self._suscriptores = {}  # canal -> {cola: loop}
+        self._lock = threading.Lock()
+
+    def suscribir(self, canales):
+        """Cola que recibe los mensajes de ``canales``; llamar desde el bucle de eventos"""
+        cola = asyncio.Queue(maxsize=settings.DIFUSION['COLA'])
+        cola.canales = tuple(canales)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for nombre in cola.canales:
+                self._suscriptores.setdefault(nombre, {})[cola] = loop
+        return cola
+
+    def cancelar(self, cola):
+        with self._lock:
+            for nombre in cola.canales:
+                colas = self._suscriptores.get(nombre, {})
+                colas.pop(cola, None)
+                if not colas:
+                    self._suscriptores.pop(nombre, None)
+
+    def entregar(self, nombre, mensaje):
+        with self._lock:
+            destinos = list(self._suscriptores.get(nombre, {}).items())
+        for cola, loop in destinos:
+            try:
+                loop.call_soon_threadsafe(_encolar, cola, mensaje)
+            except RuntimeError:  # bucle ya cerrado
+                self.cancelar(cola)
+
+    def publicar(self, nombre, mensaje):
+        self.entregar(nombre, mensaje)
+
+
+def _encolar(cola, mensaje):
+    try:
+        cola.put_nowait(mensaje)
+    except asyncio.QueueFull:
+        # Cliente lento: se descarta lo pendiente y se le pide recargar la tabla
+        while not cola.empty():
+            cola.get_nowait()
+        cola.put_nowait(RECARGAR)
+
+
+class BrokerPostgres(Broker):
+    """
+    Publica con ``pg_notify`` y escucha con una conexión propia (``LISTEN``) en
+    un hilo del proceso, que se inicia con la primera suscripción.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._escucha = None
+
+    def publicar(self, nombre, mensaje):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [settings.DIFUSION['CANAL_PG'], json.dumps([nombre, mensaje])])
+
+    def suscribir(self, canales):
+        with self._lock:
+            if self._escucha is None or not self._escucha.is_alive():
+                self._escucha = threading.Thread(target=self._escuchar, name='difusion-listen', daemon=True)
+                self._escucha.start()
+        return super().suscribir(canales)
+
+    def _escuchar(self):
+        base = connections['default']
+        while True:
+            conn = None
+            try:
+                conn = base.get_new_connection(base.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {settings.DIFUSION['CANAL_PG']}")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        nombre, mensaje = json.loads(aviso.payload)
+                        self.entregar(nombre, mensaje)
+            except Exception as e:
+                logger.warning(f"Difusión: se perdió la conexión LISTEN ({e}); reintentando")
+                with self._lock:
+                    destinos = {cola: loop for colas in self._suscriptores.values() for cola, loop in colas.items()}
+                # Los avisos perdidos mientras tanto no se recuperan: las tablas abiertas recargan
+                for cola, loop in destinos.items():
+                    loop.call_soon_threadsafe(_encolar, cola, RECARGAR)
+                if conn is not None:
+                    conn.close()
+                threading.Event().wait(5)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def varios_procesos():
+    """El servidor arranca más de un worker (``WEB_CONCURRENCY``, que leen gunicorn y uvicorn)"""
+    try:
+        return int(os.getenv('WEB_CONCURRENCY', '1')) > 1
+    except ValueError:
+        return False
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                if settings.DIFUSION['BROKER'] == 'postgres':
+                    _broker = BrokerPostgres()
+                else:
+                    if varios_procesos():
+                        logger.error("DIFUSION['BROKER'] = 'local' con varios procesos: las tablas abiertas "
+                                     "no recibirán los cambios hechos en otros procesos; usar 'postgres'")
+                    _broker = Broker()
+    return _broker
+
+
+def activa():
+    return settings.DIFUSION['BROKER'] != 'ninguno'
+
+
+def publicar_celdas(celdas):
+    """``celdas``: tuplas ``(incidencia_id, trabajador_id, area_id, fecha, estado_id, version)``"""
+    por_canal = {}
+    for incidencia_id, trabajador_id, area_id, fecha, estado_id, version in celdas:
+        por_canal.setdefault(canal(area_id, fecha), []).append(
+            [incidencia_id, trabajador_id, fecha.isoformat(), estado_id, version])
+    maximo = settings.DIFUSION['MAX_CELDAS']
+    for nombre, lista in por_canal.items():
+        try:
+            broker().publicar(nombre, RECARGAR if len(lista) > maximo else json.dumps({'celdas': lista}))
+        except Exception as e:
+            # La difusión es un aviso: nunca debe hacer fallar la escritura ya confirmada
+            logger.warning(f"Difusión: no se pudo publicar en {nombre}: {e}")
+
+
+def al_confirmar(celdas, using=None):
+    """Publica ``celdas`` cuando se confirme la transacción en curso (al momento si no hay)"""
+    if activa() and celdas:
+        transaction.on_commit(lambda: publicar_celdas(celdas), using=using)
+
+
+async def eventos(canales):
+    """Flujo Server-Sent Events de ``canales``; se cancela cuando el cliente se desconecta"""
+    cola = broker().suscribir(canales)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                mensaje = await asyncio.wait_for(cola.get(), timeout=settings.DIFUSION['KEEPALIVE'])
+            except asyncio.TimeoutError:
+                yield ': sigue\n\n'  # comentario: mantiene viva la conexión a través de proxies
+                continue
+            yield f"event: celdas\ndata: {mensaje}\n\n"
+    finally:
+        broker().cancelar(cola)
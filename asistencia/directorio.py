@@ -0,0 +1,246 @@
+# directorio.py
+"""
+Caché de consultas al directorio LDAP.
+
+``buscar(filtro, atributos)`` guarda en memoria del proceso el resultado de cada
+búsqueda, con la clave ``(base, filtro normalizado, atributos)``: el filtro se
+normaliza (nombres de atributo en minúsculas, sin espacios sobrantes y con los
+operandos de ``&`` y ``|`` ordenados) para que dos llamadas equivalentes
+compartan la entrada.
+
+Cada entrada es fresca durante ``QUERY_CACHE_TTL`` segundos. Pasado ese tiempo
+y hasta ``QUERY_CACHE_STALE`` segundos más se devuelve igualmente y se refresca
+en un hilo aparte (stale-while-revalidate); después se consulta al directorio en
+la propia llamada. Si el directorio no responde (circuito abierto o error de
+comunicación) se sirve la última copia, por vieja que sea. Como mucho se
+guardan ``QUERY_CACHE_SIZE`` búsquedas; al superarlo se descarta la menos usada.
+
+Las entradas son diccionarios ``{atributo en minúsculas: tupla de valores}``;
+``valor(entrada, 'Correo')`` devuelve el primero como texto.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from ldap3.utils.conv import escape_filter_chars
+
+from . import ldap_client, metricas
+from .ldap_client import ERRORES_COMUNICACION, LDAPNoDisponible
+from .models import EntradaDirectorio
+
+logger = logging.getLogger(__name__)
+
+
+def _config(clave, defecto):
+    return settings.LDAP_CONFIG.get(clave, defecto)
+
+
+# Normalización de filtros ---------------------------------------------------
+
+_RE_COMPARACION = re.compile(r'^\s*([^=~<>()\s]+)\s*(~=|>=|<=|=)(.*)$', re.S)
+
+
+def _leer(filtro, i):
+    """Árbol del filtro que empieza en ``filtro[i]`` (un paréntesis) y posición siguiente"""
+    if filtro[i] != '(':
+        raise ValueError(filtro)
+    i += 1
+    while filtro[i].isspace():
+        i += 1
+    operador = filtro[i]
+    if operador in '&|!':
+        i += 1
+        hijos = []
+        while True:
+            while filtro[i].isspace():
+                i += 1
+            if filtro[i] == ')':
+                break
+            hijo, i = _leer(filtro, i)
+            hijos.append(hijo)
+        return (operador, hijos), i + 1
+    fin = filtro.index(')', i)  # los valores llevan los paréntesis escapados (\28 \29)
+    comparacion = _RE_COMPARACION.match(filtro[i:fin])
+    if comparacion is None:
+        raise ValueError(filtro)
+    atributo, tipo, valor = comparacion.groups()
+    return f'({atributo.lower()}{tipo}{valor.strip()})', fin + 1
+
+
+def _escribir(arbol):
+    if isinstance(arbol, str):
+        return arbol
+    operador, hijos = arbol
+    partes = [_escribir(h) for h in hijos]
+    if operador != '!':
+        partes = sorted(set(partes))
+    return f"({operador}{''.join(partes)})"
+
+
+def normalizar_filtro(filtro):
+    """Forma canónica de ``filtro``; si no se entiende, el filtro sin espacios en los extremos"""
+    filtro = filtro.strip()
+    if not filtro.startswith('('):
+        filtro = f'({filtro})'
+    try:
+        arbol, fin = _leer(filtro, 0)
+        if filtro[fin:].strip():
+            raise ValueError(filtro)
+    except (ValueError, IndexError):
+        return filtro
+    return _escribir(arbol)
+
+
+# Caché -----------------------------------------------------------------------
+
+class CacheConsultas:
+    """LRU en memoria del proceso con TTL, ventana de obsolescencia y métricas"""
+
+    def __init__(self, maximo=256, ttl=300, obsoleto=3600):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.obsoleto = obsoleto
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> (resultado, obtenido)
+        self._refrescando = set()
+        self.metricas = Counter()
+
+    def _contar(self, metrica):
+        with self._lock:
+            self.metricas[metrica] += 1
+        metricas.incrementar('sisga_cache_total', cache='ldap_consultas', resultado=metrica)
+
+    def _guardar(self, clave, resultado):
+        with self._lock:
+            self._entradas[clave] = (resultado, time.monotonic())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+                self.metricas['desalojos'] += 1
+
+    def _refrescar(self, clave, consulta):
+        try:
+            self._guardar(clave, consulta())
+            self._contar('refrescos')
+        except Exception as e:
+            self._contar('errores')
+            logger.warning(f"No se pudo refrescar la consulta LDAP {clave[1]}: {e}")
+        finally:
+            with self._lock:
+                self._refrescando.discard(clave)
+
+    def _refrescar_en_segundo_plano(self, clave, consulta):
+        with self._lock:
+            if clave in self._refrescando:
+                return
+            self._refrescando.add(clave)
+        threading.Thread(target=self._refrescar, args=(clave, consulta), daemon=True,
+                         name='refresco-ldap').start()
+
+    def obtener(self, clave, consulta):
+        """Resultado de ``clave``; ``consulta()`` lo pide al directorio cuando hace falta"""
+        with self._lock:
+            guardada = self._entradas.get(clave)
+            if guardada is not None:
+                self._entradas.move_to_end(clave)
+        if guardada is not None:
+            resultado, obtenido = guardada
+            edad = time.monotonic() - obtenido
+            if edad < self.ttl:
+                self._contar('aciertos')
+                return resultado
+            if edad < self.ttl + self.obsoleto:
+                self._contar('obsoletos')
+                self._refrescar_en_segundo_plano(clave, consulta)
+                return resultado
+
+        self._contar('fallos')
+        try:
+            resultado = consulta()
+        except (LDAPNoDisponible, *ERRORES_COMUNICACION) as e:
+            self._contar('errores')
+            if guardada is None:
+                raise
+            self._contar('degradados')
+            logger.warning(f"Directorio LDAP sin respuesta, se sirve una copia de hace "
+                           f"{time.monotonic() - guardada[1]:.0f} s de {clave[1]}: {e}")
+            return guardada[0]
+        self._guardar(clave, resultado)
+        return resultado
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['entradas'] = len(self._entradas)
+        consultas = datos.get('aciertos', 0) + datos.get('obsoletos', 0) + datos.get('fallos', 0)
+        datos['tasa_aciertos'] = (datos.get('aciertos', 0) + datos.get('obsoletos', 0)) / consultas if consultas else 0.0
+        return datos
+
+
+cache_consultas = CacheConsultas(
+    maximo=int(_config('QUERY_CACHE_SIZE', 256)),
+    ttl=float(_config('QUERY_CACHE_TTL', 300)),
+    obsoleto=float(_config('QUERY_CACHE_STALE', 3600)),
+)
+
+
+def _consultar(base, filtro, atributos):
+    with ldap_client.conexion() as conn:
+        inicio = time.perf_counter()
+        conn.search(base, filtro, attributes=list(atributos))
+        metricas.observar('sisga_ldap_duracion_segundos', time.perf_counter() - inicio, operacion='busqueda')
+        entradas = conn.entries
+    return tuple(
+        {nombre.lower(): tuple(entrada[nombre].values) for nombre in entrada.entry_attributes}
+        for entrada in entradas
+    )
+
+
+def buscar(filtro, atributos, base=None):
+    """
+    Entradas del directorio que cumplen ``filtro`` con ``atributos``, desde la
+    caché si es posible. Lanza ``LDAPNoDisponible`` o un error de comunicación
+    solo si el directorio no responde y no hay ninguna copia guardada.
+    """
+    base = base or _config('USER_BASE', '')
+    atributos = tuple(sorted({a.lower() for a in atributos}))
+    clave = (base.lower(), normalizar_filtro(filtro), atributos)
+    return [dict(e) for e in cache_consultas.obtener(clave, lambda: _consultar(base, filtro, atributos))]
+
+
+def valor(entrada, atributo):
+    """Primer valor de ``atributo`` como texto ('' si no tiene)"""
+    valores = entrada.get(atributo.lower())
+    return str(valores[0]) if valores else ''
+
+
+def datos_usuario(username):
+    """
+    ``first_name``, ``last_name`` y ``email`` de ``username`` según el directorio,
+    para rellenar usuarios nuevos: de la copia local (espejo_directorio.py) si la
+    tiene y, si no, del directorio. Vacío si no está o si el directorio no responde.
+    """
+    entrada = EntradaDirectorio.objects.filter(uid=username).first()
+    if entrada is not None:
+        return {'first_name': entrada.cn, 'last_name': entrada.sn, 'email': entrada.correo}
+    try:
+        entradas = buscar(f'(uid={escape_filter_chars(username)})', ['cn', 'sn', 'Correo'])
+    except Exception as e:
+        logger.warning(f"No se pudieron leer del directorio los datos de {username}: {e}")
+        return {}
+    if not entradas:
+        return {}
+    entrada = entradas[0]
+    return {'first_name': valor(entrada, 'cn'), 'last_name': valor(entrada, 'sn'), 'email': valor(entrada, 'Correo')}
+
+
+def estadisticas():
+    """Aciertos, fallos, copias obsoletas servidas, errores, desalojos y entradas"""
+    return cache_consultas.estadisticas()
@@ -0,0 +1,150 @@
+# edicion.py
+"""
+Edición de celdas con concurrencia optimista.
+
+El cliente envía el estado nuevo junto con la ``version`` de la incidencia que
+estaba viendo. La escritura es un ``UPDATE ... SET version = version + 1
+WHERE id = ? AND version = ?``: si otro editor cambió la celda entretanto no se
+actualiza ninguna fila y se devuelve ``Conflicto`` con el valor actual, sin
+bloquear filas ni perder cambios en silencio. Las escrituras masivas
+(importación, rangos) también incrementan ``version``. Las celdas de un mes
+cerrado no se editan (``instantaneas.MesCerrado``): la comprobación va en la
+misma transacción que el UPDATE y bloquea la fila ``CierreMes`` del mes, así
+que un cierre simultáneo espera a que la edición termine (y la exporta) o la
+edición ve el mes ya cerrado.
+"""
+from dataclasses import dataclass, field
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import cambios, instantaneas
+from .models import Estado, Incidencia
+
+MAX_LOTE = 1000  # celdas por petición de editar_incidencias_lote
+
+
+@dataclass
+class Conflicto:
+    id: int
+    estado_id: int  # valor actual en la base de datos
+    version: int
+
+    def como_dict(self):
+        return {'id': self.id, 'estado': self.estado_id, 'version': self.version}
+
+
+@dataclass
+class Resultado:
+    aplicadas: list = field(default_factory=list)  # (id, version_nueva)
+    conflictos: list = field(default_factory=list)  # Conflicto
+    no_encontradas: list = field(default_factory=list)  # ids
+    cerradas: list = field(default_factory=list)  # ids en meses cerrados
+
+
+def _conflicto(incidencia_id):
+    actual = Incidencia.objects.filter(pk=incidencia_id).values_list('estado_id', 'version').first()
+    return None if actual is None else Conflicto(incidencia_id, *actual)
+
+
+def cambiar_estado(incidencia, estado_id, version):
+    """
+    Cambia el estado de ``incidencia`` (leída en esta petición) si su versión sigue
+    siendo ``version``. Devuelve la versión nueva o un ``Conflicto``; lanza
+    ``instantaneas.MesCerrado`` si la celda es de un mes cerrado.
+    """
+    with transaction.atomic():
+        instantaneas.comprobar_abierto([incidencia.fecha_asistencia], bloquear=True)
+        return _cambiar(incidencia, estado_id, version)
+
+
+def _cambiar(incidencia, estado_id, version):
+    if incidencia.version != version:
+        return Conflicto(incidencia.pk, incidencia.estado_id, incidencia.version)
+    if incidencia.estado_id == estado_id:
+        return version
+    with transaction.atomic():
+        filas = (Incidencia.objects.filter(pk=incidencia.pk, version=version)
+                 .update(estado_id=estado_id, version=F('version') + 1, actualizado=timezone.now()))
+        if not filas:
+            return _conflicto(incidencia.pk) or Conflicto(incidencia.pk, None, None)
+        # Con la versión intacta, el estado anterior es el que se leyó
+        anterior = incidencia.estado_id
+        incidencia.estado_id = estado_id
+        incidencia.version = version + 1
+        incidencia._estado_original = estado_id
+        cambios.registrar(incidencia, anterior)
+    return incidencia.version
+
+
+def cambiar_lote(peticiones, area_ids=None):
+    """
+    ``peticiones``: ``[(incidencia_id, estado_id, version), ...]``. Cada celda se
+    aplica o se rechaza por separado en una sola transacción; ``area_ids`` limita
+    las áreas editables (``None`` = todas).
+    """
+    resultado = Resultado()
+    qs = Incidencia.objects.filter(pk__in=[p[0] for p in peticiones]).order_by()
+    if area_ids is not None:
+        qs = qs.filter(area_id__in=area_ids)
+    incidencias = {i.pk: i for i in qs.only('id', 'trabajador_id', 'area_id', 'fecha_asistencia',
+                                            'estado_id', 'version')}
+    fechas = [i.fecha_asistencia for i in incidencias.values()]
+    with transaction.atomic():
+        cerrados = instantaneas.meses_cerrados(min(fechas), max(fechas), bloquear=True) if fechas else set()
+        for incidencia_id, estado_id, version in peticiones:
+            incidencia = incidencias.get(incidencia_id)
+            if incidencia is None:
+                resultado.no_encontradas.append(incidencia_id)
+                continue
+            if incidencia.fecha_asistencia.replace(day=1) in cerrados:
+                resultado.cerradas.append(incidencia_id)
+                continue
+            nueva = _cambiar(incidencia, estado_id, version)
+            if isinstance(nueva, Conflicto):
+                resultado.conflictos.append(nueva)
+            else:
+                resultado.aplicadas.append((incidencia_id, nueva))
+    return resultado
+
+
+# Días ISO de la semana de cada estado por defecto (ver Estado.id_por_defecto)
+DIAS_POR_DEFECTO = {Estado.ASISTENCIA: (1, 2, 3, 4, 5), Estado.SABADO: (6,), Estado.DOMINGO: (7,)}
+
+
+def restablecer_por_defecto(queryset):
+    """
+    Devuelve las celdas de ``queryset`` a su estado por defecto con un ``UPDATE``
+    por estado (acción del admin), sin cargar instancias; las de meses cerrados
+    se dejan como están. Devuelve ``(cambiadas, en_meses_cerrados)``.
+    """
+    base = queryset.order_by()
+    cerradas = 0
+    meses = instantaneas.meses_cerrados()
+    if meses:
+        en_cerrados = Q()
+        for mes in meses:
+            en_cerrados |= Q(fecha_asistencia__gte=mes, fecha_asistencia__lt=mes + relativedelta(months=1))
+        cerradas = base.filter(en_cerrados).count()
+        base = base.exclude(en_cerrados)
+
+    registro = []
+    with transaction.atomic():
+        ahora = timezone.now()
+        for estado_id, dias in DIAS_POR_DEFECTO.items():
+            qs = base.filter(fecha_asistencia__iso_week_day__in=dias).exclude(estado_id=estado_id)
+            # Se bloquean antes de leerlas para que el registro coincida con lo que escribe el UPDATE
+            filas = list(qs.select_for_update(of=('self',))
+                         .values_list('id', 'trabajador_id', 'area_id', 'fecha_asistencia', 'estado_id', 'version'))
+            if not filas:
+                continue
+            qs.update(estado_id=estado_id, version=F('version') + 1, actualizado=ahora)
+            registro.extend(
+                (Incidencia(pk=pk, trabajador_id=t, area_id=a, fecha_asistencia=f, estado_id=estado_id, version=v + 1),
+                 anterior)
+                for pk, t, a, f, anterior, v in filas
+            )
+        cambios.registrar_lote(registro)
+    return len(registro), cerradas
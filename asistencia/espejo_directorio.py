@@ -0,0 +1,192 @@
+# espejo_directorio.py
+"""
+Copia local buscable de las entradas ``Trabajador`` del directorio LDAP.
+
+``sincronizar()`` trae al modelo ``EntradaDirectorio`` solo las entradas cuyo
+``modifyTimestamp`` es igual o posterior al más reciente ya copiado (el reloj es
+el del servidor LDAP, no el nuestro); la primera vez, o con ``completo=True``,
+las trae todas y borra las que ya no están en el directorio. La búsqueda es
+paginada (``LOTE`` entradas por página) y cada página se escribe con un único
+``INSERT ... ON CONFLICT``. Las bajas lógicas llegan como ``EsBaja``; los
+borrados físicos solo se detectan en la sincronización completa, que conviene
+programar cada noche (``manage.py sincronizar_directorio --completo``).
+
+``buscar(texto)`` resuelve el selector de personas en la base de datos: primero
+las coincidencias por prefijo de uid, CI o nombre, y después, en PostgreSQL,
+las que contienen el texto o se le parecen por trigramas (``pg_trgm``),
+ordenadas por similitud. Los índices los crea la migración 0013.
+"""
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import F, Max, Q, Value
+from django.utils import timezone
+
+from . import ldap_client, sesion
+from .models import EntradaDirectorio
+
+logger = logging.getLogger(__name__)
+
+LOTE = 500
+LIMITE = 20  # resultados por búsqueda
+MINIMO_DIFUSA = 3  # caracteres a partir de los que se busca por contenido y trigramas
+FILTRO = '(objectClass=Trabajador)'
+ATRIBUTOS = ['uid', 'cn', 'sn', 'Correo', 'CI', 'CodigoDelArea', 'CodigoDeDependencia', 'EsBaja', 'modifyTimestamp']
+CAMPOS = ['cn', 'sn', 'correo', 'ci', 'cod_area', 'cod_dependencia', 'es_baja', 'busqueda', 'modificado',
+          'sincronizado']
+
+_RE_ESPACIOS = re.compile(r'\s+')
+_RE_HORA_LDAP = re.compile(r'^(\d{14})(?:[.,]\d+)?Z$')
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con los espacios colapsados"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _RE_ESPACIOS.sub(' ', texto).strip().lower()
+
+
+def _primero(valor):
+    if isinstance(valor, (list, tuple)):
+        valor = valor[0] if valor else ''
+    return '' if valor is None else valor
+
+
+def _hora_ldap(valor):
+    """``modifyTimestamp`` (GeneralizedTime) como datetime con zona; ``None`` si no se entiende"""
+    valor = _primero(valor)
+    if isinstance(valor, datetime):
+        return valor if timezone.is_aware(valor) else valor.replace(tzinfo=dt_timezone.utc)
+    coincidencia = _RE_HORA_LDAP.match(str(valor))
+    if coincidencia is None:
+        return None
+    return datetime.strptime(coincidencia.group(1), '%Y%m%d%H%M%S').replace(tzinfo=dt_timezone.utc)
+
+
+def _entrada(atributos, ahora):
+    uid = str(_primero(atributos.get('uid'))).strip()
+    if not uid:
+        return None
+    datos = {
+        'cn': str(_primero(atributos.get('cn'))),
+        'sn': str(_primero(atributos.get('sn'))),
+        'correo': str(_primero(atributos.get('Correo'))),
+        'ci': str(_primero(atributos.get('CI'))).strip(),
+        'cod_area': str(_primero(atributos.get('CodigoDelArea'))),
+        'cod_dependencia': str(_primero(atributos.get('CodigoDeDependencia'))),
+    }
+    return EntradaDirectorio(
+        uid=uid, **datos,
+        es_baja=str(_primero(atributos.get('EsBaja'))).strip().upper() == 'TRUE',
+        busqueda=normalizar(f"{datos['cn']} {datos['sn']} {uid} {datos['ci']} {datos['correo']}")[:800],
+        modificado=_hora_ldap(atributos.get('modifyTimestamp')),
+        sincronizado=ahora,
+    )
+
+
+@dataclass
+class Resultado:
+    completo: bool = False
+    leidas: int = 0
+    creadas: int = 0
+    actualizadas: int = 0
+    borradas: int = 0
+
+
+def _escribir(lote, resultado):
+    existentes = set(EntradaDirectorio.objects.filter(uid__in=[e.uid for e in lote]).values_list('uid', flat=True))
+    EntradaDirectorio.objects.bulk_create(lote, update_conflicts=True, unique_fields=['uid'], update_fields=CAMPOS)
+    resultado.creadas += len(lote) - len(existentes)
+    resultado.actualizadas += len(existentes)
+
+
+def sincronizar(completo=False):
+    """Actualiza la copia local desde el directorio y devuelve un ``Resultado``"""
+    desde = None
+    if not completo:
+        desde = EntradaDirectorio.objects.aggregate(ultima=Max('modificado'))['ultima']
+    resultado = Resultado(completo=desde is None)
+    filtro = FILTRO
+    if desde is not None:
+        filtro = f"(&{FILTRO}(modifyTimestamp>={desde.astimezone(dt_timezone.utc):%Y%m%d%H%M%S}Z))"
+
+    ahora = timezone.now()
+    lote = {}
+    with ldap_client.conexion() as conn:
+        respuestas = conn.extend.standard.paged_search(
+            settings.LDAP_CONFIG['USER_BASE'], filtro, attributes=ATRIBUTOS, paged_size=LOTE, generator=True,
+        )
+        for respuesta in respuestas:
+            if respuesta.get('type') != 'searchResEntry':
+                continue
+            entrada = _entrada(respuesta['attributes'], ahora)
+            if entrada is None:
+                continue
+            resultado.leidas += 1
+            lote[entrada.uid] = entrada
+            if len(lote) >= LOTE:
+                _escribir(list(lote.values()), resultado)
+                lote = {}
+    if lote:
+        _escribir(list(lote.values()), resultado)
+
+    if resultado.completo:
+        # Las que no se vieron en esta pasada ya no están en el directorio
+        resultado.borradas, _ = EntradaDirectorio.objects.filter(sincronizado__lt=ahora).delete()
+    if resultado.leidas or resultado.borradas:
+        sesion.invalidar_directorio()
+    logger.info(f"Directorio sincronizado ({'completo' if resultado.completo else f'desde {desde}'}): "
+                f"{resultado.leidas} leídas, {resultado.creadas} nuevas, {resultado.actualizadas} actualizadas, "
+                f"{resultado.borradas} borradas")
+    return resultado
+
+
+def obtener(uid):
+    return EntradaDirectorio.objects.filter(uid=uid).first()
+
+
+def buscar(texto, limite=LIMITE, incluir_bajas=False):
+    """Entradas que coinciden con ``texto`` (uid, CI, nombre o correo), las de prefijo primero"""
+    termino = normalizar(texto)
+    if not termino:
+        return []
+    qs = EntradaDirectorio.objects.all()
+    if not incluir_bajas:
+        qs = qs.filter(es_baja=False)
+
+    encontradas = list(
+        qs.filter(Q(uid__startswith=termino) | Q(ci__startswith=termino) | Q(busqueda__startswith=termino))
+        .order_by('uid')[:limite]
+    )
+    if len(encontradas) >= limite or len(termino) < MINIMO_DIFUSA:
+        return encontradas
+
+    resto = qs.exclude(pk__in=[e.pk for e in encontradas])
+    if connections[qs.db].vendor == 'postgresql':
+        resto = (resto.filter(Q(busqueda__contains=termino) | Q(TrigramSimilar(F('busqueda'), Value(termino))))
+                 .annotate(similitud=TrigramSimilarity('busqueda', Value(termino)))
+                 .order_by('-similitud', 'uid'))
+    else:
+        resto = resto.filter(busqueda__contains=termino).order_by('uid')
+    return encontradas + list(resto[:limite - len(encontradas)])
+
+
+def como_dict(entrada):
+    return {
+        'uid': entrada.uid,
+        'cn': entrada.cn,
+        'sn': entrada.sn,
+        'email': entrada.correo,
+        'ci': entrada.ci,
+        'codarea': entrada.cod_area,
+        'dependencia': entrada.cod_dependencia,
+        'baja': entrada.es_baja,
+    }
+
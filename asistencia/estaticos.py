@@ -0,0 +1,212 @@
+# estaticos.py
+"""
+Pipeline de archivos estáticos.
+
+``collectstatic`` (con ``EstaticosStorage``):
+  1. Concatena los paquetes de ``STATIC_BUNDLES`` (CSS y JS que carga ``base.html``)
+     reescribiendo las ``url()`` relativas de los CSS y convirtiendo los JSON en
+     variables globales (``window.DATATABLES_ES``), de modo que la traducción de
+     DataTables viaja dentro del paquete en lugar de pedirse en cada página.
+  2. Añade el hash del contenido a cada nombre (``ManifestStaticFilesStorage``).
+  3. Genera variantes ``.gz`` y, si está instalado el paquete ``brotli``, ``.br``.
+
+``ServirEstaticosMiddleware`` sirve ``STATIC_ROOT`` desde el propio proceso,
+negociando ``Accept-Encoding`` y con ``Cache-Control: immutable`` a un año para
+los nombres con hash. Detrás de nginx se consigue lo mismo con::
+
+    location /static/ {
+        alias /ruta/a/staticfiles/;
+        gzip_static on;
+        brotli_static on;  # módulo ngx_brotli
+        location ~ "\\.[0-9a-f]{12}\\." { add_header Cache-Control "public, max-age=31536000, immutable"; }
+    }
+"""
+import gzip
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli solo se generan variantes gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.map', '.ttf', '.eot')
+TAMANO_MINIMO_COMPRESION = 512
+RE_HASH = re.compile(r'\.[0-9a-f]{12}\.')
+RE_SOURCE_MAP = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.MULTILINE)
+RE_CSS_URL = re.compile(r'url\(\s*(["\']?)(?!data:|https?:|/|#)([^"\')]+)\1\s*\)')
+
+
+def bundles():
+    return getattr(settings, 'STATIC_BUNDLES', {})
+
+
+def bundles_activos():
+    """En desarrollo se sirven los archivos sueltos; en producción los paquetes"""
+    return getattr(settings, 'STATIC_BUNDLES_ENABLED', not settings.DEBUG)
+
+
+def fuente(entrada):
+    """Una entrada del paquete es una ruta o una tupla (ruta.json, variable_global)"""
+    return entrada if isinstance(entrada, tuple) else (entrada, None)
+
+
+def json_como_js(contenido, variable):
+    return f"window.{variable} = {json.dumps(json.loads(contenido), ensure_ascii=False, separators=(',', ':'))};"
+
+
+def _reescribir_urls_css(css, origen, destino):
+    dir_origen = posixpath.dirname(origen)
+    dir_destino = posixpath.dirname(destino)
+
+    def reemplazar(m):
+        ruta, _, sufijo = m.group(2).partition('?')
+        absoluta = posixpath.normpath(posixpath.join(dir_origen, ruta))
+        relativa = posixpath.relpath(absoluta, dir_destino)
+        return f'url("{relativa}{"?" + sufijo if sufijo else ""}")'
+
+    return RE_CSS_URL.sub(reemplazar, css)
+
+
+def construir_bundle(nombre, entradas, leer):
+    """Concatena las ``entradas`` del paquete ``nombre``; ``leer(ruta)`` devuelve el texto"""
+    partes = []
+    for entrada in entradas:
+        ruta, variable = fuente(entrada)
+        contenido = leer(ruta)
+        if variable:
+            contenido = json_como_js(contenido, variable)
+        else:
+            contenido = RE_SOURCE_MAP.sub('', contenido)
+            if nombre.endswith('.css'):
+                contenido = _reescribir_urls_css(contenido, ruta, nombre)
+        partes.append(f"/* {ruta} */\n{contenido}")
+    separador = '\n' if nombre.endswith('.css') else '\n;\n'
+    return separador.join(partes)
+
+
+def comprimir(ruta):
+    """Escribe ``ruta.gz`` (y ``ruta.br``) junto al archivo si merece la pena"""
+    if not ruta.endswith(EXTENSIONES_COMPRIMIBLES) or os.path.getsize(ruta) < TAMANO_MINIMO_COMPRESION:
+        return
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    comprimido = gzip.compress(datos, compresslevel=9, mtime=0)
+    if len(comprimido) < len(datos):
+        with open(ruta + '.gz', 'wb') as f:
+            f.write(comprimido)
+    if brotli is not None:
+        comprimido = brotli.compress(datos, quality=11)
+        if len(comprimido) < len(datos):
+            with open(ruta + '.br', 'wb') as f:
+                f.write(comprimido)
+
+
+class EstaticosStorage(ManifestStaticFilesStorage):
+
+    def hashed_name(self, name, content=None, filename=None):
+        # Las referencias a archivos que no se distribuyen (fuentes de iconos,
+        # source maps) se dejan sin hash en lugar de abortar collectstatic.
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError as e:
+            logger.warning(f"Estático sin hash: {e}")
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        for nombre, entradas in bundles().items():
+            def leer(ruta):
+                with self.open(ruta) as f:
+                    return f.read().decode('utf-8')
+            if self.exists(nombre):
+                self.delete(nombre)
+            self._save(nombre, ContentFile(construir_bundle(nombre, entradas, leer).encode('utf-8')))
+            paths[nombre] = (self, nombre)
+
+        procesados = set()
+        for original, procesado, ok in super().post_process(paths, dry_run, **options):
+            if not isinstance(ok, Exception):
+                procesados.add(original)
+                if procesado:
+                    procesados.add(procesado)
+            yield original, procesado, ok
+
+        for nombre in procesados:
+            comprimir(self.path(nombre))
+
+
+class ServirEstaticosMiddleware:
+    """
+    Sirve ``STATIC_ROOT`` con variantes precomprimidas y caché de larga duración.
+    Solo actúa si ``SERVIR_ESTATICOS`` está activo; si no, deja pasar la petición.
+    """
+    CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+    CACHE_CORTA = 'public, max-age=3600'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activo = getattr(settings, 'SERVIR_ESTATICOS', False) and settings.STATIC_ROOT
+        self.prefijo = '/' + settings.STATIC_URL.lstrip('/')
+
+    def __call__(self, request):
+        if not self.activo or not request.path.startswith(self.prefijo) or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.servir(request, request.path[len(self.prefijo):]) or self.get_response(request)
+
+    def servir(self, request, nombre):
+        try:
+            ruta = safe_join(settings.STATIC_ROOT, nombre)
+        except Exception:
+            return None
+        if not os.path.isfile(ruta):
+            return None
+
+        stat = os.stat(ruta)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            return HttpResponseNotModified()
+
+        tipo, _ = mimetypes.guess_type(ruta)
+        aceptadas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        codificacion = None
+        for sufijo, nombre_codificacion in (('.br', 'br'), ('.gz', 'gzip')):
+            if nombre_codificacion in aceptadas and os.path.isfile(ruta + sufijo):
+                ruta += sufijo
+                codificacion = nombre_codificacion
+                break
+
+        response = FileResponse(open(ruta, 'rb'), content_type=tipo or 'application/octet-stream')
+        if codificacion:
+            response['Content-Encoding'] = codificacion
+        response['Content-Length'] = os.path.getsize(ruta)
+        response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = self.CACHE_INMUTABLE if RE_HASH.search(nombre) else self.CACHE_CORTA
+        return response
+
+
+def leer_fuente(ruta):
+    """Lee un estático de desarrollo con los finders (sin collectstatic)"""
+    encontrado = finders.find(ruta)
+    if not encontrado:
+        raise FileNotFoundError(ruta)
+    with open(encontrado, encoding='utf-8') as f:
+        return f.read()
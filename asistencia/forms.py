@@ -1,11 +1,15 @@
 # forms.py
 from django import forms
+from django.conf import settings
 from django.db.models import F
 from django.contrib.auth.forms import AuthenticationForm
 from django.core.exceptions import ValidationError
-from .models import ResponsableArea, Area, Incidencia
+from .models import ResponsableArea, Area, Incidencia, Estado, Trabajador
+from .instantaneas import meses_cerrados
 from django.contrib.auth.models import User
+import calendar
 import re
+from datetime import date
 
 
 class LDAPAuthenticationForm(AuthenticationForm):
@@ -314,6 +318,10 @@ class AsignacionRapidaForm(forms.Form):
 
 
 class IncidenciaForm(forms.ModelForm):
+    # Versión que veía el editor (concurrencia optimista, ver edicion.py); sin ella
+    # no se sabe si el cambio pisa el de otro usuario y se rechaza
+    version = forms.IntegerField(min_value=1, widget=forms.HiddenInput)
+
     class Meta:
         model = Incidencia
         fields = ['estado']
@@ -332,4 +340,230 @@ class FiltroFechaForm(forms.Form):
     fecha_fin = forms.DateField(
         label='Fecha fin',
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
-    )
\ No newline at end of file
+    )
+
+
+class ImportarIncidenciasForm(forms.Form):
+    archivo = forms.FileField(
+        label='Archivo',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+    sobrescribir = forms.BooleanField(
+        required=False,
+        label='Sobrescribir existentes',
+        help_text='Reemplaza el estado de las incidencias que ya estén registradas',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    estado_predeterminado = forms.ChoiceField(
+        required=False,
+        label='Estado predeterminado',
+        help_text='Se asigna a las filas sin estado',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    segundo_plano = forms.BooleanField(
+        required=False,
+        label='Procesar en segundo plano',
+        help_text='Para archivos grandes: se sigue el avance en la página de la tarea',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['estado_predeterminado'].choices = [('', '---------')] + [
+            (e.clave_id, e.clave) for e in Estado.objects.order_by('clave_id')
+        ]
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError('Formatos aceptados: CSV y XLSX.')
+        if archivo.size > settings.IMPORTACION_MAX_MB * 1024 * 1024:
+            raise ValidationError(f"El archivo supera {settings.IMPORTACION_MAX_MB} MB.")
+        return archivo
+
+    def clean_estado_predeterminado(self):
+        clave_id = self.cleaned_data.get('estado_predeterminado')
+        if not clave_id:
+            return None
+        return Estado.objects.filter(clave_id=clave_id).values_list('id', flat=True).first()
+
+
+MESES = [
+    (1, 'Enero'), (2, 'Febrero'), (3, 'Marzo'), (4, 'Abril'), (5, 'Mayo'), (6, 'Junio'),
+    (7, 'Julio'), (8, 'Agosto'), (9, 'Septiembre'), (10, 'Octubre'), (11, 'Noviembre'), (12, 'Diciembre'),
+]
+DIAS_SEMANA = [
+    (1, 'Lunes'), (2, 'Martes'), (3, 'Miércoles'), (4, 'Jueves'), (5, 'Viernes'), (6, 'Sábado'), (7, 'Domingo'),
+]
+
+
+class ReporteMensualForm(forms.Form):
+    """Informe mensual imprimible de un área y sus descendientes; sin área, todas (solo staff)"""
+    mes = forms.DateField(
+        label='Mes',
+        input_formats=['%Y-%m'],
+        widget=forms.DateInput(attrs={'type': 'month', 'class': 'form-control'}, format='%Y-%m')
+    )
+    area = forms.ModelChoiceField(
+        queryset=Area.objects.all(),
+        label='Área',
+        help_text='Incluye todas sus áreas descendientes',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    def __init__(self, *args, area_ids=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if area_ids is None:
+            self.fields['area'].required = False
+            self.fields['area'].empty_label = 'Todas las áreas (paquete ZIP)'
+        else:
+            self.fields['area'].queryset = Area.objects.filter(pk__in=area_ids)
+
+    def clean_mes(self):
+        return self.cleaned_data['mes'].replace(day=1)
+
+
+class RangoDiasForm(forms.Form):
+    """
+    Asignación de un estado a varios trabajadores durante un rango de fechas
+    (ver rangos.py). ``area_ids``: áreas que el usuario puede modificar
+    (``None`` = todas). En ``cleaned_data`` quedan ``trabajadores`` (ids),
+    ``desde`` y ``hasta``.
+    """
+    area = forms.ModelChoiceField(
+        queryset=Area.objects.all(),
+        label='Área',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    estado_predeterminado = forms.ModelChoiceField(
+        queryset=Estado.objects.all(),
+        label='Estado',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    sobrescribir_existentes = forms.BooleanField(
+        required=False,
+        label='Sobrescribir incidencias existentes',
+        help_text='Sin marcar solo se reemplazan asistencias, sábados y domingos',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    excluir_fines_semana = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Excluir sábados y domingos',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    excluir_festivos = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Excluir días festivos',
+        help_text='Festivos configurados en FESTIVOS',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    dias_excluir = forms.TypedMultipleChoiceField(
+        required=False,
+        choices=DIAS_SEMANA,
+        coerce=int,
+        label='Excluir días de la semana',
+        help_text='Días que no se asignan aunque estén en el rango',
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'})
+    )
+    empleados = forms.CharField(
+        label='Empleados (CI)',
+        help_text='Un carnet de identidad por línea; puede ir seguido del nombre',
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 12, 'placeholder': '85010112345 Juan Pérez'})
+    )
+    tipo_rango = forms.ChoiceField(
+        choices=[('rango_fechas', 'Rango de fechas'), ('mes_completo', 'Mes completo')],
+        initial='rango_fechas',
+        label='Tipo de rango',
+        widget=forms.RadioSelect(attrs={'class': 'form-check-input'})
+    )
+    fecha_inicio = forms.DateField(
+        required=False,
+        label='Fecha inicio',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    fecha_fin = forms.DateField(
+        required=False,
+        label='Fecha fin',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    mes = forms.TypedChoiceField(
+        required=False,
+        choices=[('', '---------')] + MESES,
+        coerce=int,
+        empty_value=None,
+        label='Mes',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    año = forms.IntegerField(
+        required=False,
+        min_value=2000,
+        max_value=2100,
+        label='Año',
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+
+    def __init__(self, *args, area_ids=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.area_ids = area_ids
+        if area_ids is not None:
+            self.fields['area'].queryset = Area.objects.filter(id__in=area_ids)
+        if not self.is_bound:
+            self.fields['año'].initial = date.today().year
+            self.fields['mes'].initial = date.today().month
+
+    def clean_empleados(self):
+        cis = []
+        for linea in self.cleaned_data['empleados'].splitlines():
+            partes = linea.split()
+            if not partes:
+                continue
+            if not partes[0].isdigit():
+                raise ValidationError(f"La línea {linea.strip()!r} no empieza con un carnet de identidad.")
+            if partes[0] not in cis:
+                cis.append(partes[0])
+        maximo = settings.RANGOS['MAX_TRABAJADORES']
+        if len(cis) > maximo:
+            raise ValidationError(f"Como máximo {maximo} empleados por operación.")
+        return cis
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('tipo_rango') == 'mes_completo':
+            mes, anio = cleaned_data.get('mes'), cleaned_data.get('año')
+            if not mes or not anio:
+                raise ValidationError('Seleccione el mes y el año.')
+            cleaned_data['desde'] = date(anio, mes, 1)
+            cleaned_data['hasta'] = date(anio, mes, calendar.monthrange(anio, mes)[1])
+        else:
+            desde, hasta = cleaned_data.get('fecha_inicio'), cleaned_data.get('fecha_fin')
+            if not desde or not hasta:
+                raise ValidationError('Indique la fecha de inicio y la de fin.')
+            if hasta < desde:
+                self.add_error('fecha_fin', 'La fecha fin debe ser posterior a la fecha inicio.')
+                return cleaned_data
+            cleaned_data['desde'], cleaned_data['hasta'] = desde, hasta
+
+        cerrados = meses_cerrados(cleaned_data['desde'], cleaned_data['hasta'])
+        if cerrados:
+            raise ValidationError(f"El rango incluye meses cerrados: "
+                                  f"{', '.join(f'{m:%Y-%m}' for m in sorted(cerrados))}.")
+
+        area, cis = cleaned_data.get('area'), cleaned_data.get('empleados')
+        if area and cis:
+            # Trabajadores del área o de sus hijas directas, como en tabla_incidencias
+            areas = [area.pk, *Area.objects.filter(unidad_padre=area.cod_area).values_list('id', flat=True)]
+            if self.area_ids is not None:
+                areas = [a for a in areas if a in self.area_ids]
+            encontrados = dict(Trabajador.objects.filter(ci__in=cis, area_id__in=areas).values_list('ci', 'id'))
+            faltan = [ci for ci in cis if ci not in encontrados]
+            if faltan:
+                self.add_error('empleados', f"No pertenecen al área: {', '.join(faltan)}")
+            cleaned_data['trabajadores'] = [encontrados[ci] for ci in cis if ci in encontrados]
+
+            dias = (cleaned_data['hasta'] - cleaned_data['desde']).days + 1
+            maximo = settings.RANGOS['MAX_CELDAS']
+            if len(cis) * dias > maximo:
+                raise ValidationError(f"El rango supera {maximo} celdas (empleados x días).")
+        return cleaned_data
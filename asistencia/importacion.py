@@ -0,0 +1,287 @@
+# importacion.py
+"""
+Importación de incidencias desde exportaciones de relojes o biométricos (CSV o XLSX).
+
+El archivo se recorre fila a fila sin cargarlo entero en memoria. ``ci`` y
+``estado`` se resuelven contra diccionarios precargados y las filas válidas se
+escriben en lotes de ``LOTE`` con un único ``INSERT ... ON CONFLICT`` por lote
+sobre ``(trabajador, fecha_asistencia)``. El upsert es condicional, como el
+UPDATE de edicion.py: una fila existente solo se actualiza si su ``version``
+sigue siendo la leída al clasificar el lote. Las filas que otro usuario cambió
+(o creó) entretanto no se pisan y se cuentan como ``conflictos``. Cada lote va
+en su propia transacción junto con su registro de cambios; si el archivo
+resulta ilegible a mitad de camino, los lotes anteriores quedan escritos.
+
+Columnas reconocidas (por nombre, en cualquier orden): ``ci`` (o ``carnet``),
+``fecha`` y, opcionalmente, ``estado`` con la clave o su descripción. Las filas
+de meses cerrados se rechazan como errores.
+"""
+import csv
+import io
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cambios, instantaneas
+from .models import Estado, Incidencia, Trabajador
+
+try:
+    import openpyxl
+except ImportError:  # Opcional: sin openpyxl solo se aceptan archivos CSV
+    openpyxl = None
+
+LOTE = 2000
+MAX_ERRORES = 200  # errores conservados para mostrar; el resto solo se cuenta
+COLUMNAS = {'ci': ('ci', 'carnet', 'no_ci'), 'fecha': ('fecha', 'fecha_asistencia'), 'estado': ('estado', 'clave')}
+FORMATOS_FECHA = ('%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d')
+
+# PostgreSQL y SQLite (3.35+). Las filas que no cumplen el WHERE no vuelven en el RETURNING
+SQL_UPSERT = (
+    "INSERT INTO {tabla} ({area}, {trabajador}, {estado}, {fecha_asistencia}, {version}, {actualizado}) "
+    "VALUES {valores} "
+    "ON CONFLICT ({trabajador}, {fecha_asistencia}) DO UPDATE SET {estado} = EXCLUDED.{estado}, "
+    "{version} = EXCLUDED.{version}, {actualizado} = EXCLUDED.{actualizado} "
+    "WHERE {tabla}.{version} = EXCLUDED.{version} - 1 "
+    "RETURNING {id}, {trabajador}, {fecha_asistencia}"
+)
+
+
+class ArchivoNoValido(Exception):
+    """El archivo no se puede leer o no tiene las columnas necesarias."""
+
+
+@dataclass
+class Resultado:
+    filas: int = 0
+    creadas: int = 0
+    actualizadas: int = 0
+    sin_cambios: int = 0
+    omitidas: int = 0  # ya existían y no se pidió sobrescribir
+    conflictos: int = 0  # otro usuario las cambió mientras se importaba; no se pisan
+    total_errores: int = 0
+    errores: list = field(default_factory=list)  # (fila, mensaje)
+
+    def error(self, fila, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append((fila, mensaje))
+
+
+def _filas_csv(archivo):
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    yield from csv.reader(texto, dialecto)
+
+
+def _filas_xlsx(archivo):
+    if openpyxl is None:
+        raise ArchivoNoValido('Para importar archivos XLSX debe instalarse openpyxl')
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        for fila in libro.active.iter_rows(values_only=True):
+            yield ['' if v is None else v for v in fila]
+    finally:
+        libro.close()
+
+
+def _leer_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()
+    try:
+        return date.fromisoformat(texto[:10])
+    except ValueError:
+        pass
+    if len(texto) == 10 and texto[2] == texto[5] and texto[2] in '/-':
+        # dd/mm/aaaa, el formato habitual de los relojes; evita strptime en cada fila
+        try:
+            return date(int(texto[6:]), int(texto[3:5]), int(texto[:2]))
+        except ValueError:
+            raise ValueError(f"Fecha no válida: {texto!r}")
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto[:10], formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Fecha no válida: {texto!r}")
+
+
+def _indices(cabecera):
+    nombres = [str(c).strip().lower() for c in cabecera]
+    indices = {}
+    for columna, alias in COLUMNAS.items():
+        for nombre in alias:
+            if nombre in nombres:
+                indices[columna] = nombres.index(nombre)
+                break
+    faltan = {'ci', 'fecha'} - set(indices)
+    if faltan:
+        raise ArchivoNoValido(f"Faltan columnas: {', '.join(sorted(faltan))}")
+    return indices
+
+
+def _estados():
+    """Clave y descripción (en minúsculas) -> id de Estado"""
+    estados = {}
+    for pk, clave, clave_id in Estado.objects.values_list('id', 'clave', 'clave_id'):
+        estados.setdefault(clave.strip().lower(), pk)
+        estados[clave_id.strip().lower()] = pk
+    return estados
+
+
+def _por_fecha(claves):
+    """Filtro exacto de pares (trabajador_id, fecha): un término por fecha distinta"""
+    por_fecha = {}
+    for trabajador_id, fecha in claves:
+        por_fecha.setdefault(fecha, []).append(trabajador_id)
+    filtro = Q()
+    for fecha, trabajadores in por_fecha.items():
+        filtro |= Q(fecha_asistencia=fecha, trabajador_id__in=trabajadores)
+    return filtro
+
+
+def _escribir_lote(lote, sobrescribir, resultado):
+    """``lote``: {(trabajador_id, fecha): (area_id, estado_id)}"""
+    existentes = {
+        (t, f): (pk, e, v)
+        for pk, t, f, e, v in Incidencia.objects.filter(_por_fecha(lote)).order_by()
+        .values_list('id', 'trabajador_id', 'fecha_asistencia', 'estado_id', 'version')
+    }
+
+    nuevas, modificadas = [], []
+    for (trabajador_id, fecha), (area_id, estado_id) in lote.items():
+        actual = existentes.get((trabajador_id, fecha))
+        if actual is not None and actual[1] == estado_id:
+            resultado.sin_cambios += 1
+        elif actual is not None and not sobrescribir:
+            resultado.omitidas += 1
+        else:
+            incidencia = Incidencia(trabajador_id=trabajador_id, fecha_asistencia=fecha, area_id=area_id,
+                                    estado_id=estado_id, version=1 if actual is None else actual[2] + 1)
+            if actual is None:
+                nuevas.append(incidencia)
+            else:
+                modificadas.append((incidencia, actual))
+
+    escribir = nuevas + [i for i, _ in modificadas]
+    if not escribir:
+        return
+    alias = router.db_for_write(Incidencia)
+    with transaction.atomic(using=alias):
+        escritas = _upsert(escribir, alias)
+        creadas = [i for i in nuevas if (i.trabajador_id, i.fecha_asistencia) in escritas]
+        actualizadas = [(i, anterior) for i, (_, anterior, _) in modificadas
+                        if (i.trabajador_id, i.fecha_asistencia) in escritas]
+        for incidencia in creadas + [i for i, _ in actualizadas]:
+            incidencia.pk = escritas[(incidencia.trabajador_id, incidencia.fecha_asistencia)]
+        cambios.registrar_lote([(i, None) for i in creadas] + actualizadas, using=alias)
+    resultado.creadas += len(creadas)
+    resultado.actualizadas += len(actualizadas)
+    resultado.conflictos += len(escribir) - len(escritas)
+
+
+def _upsert(incidencias, alias):
+    """
+    Inserta o actualiza ``incidencias`` con el upsert condicional de ``SQL_UPSERT``.
+    Devuelve ``{(trabajador_id, fecha): id}`` de las filas escritas.
+    """
+    conexion = connections[alias]
+    ops = conexion.ops
+    columnas = {campo.name: ops.quote_name(campo.column) for campo in Incidencia._meta.concrete_fields}
+    sql = SQL_UPSERT.format(
+        tabla=ops.quote_name(Incidencia._meta.db_table),
+        valores=', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(incidencias)),
+        **columnas,
+    )
+    ahora = ops.adapt_datetimefield_value(timezone.now())
+    parametros = []
+    for i in incidencias:
+        parametros += [i.area_id, i.trabajador_id, i.estado_id, ops.adapt_datefield_value(i.fecha_asistencia),
+                       i.version, ahora]
+    with conexion.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        filas = cursor.fetchall()
+    # SQLite devuelve las fechas como texto
+    return {(t, f if isinstance(f, date) else date.fromisoformat(f)): pk for pk, t, f in filas}
+
+
+def importar(archivo, nombre, sobrescribir=False, estado_predeterminado=None, area_ids=None, progreso=None):
+    """
+    Importa ``archivo`` (objeto binario) y devuelve un ``Resultado``.
+
+    ``estado_predeterminado``: id de Estado para las filas sin estado.
+    ``area_ids``: si se indica, solo se aceptan trabajadores de esas áreas.
+    ``progreso(resultado)``: se llama tras escribir cada lote.
+    """
+    filas = _filas_xlsx(archivo) if nombre.lower().endswith('.xlsx') else _filas_csv(archivo)
+    try:
+        cabecera = next(filas)
+    except StopIteration:
+        raise ArchivoNoValido('El archivo está vacío')
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ArchivoNoValido(f"No se pudo leer el archivo: {e}")
+    indices = _indices(cabecera)
+
+    trabajadores_qs = Trabajador.objects.all()
+    if area_ids is not None:
+        trabajadores_qs = trabajadores_qs.filter(area_id__in=area_ids)
+    trabajadores = {ci.strip(): (pk, area_id) for pk, ci, area_id in trabajadores_qs.values_list('id', 'ci', 'area_id')}
+    estados = _estados()
+    cerrados = instantaneas.meses_cerrados()
+
+    resultado = Resultado()
+    lote = {}
+    try:
+        for numero, fila in enumerate(filas, start=2):
+            if not any(str(v).strip() for v in fila):
+                continue
+            resultado.filas += 1
+            try:
+                ci = str(fila[indices['ci']]).strip()
+                if ci.endswith('.0'):  # CI leído como número desde XLSX
+                    ci = ci[:-2]
+                trabajador = trabajadores.get(ci)
+                if trabajador is None:
+                    raise ValueError(f"Trabajador no encontrado o sin permiso: {ci!r}")
+                fecha = _leer_fecha(fila[indices['fecha']])
+                if fecha.replace(day=1) in cerrados:
+                    raise ValueError(f"El mes {fecha:%Y-%m} está cerrado")
+
+                clave = str(fila[indices['estado']]).strip() if 'estado' in indices and len(fila) > indices['estado'] else ''
+                if clave:
+                    estado_id = estados.get(clave.lower())
+                    if estado_id is None:
+                        raise ValueError(f"Estado desconocido: {clave!r}")
+                elif estado_predeterminado:
+                    estado_id = estado_predeterminado
+                else:
+                    raise ValueError('Fila sin estado y sin estado predeterminado')
+            except IndexError:
+                resultado.error(numero, 'Faltan columnas en la fila')
+                continue
+            except ValueError as e:
+                resultado.error(numero, str(e))
+                continue
+
+            # Si el archivo repite (trabajador, fecha) prevalece la última fila
+            lote[(trabajador[0], fecha)] = (trabajador[1], estado_id)
+            if len(lote) >= LOTE:
+                _escribir_lote(lote, sobrescribir, resultado)
+                lote = {}
+                if progreso:
+                    progreso(resultado)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ArchivoNoValido(f"No se pudo leer el archivo: {e}")
+    if lote:
+        _escribir_lote(lote, sobrescribir, resultado)
+    return resultado
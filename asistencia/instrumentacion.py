@@ -0,0 +1,175 @@
+# instrumentacion.py
+"""
+Medición por petición: tiempo total, consultas y tiempo de BD por alias,
+llamadas y tiempo de LDAP y tiempo de renderizado de plantillas.
+
+Solo se instrumenta una muestra de las peticiones (``INSTRUMENTACION['SAMPLE_RATE']``);
+en las demás el middleware no instala nada. Las peticiones medidas reciben una
+cabecera ``Server-Timing`` (visible en las herramientas del navegador) y las que
+superan el presupuesto de tiempo o de consultas se registran en el log con las
+sentencias SQL que más se repiten.
+"""
+import logging
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+CONFIG_DEFECTO = {
+    'SAMPLE_RATE': 0.01,
+    'BUDGET_MS': 1000,
+    'BUDGET_QUERIES': 100,
+    'TOP_SQL': 5,
+    'SERVER_TIMING': True,
+}
+
+
+def config(clave):
+    return getattr(settings, 'INSTRUMENTACION', {}).get(clave, CONFIG_DEFECTO[clave])
+
+
+_RE_IN = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_RE_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+def huella_sql(sql):
+    """Normaliza una sentencia para agrupar las que solo difieren en valores"""
+    sql = _RE_IN.sub('(%s, ...)', sql)
+    sql = _RE_LITERAL.sub('?', sql)
+    return _RE_ESPACIOS.sub(' ', sql).strip()
+
+
+class Medicion:
+    """Acumulador de una petición"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.total = 0.0
+        self.db = defaultdict(lambda: [0, 0.0])  # alias -> [consultas, segundos]
+        self.sql = Counter()
+        self.ldap = [0, 0.0]
+        self.plantillas = 0.0
+
+    @property
+    def consultas(self):
+        return sum(n for n, _ in self.db.values())
+
+    def server_timing(self):
+        partes = [f'total;dur={self.total * 1000:.1f}']
+        for alias, (n, segundos) in self.db.items():
+            partes.append(f'db-{alias};dur={segundos * 1000:.1f};desc="{n} consultas"')
+        if self.ldap[0]:
+            partes.append(f'ldap;dur={self.ldap[1] * 1000:.1f};desc="{self.ldap[0]} llamadas"')
+        if self.plantillas:
+            partes.append(f'plantillas;dur={self.plantillas * 1000:.1f}')
+        return ', '.join(partes)
+
+
+def medicion_actual():
+    return _medicion_actual.get()
+
+
+def registrar_ldap(segundos):
+    """Lo llama ``ldap_client`` por cada conexión al directorio"""
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.ldap[0] += 1
+        medicion.ldap[1] += segundos
+
+
+def _envoltorio_db(alias, medicion):
+    def envoltorio(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            datos = medicion.db[alias]
+            datos[0] += 1
+            datos[1] += time.perf_counter() - inicio
+            medicion.sql[huella_sql(sql)] += 1
+    return envoltorio
+
+
+_plantillas_instaladas = False
+
+
+def instalar_medicion_plantillas():
+    """Envuelve el render del backend de plantillas de Django (una sola vez por proceso)"""
+    global _plantillas_instaladas
+    if _plantillas_instaladas:
+        return
+    from django.template.backends.django import Template
+
+    render_original = Template.render
+
+    def render(self, *args, **kwargs):
+        medicion = _medicion_actual.get()
+        if medicion is None:
+            return render_original(self, *args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, *args, **kwargs)
+        finally:
+            medicion.plantillas += time.perf_counter() - inicio
+
+    Template.render = render
+    _plantillas_instaladas = True
+
+
+class InstrumentacionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instalar_medicion_plantillas()
+        # Alias cuyo backend se puede cargar (p. ej. sin el driver ODBC no se mide 'sqlserver')
+        self.alias = []
+        for alias in connections:
+            try:
+                connections[alias]
+            except Exception as e:
+                logger.info(f"Instrumentación sin el alias {alias}: {e}")
+            else:
+                self.alias.append(alias)
+
+    def __call__(self, request):
+        if random.random() >= config('SAMPLE_RATE'):
+            return self.get_response(request)
+
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            with ExitStack() as stack:
+                for alias in self.alias:
+                    stack.enter_context(connections[alias].execute_wrapper(_envoltorio_db(alias, medicion)))
+                response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+            medicion.total = time.perf_counter() - medicion.inicio
+
+        if config('SERVER_TIMING'):
+            response['Server-Timing'] = medicion.server_timing()
+        self.revisar_presupuesto(request, medicion)
+        return response
+
+    def revisar_presupuesto(self, request, medicion):
+        total_ms = medicion.total * 1000
+        if total_ms <= config('BUDGET_MS') and medicion.consultas <= config('BUDGET_QUERIES'):
+            return
+        vista = request.resolver_match.view_name if request.resolver_match else request.path
+        repetidas = '\n'.join(
+            f"    {n}x {sql[:300]}" for sql, n in medicion.sql.most_common(config('TOP_SQL')) if n > 1
+        )
+        logger.warning(
+            f"Petición lenta {request.method} {vista}: {total_ms:.0f} ms, "
+            f"{medicion.consultas} consultas, {medicion.server_timing()}"
+            + (f"\n  Consultas más repetidas:\n{repetidas}" if repetidas else '')
+        )
@@ -0,0 +1,266 @@
+# ldap_client.py
+"""
+Acceso centralizado al directorio LDAP.
+
+Todas las llamadas al directorio (autenticación, actualización de usuarios y
+sincronizaciones) pasan por ``conexion()``, que aplica los timeouts
+configurados y un circuit breaker: tras varios fallos de comunicación seguidos
+el circuito se abre y las llamadas fallan de inmediato con ``LDAPNoDisponible``
+hasta que, pasado el tiempo de recuperación, una llamada de prueba confirma que
+el servidor volvió a responder.
+"""
+import hashlib
+import hmac
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from ldap3 import Server, Connection, NONE, SYNC
+from ldap3.core.exceptions import LDAPBindError, LDAPCommunicationError, LDAPResponseTimeoutError
+from ldap3.utils.dn import escape_rdn
+
+from . import instrumentacion, metricas
+
+logger = logging.getLogger(__name__)
+
+# Errores que indican que el servidor no responde (no que rechazó la petición)
+ERRORES_COMUNICACION = (LDAPCommunicationError, LDAPResponseTimeoutError, socket.timeout, ConnectionError)
+
+
+class LDAPNoDisponible(Exception):
+    """El circuito está abierto y el directorio no se consulta."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker en memoria del proceso.
+
+    cerrado     -> las llamadas pasan; se cuentan los fallos consecutivos.
+    abierto     -> las llamadas fallan de inmediato durante ``tiempo_recuperacion``.
+    semiabierto -> se deja pasar una única llamada de prueba; si funciona se
+                   cierra el circuito y si falla se vuelve a abrir.
+    """
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, umbral_fallos=5, tiempo_recuperacion=30):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_recuperacion = tiempo_recuperacion
+        self._lock = threading.Lock()
+        self._estado = self.CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+
+    @property
+    def estado(self):
+        return self._estado
+
+    def permitir(self):
+        """Lanza ``LDAPNoDisponible`` si la llamada no debe llegar al servidor."""
+        with self._lock:
+            if self._estado == self.CERRADO:
+                return
+            if self._estado == self.ABIERTO:
+                if time.monotonic() - self._abierto_desde < self.tiempo_recuperacion:
+                    raise LDAPNoDisponible('Directorio LDAP no disponible (circuito abierto)')
+                self._estado = self.SEMIABIERTO
+                self._prueba_en_curso = False
+            # Semiabierto: solo una llamada de prueba a la vez
+            if self._prueba_en_curso:
+                raise LDAPNoDisponible('Directorio LDAP no disponible (probando recuperación)')
+            self._prueba_en_curso = True
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._estado != self.CERRADO:
+                logger.info("Directorio LDAP recuperado, circuito cerrado")
+            self._estado = self.CERRADO
+            self._fallos = 0
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba_en_curso = False
+            if self._estado == self.SEMIABIERTO or self._fallos >= self.umbral_fallos:
+                if self._estado != self.ABIERTO:
+                    logger.error(f"Directorio LDAP sin respuesta tras {self._fallos} fallos, circuito abierto")
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+
+    def liberar(self):
+        """Termina la llamada sin veredicto sobre el servidor (error ajeno a la comunicación)"""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def reiniciar(self):
+        with self._lock:
+            self._estado = self.CERRADO
+            self._fallos = 0
+            self._prueba_en_curso = False
+
+
+def _config(clave, defecto=None):
+    return settings.LDAP_CONFIG.get(clave, defecto)
+
+
+breaker = CircuitBreaker(
+    umbral_fallos=int(_config('FAILURE_THRESHOLD', 5)),
+    tiempo_recuperacion=float(_config('RECOVERY_TIMEOUT', 30)),
+)
+
+_servidor = None
+_estrategia = SYNC
+
+
+def servidor():
+    """Devuelve el ``Server`` de ldap3 compartido por el proceso."""
+    global _servidor
+    if _servidor is None:
+        # get_info=NONE: no se descarga el esquema en cada conexión
+        _servidor = Server(
+            _config('SERVER_URI'),
+            get_info=NONE,
+            connect_timeout=float(_config('CONNECT_TIMEOUT', 5)),
+        )
+    return _servidor
+
+
+def configurar_servidor(server, estrategia=SYNC):
+    """
+    Sustituye el servidor del proceso, por ejemplo por uno con la estrategia
+    ``MOCK_SYNC`` de ldap3 en benchmarks y pruebas de carga.
+    """
+    global _servidor, _estrategia
+    _servidor = server
+    _estrategia = estrategia
+    breaker.reiniciar()
+
+
+@contextmanager
+def conexion(usuario=None, password=None):
+    """
+    Abre una conexión enlazada al directorio protegida por el circuit breaker.
+
+    Sin credenciales se usa la cuenta de servicio de ``LDAP_CONFIG``. Un
+    ``LDAPBindError`` (credenciales rechazadas) no cuenta como fallo del servidor.
+    """
+    if usuario is None:
+        usuario = _config('BIND_DN')
+        password = _config('BIND_PASSWORD')
+
+    try:
+        breaker.permitir()
+    except LDAPNoDisponible:
+        metricas.incrementar('sisga_ldap_fallos_total', tipo='circuito')
+        raise
+    inicio = time.perf_counter()
+    try:
+        conn = Connection(
+            servidor(),
+            user=usuario,
+            password=password,
+            client_strategy=_estrategia,
+            receive_timeout=float(_config('RECEIVE_TIMEOUT', 10)),
+        )
+        # bind() explícito en lugar de auto_bind: las estrategias MOCK no lo ejecutan
+        if not conn.bind():
+            raise LDAPBindError(f"Bind rechazado: {conn.result.get('description') if conn.result else ''}")
+    except LDAPBindError:
+        breaker.registrar_exito()
+        instrumentacion.registrar_ldap(time.perf_counter() - inicio)
+        metricas.incrementar('sisga_ldap_fallos_total', tipo='rechazo')
+        raise
+    except ERRORES_COMUNICACION:
+        breaker.registrar_fallo()
+        instrumentacion.registrar_ldap(time.perf_counter() - inicio)
+        metricas.incrementar('sisga_ldap_fallos_total', tipo='comunicacion')
+        raise
+    except BaseException:
+        # Cualquier otro error (o la interrupción del worker) no dice nada del servidor, pero debe soltar la llamada
+        # de prueba: si no, en semiabierto el circuito no volvería a dejar pasar ninguna
+        breaker.liberar()
+        instrumentacion.registrar_ldap(time.perf_counter() - inicio)
+        raise
+    metricas.observar('sisga_ldap_duracion_segundos', time.perf_counter() - inicio, operacion='bind')
+
+    try:
+        yield conn
+    except ERRORES_COMUNICACION:
+        breaker.registrar_fallo()
+        metricas.incrementar('sisga_ldap_fallos_total', tipo='comunicacion')
+        raise
+    except BaseException:
+        breaker.liberar()
+        raise
+    else:
+        breaker.registrar_exito()
+    finally:
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+        instrumentacion.registrar_ldap(time.perf_counter() - inicio)
+
+
+def user_dn(username):
+    """Construye el DN de un usuario del directorio"""
+    return _config('USER_DN_TEMPLATE', 'uid={username},' + _config('USER_BASE')).format(
+        username=escape_rdn(username)
+    )
+
+
+def autenticar(username, password):
+    """
+    Verifica las credenciales contra LDAP.
+
+    Devuelve ``False`` si el servidor las rechaza. Los errores de comunicación
+    y ``LDAPNoDisponible`` se propagan para que el llamador no los confunda con
+    una contraseña incorrecta.
+    """
+    try:
+        with conexion(user_dn(username), password):
+            return True
+    except LDAPBindError:
+        return False
+
+
+# Caché negativa -------------------------------------------------------------
+
+def _clave_usuario(username):
+    return f"ldap:desconocido:{hashlib.sha256(username.encode()).hexdigest()}"
+
+
+def _clave_credencial(username, password):
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(),
+        f"{username}\0{password}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+    return f"ldap:fallido:{digest}"
+
+
+def es_usuario_desconocido(username):
+    return cache.get(_clave_usuario(username)) is not None
+
+
+def marcar_usuario_desconocido(username):
+    cache.set(_clave_usuario(username), 1, int(_config('UNKNOWN_USER_TTL', 60)))
+
+
+def olvidar_usuario_desconocido(username):
+    cache.delete(_clave_usuario(username))
+
+
+def es_credencial_fallida(username, password):
+    return cache.get(_clave_credencial(username, password)) is not None
+
+
+def marcar_credencial_fallida(username, password):
+    cache.set(_clave_credencial(username, password), 1, int(_config('FAILED_LOGIN_TTL', 300)))
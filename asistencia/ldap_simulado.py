@@ -0,0 +1,60 @@
+# ldap_simulado.py
+"""
+Directorio LDAP en memoria (estrategia ``MOCK_SYNC`` de ldap3) para benchmarks
+y pruebas de carga. Reemplaza el servidor de ``ldap_client`` en el proceso
+actual; nada sale a la red.
+"""
+from django.conf import settings
+from ldap3 import Server, Connection, MOCK_SYNC
+
+from . import ldap_client
+
+
+def instalar_directorio_simulado(usuarios, password, trabajadores=()):
+    """
+    Crea el directorio simulado y lo instala en ``ldap_client``.
+
+    ``usuarios``: nombres de usuario que pueden autenticarse con ``password``.
+    ``trabajadores``: diccionarios con las claves que devuelve
+    ``obtener_usuarios_ldap3`` (uid, cn, sn, email, area, ci, dependencia, codarea)
+    y, opcionalmente, ``modificado`` (``modifyTimestamp``, GeneralizedTime).
+    """
+    servidor = Server('ldap-simulado')
+    conn = Connection(servidor, client_strategy=MOCK_SYNC)
+    config = settings.LDAP_CONFIG
+
+    conn.strategy.add_entry(config['BIND_DN'], {'userPassword': config['BIND_PASSWORD'], 'sn': 'admin'})
+
+    vistos = set()
+    for t in trabajadores:
+        vistos.add(t['uid'])
+        conn.strategy.add_entry(ldap_client.user_dn(t['uid']), {
+            'objectClass': ['Trabajador'],
+            'userPassword': password,
+            'uid': t['uid'],
+            'cn': t.get('cn') or t['uid'],
+            'sn': t.get('sn') or '-',
+            'Correo': t.get('email') or f"{t['uid']}@uh.cu",
+            'Area': t.get('area') or '-',
+            'CI': t.get('ci') or '-',
+            'CodigoDeDependencia': t.get('dependencia') or '-',
+            'CodigoDelArea': t.get('codarea') or '-',
+            'Assets': t.get('assets') or '-',
+            'EsBaja': t.get('baja') or 'False',
+            'modifyTimestamp': t.get('modificado') or '20260101000000Z',
+        })
+
+    for username in usuarios:
+        if username in vistos:
+            continue
+        conn.strategy.add_entry(ldap_client.user_dn(username), {
+            'objectClass': ['Trabajador'],
+            'userPassword': password,
+            'uid': username,
+            'cn': username,
+            'sn': '-',
+            'Correo': f"{username}@uh.cu",
+        })
+
+    ldap_client.configurar_servidor(servidor, MOCK_SYNC)
+    return servidor
@@ -0,0 +1,202 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from asistencia.ldap_simulado import instalar_directorio_simulado
+from asistencia.models import Area, Incidencia, ResponsableArea, Trabajador, Estado
+
+PASSWORD_BENCH = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = ('Mide tiempo y número de consultas de los caminos críticos sobre los datos '
+            'de seed_organizacion y escribe el resultado en JSON para comparar entre commits')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--escenarios', nargs='*', help='Subconjunto de escenarios a ejecutar')
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto stdout)')
+        parser.add_argument('--comparar', help='JSON de una ejecución anterior para mostrar diferencias')
+        parser.add_argument('--confirmar', action='store_true',
+                            help='Ejecutar aunque DEBUG esté desactivado (la base de datos no es de pruebas)')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['confirmar']:
+            raise CommandError('benchmark crea usuarios y modifica incidencias: solo se ejecuta con DEBUG '
+                               'o con --confirmar sobre una base de datos de pruebas')
+        area = (Area.objects.annotate(n=Count('trabajador')).filter(responsablearea__activo=True)
+                .order_by('-n').first())
+        if area is None or not Estado.objects.filter(pk=Estado.ASISTENCIA).exists():
+            raise CommandError('No hay datos: ejecute antes manage.py seed_organizacion')
+        self.area = area
+        self.responsable = ResponsableArea.objects.filter(area=area, activo=True).select_related('usuario').first().usuario
+        self.staff, _ = User.objects.get_or_create(username='bench.staff', defaults={'is_staff': True})
+
+        instalar_directorio_simulado(
+            [self.responsable.username],
+            PASSWORD_BENCH,
+            trabajadores=[
+                {'uid': f"t{t.ci}", 'cn': t.nombre, 'sn': t.apellidos, 'ci': t.ci,
+                 'dependencia': area.cod_area, 'codarea': area.cod_area, 'area': area.nombre}
+                for t in Trabajador.objects.filter(area=area)
+            ],
+        )
+
+        escenarios = {
+            'login': self.escenario_login,
+            'tabla_incidencias': self.escenario_tabla_incidencias,
+            'editar_incidencia': self.escenario_editar_incidencia,
+            'responsable_area_list': self.escenario_responsable_area_list,
+            'sync_trabajadores_ldap': self.escenario_sync_trabajadores,
+            'sync_areas_ldap': self.escenario_sync_areas,
+        }
+        seleccion = options['escenarios'] or list(escenarios)
+        desconocidos = set(seleccion) - set(escenarios)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+        resultados = []
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for nombre in seleccion:
+                resultados.append(self.medir(nombre, escenarios[nombre], options['repeticiones']))
+
+        informe = {
+            'commit': self.commit_actual(),
+            'fecha': date.today().isoformat(),
+            'python': platform.python_version(),
+            'vendor': connections['default'].vendor,
+            'datos': {
+                'areas': Area.objects.count(),
+                'trabajadores': Trabajador.objects.count(),
+                'incidencias': Incidencia.objects.count(),
+                'trabajadores_area_medida': Trabajador.objects.filter(area=area).count(),
+            },
+            'resultados': resultados,
+        }
+
+        salida = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                f.write(salida)
+        else:
+            self.stdout.write(salida)
+
+        if options['comparar']:
+            self.comparar(options['comparar'], resultados)
+
+    def medir(self, nombre, escenario, repeticiones):
+        tiempos = []
+        consultas = []
+        for _ in range(repeticiones):
+            preparar = escenario()
+            with CaptureQueriesContext(connections['default']) as ctx:
+                inicio = time.perf_counter()
+                preparar()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(len(ctx.captured_queries))
+        tiempos.sort()
+        self.stderr.write(f"{nombre:<24} p50 {statistics.median(tiempos):9.1f} ms  consultas {max(consultas)}")
+        return {
+            'escenario': nombre,
+            'repeticiones': repeticiones,
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'media_ms': round(statistics.mean(tiempos), 2),
+            'min_ms': round(tiempos[0], 2),
+            'max_ms': round(tiempos[-1], 2),
+            'consultas': max(consultas),
+        }
+
+    # Cada escenario prepara su estado y devuelve la llamada que se mide
+
+    def escenario_login(self):
+        cliente = Client()
+
+        def ejecutar():
+            respuesta = cliente.post(reverse('login'), {'username': self.responsable.username,
+                                                       'password': PASSWORD_BENCH})
+            assert respuesta.status_code == 302, respuesta.status_code
+        return ejecutar
+
+    def _cliente(self, usuario):
+        cliente = Client()
+        cliente.force_login(usuario, backend='asistencia.authentication_backends.LDAP3Backend')
+        return cliente
+
+    def escenario_tabla_incidencias(self):
+        cliente = self._cliente(self.responsable)
+        hoy = date.today()
+        url = reverse('tabla_incidencias', args=[self.area.pk])
+        datos = {'fecha_inicio': hoy.replace(day=1).isoformat(), 'fecha_fin': hoy.isoformat()}
+
+        def ejecutar():
+            respuesta = cliente.get(url, datos)
+            assert respuesta.status_code == 200, respuesta.status_code
+        return ejecutar
+
+    def escenario_editar_incidencia(self):
+        cliente = self._cliente(self.responsable)
+        incidencia = Incidencia.objects.filter(area=self.area).order_by('-fecha_asistencia').first()
+        url = reverse('editar_incidencia', args=[incidencia.pk])
+
+        version = [incidencia.version]
+
+        def ejecutar():
+            respuesta = cliente.post(url, {'estado': Estado.ASISTENCIA, 'version': version[0]},
+                                     HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            assert respuesta.status_code == 200, respuesta.status_code
+            version[0] = respuesta.json()['version']
+        return ejecutar
+
+    def escenario_responsable_area_list(self):
+        cliente = self._cliente(self.staff)
+
+        def ejecutar():
+            respuesta = cliente.get(reverse('responsable_area_list'))
+            assert respuesta.status_code == 200, respuesta.status_code
+        return ejecutar
+
+    def escenario_sync_trabajadores(self):
+        from asistencia.trabajadores import obtener_usuarios_ldap3
+
+        def ejecutar():
+            assert obtener_usuarios_ldap3(self.area.cod_area)
+        return ejecutar
+
+    def escenario_sync_areas(self):
+        from asistencia.Areas import obtener_areas
+
+        def ejecutar():
+            assert obtener_areas()
+        return ejecutar
+
+    def commit_actual(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except Exception:
+            return None
+
+    def comparar(self, ruta, resultados):
+        with open(ruta, encoding='utf-8') as f:
+            anteriores = {r['escenario']: r for r in json.load(f)['resultados']}
+        for r in resultados:
+            previo = anteriores.get(r['escenario'])
+            if not previo:
+                continue
+            delta = (r['p50_ms'] - previo['p50_ms']) / previo['p50_ms'] * 100 if previo['p50_ms'] else 0
+            self.stderr.write(
+                f"{r['escenario']:<24} p50 {previo['p50_ms']:9.1f} -> {r['p50_ms']:9.1f} ms ({delta:+.0f}%)  "
+                f"consultas {previo['consultas']} -> {r['consultas']}"
+            )
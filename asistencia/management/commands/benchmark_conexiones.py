@@ -0,0 +1,124 @@
+import json
+import math
+import statistics
+import time
+
+from django.core import signals
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from asistencia import nomina
+
+
+class Command(BaseCommand):
+    help = ('Mide el coste de conexión por petición: conexión nueva en cada petición '
+            'frente a conexiones persistentes / pool, para cada alias de base de datos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=200)
+        parser.add_argument('--alias', nargs='*', default=['default', nomina.ALIAS])
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        iteraciones = options['iteraciones']
+        if iteraciones < 1:
+            raise CommandError('--iteraciones debe ser al menos 1')
+        resultados = []
+
+        for alias in options['alias']:
+            try:
+                if alias == nomina.ALIAS:
+                    resultados += self.medir_nomina(iteraciones)
+                else:
+                    resultados += self.medir_django(alias, iteraciones)
+            except Exception as e:
+                resultados.append({'alias': alias, 'modo': 'error', 'error': str(e)})
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+
+        for r in resultados:
+            if 'error' in r:
+                self.stdout.write(self.style.ERROR(f"{r['alias']}: {r['error']}"))
+                continue
+            self.stdout.write(
+                f"{r['alias']:<10} {r['modo']:<28} media {r['media_ms']:8.3f} ms  "
+                f"p95 {r['p95_ms']:8.3f} ms  conexiones abiertas {r['conexiones']}"
+            )
+
+    def _resumen(self, alias, modo, tiempos, conexiones):
+        tiempos_ms = sorted(t * 1000 for t in tiempos)
+        return {
+            'alias': alias,
+            'modo': modo,
+            'iteraciones': len(tiempos_ms),
+            'media_ms': statistics.mean(tiempos_ms),
+            # Rango más cercano: el valor en la posición ceil(0,95·n)
+            'p95_ms': tiempos_ms[math.ceil(0.95 * len(tiempos_ms)) - 1],
+            'conexiones': conexiones,
+        }
+
+    def medir_django(self, alias, iteraciones):
+        """
+        Simula el ciclo de una petición (request_started / request_finished),
+        que es cuando Django decide si cierra o reutiliza la conexión.
+        """
+        conexion = connections[alias]
+        original = conexion.settings_dict['CONN_MAX_AGE']
+        resultados = []
+        modos = [('nueva por petición', 0), ('persistente', original or 60)]
+        if conexion.settings_dict['OPTIONS'].get('pool'):
+            modos = [('pool psycopg', 0)]
+
+        try:
+            for modo, max_age in modos:
+                conexion.close()
+                conexion.settings_dict['CONN_MAX_AGE'] = max_age
+                tiempos = []
+                abiertas = 0
+                for _ in range(iteraciones):
+                    inicio = time.perf_counter()
+                    signals.request_started.send(sender=self.__class__)
+                    if conexion.connection is None:
+                        abiertas += 1
+                    with conexion.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                        cursor.fetchall()
+                    signals.request_finished.send(sender=self.__class__)
+                    tiempos.append(time.perf_counter() - inicio)
+                resultados.append(self._resumen(alias, modo, tiempos, abiertas))
+        finally:
+            conexion.settings_dict['CONN_MAX_AGE'] = original
+            conexion.close()
+        return resultados
+
+    def medir_nomina(self, iteraciones):
+        """Conexión ad hoc por consulta frente al pool de ``asistencia.nomina``."""
+        tiempos = []
+        for _ in range(iteraciones):
+            inicio = time.perf_counter()
+            conn = nomina.nueva_conexion()
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+            conn.close()
+            tiempos.append(time.perf_counter() - inicio)
+        resultados = [self._resumen(nomina.ALIAS, 'nueva por consulta', tiempos, iteraciones)]
+
+        creadas = [0]
+
+        def fabrica():
+            creadas[0] += 1
+            return nomina.nueva_conexion()
+
+        pool = nomina.PoolNomina(fabrica, max_size=1)
+        tiempos = []
+        for _ in range(iteraciones):
+            inicio = time.perf_counter()
+            pool.consultar('SELECT 1')
+            tiempos.append(time.perf_counter() - inicio)
+        pool.cerrar_todas()
+        resultados.append(self._resumen(nomina.ALIAS, 'pool', tiempos, creadas[0]))
+        return resultados
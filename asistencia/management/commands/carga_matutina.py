@@ -0,0 +1,206 @@
+import json
+import math
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+
+from asistencia.ldap_simulado import instalar_directorio_simulado
+from asistencia.models import ResponsableArea, Estado
+
+PASSWORD_CARGA = 'carga'
+RE_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+# Cada celda editable: id de la incidencia y la versión que se está viendo (campo oculto del formulario)
+RE_EDITAR = re.compile(r'action="/editar/(\d+)/".*?name="version" value="(\d+)"', re.S)
+
+
+class _Silencioso(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Resultados:
+    """Latencias y errores por endpoint, compartidos entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+
+    def registrar(self, endpoint, segundos, ok):
+        with self._lock:
+            self.latencias[endpoint].append(segundos * 1000)
+            if not ok:
+                self.errores[endpoint] += 1
+
+    def resumen(self, duracion):
+        filas = []
+        for endpoint, tiempos in self.latencias.items():
+            tiempos = sorted(tiempos)
+            n = len(tiempos)
+            filas.append({
+                'endpoint': endpoint,
+                'peticiones': n,
+                'errores': self.errores[endpoint],
+                'tasa_error': round(self.errores[endpoint] / n, 4),
+                'rps': round(n / duracion, 2),
+                'p50_ms': round(statistics.median(tiempos), 1),
+                # Percentiles por rango más cercano: el valor en la posición ceil(p·n)
+                'p95_ms': round(tiempos[math.ceil(0.95 * n) - 1], 1),
+                'p99_ms': round(tiempos[math.ceil(0.99 * n) - 1], 1),
+            })
+        return filas
+
+
+class UsuarioVirtual:
+    """Sesión de un responsable: login -> dashboard -> tabla de su área -> ediciones de celdas"""
+
+    def __init__(self, base, username, password, area_id, ediciones, pausa, resultados, rnd):
+        self.base = base
+        self.username = username
+        self.password = password
+        self.area_id = area_id
+        self.ediciones = ediciones
+        self.pausa = pausa
+        self.resultados = resultados
+        self.rnd = rnd
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def pedir(self, endpoint, ruta, datos=None, fallo_si_termina_en=None):
+        """
+        HTML de la respuesta o ``None`` si falló. Con ``fallo_si_termina_en``, acabar
+        (tras las redirecciones) en esa ruta también es un fallo: un login rechazado
+        responde 200 con el formulario de nuevo.
+        """
+        cuerpo = urllib.parse.urlencode(datos).encode() if datos is not None else None
+        inicio = time.perf_counter()
+        ok = True
+        html = ''
+        try:
+            with self.opener.open(self.base + ruta, data=cuerpo, timeout=60) as respuesta:
+                html = respuesta.read().decode('utf-8', 'replace')
+                ok = respuesta.status < 400
+                if fallo_si_termina_en and urllib.parse.urlsplit(respuesta.geturl()).path == fallo_si_termina_en:
+                    ok = False
+        except (urllib.error.URLError, OSError):
+            ok = False
+        self.resultados.registrar(endpoint, time.perf_counter() - inicio, ok)
+        if self.pausa:
+            time.sleep(self.rnd.uniform(0, self.pausa))
+        return html if ok else None
+
+    def ejecutar(self):
+        html = self.pedir('login_form', '/accounts/login/')
+        if html is None:
+            return
+        csrf = RE_CSRF.search(html)
+        html = self.pedir('login', '/accounts/login/', {
+            'csrfmiddlewaretoken': csrf.group(1) if csrf else '',
+            'username': self.username,
+            'password': self.password,
+        }, fallo_si_termina_en=settings.LOGIN_URL)
+        if html is None:
+            return
+        self.pedir('dashboard', '/')
+
+        hoy = date.today()
+        html = self.pedir('tabla_incidencias', f"/incidencias/{self.area_id}/?" + urllib.parse.urlencode({
+            'fecha_inicio': hoy.replace(day=1).isoformat(), 'fecha_fin': hoy.isoformat(),
+        }))
+        if not html:
+            return
+        celdas = RE_EDITAR.findall(html)
+        csrf = RE_CSRF.search(html)
+        for incidencia_id, version in self.rnd.sample(celdas, min(self.ediciones, len(celdas))):
+            self.pedir('editar_incidencia', f"/editar/{incidencia_id}/", {
+                'csrfmiddlewaretoken': csrf.group(1) if csrf else '',
+                'estado': Estado.ASISTENCIA,
+                'version': version,
+            })
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga de la hora pico (08:00): muchos responsables inician sesión y abren '
+            'su tabla de incidencias a la vez. Arranca la aplicación en este proceso contra la BD '
+            'configurada y un LDAP simulado en memoria, y reporta p50/p95/p99, throughput y errores')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=200, help='Responsables distintos que inician sesión')
+        parser.add_argument('--concurrencia', type=int, default=50)
+        parser.add_argument('--ediciones', type=int, default=5, help='Celdas editadas por usuario')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Pausa máxima entre peticiones (s)')
+        parser.add_argument('--puerto', type=int, default=0, help='Puerto del servidor local (0 = libre)')
+        parser.add_argument('--url', help='Probar un servidor ya levantado en lugar de arrancar uno local')
+        parser.add_argument('--password', default=PASSWORD_CARGA, help='Contraseña de los usuarios con --url')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        asignaciones = list(
+            ResponsableArea.objects.filter(activo=True).select_related('usuario')
+            .order_by('usuario__username')[:options['usuarios']]
+        )
+        if not asignaciones:
+            raise CommandError('No hay responsables: ejecute antes manage.py seed_organizacion')
+
+        servidor = None
+        if options['url']:
+            base = options['url'].rstrip('/')
+            password = options['password']
+        else:
+            password = PASSWORD_CARGA
+            instalar_directorio_simulado({a.usuario.username for a in asignaciones}, password)
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, '127.0.0.1']
+            servidor = ThreadedWSGIServer(('127.0.0.1', options['puerto']), _Silencioso)
+            servidor.set_app(get_wsgi_application())
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            base = f"http://127.0.0.1:{servidor.server_address[1]}"
+            self.stderr.write(f"Servidor local en {base}")
+
+        resultados = Resultados()
+        rnd = random.Random(options['semilla'])
+        usuarios = [
+            UsuarioVirtual(base, a.usuario.username, password, a.area_id, options['ediciones'],
+                           options['pausa'], resultados, random.Random(rnd.random()))
+            for a in asignaciones
+        ]
+
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrencia']) as pool:
+                list(pool.map(lambda u: u.ejecutar(), usuarios))
+        finally:
+            duracion = time.perf_counter() - inicio
+            if servidor is not None:
+                servidor.shutdown()
+
+        filas = resultados.resumen(duracion)
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'usuarios': len(usuarios),
+                'concurrencia': options['concurrencia'],
+                'duracion_s': round(duracion, 2),
+                'endpoints': filas,
+            }, indent=2))
+            return
+
+        self.stdout.write(f"{len(usuarios)} usuarios, concurrencia {options['concurrencia']}, {duracion:.1f} s")
+        self.stdout.write(f"{'endpoint':<20}{'peticiones':>11}{'errores':>9}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for f in filas:
+            self.stdout.write(
+                f"{f['endpoint']:<20}{f['peticiones']:>11}{f['errores']:>9}{f['rps']:>9}"
+                f"{f['p50_ms']:>9}{f['p95_ms']:>9}{f['p99_ms']:>9}"
+            )
@@ -0,0 +1,60 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asistencia import cierre, instantaneas
+from asistencia.models import CierreArea, CierreMes
+
+
+class Command(BaseCommand):
+    help = ('Cierra un mes: materializa, valida y resume cada área en paralelo por subárboles, '
+            'marca el mes como cerrado y exporta sus ausencias a NOMINA. Si se interrumpe, '
+            'al repetirlo continúa desde las áreas pendientes. Con --reabrir el mes vuelve a admitir cambios')
+
+    def add_arguments(self, parser):
+        parser.add_argument('mes', help='Mes a cerrar (AAAA-MM)')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count(),
+                            help='Procesos en paralelo (por defecto, uno por núcleo)')
+        parser.add_argument('--sin-exportar', action='store_true', help='Cerrar sin escribir en NOMINA')
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Descartar los puntos de control y procesar todas las áreas de nuevo')
+        parser.add_argument('--reabrir', action='store_true',
+                            help='Reabrir un mes cerrado: descarta sus instantáneas y admite cambios hasta el próximo cierre')
+
+    def handle(self, *args, **options):
+        try:
+            inicio = datetime.strptime(options['mes'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('El mes debe tener el formato AAAA-MM')
+
+        if options['reabrir']:
+            if instantaneas.reabrir(inicio) is None:
+                raise CommandError(f"{options['mes']} no está cerrado")
+            self.stdout.write(self.style.SUCCESS(f"{options['mes']} reabierto"))
+            return
+
+        existente = CierreMes.objects.filter(mes=inicio).first()
+        if existente and existente.estado == CierreMes.CERRADO:
+            # Completa las instantáneas si la ejecución anterior se cortó al congelar
+            cierre.cerrar(inicio, options['procesos'])
+            self.stdout.write(f"{options['mes']} ya está cerrado ({existente.cerrado:%Y-%m-%d %H:%M})")
+            return
+        if existente and options['reiniciar']:
+            CierreArea.objects.filter(cierre=existente).delete()
+        elif existente:
+            self.stdout.write(f"Reanudando: {existente.areas.count()} áreas ya procesadas")
+
+        def progreso(hechos, total, resultado):
+            areas, creadas, sin_estado, segundos = resultado
+            self.stdout.write(f"[{hechos}/{total}] {areas} áreas, {creadas} incidencias creadas, "
+                              f"{sin_estado} sin estado ({segundos:.1f} s)")
+
+        try:
+            resultado = cierre.cerrar(inicio, options['procesos'], not options['sin_exportar'], progreso)
+        except cierre.MesNoValidado as e:
+            raise CommandError(f"{e}. Corríjalas y repita el comando: las áreas ya procesadas no se repiten")
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['mes']} cerrado: {resultado.areas.count()} áreas"
+            + ('' if resultado.exportado else ' (sin exportar a NOMINA)')
+        ))
@@ -0,0 +1,60 @@
+import csv
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asistencia import conciliacion
+
+
+class Command(BaseCommand):
+    help = ('Concilia las ausencias de un mes entre SisGA y NOMINA comparando resúmenes por '
+            'trabajador y detallando solo los trabajadores que no coinciden')
+
+    def add_arguments(self, parser):
+        parser.add_argument('mes', help='Mes a conciliar (AAAA-MM)')
+        parser.add_argument('--area', help='Código de área: concilia solo su subárbol')
+        parser.add_argument('--paralelo', type=int, default=4, help='Subárboles procesados a la vez')
+        parser.add_argument('--salida', help='Fichero del informe de discrepancias (.csv o .json)')
+
+    def handle(self, *args, **options):
+        try:
+            inicio = datetime.strptime(options['mes'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('El mes debe tener el formato AAAA-MM')
+
+        t0 = time.perf_counter()
+        informe = conciliacion.conciliar(inicio, options['area'], options['paralelo'])
+        duracion = time.perf_counter() - t0
+
+        self.stdout.write(
+            f"{options['mes']}: {informe.trabajadores} trabajadores con ausencias, {informe.coincidentes} "
+            f"coinciden, {informe.trabajadores_con_diferencias} con diferencias ({duracion:.1f} s)"
+        )
+        for cod_area, n in informe.por_area().items():
+            self.stdout.write(f"  {cod_area or '(sin trabajador en SisGA)':<24}{n:>6}")
+
+        if options['salida']:
+            self.escribir(options['salida'], informe.discrepancias)
+            self.stdout.write(f"Informe escrito en {options['salida']}")
+        elif informe.discrepancias:
+            for d in informe.discrepancias[:50]:
+                self.stdout.write(f"  {d.cod_area or '-'} {d.ci} {d.fecha} SisGA={d.clave_sisga or '-'} "
+                                  f"NOMINA={d.clave_nomina or '-'}")
+            if len(informe.discrepancias) > 50:
+                self.stdout.write(f"  ... {len(informe.discrepancias) - 50} más (use --salida)")
+
+        if not informe.discrepancias:
+            self.stdout.write(self.style.SUCCESS('SisGA y NOMINA coinciden'))
+
+    def escribir(self, ruta, discrepancias):
+        campos = ['cod_area', 'ci', 'fecha', 'clave_sisga', 'clave_nomina']
+        filas = [[d.cod_area, d.ci, d.fecha.isoformat(), d.clave_sisga, d.clave_nomina] for d in discrepancias]
+        with open(ruta, 'w', encoding='utf-8', newline='') as f:
+            if ruta.endswith('.json'):
+                json.dump([dict(zip(campos, fila)) for fila in filas], f, ensure_ascii=False, indent=2)
+            else:
+                writer = csv.writer(f)
+                writer.writerow(campos)
+                writer.writerows(filas)
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asistencia import ausencias_nomina
+from asistencia.models import CierreMes
+
+
+class Command(BaseCommand):
+    help = ('Escribe en NOMINA las ausencias de un mes cerrado. Solo envía las diferencias con '
+            'lo ya exportado, por lo que puede repetirse sin duplicar filas')
+
+    def add_arguments(self, parser):
+        parser.add_argument('mes', help='Mes a exportar (AAAA-MM)')
+        parser.add_argument('--area', help='Código de área: exporta solo su subárbol')
+        parser.add_argument('--dry-run', action='store_true', help='Mostrar las diferencias sin escribir')
+        parser.add_argument('--detalle', action='store_true', help='Listar cada fila de las diferencias')
+        parser.add_argument('--lote', type=int, help='Filas por executemany')
+        parser.add_argument('--crear-tabla', action='store_true',
+                            help='Crear la tabla de destino (solo en bases de prueba)')
+        parser.add_argument('--forzar', action='store_true',
+                            help='Exportar aunque el mes no esté cerrado (los datos aún pueden cambiar)')
+
+    def handle(self, *args, **options):
+        try:
+            inicio = datetime.strptime(options['mes'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('El mes debe tener el formato AAAA-MM')
+
+        # Un mes abierto aún admite cambios; --dry-run no escribe y se permite
+        cerrado = CierreMes.objects.filter(mes=inicio, estado=CierreMes.CERRADO).exists()
+        if not cerrado and not options['forzar'] and not options['dry_run']:
+            raise CommandError(f"El mes {options['mes']} no está cerrado; ciérrelo con cerrar_mes o use --forzar")
+
+        if options['crear_tabla']:
+            ausencias_nomina.crear_tabla()
+
+        dif = ausencias_nomina.diferencias(inicio, options['area'])
+        self.stdout.write(
+            f"{options['mes']}: {len(dif.insertar)} a insertar, {len(dif.actualizar)} a actualizar, "
+            f"{len(dif.eliminar)} a eliminar, {dif.sin_cambios} sin cambios, {len(dif.conflictos)} en conflicto"
+        )
+        if options['detalle'] or options['dry_run']:
+            for ci, fecha, clave in dif.insertar:
+                self.stdout.write(f"+ {ci} {fecha} {clave}")
+            for ci, fecha, anterior, nueva in dif.actualizar:
+                self.stdout.write(f"~ {ci} {fecha} {anterior} -> {nueva}")
+            for ci, fecha, clave in dif.eliminar:
+                self.stdout.write(f"- {ci} {fecha} {clave}")
+        for ci, fecha, en_nomina, en_sisga in dif.conflictos:
+            self.stdout.write(self.style.WARNING(
+                f"! {ci} {fecha}: NOMINA tiene {en_nomina} cargada a mano, SisGA {en_sisga}"))
+
+        if options['dry_run'] or dif.vacia:
+            return
+        ausencias_nomina.aplicar(dif, options['lote'])
+        self.stdout.write(self.style.SUCCESS('Exportación completada'))
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from asistencia import cambios
+from asistencia.models import CambioIncidencia
+
+
+class Command(BaseCommand):
+    help = ('Elimina del registro de cambios de incidencias las filas más antiguas que la '
+            'retención (CAMBIOS["RETENCION_DIAS"]) o hasta un seq dado; con ambos límites, '
+            'solo las que cumplen los dos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int,
+                            help='Conservar los cambios de los últimos N días (por defecto '
+                                 'CAMBIOS["RETENCION_DIAS"] si no se indica --hasta-seq)')
+        parser.add_argument('--hasta-seq', type=int,
+                            help='Eliminar hasta este seq (p. ej. el mínimo confirmado por los consumidores)')
+        parser.add_argument('--lote', type=int, default=10000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        # Los cambios cuya numeración no llegó a ejecutarse (proceso terminado) no tienen seq
+        while cambios.numerar(lote=options['lote']):
+            pass
+        dias, hasta = options['dias'], options['hasta_seq']
+        if dias is None and hasta is None:
+            dias = settings.CAMBIOS['RETENCION_DIAS']
+        if dias is not None:
+            # Último seq anterior a la retención; cada límite recorta al otro
+            limite = timezone.now() - timedelta(days=dias)
+            antiguo = (CambioIncidencia.objects.filter(registrado__lt=limite, seq__isnull=False)
+                       .order_by('-seq').values_list('seq', flat=True).first())
+            hasta = antiguo if hasta is None or antiguo is None else min(hasta, antiguo)
+
+        if not hasta or hasta < 1:
+            self.stdout.write('Nada que podar')
+            return
+
+        if options['dry_run']:
+            n = CambioIncidencia.objects.filter(seq__lte=hasta).count()
+            self.stdout.write(f"Se eliminarían {n} cambios (seq <= {hasta})")
+            return
+
+        n = cambios.podar(hasta, options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Eliminados {n} cambios (seq <= {hasta})"))
@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+import threading
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from asistencia import tareas
+
+
+def _proceso(hilos, parar, tipos_admitidos, una_vez):
+    django.setup()
+    # Ctrl+C llega a todo el grupo de procesos: el padre decide y avisa con ``parar``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    tareas.ejecutar_proceso(hilos, parar, tipos_admitidos, una_vez)
+
+
+class Command(BaseCommand):
+    help = ('Ejecuta las tareas en segundo plano de la cola (tabla tarea) con varios procesos e hilos; '
+            'SIGTERM o Ctrl+C terminan las tareas en curso y salen')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=settings.TAREAS['PROCESOS'])
+        parser.add_argument('--hilos', type=int, default=settings.TAREAS['HILOS'], help='Hilos por proceso')
+        parser.add_argument('--tipos', help=f"Solo estos tipos, separados por comas ({', '.join(tareas.tipos())})")
+        parser.add_argument('--una-vez', action='store_true', help='Salir cuando la cola quede vacía')
+
+    def handle(self, *args, **options):
+        procesos, hilos = options['procesos'], options['hilos']
+        if procesos < 1 or hilos < 1:
+            raise CommandError('--procesos y --hilos deben ser al menos 1')
+        tipos_admitidos = [t.strip() for t in options['tipos'].split(',')] if options['tipos'] else None
+        desconocidos = set(tipos_admitidos or ()) - set(tareas.tipos())
+        if desconocidos:
+            raise CommandError(f"Tipos de tarea desconocidos: {', '.join(sorted(desconocidos))}")
+
+        self.stdout.write(f"{procesos} procesos × {hilos} hilos esperando tareas "
+                          f"({', '.join(tipos_admitidos or tareas.tipos())})")
+
+        if procesos == 1:
+            parar = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: parar.set())
+            try:
+                tareas.ejecutar_proceso(hilos, parar, tipos_admitidos, options['una_vez'])
+            except KeyboardInterrupt:
+                parar.set()
+            return
+
+        parar = multiprocessing.Event()
+        # Los hijos abren sus propias conexiones
+        connections.close_all()
+        # No son daemon: cerrar_mes reparte los subárboles en procesos hijos propios
+        hijos = [
+            multiprocessing.Process(target=_proceso, args=(hilos, parar, tipos_admitidos, options['una_vez']),
+                                    name=f'tareas-proceso-{n}')
+            for n in range(procesos)
+        ]
+        signal.signal(signal.SIGTERM, lambda *_: parar.set())
+        for hijo in hijos:
+            hijo.start()
+        try:
+            for hijo in hijos:
+                hijo.join()
+        except KeyboardInterrupt:
+            self.stdout.write('Terminando las tareas en curso...')
+            parar.set()
+            for hijo in hijos:
+                hijo.join()
+        self.stdout.write(self.style.SUCCESS('Trabajadores detenidos'))
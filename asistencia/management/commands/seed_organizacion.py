@@ -0,0 +1,186 @@
+import random
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from asistencia.models import Area, ResponsableArea, Trabajador, Estado, Incidencia
+
+# Catálogo sintético, solo con --estados-sinteticos (sin acceso a NOMINA): los tres estados que
+# asigna la tabla por defecto más claves de ausencia. Por defecto se usa el catálogo real: el
+# que ya tenga la base de datos o, si está vacía, el de RH_Claves_Ausencias de NOMINA.
+CATALOGO_ESTADOS = [
+    (Estado.ASISTENCIA, 'Asistencia', 'A'),
+    (Estado.SABADO, 'Sábado', 'S'),
+    (Estado.DOMINGO, 'Domingo', 'D'),
+    (112, 'Vacaciones', 'V'),
+    (113, 'Certificado médico', 'CM'),
+    (114, 'Licencia de maternidad', 'LM'),
+    (115, 'Ausencia justificada', 'AJ'),
+    (116, 'Ausencia injustificada', 'AI'),
+    (117, 'Licencia sin sueldo', 'LS'),
+    (118, 'Movilizado', 'MO'),
+    (119, 'Día feriado', 'F'),
+]
+
+NOMBRES = ['Ana', 'Luis', 'María', 'José', 'Carmen', 'Jorge', 'Elena', 'Pedro', 'Rosa', 'Carlos',
+           'Lucía', 'Miguel', 'Isabel', 'Raúl', 'Marta', 'Ernesto', 'Yamila', 'Osmany', 'Daymí', 'Yoel']
+APELLIDOS = ['Pérez', 'González', 'Rodríguez', 'Fernández', 'López', 'Martínez', 'Sánchez', 'Díaz',
+             'Hernández', 'García', 'Álvarez', 'Romero', 'Torres', 'Ramírez', 'Castro', 'Suárez']
+
+
+class Command(BaseCommand):
+    help = ('Genera una organización sintética a escala universitaria: árbol de áreas, '
+            'trabajadores, responsables, catálogo de estados y meses de incidencias')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--niveles', type=int, default=3, help='Profundidad del árbol de áreas')
+        parser.add_argument('--hijos', type=int, default=6, help='Áreas hijas por área')
+        parser.add_argument('--raices', type=int, default=4, help='Áreas raíz (facultades, direcciones)')
+        parser.add_argument('--trabajadores', type=int, default=5000)
+        parser.add_argument('--meses', type=int, default=3, help='Meses de incidencias hasta el mes actual')
+        parser.add_argument('--prob-ausencia', type=float, default=0.05)
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--estados-sinteticos', action='store_true',
+                            help='Crear un catálogo de estados inventado si la base de datos no tiene '
+                                 'estados (por defecto se cargan de NOMINA)')
+        parser.add_argument('--limpiar', action='store_true', help='Borrar antes los datos de asistencia')
+        parser.add_argument('--confirmar', action='store_true',
+                            help='Ejecutar aunque DEBUG esté desactivado (la base de datos no es de pruebas)')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['confirmar']:
+            raise CommandError('seed_organizacion escribe datos sintéticos (y con --limpiar borra los reales): '
+                               'solo se ejecuta con DEBUG o con --confirmar')
+        rnd = random.Random(options['semilla'])
+
+        if options['limpiar']:
+            Incidencia.objects.all().delete()
+            Trabajador.objects.all().delete()
+            ResponsableArea.objects.all().delete()
+            Area.objects.all().delete()
+            User.objects.filter(username__startswith='resp.').delete()
+
+        estados = self.crear_estados(options['estados_sinteticos'])
+        areas = self.crear_areas(options['raices'], options['hijos'], options['niveles'])
+        trabajadores = self.crear_trabajadores(areas, options['trabajadores'], rnd)
+        responsables = self.crear_responsables(areas)
+        incidencias = self.crear_incidencias(trabajadores, estados, options['meses'], options['prob_ausencia'], rnd)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Áreas: {len(areas)}  Trabajadores: {len(trabajadores)}  Responsables: {responsables}  "
+            f"Estados: {len(estados)}  Incidencias: {incidencias}"
+        ))
+
+    def crear_estados(self, sinteticos):
+        """Nunca modifica estados existentes: solo crea los que faltan"""
+        if not Estado.objects.exists():
+            if sinteticos:
+                catalogo = CATALOGO_ESTADOS
+            else:
+                catalogo = CATALOGO_ESTADOS[:3]
+                self.cargar_estados_nomina()
+        else:
+            catalogo = CATALOGO_ESTADOS[:3]
+        # Los estados por defecto de la tabla deben existir con sus IDs
+        for pk, clave, clave_id in catalogo:
+            Estado.objects.get_or_create(pk=pk, defaults={'clave': clave, 'clave_id': clave_id})
+        return list(Estado.objects.all())
+
+    def cargar_estados_nomina(self):
+        from asistencia import nomina
+        try:
+            filas = nomina.consultar("SELECT Desc_Clave, Id_Clave FROM RH_Claves_Ausencias;")
+        except Exception as e:
+            raise CommandError(f"No se pudo leer el catálogo de NOMINA ({e}); use --estados-sinteticos")
+        if not filas:
+            raise CommandError('NOMINA no devolvió claves de ausencia; use --estados-sinteticos')
+        for clave, clave_id in filas:
+            Estado.objects.get_or_create(clave_id=clave_id.strip(), defaults={'clave': clave.strip()})
+
+    def crear_areas(self, raices, hijos, niveles):
+        """Árbol por ``unidad_padre``: las raíces son su propio padre"""
+        nuevas = []
+        nivel = []
+        for i in range(raices):
+            cod = f"S{i + 1:02d}"
+            nuevas.append(Area(cod_area=cod, nombre=f"Área {cod}", unidad_padre=cod))
+            nivel.append(cod)
+        for _ in range(niveles - 1):
+            siguiente = []
+            for padre in nivel:
+                for j in range(hijos):
+                    cod = f"{padre}.{j + 1}"
+                    nuevas.append(Area(cod_area=cod, nombre=f"Área {cod}", unidad_padre=padre))
+                    siguiente.append(cod)
+            nivel = siguiente
+        existentes = set(Area.objects.values_list('cod_area', flat=True))
+        Area.objects.bulk_create([a for a in nuevas if a.cod_area not in existentes], batch_size=1000)
+        return list(Area.objects.filter(cod_area__in=[a.cod_area for a in nuevas]))
+
+    def crear_trabajadores(self, areas, total, rnd):
+        existentes = Trabajador.objects.filter(area__in=areas).count()
+        nuevos = [
+            Trabajador(
+                ci=f"{80000000000 + existentes + i}",
+                nombre=rnd.choice(NOMBRES),
+                apellidos=f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+                es_baja=False,
+                area=rnd.choice(areas),
+            )
+            for i in range(max(total - existentes, 0))
+        ]
+        Trabajador.objects.bulk_create(nuevos, batch_size=2000)
+        return list(Trabajador.objects.filter(area__in=areas))
+
+    def crear_responsables(self, areas):
+        """Un usuario responsable por área (resp.<cod_area>) con contraseña inutilizable (LDAP)"""
+        usuarios = {u.username: u for u in User.objects.filter(username__startswith='resp.')}
+        nuevos = []
+        for area in areas:
+            username = f"resp.{area.cod_area}"
+            if username not in usuarios:
+                usuario = User(username=username, first_name='Responsable', last_name=area.cod_area)
+                usuario.set_unusable_password()
+                nuevos.append(usuario)
+        User.objects.bulk_create(nuevos, batch_size=1000)
+        usuarios = {u.username: u for u in User.objects.filter(username__startswith='resp.')}
+        ResponsableArea.objects.bulk_create(
+            [ResponsableArea(usuario=usuarios[f"resp.{a.cod_area}"], area=a) for a in areas],
+            batch_size=1000, ignore_conflicts=True,
+        )
+        return len(areas)
+
+    def crear_incidencias(self, trabajadores, estados, meses, prob_ausencia, rnd):
+        hoy = date.today()
+        inicio = (hoy - relativedelta(months=meses - 1)).replace(day=1)
+        ausencias = [e for e in estados if e.pk not in (Estado.ASISTENCIA, Estado.SABADO, Estado.DOMINGO)]
+        dias = [inicio + timedelta(days=i) for i in range((hoy - inicio).days + 1)]
+
+        total = 0
+        lote = []
+        for trabajador in trabajadores:
+            for dia in dias:
+                if dia.weekday() == 5:
+                    estado_id = Estado.SABADO
+                elif dia.weekday() == 6:
+                    estado_id = Estado.DOMINGO
+                elif ausencias and rnd.random() < prob_ausencia:
+                    estado_id = rnd.choice(ausencias).pk
+                else:
+                    estado_id = Estado.ASISTENCIA
+                lote.append(Incidencia(area_id=trabajador.area_id, trabajador=trabajador,
+                                       estado_id=estado_id, fecha_asistencia=dia))
+            if len(lote) >= 5000:
+                total += self._guardar(lote)
+                lote = []
+        total += self._guardar(lote)
+        return total
+
+    def _guardar(self, lote):
+        with transaction.atomic():
+            Incidencia.objects.bulk_create(lote, batch_size=5000, ignore_conflicts=True)
+        return len(lote)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from asistencia import espejo_directorio
+from asistencia.ldap_client import ERRORES_COMUNICACION, LDAPNoDisponible
+
+
+class Command(BaseCommand):
+    help = ('Actualiza la copia local del directorio LDAP (ou=Trabajadores) con las entradas '
+            'modificadas desde la última sincronización')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Copiar todas las entradas y borrar las que ya no están en el directorio')
+
+    def handle(self, *args, **options):
+        try:
+            resultado = espejo_directorio.sincronizar(completo=options['completo'])
+        except (LDAPNoDisponible, *ERRORES_COMUNICACION) as e:
+            raise CommandError(f"Directorio LDAP no disponible: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Sincronización completa' if resultado.completo else 'Sincronización incremental'}: "
+            f"{resultado.leidas} entradas leídas, {resultado.creadas} nuevas, "
+            f"{resultado.actualizadas} actualizadas, {resultado.borradas} borradas"
+        ))
@@ -0,0 +1,373 @@
+# metricas.py
+"""
+Métricas de la aplicación en formato de exposición de Prometheus (``/metrics``).
+
+Cada proceso acumula en memoria contadores e histogramas (``incrementar`` y
+``observar``; un diccionario y un lock, sin E/S). Con varios workers, cada
+proceso que registró algo vuelca además su copia a ``METRICAS['DIRECTORIO']``
+como mucho cada ``INTERVALO`` segundos (un archivo JSON por proceso, escrito de
+forma atómica), y ``/metrics`` suma los archivos de todos: responda el worker
+que responda, se ven los totales. Al terminar, un proceso suma su copia al
+archivo ``terminados.json`` y borra la suya, para que los contadores no
+retrocedan sin que los archivos se acumulen; los de procesos que murieron sin
+hacerlo se suman igual al servir ``/metrics`` (como ``mark_process_dead`` de
+``prometheus_client``). Sin directorio configurado solo se ve el proceso que
+atiende la petición.
+
+Las métricas de estado (profundidad de la cola de tareas) se calculan al
+servirlas. El cociente de aciertos de cada caché sale de ``sisga_cache_total``
+por ``resultado``.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+CONTADOR = 'counter'
+HISTOGRAMA = 'histogram'
+
+LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FILAS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+DEFINICIONES = {
+    'sisga_peticion_duracion_segundos': (HISTOGRAMA, 'Duración de las peticiones por vista', LATENCIA),
+    'sisga_bd_consultas_total': (CONTADOR, 'Consultas SQL hechas durante peticiones, por alias', None),
+    'sisga_bd_duracion_segundos_total': (CONTADOR, 'Tiempo de las consultas SQL durante peticiones, por alias', None),
+    'sisga_ldap_duracion_segundos': (HISTOGRAMA, 'Duración de las operaciones LDAP (bind, búsqueda)', LATENCIA),
+    'sisga_ldap_fallos_total': (CONTADOR, 'Fallos LDAP: comunicación, circuito abierto o bind rechazado', None),
+    'sisga_cache_total': (CONTADOR, 'Consultas a cada caché por resultado', None),
+    'sisga_tabla_filas': (HISTOGRAMA, 'Filas (trabajadores) materializadas por tabla de incidencias', FILAS),
+    'sisga_tabla_celdas': (HISTOGRAMA, 'Celdas materializadas por tabla de incidencias', FILAS),
+    'sisga_tareas_cola': ('gauge', 'Tareas en segundo plano pendientes y en curso', None),
+}
+
+
+class Registro:
+    """Valores del proceso: ``{(nombre, etiquetas): valor}``; en histogramas, ``[cubetas..., suma, n]``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valores = {}
+
+    def incrementar(self, nombre, valor, etiquetas):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            self.valores[clave] = self.valores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, etiquetas):
+        limites = DEFINICIONES[nombre][2]
+        clave = (nombre, etiquetas)
+        with self._lock:
+            datos = self.valores.get(clave)
+            if datos is None:
+                datos = self.valores[clave] = [0] * (len(limites) + 2)
+            for i, limite in enumerate(limites):
+                if valor <= limite:
+                    datos[i] += 1
+            datos[-2] += valor
+            datos[-1] += 1
+
+    def copia(self):
+        with self._lock:
+            return [[nombre, list(etiquetas), list(v) if isinstance(v, list) else v]
+                    for (nombre, etiquetas), v in self.valores.items()]
+
+
+registro = Registro()
+_archivo = None
+_ultimo_volcado = 0.0
+
+
+def config(clave):
+    return settings.METRICAS[clave]
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def incrementar(nombre, valor=1, **etiquetas):
+    registro.incrementar(nombre, valor, _etiquetas(etiquetas))
+
+
+def observar(nombre, valor, **etiquetas):
+    registro.observar(nombre, valor, _etiquetas(etiquetas))
+
+
+# Modo multiproceso ------------------------------------------------------------
+
+TERMINADOS = 'terminados.json'
+_terminado = False
+
+
+def _ruta(nombre):
+    return os.path.join(config('DIRECTORIO'), nombre)
+
+
+def _ruta_proceso():
+    global _archivo
+    if _archivo is None:
+        # pid + arranque: un pid reutilizado no pisa los contadores de un proceso anterior
+        _archivo = _ruta(f"{os.getpid()}-{time.time_ns()}.json")
+    return _archivo
+
+
+def _escribir(ruta, copia):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w') as archivo:
+        json.dump(copia, archivo)
+    os.replace(temporal, ruta)
+
+
+def volcar(forzar=False):
+    """Escribe la copia del proceso si pasó ``INTERVALO`` desde la anterior (o si ``forzar``)"""
+    global _ultimo_volcado
+    if not config('DIRECTORIO') or _terminado or not registro.valores:
+        return
+    ahora = time.monotonic()
+    if not forzar and ahora - _ultimo_volcado < config('INTERVALO'):
+        return
+    _ultimo_volcado = ahora
+    ruta = _ruta_proceso()
+    try:
+        os.makedirs(config('DIRECTORIO'), exist_ok=True)
+        _escribir(ruta, registro.copia())
+    except OSError as e:
+        logger.warning(f"No se pudieron volcar las métricas en {ruta}: {e}")
+
+
+@contextmanager
+def _bloqueo(espera=5, caducidad=30):
+    """Exclusión entre procesos sobre el directorio (archivo creado con ``O_EXCL``, portable)"""
+    os.makedirs(config('DIRECTORIO'), exist_ok=True)
+    ruta = _ruta('.lock')
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(ruta) > caducidad:
+                    os.remove(ruta)  # de un proceso que murió con el bloqueo
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Bloqueo de métricas ocupado: {ruta}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.remove(ruta)
+
+
+def _vivo(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # En Windows os.kill(pid, 0) envía CTRL_C: solo se suman los procesos que terminan con atexit
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _leer(nombre):
+    try:
+        with open(_ruta(nombre)) as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.warning(f"Archivo de métricas ilegible {nombre}: {e}")
+        return []
+
+
+def _archivos_proceso():
+    """``{nombre: pid}`` de los archivos de proceso del directorio"""
+    try:
+        nombres = os.listdir(config('DIRECTORIO'))
+    except FileNotFoundError:
+        return {}
+    archivos = {}
+    for nombre in nombres:
+        pid = nombre.split('-', 1)[0]
+        if nombre.endswith('.json') and pid.isdigit():
+            archivos[nombre] = int(pid)
+    return archivos
+
+
+def _sumar(total, copia):
+    for nombre, etiquetas, valor in copia:
+        clave = (nombre, tuple(tuple(e) for e in etiquetas))
+        if isinstance(valor, list):
+            acumulado = total.setdefault(clave, [0] * len(valor))
+            for i, v in enumerate(valor):
+                acumulado[i] += v
+        else:
+            total[clave] = total.get(clave, 0) + valor
+    return total
+
+
+def _como_copia(total):
+    return [[nombre, [list(e) for e in etiquetas], valor] for (nombre, etiquetas), valor in total.items()]
+
+
+def _retirar(nombres):
+    """Suma los archivos ``nombres`` a ``terminados.json`` y los borra; llamar con ``_bloqueo``"""
+    total = _sumar({}, _leer(TERMINADOS))
+    for nombre in nombres:
+        _sumar(total, _leer(nombre))
+    _escribir(_ruta(TERMINADOS), _como_copia(total))
+    for nombre in nombres:
+        try:
+            os.remove(_ruta(nombre))
+        except FileNotFoundError:
+            pass
+
+
+def terminar():
+    """Al salir el proceso: su copia pasa a ``terminados.json`` y su archivo desaparece"""
+    global _terminado
+    if not config('DIRECTORIO') or not registro.valores:
+        return
+    volcar(forzar=True)
+    _terminado = True
+    try:
+        with _bloqueo():
+            _retirar([os.path.basename(_ruta_proceso())])
+    except (OSError, TimeoutError) as e:
+        logger.warning(f"No se pudieron retirar las métricas del proceso {os.getpid()}: {e}")
+
+
+atexit.register(terminar)
+
+
+def _agregar():
+    """Suma de todos los procesos (o solo el actual, sin directorio)"""
+    if not config('DIRECTORIO'):
+        return _sumar({}, registro.copia())
+    volcar(forzar=True)
+    try:
+        with _bloqueo():
+            archivos = _archivos_proceso()
+            muertos = [nombre for nombre, pid in archivos.items() if not _vivo(pid)]
+            if muertos:
+                _retirar(muertos)
+                logger.info(f"Métricas de {len(muertos)} procesos terminados sumadas a {TERMINADOS}")
+            total = _sumar({}, _leer(TERMINADOS))
+            for nombre in archivos:
+                if nombre not in muertos:
+                    _sumar(total, _leer(nombre))
+    except (OSError, TimeoutError) as e:
+        logger.warning(f"Métricas solo del proceso actual: {e}")
+        total = _sumar({}, registro.copia())
+    return {clave: valor for clave, valor in total.items() if clave[0] in DEFINICIONES}
+
+
+def _cola():
+    from .tareas import profundidad
+
+    cola = profundidad()
+    return {('sisga_tareas_cola', (('estado', estado),)): cola.get(estado, 0) for estado in ('pendiente', 'en_curso')}
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _texto_etiquetas(etiquetas, extra=()):
+    partes = [f'{k}="{_escapar(v)}"' for k, v in (*etiquetas, *extra)]
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exposicion():
+    """Texto en formato de exposición de Prometheus 0.0.4"""
+    valores = _agregar()
+    try:
+        valores.update(_cola())
+    except Exception as e:
+        logger.warning(f"Métricas sin la cola de tareas: {e}")
+
+    por_nombre = {}
+    for (nombre, etiquetas), valor in valores.items():
+        por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+
+    lineas = []
+    for nombre, series in sorted(por_nombre.items()):
+        tipo, ayuda, limites = DEFINICIONES[nombre]
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for etiquetas, valor in sorted(series):
+            if tipo != HISTOGRAMA:
+                lineas.append(f"{nombre}{_texto_etiquetas(etiquetas)} {_numero(valor)}")
+                continue
+            # Las cubetas se guardan sin acumular por límite: ya cuentan todo valor <= límite
+            for limite, n in zip(limites, valor):
+                lineas.append(f"{nombre}_bucket{_texto_etiquetas(etiquetas, [('le', limite)])} {n}")
+            lineas.append(f"{nombre}_bucket{_texto_etiquetas(etiquetas, [('le', '+Inf')])} {valor[-1]}")
+            lineas.append(f"{nombre}_sum{_texto_etiquetas(etiquetas)} {_numero(valor[-2])}")
+            lineas.append(f"{nombre}_count{_texto_etiquetas(etiquetas)} {valor[-1]}")
+    return '\n'.join(lineas) + '\n'
+
+
+# Middleware -------------------------------------------------------------------
+
+def _envoltorio_db(alias, conteo):
+    def envoltorio(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            conteo[alias][0] += 1
+            conteo[alias][1] += time.perf_counter() - inicio
+    return envoltorio
+
+
+class MetricasMiddleware:
+    """Latencia por vista y consultas por alias de todas las peticiones"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.alias = []
+        for alias in connections:
+            try:
+                connections[alias]
+            except Exception:
+                continue
+            self.alias.append(alias)
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        conteo = {alias: [0, 0.0] for alias in self.alias}
+        with ExitStack() as stack:
+            for alias in self.alias:
+                stack.enter_context(connections[alias].execute_wrapper(_envoltorio_db(alias, conteo)))
+            response = self.get_response(request)
+
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_ruta'
+        observar('sisga_peticion_duracion_segundos', time.perf_counter() - inicio,
+                 vista=vista, metodo=request.method, codigo=f"{response.status_code // 100}xx")
+        for alias, (n, segundos) in conteo.items():
+            if n:
+                incrementar('sisga_bd_consultas_total', n, alias=alias)
+                incrementar('sisga_bd_duracion_segundos_total', segundos, alias=alias)
+        volcar()
+        return response
@@ -0,0 +1,53 @@
+# middleware.py
+from django.conf import settings
+
+from . import cambios, routers
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class PrimariaTrasEscrituraMiddleware:
+    """
+    Read-your-writes con réplica: tras una petición que escribe (POST, etc.) el
+    navegador recibe una cookie de corta duración y, mientras exista, todas sus
+    lecturas se hacen en la primaria. El ámbito de ``routers.fijar_primaria`` dura
+    solo la petición; sin réplica no se abre, y las escrituras no fijan nada.
+    """
+    COOKIE = 'sisga_primaria'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if routers.REPLICA not in settings.DATABASES:
+            return self.get_response(request)
+
+        token = routers.fijar_primaria(self.COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.liberar_primaria(token)
+
+        if request.method not in METODOS_SEGUROS:
+            response.set_cookie(
+                self.COOKIE, '1',
+                max_age=settings.DB_REPLICA['STICKY_SECONDS'],
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class AutorCambiosMiddleware:
+    """Atribuye al usuario de la petición los cambios de incidencias que se registren (ver cambios.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Se guarda una función y no ``request.user``: asgiref inspecciona las variables de
+        # contexto al pasar a las vistas async y evaluaría el usuario perezoso fuera de un hilo
+        token = cambios.fijar_autor(lambda: request.user)
+        try:
+            return self.get_response(request)
+        finally:
+            cambios.liberar_autor(token)
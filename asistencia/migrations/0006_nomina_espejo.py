@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0005_alter_responsablearea_area'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveAusenciaNomina',
+            fields=[
+                ('id_clave', models.CharField(db_column='Id_Clave', max_length=10, primary_key=True, serialize=False)),
+                ('desc_clave', models.CharField(db_column='Desc_Clave', max_length=100)),
+            ],
+            options={
+                'db_table': 'RH_Claves_Ausencias',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='EmpleadoNomina',
+            fields=[
+                ('no_ci', models.CharField(db_column='No_CI', max_length=11, primary_key=True, serialize=False)),
+                ('nombre', models.CharField(db_column='Nombre', max_length=100)),
+                ('apellido_1', models.CharField(db_column='Apellido_1', max_length=100)),
+                ('apellido_2', models.CharField(db_column='Apellido_2', max_length=100)),
+                ('id_direccion', models.CharField(db_column='Id_Direccion', max_length=20)),
+                ('baja', models.BooleanField(db_column='Baja')),
+            ],
+            options={
+                'db_table': 'Empleados_Gral',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UnidadOrganizativaNomina',
+            fields=[
+                ('id_direccion', models.CharField(db_column='Id_Direccion', max_length=20, primary_key=True, serialize=False)),
+                ('desc_direccion', models.CharField(db_column='Desc_Direccion', max_length=200)),
+                ('grupo_nomina', models.CharField(db_column='GrupoNomina', max_length=20)),
+            ],
+            options={
+                'db_table': 'RH_Unidades_Organizativas',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0006_nomina_espejo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioIncidencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('incidencia_id', models.BigIntegerField(db_index=True)),
+                ('trabajador_id', models.BigIntegerField()),
+                ('area_id', models.BigIntegerField()),
+                ('fecha', models.DateField()),
+                ('estado_anterior_id', models.BigIntegerField(null=True)),
+                ('estado_nuevo_id', models.BigIntegerField(null=True)),
+                ('usuario_id', models.IntegerField(null=True)),
+                ('registrado', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Cambio de incidencia',
+                'verbose_name_plural': 'Cambios de incidencias',
+                'db_table': 'cambio_incidencia',
+                'ordering': ['id'],
+            },
+        ),
+    ]
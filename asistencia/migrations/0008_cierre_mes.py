@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0007_cambio_incidencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(unique=True)),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('cerrado', 'Cerrado')], default='en_curso', max_length=10)),
+                ('exportado', models.BooleanField(default=False)),
+                ('iniciado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cerrado', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Cierre de mes',
+                'verbose_name_plural': 'Cierres de mes',
+                'db_table': 'cierre_mes',
+                'ordering': ['-mes'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CierreArea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trabajadores', models.IntegerField(default=0)),
+                ('creadas', models.IntegerField(default=0)),
+                ('sin_estado', models.IntegerField(default=0)),
+                ('resumen', models.JSONField(default=dict)),
+                ('terminado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('area', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='asistencia.area')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='areas', to='asistencia.cierremes')),
+            ],
+            options={
+                'verbose_name': 'Área cerrada',
+                'verbose_name_plural': 'Áreas cerradas',
+                'db_table': 'cierre_area',
+                'unique_together': {('cierre', 'area')},
+            },
+        ),
+    ]
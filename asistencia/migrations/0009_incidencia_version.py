@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0008_cierre_mes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incidencia',
+            name='version',
+            field=models.PositiveIntegerField(db_column='Version', default=1),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0009_incidencia_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneaArea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias', models.PositiveSmallIntegerField()),
+                ('filas', models.IntegerField()),
+                ('tipo', models.CharField(max_length=1)),
+                ('trabajadores', models.BinaryField()),
+                ('estados', models.BinaryField()),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cierre_area', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='instantanea', to='asistencia.cierrearea')),
+            ],
+            options={
+                'verbose_name': 'Instantánea de área',
+                'verbose_name_plural': 'Instantáneas de áreas',
+                'db_table': 'instantanea_area',
+            },
+        ),
+    ]
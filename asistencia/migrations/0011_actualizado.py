@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0010_instantanea_area'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incidencia',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_column='Actualizado', default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='responsablearea',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['area', 'fecha_asistencia', 'actualizado'], name='incidencia_area_fecha_act'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0011_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['fecha_asistencia'], name='incidencia_fecha'),
+        ),
+    ]
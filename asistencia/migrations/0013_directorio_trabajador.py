@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Búsqueda por prefijo (LIKE 'abc%' con cualquier collation) y por trigramas
+# (LIKE '%abc%' y el operador %). Solo en PostgreSQL; requiere poder crear pg_trgm.
+INDICES_POSTGRES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX directorio_uid_prefijo ON directorio_trabajador (uid varchar_pattern_ops)',
+    'CREATE INDEX directorio_ci_prefijo ON directorio_trabajador (ci varchar_pattern_ops)',
+    'CREATE INDEX directorio_busqueda_prefijo ON directorio_trabajador (busqueda varchar_pattern_ops)',
+    'CREATE INDEX directorio_busqueda_trgm ON directorio_trabajador USING gin (busqueda gin_trgm_ops)',
+]
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in INDICES_POSTGRES:
+            schema_editor.execute(sql)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for nombre in ('directorio_uid_prefijo', 'directorio_ci_prefijo', 'directorio_busqueda_prefijo',
+                       'directorio_busqueda_trgm'):
+            schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0012_incidencia_fecha_indice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntradaDirectorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(max_length=150, unique=True)),
+                ('cn', models.CharField(blank=True, max_length=200)),
+                ('sn', models.CharField(blank=True, max_length=200)),
+                ('correo', models.CharField(blank=True, max_length=254)),
+                ('ci', models.CharField(blank=True, max_length=20)),
+                ('cod_area', models.CharField(blank=True, max_length=50)),
+                ('cod_dependencia', models.CharField(blank=True, max_length=50)),
+                ('es_baja', models.BooleanField(default=False)),
+                ('busqueda', models.CharField(blank=True, max_length=800)),
+                ('modificado', models.DateTimeField(blank=True, null=True)),
+                ('sincronizado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Entrada del directorio',
+                'verbose_name_plural': 'Entradas del directorio',
+                'db_table': 'directorio_trabajador',
+                'ordering': ['uid'],
+                'indexes': [models.Index(fields=['modificado'], name='directorio_modificado')],
+            },
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
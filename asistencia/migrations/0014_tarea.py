@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0013_directorio_trabajador'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('terminada', 'Terminada'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('prioridad', models.SmallIntegerField(default=0)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('disponible', models.DateTimeField(default=django.utils.timezone.now)),
+                ('progreso', models.FloatField(default=0)),
+                ('mensaje', models.CharField(blank=True, max_length=255)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('latido', models.DateTimeField(blank=True, null=True)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tareas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'db_table': 'tarea',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['estado', 'disponible', '-prioridad'], name='tarea_cola')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencia', '0014_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cambioincidencia',
+            name='seq',
+            field=models.BigIntegerField(null=True, unique=True),
+        ),
+        # Los cambios existentes conservan como seq su id: los cursores guardados siguen valiendo
+        migrations.RunSQL('UPDATE cambio_incidencia SET seq = id', migrations.RunSQL.noop),
+    ]
@@ -1,7 +1,7 @@
 
 import datetime
 
-from django.db import models
+from django.db import models, router, transaction
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
@@ -25,6 +25,52 @@ class Area(models.Model):
     def __str__(self):
         return f"{self.cod_area} {self.nombre}"
 
+    @classmethod
+    def _arbol(cls):
+        """``(hijos, padres)``: ``{cod: [cod_hijo, ...]}`` y ``{cod: cod_padre}``"""
+        hijos = {}
+        padres = {}
+        for cod, padre in cls.objects.values_list('cod_area', 'unidad_padre'):
+            padres[cod] = padre
+            if cod != padre:
+                hijos.setdefault(padre, []).append(cod)
+        return hijos, padres
+
+    @staticmethod
+    def _descendientes(hijos, cod_area):
+        codigos = {cod_area}
+        pendientes = [cod_area]
+        while pendientes:
+            for hijo in hijos.get(pendientes.pop(), ()):
+                if hijo not in codigos:
+                    codigos.add(hijo)
+                    pendientes.append(hijo)
+        return codigos
+
+    @classmethod
+    def codigos_subarbol(cls, cod_area):
+        """Códigos de ``cod_area`` y todas sus descendientes (por ``unidad_padre``)"""
+        hijos, _ = cls._arbol()
+        return cls._descendientes(hijos, cod_area)
+
+    @classmethod
+    def subarboles(cls, cod_area=None):
+        """
+        Parte el árbol (o el subárbol de ``cod_area``) en conjuntos de códigos
+        disjuntos que pueden procesarse en paralelo: cada raíz sola y el
+        subárbol completo de cada uno de sus hijos.
+        """
+        hijos, padres = cls._arbol()
+        if cod_area:
+            raices = [cod_area]
+        else:
+            raices = sorted(c for c, p in padres.items() if p == c or p not in padres)
+        partes = []
+        for raiz in raices:
+            partes.append({raiz})
+            partes.extend(cls._descendientes(hijos, hijo) for hijo in sorted(hijos.get(raiz, ())))
+        return partes
+
 
 class ResponsableArea(models.Model):
     """Modelo para asignar responsables a las áreas"""
@@ -32,6 +78,8 @@ class ResponsableArea(models.Model):
     area = models.ForeignKey(Area, on_delete=models.CASCADE, db_column='Area')
     fecha_asignacion = models.DateTimeField(auto_now_add=True)
     activo = models.BooleanField(default=True)
+    # Peticiones condicionales (ver condicional.py)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Responsable de Área'
@@ -78,6 +126,12 @@ class Trabajador(models.Model):
 
 
 class Estado(models.Model):
+    # Estados que la tabla de incidencias asigna por defecto
+    ASISTENCIA = 109
+    SABADO = 110
+    DOMINGO = 111
+    POR_DEFECTO = (ASISTENCIA, SABADO, DOMINGO)
+
     clave = models.CharField(max_length=100, db_column='Clave')
     clave_id = models.CharField(max_length=10, db_column='Clave_id')
     class Meta:
@@ -88,11 +142,20 @@ class Estado(models.Model):
     def __str__(self):
         return f"{self.clave}"
 
+    @classmethod
+    def id_por_defecto(cls, fecha):
+        """Estado que corresponde a ``fecha`` si no hay incidencia: sábado, domingo o asistencia"""
+        return {5: cls.SABADO, 6: cls.DOMINGO}.get(fecha.weekday(), cls.ASISTENCIA)
+
 class Incidencia(models.Model):
     area = models.ForeignKey(Area, on_delete=models.CASCADE, db_column='Area')
     trabajador = models.ForeignKey(Trabajador, on_delete=models.CASCADE, db_column='Trabajador', default=None)
     estado = models.ForeignKey(Estado, on_delete=models.CASCADE, db_column='Estado', null=True, default=None)
     fecha_asistencia = models.DateField(db_column='Fecha_Asistencia', default=datetime.date.today)
+    # Concurrencia optimista: cada cambio de estado la incrementa (ver edicion.py)
+    version = models.PositiveIntegerField(db_column='Version', default=1)
+    # Último cambio de la fila; con el índice, el token de condicional.py sale del índice solo
+    actualizado = models.DateTimeField(db_column='Actualizado', auto_now=True)
 
     class Meta:
         verbose_name = 'Incidencia'
@@ -100,6 +163,263 @@ class Incidencia(models.Model):
         db_table = 'incidencia'
         unique_together = ['trabajador', 'fecha_asistencia']
         ordering = ['trabajador',]
+        indexes = [
+            models.Index(fields=['area', 'fecha_asistencia', 'actualizado'], name='incidencia_area_fecha_act'),
+            # date_hierarchy del admin: rango de fechas y años/meses/días sin recorrer la tabla
+            models.Index(fields=['fecha_asistencia'], name='incidencia_fecha'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estado leído de la BD: al guardar se compara para registrar el cambio
+        instancia._estado_original = instancia.__dict__.get('estado_id')
+        return instancia
+
+    def save(self, *args, **kwargs):
+        """Guarda y registra en ``CambioIncidencia`` la creación o el cambio de estado, en la misma transacción"""
+        from . import cambios, instantaneas
+
+        creada = self._state.adding
+        anterior = getattr(self, '_estado_original', None)
+        update_fields = kwargs.get('update_fields')
+        registrar = creada or (anterior != self.estado_id and (
+            update_fields is None or {'estado', 'estado_id'} & set(update_fields)))
+
+        if registrar:
+            # Los meses cerrados solo cambian si se reabren
+            instantaneas.comprobar_abierto([self.fecha_asistencia])
+        if registrar and not creada:
+            # Invalida las copias que otros editores tengan abiertas
+            self.version += 1
+            if update_fields is not None:
+                update_fields = kwargs['update_fields'] = {*update_fields, 'version'}
+        if update_fields:
+            # ``auto_now`` solo se escribe si está entre los campos a guardar
+            kwargs['update_fields'] = {*update_fields, 'actualizado'}
+
+        alias = kwargs.get('using') or router.db_for_write(Incidencia, instance=self)
+        with transaction.atomic(using=alias):
+            super().save(*args, **kwargs)
+            if registrar:
+                cambios.registrar(self, None if creada else anterior)
+        self._estado_original = self.estado_id
+
+
+class CambioIncidencia(models.Model):
+    """
+    Registro de cambios de ``Incidencia`` (solo se añaden filas). ``seq`` es la
+    secuencia que usan los consumidores (``since=<seq>``): se asigna después de
+    confirmarse la transacción (``cambios.numerar``), así que sigue el orden de
+    confirmación y no el de inserción. Sin claves foráneas para que la inserción
+    sea barata y el historial sobreviva a los borrados.
+    """
+    seq = models.BigIntegerField(null=True, unique=True)  # None: confirmado pero aún sin numerar
+    incidencia_id = models.BigIntegerField(db_index=True)
+    trabajador_id = models.BigIntegerField()
+    area_id = models.BigIntegerField()
+    fecha = models.DateField()
+    estado_anterior_id = models.BigIntegerField(null=True)  # None: incidencia creada
+    estado_nuevo_id = models.BigIntegerField(null=True)
+    usuario_id = models.IntegerField(null=True)  # None: proceso sin usuario (comandos, sincronizaciones)
+    registrado = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'Cambio de incidencia'
+        verbose_name_plural = 'Cambios de incidencias'
+        db_table = 'cambio_incidencia'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.id}: {self.incidencia_id} {self.estado_anterior_id} -> {self.estado_nuevo_id}"
+
+
+class CierreMes(models.Model):
+    """Cierre mensual (``manage.py cerrar_mes``): con ``estado = cerrado`` el mes ya no admite cambios"""
+    EN_CURSO = 'en_curso'
+    CERRADO = 'cerrado'
+    ESTADOS = [(EN_CURSO, 'En curso'), (CERRADO, 'Cerrado')]
+
+    mes = models.DateField(unique=True)  # primer día del mes
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=EN_CURSO)
+    exportado = models.BooleanField(default=False)
+    iniciado = models.DateTimeField(default=timezone.now)
+    cerrado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Cierre de mes'
+        verbose_name_plural = 'Cierres de mes'
+        db_table = 'cierre_mes'
+        ordering = ['-mes']
+
+    def __str__(self):
+        return f"{self.mes:%Y-%m} ({self.get_estado_display()})"
+
+
+class CierreArea(models.Model):
+    """Punto de control de ``cerrar_mes``: área ya materializada y resumida; al reanudar se salta"""
+    cierre = models.ForeignKey(CierreMes, on_delete=models.CASCADE, related_name='areas')
+    area = models.ForeignKey(Area, on_delete=models.CASCADE)
+    trabajadores = models.IntegerField(default=0)
+    creadas = models.IntegerField(default=0)  # incidencias por defecto añadidas al materializar
+    sin_estado = models.IntegerField(default=0)
+    resumen = models.JSONField(default=dict)  # {clave_id: número de incidencias}
+    terminado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Área cerrada'
+        verbose_name_plural = 'Áreas cerradas'
+        db_table = 'cierre_area'
+        unique_together = ['cierre', 'area']
+
+    def __str__(self):
+        return f"{self.cierre} {self.area_id}"
+
+
+class InstantaneaArea(models.Model):
+    """
+    Copia inmutable y comprimida de las incidencias de un área en un mes cerrado
+    (ver instantaneas.py). Se borra con su ``CierreArea`` al reabrir el mes.
+    """
+    cierre_area = models.OneToOneField(CierreArea, on_delete=models.CASCADE, related_name='instantanea')
+    dias = models.PositiveSmallIntegerField()
+    filas = models.IntegerField()  # incidencias congeladas
+    tipo = models.CharField(max_length=1)  # typecode de ``array`` de la matriz de estados
+    trabajadores = models.BinaryField()  # ids ('q'), zlib
+    estados = models.BinaryField()  # matriz trabajadores × días, zlib
+    creada = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Instantánea de área'
+        verbose_name_plural = 'Instantáneas de áreas'
+        db_table = 'instantanea_area'
+
+    def __str__(self):
+        return f"{self.cierre_area} ({self.filas} incidencias)"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Las instantáneas no se modifican: reabra el mes y vuelva a cerrarlo')
+        super().save(*args, **kwargs)
+
+
+class EntradaDirectorio(models.Model):
+    """
+    Copia local de una entrada de ``ou=Trabajadores`` del directorio LDAP, para
+    buscar personas sin consultar LDAP (ver espejo_directorio.py).
+    """
+    uid = models.CharField(max_length=150, unique=True)
+    cn = models.CharField(max_length=200, blank=True)
+    sn = models.CharField(max_length=200, blank=True)
+    correo = models.CharField(max_length=254, blank=True)
+    ci = models.CharField(max_length=20, blank=True)
+    cod_area = models.CharField(max_length=50, blank=True)
+    cod_dependencia = models.CharField(max_length=50, blank=True)
+    es_baja = models.BooleanField(default=False)
+    # uid, nombre, apellidos, CI y correo en minúsculas y sin tildes
+    busqueda = models.CharField(max_length=800, blank=True)
+    modificado = models.DateTimeField(null=True, blank=True)  # modifyTimestamp del directorio
+    sincronizado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Entrada del directorio'
+        verbose_name_plural = 'Entradas del directorio'
+        db_table = 'directorio_trabajador'
+        ordering = ['uid']
+        indexes = [
+            models.Index(fields=['modificado'], name='directorio_modificado'),
+        ]
+
+    def __str__(self):
+        return f"{self.uid} ({self.cn} {self.sn})"
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano que ejecuta ``manage.py run_workers`` (ver tareas.py)"""
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    TERMINADA = 'terminada'
+    FALLIDA = 'fallida'
+    ESTADOS = [(PENDIENTE, 'Pendiente'), (EN_CURSO, 'En curso'), (TERMINADA, 'Terminada'), (FALLIDA, 'Fallida')]
+
+    tipo = models.CharField(max_length=50)
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    prioridad = models.SmallIntegerField(default=0)  # mayor primero
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tareas')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    disponible = models.DateTimeField(default=timezone.now)  # no se reclama antes (reintentos)
+    progreso = models.FloatField(default=0)  # porcentaje
+    mensaje = models.CharField(max_length=255, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    trabajador = models.CharField(max_length=100, blank=True)  # host:pid:hilo que la ejecuta
+    latido = models.DateTimeField(null=True, blank=True)
+    creada = models.DateTimeField(default=timezone.now)
+    iniciada = models.DateTimeField(null=True, blank=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Tarea'
+        verbose_name_plural = 'Tareas'
+        db_table = 'tarea'
+        ordering = ['-id']
+        indexes = [
+            # Reclamar: pendientes disponibles por prioridad
+            models.Index(fields=['estado', 'disponible', '-prioridad'], name='tarea_cola'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} {self.tipo} ({self.get_estado_display()})"
+
+    @property
+    def activa(self):
+        return self.estado in (self.PENDIENTE, self.EN_CURSO)
+
 
 
 
+
+# Tablas de NOMINA (SQL Server). Solo lectura: las gestiona NOMINA, no Django.
+# DatabaseRouter envía sus lecturas al alias 'sqlserver' y rechaza las escrituras.
+
+class UnidadOrganizativaNomina(models.Model):
+    id_direccion = models.CharField(max_length=20, primary_key=True, db_column='Id_Direccion')
+    desc_direccion = models.CharField(max_length=200, db_column='Desc_Direccion')
+    grupo_nomina = models.CharField(max_length=20, db_column='GrupoNomina')
+
+    class Meta:
+        managed = False
+        db_table = 'RH_Unidades_Organizativas'
+
+    def __str__(self):
+        return f"{self.id_direccion} {self.desc_direccion}"
+
+
+class EmpleadoNomina(models.Model):
+    no_ci = models.CharField(max_length=11, primary_key=True, db_column='No_CI')
+    nombre = models.CharField(max_length=100, db_column='Nombre')
+    apellido_1 = models.CharField(max_length=100, db_column='Apellido_1')
+    apellido_2 = models.CharField(max_length=100, db_column='Apellido_2')
+    id_direccion = models.CharField(max_length=20, db_column='Id_Direccion')
+    baja = models.BooleanField(db_column='Baja')
+
+    class Meta:
+        managed = False
+        db_table = 'Empleados_Gral'
+
+    def __str__(self):
+        return f"{self.nombre} {self.apellido_1} {self.apellido_2}"
+
+
+class ClaveAusenciaNomina(models.Model):
+    id_clave = models.CharField(max_length=10, primary_key=True, db_column='Id_Clave')
+    desc_clave = models.CharField(max_length=100, db_column='Desc_Clave')
+
+    class Meta:
+        managed = False
+        db_table = 'RH_Claves_Ausencias'
+
+    def __str__(self):
+        return f"{self.desc_clave}"
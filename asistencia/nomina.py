@@ -0,0 +1,177 @@
+# nomina.py
+"""
+Pool acotado de conexiones DB-API hacia NOMINA (alias ``sqlserver``).
+
+Las consultas directas a NOMINA (sincronizaciones, exportaciones) no pasan por
+el ORM; antes abrían una conexión ODBC nueva cada vez. ``PoolNomina`` mantiene
+como máximo ``MAX_SIZE`` conexiones abiertas, verifica con ``SELECT 1`` las que
+llevan un rato inactivas, descarta las que fallan y vuelve a conectar.
+
+Las conexiones se crean con el mismo backend de Django configurado para el
+alias, de modo que en desarrollo basta con apuntar ``sqlserver`` a SQLite o
+PostgreSQL.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+ALIAS = 'sqlserver'
+
+
+class PoolAgotado(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera."""
+
+
+class _Entrada:
+    __slots__ = ('conn', 'creada', 'usada')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.creada = self.usada = time.monotonic()
+
+
+def _es_error_conexion(error):
+    """Errores tras los cuales la conexión no es reutilizable"""
+    wrapper = connections[ALIAS]
+    database = wrapper.Database
+    if isinstance(error, (getattr(database, 'OperationalError', ()), getattr(database, 'InterfaceError', ()))):
+        return True
+    # pyodbc: SQLSTATE 08xxx (conexión) y HYT00/HYT01 (timeout)
+    estado = error.args[0] if getattr(error, 'args', None) else ''
+    return isinstance(estado, str) and (estado.startswith('08') or estado in ('HYT00', 'HYT01'))
+
+
+class PoolNomina:
+    def __init__(self, fabrica, max_size=4, timeout=10, max_idle=30, max_age=1800):
+        self._fabrica = fabrica
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self._libres = deque()
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(max_size)
+
+    def _cerrar(self, entrada):
+        try:
+            entrada.conn.close()
+        except Exception:
+            pass
+
+    def _valida(self, entrada):
+        ahora = time.monotonic()
+        if ahora - entrada.creada > self.max_age:
+            return False
+        if ahora - entrada.usada < self.max_idle:
+            return True
+        try:
+            cursor = entrada.conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Conexión a NOMINA descartada tras verificación: {e}")
+            return False
+
+    def _obtener(self):
+        while True:
+            with self._lock:
+                entrada = self._libres.pop() if self._libres else None
+            if entrada is None:
+                return _Entrada(self._fabrica())
+            if self._valida(entrada):
+                return entrada
+            self._cerrar(entrada)
+
+    def _devolver(self, entrada):
+        try:
+            # Deja la conexión sin transacciones abiertas
+            entrada.conn.rollback()
+        except Exception:
+            self._cerrar(entrada)
+            return
+        entrada.usada = time.monotonic()
+        with self._lock:
+            self._libres.append(entrada)
+
+    @contextmanager
+    def conexion(self):
+        """Presta una conexión del pool; se devuelve (o descarta) al salir."""
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise PoolAgotado(f"Sin conexiones libres a NOMINA tras {self.timeout}s")
+        entrada = None
+        try:
+            entrada = self._obtener()
+            yield entrada.conn
+        except Exception as e:
+            if entrada is not None and _es_error_conexion(e):
+                self._cerrar(entrada)
+                entrada = None
+            raise
+        finally:
+            if entrada is not None:
+                self._devolver(entrada)
+            self._cupos.release()
+
+    def consultar(self, sql, params=None):
+        """
+        Ejecuta una consulta de lectura y devuelve todas las filas.
+        Si la conexión se cae se reintenta una vez con una conexión nueva.
+        """
+        for intento in (1, 2):
+            try:
+                with self.conexion() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        cursor.execute(sql, params or ())
+                        return cursor.fetchall()
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                if intento == 2 or not _es_error_conexion(e):
+                    raise
+                logger.warning(f"Reconectando con NOMINA tras error: {e}")
+
+    def cerrar_todas(self):
+        with self._lock:
+            libres, self._libres = list(self._libres), deque()
+        for entrada in libres:
+            self._cerrar(entrada)
+
+
+def nueva_conexion():
+    """Abre una conexión DB-API sin pasar por el pool (usa el backend del alias)."""
+    wrapper = connections[ALIAS]
+    return wrapper.get_new_connection(wrapper.get_connection_params())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = settings.NOMINA_POOL
+                _pool = PoolNomina(
+                    nueva_conexion,
+                    max_size=config['MAX_SIZE'],
+                    timeout=config['TIMEOUT'],
+                    max_idle=config['MAX_IDLE'],
+                    max_age=config['MAX_AGE'],
+                )
+    return _pool
+
+
+def consultar(sql, params=None):
+    return pool().consultar(sql, params)
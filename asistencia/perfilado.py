@@ -0,0 +1,308 @@
+# perfilado.py
+"""
+Perfilado bajo demanda de una petición concreta, en producción y sin desplegar.
+
+Un usuario staff añade ``?_perfilar=1`` a la URL (o envía la cabecera
+``X-Perfilar: 1``) y esa petición se ejecuta bajo ``cProfile``; con
+``_perfilar=muestreo`` se usa en su lugar un perfilador por muestreo (un hilo
+que lee la pila del hilo de la petición cada ``INTERVALO_MUESTREO`` segundos),
+que apenas altera los tiempos y produce pilas colapsadas listas para
+``flamegraph.pl`` o speedscope. En ambos casos se guarda también el registro de
+las consultas SQL con su duración.
+
+Los perfiles se escriben en ``PERFILADO['DIRECTORIO']`` y solo se conservan los
+``MAXIMO`` más recientes (búfer circular en disco). La respuesta perfilada lleva
+la cabecera ``X-Perfil`` con el identificador del perfil.
+
+Sin el parámetro ni la cabecera el middleware solo mira la cadena de consulta y
+la cabecera: no instala perfilador ni envoltorios de base de datos.
+"""
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DETERMINISTA = 'determinista'
+MUESTREO = 'muestreo'
+
+# Extensión y tipo MIME de cada archivo de un perfil
+FORMATOS = {
+    'pstats': ('pstats', 'application/octet-stream'),
+    'colapsado': ('txt', 'text/plain; charset=utf-8'),
+    'sql': ('sql.json', 'application/json'),
+}
+
+_RE_ID = re.compile(r'^\d{20}-[0-9a-f]{8}$')
+
+# cProfile no admite dos perfiladores a la vez en el mismo intérprete (3.12+);
+# con uno en curso, las demás peticiones se atienden sin perfilar
+_en_curso = threading.Lock()
+
+
+def config(clave):
+    return settings.PERFILADO[clave]
+
+
+def _ruta(perfil_id, extension):
+    return os.path.join(config('DIRECTORIO'), f"{perfil_id}.{extension}")
+
+
+def solicitado(request):
+    """Modo pedido por la petición (``None`` si no se pide perfilar)"""
+    valor = request.META.get(config('CABECERA'))
+    if valor is None:
+        # Comprobación barata antes de analizar la cadena de consulta
+        if config('PARAMETRO') not in request.META.get('QUERY_STRING', ''):
+            return None
+        valor = request.GET.get(config('PARAMETRO'))
+        if valor is None:
+            return None
+    return MUESTREO if valor.strip().lower() == MUESTREO else DETERMINISTA
+
+
+# Muestreo ----------------------------------------------------------------------
+
+def _marco(codigo):
+    archivo = codigo.co_filename
+    for prefijo in sorted({str(settings.BASE_DIR), *sys.path}, key=len, reverse=True):
+        if prefijo and archivo.startswith(prefijo):
+            archivo = archivo[len(prefijo):].lstrip(os.sep)
+            break
+    # ';' separa marcos en el formato colapsado
+    return f"{codigo.co_name} ({archivo}:{codigo.co_firstlineno})".replace(';', ':')
+
+
+class Muestreador:
+    """Cuenta las pilas del hilo ``hilo_id`` tomadas cada ``intervalo`` segundos"""
+
+    def __init__(self, hilo_id, intervalo):
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True, name='perfilado-muestreo')
+
+    def _muestrear(self):
+        marcos = {}
+        while not self._parar.wait(self.intervalo):
+            marco = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                if codigo not in marcos:
+                    marcos[codigo] = _marco(codigo)
+                pila.append(marcos[codigo])
+                marco = marco.f_back
+            if pila:
+                self.pilas[';'.join(reversed(pila))] += 1
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+
+    def colapsado(self):
+        return ''.join(f"{pila} {n}\n" for pila, n in self.pilas.most_common())
+
+
+# Registro de SQL -----------------------------------------------------------------
+
+def _envoltorio_sql(alias, registro, inicio_peticion):
+    def envoltorio(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(registro['consultas']) < config('MAX_SQL'):
+                registro['consultas'].append({
+                    'alias': alias,
+                    'inicio_ms': round((inicio - inicio_peticion) * 1000, 3),
+                    'ms': round((time.perf_counter() - inicio) * 1000, 3),
+                    'sql': sql,
+                    'params': repr(params)[:500],
+                    'many': many,
+                })
+            else:
+                registro['omitidas'] += 1
+    return envoltorio
+
+
+# Almacén -----------------------------------------------------------------------
+
+def _guardar(meta, archivos):
+    """Escribe un perfil (``archivos``: ``{formato: bytes}``) y descarta los más antiguos"""
+    os.makedirs(config('DIRECTORIO'), exist_ok=True)
+    for formato, contenido in archivos.items():
+        with open(_ruta(meta['id'], FORMATOS[formato][0]), 'wb') as archivo:
+            archivo.write(contenido)
+    meta['formatos'] = sorted(archivos)
+    # El .json va el último: un perfil es visible solo cuando está completo
+    temporal = _ruta(meta['id'], 'json.tmp')
+    with open(temporal, 'w') as archivo:
+        json.dump(meta, archivo)
+    os.replace(temporal, _ruta(meta['id'], 'json'))
+
+    for antiguo in [p['id'] for p in listar()][config('MAXIMO'):]:
+        borrar(antiguo)
+
+
+def listar():
+    """Metadatos de los perfiles guardados, el más reciente primero"""
+    try:
+        nombres = os.listdir(config('DIRECTORIO'))
+    except FileNotFoundError:
+        return []
+    perfiles = []
+    for nombre in sorted(nombres, reverse=True):
+        if not nombre.endswith('.json') or nombre.endswith('.sql.json'):
+            continue
+        meta = obtener(nombre[:-len('.json')])
+        if meta is not None:
+            perfiles.append(meta)
+    return perfiles
+
+
+def obtener(perfil_id):
+    if not _RE_ID.match(perfil_id):
+        return None
+    try:
+        with open(_ruta(perfil_id, 'json')) as archivo:
+            meta = json.load(archivo)
+    except (OSError, ValueError):
+        return None
+    meta['fecha'] = datetime.fromtimestamp(meta['creado'], tz=dt_timezone.utc)
+    return meta
+
+
+def ruta_archivo(perfil_id, formato):
+    """Ruta del archivo ``formato`` del perfil; ``None`` si no existe"""
+    meta = obtener(perfil_id)
+    if meta is None or formato not in meta['formatos']:
+        return None
+    return _ruta(perfil_id, FORMATOS[formato][0])
+
+
+def borrar(perfil_id):
+    for extension in ['json', *(e for e, _ in FORMATOS.values())]:
+        try:
+            os.remove(_ruta(perfil_id, extension))
+        except FileNotFoundError:
+            pass
+
+
+def resumen(perfil_id, limite=40):
+    """Texto con las funciones de más tiempo acumulado (perfil determinista) o las pilas más vistas"""
+    ruta = ruta_archivo(perfil_id, 'pstats')
+    if ruta is not None:
+        salida = io.StringIO()
+        pstats.Stats(ruta, stream=salida).strip_dirs().sort_stats('cumulative').print_stats(limite)
+        return salida.getvalue()
+    ruta = ruta_archivo(perfil_id, 'colapsado')
+    if ruta is None:
+        return ''
+    with open(ruta) as archivo:
+        return ''.join(archivo.readline() for _ in range(limite))
+
+
+def consultas(perfil_id):
+    ruta = ruta_archivo(perfil_id, 'sql')
+    if ruta is None:
+        return {'consultas': [], 'omitidas': 0}
+    with open(ruta) as archivo:
+        return json.load(archivo)
+
+
+# Middleware ----------------------------------------------------------------------
+
+class PerfiladoMiddleware:
+    """Perfila las peticiones de staff que lo piden; va después de ``AuthenticationMiddleware``"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.alias = []
+        for alias in connections:
+            try:
+                connections[alias]
+            except Exception:
+                continue
+            self.alias.append(alias)
+
+    def __call__(self, request):
+        modo = solicitado(request)
+        if modo is None:
+            return self.get_response(request)
+        usuario = request.user
+        if not (usuario.is_authenticated and (usuario.is_staff or usuario.is_superuser)):
+            return self.get_response(request)
+        if not _en_curso.acquire(blocking=False):
+            logger.info(f"Perfilado de {request.path} omitido: hay otro en curso")
+            return self.get_response(request)
+        try:
+            return self.perfilar(request, modo)
+        finally:
+            _en_curso.release()
+
+    def perfilar(self, request, modo):
+        inicio = time.perf_counter()
+        registro = {'consultas': [], 'omitidas': 0}
+        with ExitStack() as stack:
+            for alias in self.alias:
+                stack.enter_context(connections[alias].execute_wrapper(_envoltorio_sql(alias, registro, inicio)))
+            if modo == MUESTREO:
+                perfilador = stack.enter_context(Muestreador(threading.get_ident(), config('INTERVALO_MUESTREO')))
+            else:
+                perfilador = cProfile.Profile()
+                stack.callback(perfilador.disable)
+                perfilador.enable()
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        archivos = {'sql': json.dumps(registro).encode()}
+        if modo == MUESTREO:
+            archivos['colapsado'] = perfilador.colapsado().encode()
+        else:
+            perfilador.create_stats()
+            # El mismo contenido que escribe ``dump_stats``
+            archivos['pstats'] = marshal.dumps(perfilador.stats)
+
+        meta = {
+            'id': f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}",
+            'creado': time.time(),
+            'modo': modo,
+            'metodo': request.method,
+            'ruta': request.get_full_path()[:500],
+            'vista': request.resolver_match.view_name if request.resolver_match else '',
+            'usuario': request.user.get_username(),
+            'codigo': response.status_code,
+            'ms': round(duracion * 1000, 1),
+            'consultas': len(registro['consultas']) + registro['omitidas'],
+            'ms_sql': round(sum(c['ms'] for c in registro['consultas']), 1),
+        }
+        try:
+            _guardar(meta, archivos)
+        except OSError as e:
+            logger.error(f"No se pudo guardar el perfil de {meta['ruta']}: {e}")
+            return response
+        logger.info(f"Perfil {meta['id']} ({modo}) de {meta['metodo']} {meta['ruta']}: "
+                    f"{meta['ms']} ms, {meta['consultas']} consultas")
+        response['X-Perfil'] = meta['id']
+        return response
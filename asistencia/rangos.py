@@ -0,0 +1,268 @@
+# rangos.py
+"""
+Asignación de un estado a uno o varios trabajadores durante un rango de fechas
+(vacaciones, licencias, certificados médicos).
+
+En PostgreSQL el rango completo se escribe con una sola sentencia:
+``generate_series`` produce los días, se descartan fines de semana, festivos y
+los días de la semana excluidos, e ``INSERT ... ON CONFLICT DO UPDATE`` crea o
+actualiza las celdas ``(trabajador, fecha)``. Un CTE de la misma sentencia
+escribe las filas de ``CambioIncidencia`` y las celdas escritas vuelven en el
+resultado para difundirlas a las tablas abiertas: un mes de licencia para 50
+trabajadores es un solo viaje a la base de datos. En otros motores (SQLite en
+desarrollo) se calcula lo mismo en Python y se escribe con
+``bulk_create(update_conflicts=True)``.
+
+Sin ``sobrescribir`` solo se reemplazan las celdas con un estado por defecto
+(``Estado.POR_DEFECTO``) o sin estado; con ``sobrescribir`` también las que ya
+tenían otra incidencia. ``vista_previa`` devuelve el mismo resultado sin escribir.
+"""
+import calendar
+import logging
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import cambios, difusion, instantaneas
+from .models import Estado, Incidencia, Trabajador
+
+logger = logging.getLogger(__name__)
+
+SABADO, DOMINGO = 6, 7  # días ISO de la semana (1 = lunes)
+MAX_CAMBIOS_VISTA_PREVIA = 200
+
+SQL_CELDAS = """
+    dias AS (
+        SELECT d::date AS fecha
+        FROM generate_series(%(desde)s::date, %(hasta)s::date, interval '1 day') AS d
+        WHERE EXTRACT(ISODOW FROM d)::int <> ALL(%(dias_excluidos)s::int[])
+          AND d::date <> ALL(%(festivos)s::date[])
+    ),
+    celdas AS (
+        SELECT t.id AS trabajador, t."Area" AS area, dias.fecha
+        FROM trabajador t CROSS JOIN dias
+        WHERE t.id = ANY(%(trabajadores)s::bigint[])
+    ),
+    previas AS (
+        SELECT i.id, i."Estado" AS estado
+        FROM incidencia i
+        JOIN celdas c ON i."Trabajador" = c.trabajador AND i."Fecha_Asistencia" = c.fecha
+    )
+"""
+
+SQL_APLICAR = f"""
+WITH {SQL_CELDAS},
+    escritas AS (
+        INSERT INTO incidencia ("Area", "Trabajador", "Estado", "Fecha_Asistencia", "Version", "Actualizado")
+        SELECT area, trabajador, %(estado)s, fecha, 1, %(ahora)s FROM celdas
+        ON CONFLICT ("Trabajador", "Fecha_Asistencia")
+        DO UPDATE SET "Estado" = EXCLUDED."Estado", "Version" = incidencia."Version" + 1,
+                      "Actualizado" = EXCLUDED."Actualizado"
+        WHERE incidencia."Estado" IS DISTINCT FROM EXCLUDED."Estado"
+          AND (%(sobrescribir)s OR incidencia."Estado" IS NULL
+               OR incidencia."Estado" = ANY(%(por_defecto)s::bigint[]))
+        RETURNING id, "Trabajador", "Area", "Fecha_Asistencia", "Estado", "Version"
+    ),
+    registro AS (
+        INSERT INTO cambio_incidencia
+            (incidencia_id, trabajador_id, area_id, fecha, estado_anterior_id, estado_nuevo_id, usuario_id, registrado)
+        SELECT e.id, e."Trabajador", e."Area", e."Fecha_Asistencia", p.estado, e."Estado", %(usuario)s, %(ahora)s
+        FROM escritas e LEFT JOIN previas p ON p.id = e.id
+    )
+-- Una fila por celda escrita (al menos una, para los conteos)
+SELECT t.celdas, t.previas, t.iguales,
+       e.id, e."Trabajador", e."Area", e."Fecha_Asistencia", e."Estado", e."Version", p.id IS NULL
+FROM (SELECT (SELECT count(*) FROM celdas) AS celdas,
+             (SELECT count(*) FROM previas) AS previas,
+             (SELECT count(*) FROM previas WHERE estado = %(estado)s) AS iguales) t
+LEFT JOIN (escritas e LEFT JOIN previas p ON p.id = e.id) ON true
+"""
+
+
+@dataclass
+class Rango:
+    trabajadores: list  # ids de Trabajador
+    desde: date
+    hasta: date
+    estado_id: int
+    excluir_fines_semana: bool = True
+    excluir_festivos: bool = True
+    dias_excluir: tuple = ()  # días ISO de la semana
+    sobrescribir: bool = False
+
+    def dias_excluidos(self):
+        dias = {int(d) for d in self.dias_excluir}
+        if self.excluir_fines_semana:
+            dias.update((SABADO, DOMINGO))
+        return sorted(dias)
+
+    def festivos(self):
+        return festivos(self.desde, self.hasta) if self.excluir_festivos else []
+
+    def fechas(self):
+        """Días del rango que se asignan, en el mismo orden y con el mismo filtro que el SQL"""
+        excluidos = set(self.dias_excluidos())
+        libres = set(self.festivos())
+        dias = []
+        dia = self.desde
+        while dia <= self.hasta:
+            if dia.isoweekday() not in excluidos and dia not in libres:
+                dias.append(dia)
+            dia += timedelta(days=1)
+        return dias
+
+
+@dataclass
+class Resultado:
+    celdas: int = 0
+    creadas: int = 0
+    actualizadas: int = 0
+    sin_cambios: int = 0
+    omitidas: int = 0  # tenían otra incidencia y no se pidió sobrescribir
+    cambios: list = field(default_factory=list)  # vista previa: (trabajador_id, fecha, estado_actual, estado_nuevo)
+
+
+def festivos(desde, hasta):
+    """
+    Festivos de ``RANGOS['FESTIVOS']`` entre ``desde`` y ``hasta``: ``MM-DD`` se
+    repite cada año y ``AAAA-MM-DD`` es un día concreto.
+    """
+    dias = set()
+    for valor in settings.RANGOS['FESTIVOS']:
+        if len(valor) == 5:
+            mes, dia = int(valor[:2]), int(valor[3:])
+            candidatos = [date(anio, mes, dia) for anio in range(desde.year, hasta.year + 1)
+                          if not (mes == 2 and dia == 29 and not calendar.isleap(anio))]
+        else:
+            candidatos = [date.fromisoformat(valor)]
+        dias.update(d for d in candidatos if desde <= d <= hasta)
+    return sorted(dias)
+
+
+def _reemplazable(estado_actual, rango):
+    return rango.sobrescribir or estado_actual is None or estado_actual in Estado.POR_DEFECTO
+
+
+def _clasificar(rango, resultado):
+    """
+    Recorre las celdas del rango contra las incidencias existentes (una consulta)
+    y devuelve ``(nuevas, modificadas)`` para escribir; acumula los conteos.
+    """
+    fechas = rango.fechas()
+    areas = dict(Trabajador.objects.filter(id__in=rango.trabajadores).values_list('id', 'area_id'))
+    existentes = {
+        (t, f): (pk, e, a, v)
+        for pk, t, f, e, a, v in Incidencia.objects
+        .filter(trabajador_id__in=list(areas), fecha_asistencia__gte=rango.desde, fecha_asistencia__lte=rango.hasta)
+        .order_by().values_list('id', 'trabajador_id', 'fecha_asistencia', 'estado_id', 'area_id', 'version')
+    }
+
+    nuevas, modificadas = [], []
+    for trabajador_id, area_id in areas.items():
+        for fecha in fechas:
+            resultado.celdas += 1
+            actual = existentes.get((trabajador_id, fecha))
+            if actual is None:
+                resultado.creadas += 1
+                nuevas.append(Incidencia(trabajador_id=trabajador_id, fecha_asistencia=fecha,
+                                         area_id=area_id, estado_id=rango.estado_id))
+                anterior = None
+            elif actual[1] == rango.estado_id:
+                resultado.sin_cambios += 1
+                continue
+            elif not _reemplazable(actual[1], rango):
+                resultado.omitidas += 1
+                continue
+            else:
+                resultado.actualizadas += 1
+                modificadas.append((Incidencia(pk=actual[0], trabajador_id=trabajador_id, fecha_asistencia=fecha,
+                                               area_id=actual[2], estado_id=rango.estado_id, version=actual[3] + 1),
+                                    actual[1]))
+                anterior = actual[1]
+            if len(resultado.cambios) < MAX_CAMBIOS_VISTA_PREVIA:
+                resultado.cambios.append((trabajador_id, fecha, anterior, rango.estado_id))
+    return nuevas, modificadas
+
+
+def vista_previa(rango):
+    """Celdas afectadas y lista de cambios (hasta ``MAX_CAMBIOS_VISTA_PREVIA``) sin escribir nada"""
+    resultado = Resultado()
+    _clasificar(rango, resultado)
+    return resultado
+
+
+def _aplicar_sql(rango, alias):
+    parametros = {
+        'desde': rango.desde,
+        'hasta': rango.hasta,
+        'dias_excluidos': rango.dias_excluidos(),
+        'festivos': rango.festivos(),
+        'trabajadores': list(rango.trabajadores),
+        'estado': rango.estado_id,
+        'sobrescribir': rango.sobrescribir,
+        'por_defecto': list(Estado.POR_DEFECTO),
+        'usuario': cambios.autor_id(),
+        'ahora': timezone.now(),
+    }
+    with connections[alias].cursor() as cursor:
+        cursor.execute(SQL_APLICAR, parametros)
+        filas = cursor.fetchall()
+    celdas, previas, sin_cambios = filas[0][:3]
+    escritas = [fila[3:9] for fila in filas if fila[3] is not None]
+    creadas = sum(1 for fila in filas if fila[3] is not None and fila[9])
+    actualizadas = len(escritas) - creadas
+    if escritas:
+        cambios.numerar_al_confirmar(alias)
+    difusion.al_confirmar(escritas, using=alias)
+    return Resultado(celdas=celdas, creadas=creadas, actualizadas=actualizadas, sin_cambios=sin_cambios,
+                     omitidas=previas - sin_cambios - actualizadas)
+
+
+def _aplicar_orm(rango, alias):
+    resultado = Resultado()
+    nuevas, modificadas = _clasificar(rango, resultado)
+    resultado.cambios = []
+    escribir = nuevas + [i for i, _ in modificadas]
+    if escribir:
+        Incidencia.objects.using(alias).bulk_create(
+            escribir, batch_size=1000,
+            update_conflicts=True, unique_fields=['trabajador', 'fecha_asistencia'],
+            update_fields=['estado', 'version', 'actualizado'],
+        )
+        sin_pk = [i for i in nuevas if i.pk is None]
+        if sin_pk:
+            # Motores que no devuelven los ids del INSERT
+            ids = {
+                (t, f): pk for pk, t, f in Incidencia.objects.using(alias)
+                .filter(trabajador_id__in=rango.trabajadores,
+                        fecha_asistencia__gte=rango.desde, fecha_asistencia__lte=rango.hasta)
+                .order_by().values_list('id', 'trabajador_id', 'fecha_asistencia')
+            }
+            for i in sin_pk:
+                i.pk = ids.get((i.trabajador_id, i.fecha_asistencia))
+        cambios.registrar_lote([(i, None) for i in nuevas] + modificadas, using=alias)
+    return resultado
+
+
+def aplicar(rango):
+    """
+    Escribe el rango en una transacción y devuelve los conteos (``Resultado`` sin
+    ``cambios``). Lanza ``instantaneas.MesCerrado`` si el rango toca un mes cerrado.
+    """
+    # Todos los meses del rango, no solo los de sus extremos
+    cerrados = sorted(instantaneas.meses_cerrados(rango.desde, rango.hasta))
+    if cerrados:
+        raise instantaneas.MesCerrado(f"El mes {cerrados[0]:%Y-%m} está cerrado; debe reabrirse para modificarlo")
+    alias = router.db_for_write(Incidencia)
+    with transaction.atomic(using=alias):
+        if connections[alias].vendor == 'postgresql':
+            resultado = _aplicar_sql(rango, alias)
+        else:
+            resultado = _aplicar_orm(rango, alias)
+    logger.info(f"Rango {rango.desde}..{rango.hasta} estado {rango.estado_id} para {len(rango.trabajadores)} "
+                f"trabajadores: {resultado.creadas} creadas, {resultado.actualizadas} actualizadas, "
+                f"{resultado.omitidas} omitidas")
+    return resultado
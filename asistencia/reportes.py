@@ -0,0 +1,276 @@
+# reportes.py
+"""
+Informes mensuales de asistencia listos para imprimir.
+
+``generar(area, mes)`` escribe un HTML (y un PDF, si WeasyPrint está
+instalado) con una hoja por cada área del subárbol de ``area``: un trabajador
+por fila, un día por columna con la clave del estado y el total de cada clave.
+``generar_paquete(mes)`` hace lo mismo para todas las áreas, un informe por
+área, y los reúne en un ZIP.
+
+Los informes se generan en segundo plano (tarea ``reporte_mensual``) y se
+guardan en ``REPORTES['DIRECTORIO']/<AAAA-MM>/`` con la versión de los datos en
+el nombre: un resumen de las incidencias del mes (el token de
+``condicional.token_incidencias``), los trabajadores, las áreas y los estados.
+Mientras nada de eso cambie, ``buscar`` encuentra el archivo y se sirve sin
+volver a generarlo; al generar una versión nueva se borran las anteriores.
+Los meses cerrados se leen de sus instantáneas.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import zipfile
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import condicional, instantaneas
+from .cierre import dias_mes
+from .forms import MESES
+from .models import Area, Estado, Incidencia, Trabajador
+
+try:
+    from weasyprint import HTML
+except ImportError:  # Opcional: sin WeasyPrint solo se genera HTML (imprimible desde el navegador)
+    HTML = None
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar la plantilla o el contenido: invalida los informes guardados
+FORMATO = 1
+TODAS = 'todas'
+
+_RE_ARCHIVO = re.compile(r'^(\d+|todas)-([0-9a-f]{16})\.(html|pdf|zip)$')
+
+
+def config(clave):
+    return settings.REPORTES[clave]
+
+
+def pdf_disponible():
+    return HTML is not None and config('PDF')
+
+
+def areas_subarbol(area):
+    """Ids de ``area`` y todas sus descendientes"""
+    codigos = Area.codigos_subarbol(area.cod_area)
+    return list(Area.objects.filter(cod_area__in=codigos).values_list('id', flat=True))
+
+
+def version(area_ids, mes):
+    """Resumen de todo lo que muestra el informe de ``area_ids`` en ``mes``; cambia si cambia algo"""
+    dias = dias_mes(mes)
+    partes, _ = condicional.token_incidencias(area_ids, dias[0], dias[-1])
+    trabajadores = list(Trabajador.objects.filter(area_id__in=area_ids).order_by('id')
+                        .values_list('id', 'nombre', 'apellidos', 'es_baja', 'area_id'))
+    areas = list(Area.objects.filter(pk__in=area_ids).order_by('id').values_list('id', 'cod_area', 'nombre'))
+    estados = list(Estado.objects.order_by('id').values_list('id', 'clave', 'clave_id'))
+    clave = repr((FORMATO, partes, trabajadores, areas, estados))
+    return hashlib.blake2b(clave.encode(), digest_size=8).hexdigest()
+
+
+# Archivos ---------------------------------------------------------------------
+
+@dataclass
+class Reporte:
+    mes: date
+    area: object  # Area; None = paquete de todas las áreas
+    version: str
+    archivos: list = field(default_factory=list)  # nombres dentro del directorio del mes
+
+    @property
+    def clave(self):
+        return str(self.area.pk) if self.area else TODAS
+
+    @property
+    def prefijo(self):
+        return f"{self.clave}-{self.version}"
+
+    @property
+    def listo(self):
+        return bool(self.archivos)
+
+    @property
+    def titulo(self):
+        nombre = f"{self.area.cod_area} {self.area.nombre}" if self.area else 'Todas las áreas'
+        return f"{nombre}, {dict(MESES)[self.mes.month]} {self.mes.year}"
+
+
+def directorio_mes(mes):
+    return os.path.join(config('DIRECTORIO'), f"{mes:%Y-%m}")
+
+
+def ruta(mes, nombre):
+    """Ruta de un archivo de informe; ``None`` si el nombre no es de un informe o no existe"""
+    if not _RE_ARCHIVO.match(nombre):
+        return None
+    camino = os.path.join(directorio_mes(mes), nombre)
+    return camino if os.path.exists(camino) else None
+
+
+def area_archivo(nombre):
+    """Id del área de un archivo de informe (``None`` para el paquete de todas)"""
+    coincidencia = _RE_ARCHIVO.match(nombre)
+    return int(coincidencia.group(1)) if coincidencia and coincidencia.group(1) != TODAS else None
+
+
+def generados(mes, clave=None):
+    """Nombres de los informes guardados de ``mes`` (de ``clave``: id de área o ``TODAS``)"""
+    try:
+        nombres = os.listdir(directorio_mes(mes))
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in nombres if _RE_ARCHIVO.match(n) and (clave is None or n.startswith(f"{clave}-")))
+
+
+def buscar(mes, area=None):
+    """``Reporte`` de la versión actual de los datos; ``listo`` si ya está generado"""
+    area_ids = areas_subarbol(area) if area else list(Area.objects.values_list('id', flat=True))
+    reporte = Reporte(mes=mes, area=area, version=version(area_ids, mes))
+    reporte.archivos = [n for n in generados(mes, reporte.clave) if n.startswith(f"{reporte.prefijo}.")]
+    return reporte
+
+
+def _guardar(reporte, contenidos):
+    """Escribe ``{extensión: bytes}`` del informe y borra sus versiones anteriores"""
+    os.makedirs(directorio_mes(reporte.mes), exist_ok=True)
+    for extension, contenido in contenidos.items():
+        destino = os.path.join(directorio_mes(reporte.mes), f"{reporte.prefijo}.{extension}")
+        with open(f"{destino}.tmp", 'wb') as archivo:
+            archivo.write(contenido)
+        os.replace(f"{destino}.tmp", destino)
+    reporte.archivos = sorted(f"{reporte.prefijo}.{extension}" for extension in contenidos)
+    for nombre in generados(reporte.mes, reporte.clave):
+        if nombre not in reporte.archivos:
+            os.remove(os.path.join(directorio_mes(reporte.mes), nombre))
+    return reporte
+
+
+# Datos ------------------------------------------------------------------------
+
+def _cargar(area_ids, mes):
+    """
+    ``{area_id: {trabajador_id: {día: estado_id}}}`` del mes: de las instantáneas
+    en los meses cerrados y de ``Incidencia`` en los demás. Los trabajadores
+    activos sin incidencias aparecen con la fila vacía.
+    """
+    dias = dias_mes(mes)
+    celdas = {area_id: {} for area_id in area_ids}
+    congeladas = instantaneas.leer(mes, area_ids) if mes in instantaneas.meses_cerrados(mes, mes) else []
+    for instantanea in congeladas:
+        for trabajador_id, fecha, estado_id in instantanea.celdas():
+            celdas[instantanea.area_id].setdefault(trabajador_id, {})[fecha.day] = estado_id
+
+    en_vivo = set(area_ids) - {i.area_id for i in congeladas}
+    filas = (Incidencia.objects.filter(area_id__in=en_vivo, fecha_asistencia__range=[dias[0], dias[-1]])
+             .order_by().values_list('area_id', 'trabajador_id', 'fecha_asistencia', 'estado_id').iterator())
+    for area_id, trabajador_id, fecha, estado_id in filas:
+        celdas[area_id].setdefault(trabajador_id, {})[fecha.day] = estado_id
+
+    for area_id, trabajador_id in (Trabajador.objects.filter(area_id__in=en_vivo, es_baja=False)
+                                   .values_list('area_id', 'id')):
+        celdas[area_id].setdefault(trabajador_id, {})
+    return celdas
+
+
+def _hojas(area_ids, mes):
+    """Datos de la plantilla: una hoja por área con trabajadores, ordenadas por código"""
+    dias = dias_mes(mes)
+    celdas = _cargar(area_ids, mes)
+    estados = {e.pk: e for e in Estado.objects.all()}
+    ids = {t for por_trabajador in celdas.values() for t in por_trabajador}
+    nombres = {pk: (apellidos, nombre, ci) for pk, nombre, apellidos, ci
+               in Trabajador.objects.filter(pk__in=ids).values_list('id', 'nombre', 'apellidos', 'ci')}
+
+    hojas = []
+    for area in Area.objects.filter(pk__in=[a for a, filas in celdas.items() if filas]).order_by('cod_area'):
+        filas = []
+        totales = Counter()
+        for trabajador_id, por_dia in celdas[area.pk].items():
+            apellidos, nombre, ci = nombres.get(trabajador_id, ('', f"#{trabajador_id}", ''))
+            conteo = Counter(por_dia.values())
+            totales.update(conteo)
+            filas.append({
+                'nombre': f"{apellidos}, {nombre}" if apellidos else nombre,
+                'ci': ci,
+                'dias': [(getattr(estados.get(por_dia.get(d.day)), 'clave_id', ''), d.weekday() >= 5) for d in dias],
+                'conteo': conteo,
+            })
+        filas.sort(key=lambda f: f['nombre'])
+        claves = sorted((e for e in (estados.get(pk) for pk in totales) if e), key=lambda e: e.clave_id)
+        for fila in filas:
+            conteo = fila.pop('conteo')
+            fila['totales'] = [conteo.get(e.pk, 0) for e in claves]
+        hojas.append({
+            'area': area,
+            'filas': filas,
+            'claves': claves,
+            'totales': [totales[e.pk] for e in claves],
+        })
+    return hojas
+
+
+def _html(titulo, mes, hojas):
+    return render_to_string('reportes/mensual.html', {
+        'titulo': titulo,
+        'mes': mes,
+        'nombre_mes': dict(MESES)[mes.month],
+        'dias': dias_mes(mes),
+        'hojas': hojas,
+        'generado': timezone.now(),
+    }).encode()
+
+
+def _contenidos(titulo, mes, hojas):
+    html = _html(titulo, mes, hojas)
+    contenidos = {'html': html}
+    if pdf_disponible():
+        contenidos['pdf'] = HTML(string=html.decode()).write_pdf()
+    return contenidos
+
+
+# Generación ---------------------------------------------------------------------
+
+def generar(area, mes, progreso=None):
+    """Informe del subárbol de ``area`` en ``mes``; si ya existe en su versión actual, no se repite"""
+    reporte = buscar(mes, area)
+    if reporte.listo:
+        return reporte
+    if progreso:
+        progreso(10, 'Leyendo las incidencias')
+    hojas = _hojas(areas_subarbol(area), mes)
+    if progreso:
+        progreso(50, f"Componiendo {len(hojas)} hojas")
+    _guardar(reporte, _contenidos(reporte.titulo, mes, hojas))
+    logger.info(f"Informe de {reporte.titulo} generado ({len(hojas)} hojas, versión {reporte.version})")
+    return reporte
+
+
+def generar_paquete(mes, progreso=None):
+    """ZIP con el informe de cada área (sin sus descendientes) en ``mes``"""
+    reporte = buscar(mes)
+    if reporte.listo:
+        return reporte
+    if progreso:
+        progreso(5, 'Leyendo las incidencias')
+    hojas = _hojas(list(Area.objects.values_list('id', flat=True)), mes)
+
+    contenido = io.BytesIO()
+    with zipfile.ZipFile(contenido, 'w', zipfile.ZIP_DEFLATED) as paquete:
+        for n, hoja in enumerate(hojas, 1):
+            area = hoja['area']
+            nombre = re.sub(r'[^\w.-]+', '_', f"{area.cod_area} {area.nombre}")
+            for extension, datos in _contenidos(f"{area.cod_area} {area.nombre}", mes, [hoja]).items():
+                paquete.writestr(f"{mes:%Y-%m}/{nombre}.{extension}", datos)
+            if progreso:
+                progreso(5 + 90 * n / len(hojas), f"{n} de {len(hojas)} áreas")
+    _guardar(reporte, {'zip': contenido.getvalue()})
+    logger.info(f"Paquete de informes de {mes:%Y-%m} generado ({len(hojas)} áreas, versión {reporte.version})")
+    return reporte
+
@@ -1,19 +1,128 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+NOMINA = 'sqlserver'
+REPLICA = 'replica'
+
+# Tablas de NOMINA espejadas por modelos no gestionados (ver models.py)
+TABLAS_NOMINA = {'RH_Unidades_Organizativas', 'Empleados_Gral', 'RH_Claves_Ausencias'}
+
+_lectura_pesada = ContextVar('lectura_pesada', default=False)
+# Estado de la petición en curso (``[fijada]``, mutable para que las escrituras lo marquen);
+# ``None`` fuera de una petición: comandos e hilos no quedan fijados para siempre
+_primaria_fijada = ContextVar('primaria_fijada', default=None)
+
+
+class EscrituraNominaError(Exception):
+    """Se intentó escribir en una tabla de NOMINA a través del ORM."""
+
+
+@contextmanager
+def lectura_pesada():
+    """
+    Marca las consultas de solo lectura costosas (reportes, exportaciones,
+    resúmenes) para que se lean de la réplica si está disponible.
+    Se usa como ``with lectura_pesada():`` o como decorador ``@lectura_pesada()``.
+    """
+    token = _lectura_pesada.set(True)
+    try:
+        yield
+    finally:
+        _lectura_pesada.reset(token)
+
+
+def fijar_primaria(fijar=True):
+    """
+    Abre el ámbito de read-your-writes de una petición (``PrimariaTrasEscrituraMiddleware``)
+    o de un bloque de código: con ``fijar`` las lecturas van a la primaria, y si no, a
+    partir de la primera escritura. Devuelve un token para ``liberar_primaria``.
+    """
+    return _primaria_fijada.set([fijar])
+
+
+def primaria_fijada():
+    estado = _primaria_fijada.get()
+    return estado is not None and estado[0]
+
+
+def liberar_primaria(token):
+    _primaria_fijada.reset(token)
+
+
+class _RetrasoReplica:
+    """Retraso de replicación en segundos, consultado como mucho cada ``intervalo`` segundos"""
+    SQL = (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valor = float('inf')
+        self._medido = 0.0
+
+    def valor(self):
+        intervalo = settings.DB_REPLICA['LAG_CHECK_INTERVAL']
+        if time.monotonic() - self._medido < intervalo:
+            return self._valor
+        with self._lock:
+            if time.monotonic() - self._medido >= intervalo:
+                self._valor = self._medir()
+                self._medido = time.monotonic()
+        return self._valor
+
+    def _medir(self):
+        try:
+            with connections[REPLICA].cursor() as cursor:
+                cursor.execute(self.SQL)
+                return float(cursor.fetchone()[0])
+        except Exception as e:
+            logger.warning(f"No se pudo medir el retraso de la réplica: {e}")
+            return float('inf')
+
+
+retraso_replica = _RetrasoReplica()
+
+
+def es_modelo_nomina(model):
+    return not model._meta.managed and model._meta.db_table in TABLAS_NOMINA
+
+
 class DatabaseRouter:
     """
     Router para controlar las operaciones de bases de datos
+
+    - Las tablas de NOMINA se leen de 'sqlserver' y nunca se escriben por el ORM.
+    - Las lecturas marcadas con ``lectura_pesada()`` van a la réplica de PostgreSQL
+      si existe, su retraso no supera ``DB_REPLICA['MAX_LAG']`` y el usuario no
+      acaba de escribir (la primaria queda fijada unos segundos tras un POST).
     """
 
     def db_for_read(self, model, **hints):
-        if model._meta.app_label == 'asistencia' and hasattr(model, '_meta') and model._meta.db_table in ['tabla1',
-                                                                                                      'tabla2']:
-            return 'sqlserver'
+        if es_modelo_nomina(model):
+            return NOMINA
+        if (_lectura_pesada.get() and not primaria_fijada() and REPLICA in settings.DATABASES
+                and retraso_replica.valor() <= settings.DB_REPLICA['MAX_LAG']):
+            return REPLICA
         return 'default'
 
     def db_for_write(self, model, **hints):
         # Las tablas existentes son de solo lectura
-        if model._meta.app_label == 'asistencia' and hasattr(model, '_meta') and model._meta.db_table in ['tabla1',
-                                                                                                      'tabla2']:
-            return None  # No permitir escritura en tablas existentes
+        if es_modelo_nomina(model):
+            raise EscrituraNominaError(f"La tabla {model._meta.db_table} de NOMINA es de solo lectura")
+        # Lo que se lea después en esta petición debe ver la escritura; fuera de un
+        # ámbito abierto con ``fijar_primaria`` no se fija nada
+        estado = _primaria_fijada.get()
+        if estado is not None:
+            estado[0] = True
         return 'default'
 
     def allow_relation(self, obj1, obj2, **hints):
@@ -24,4 +133,4 @@ class DatabaseRouter:
         # Solo migrar modelos nuevos a la base de datos default
         if db == 'default':
             return True
-        return False  # No migrar a la base de datos sqlserver
\ No newline at end of file
+        return False  # No migrar a la base de datos sqlserver ni a la réplica
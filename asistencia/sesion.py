@@ -0,0 +1,161 @@
+# sesion.py
+"""
+Datos del usuario autenticado resueltos sin consultar la base de datos en cada
+petición.
+
+- ``obtener_usuario`` guarda el ``User`` en la caché bajo una clave versionada;
+  cada guardado de ``auth_user`` renueva la versión (ver ``signals.py``) y la
+  versión global ``version_usuarios``, que usan los ETag de las búsquedas.
+- ``areas_responsable`` guarda en la sesión las áreas a cargo del usuario
+  ("claim"), validadas contra la versión de sus asignaciones y la de las áreas.
+
+Las versiones viven en la caché por defecto, que debe ser compartida por todos
+los workers (comprobación ``asistencia.E001`` en ``checks.py``).
+"""
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+
+from . import metricas
+from .models import Area, ResponsableArea
+
+CLAIM_AREAS = '_areas_responsable'
+USUARIO_TTL = 60 * 15
+
+
+def _version(clave):
+    """Devuelve la versión actual de ``clave``, creándola si no existe"""
+    version = cache.get(clave)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(clave, version, None):
+            version = cache.get(clave, version)
+    return version
+
+
+def _renovar_version(clave):
+    cache.set(clave, uuid.uuid4().hex, None)
+
+
+def _clave_version_usuario(user_id):
+    return f"usuario:ver:{user_id}"
+
+
+def _clave_version_responsable(user_id):
+    return f"responsables:ver:{user_id}"
+
+
+CLAVE_VERSION_AREAS = 'areas:ver'
+CLAVE_VERSION_USUARIOS = 'usuarios:ver'
+CLAVE_VERSION_DIRECTORIO = 'directorio:ver'
+CLAVE_VERSION_TRABAJADORES = 'trabajadores:ver'
+CLAVE_VERSION_ESTADOS = 'estados:ver'
+
+
+def obtener_usuario(user_id):
+    """
+    Obtiene un usuario por su ID desde la caché.
+    Lanza ``DoesNotExist`` igual que ``objects.get``.
+    """
+    version = _version(_clave_version_usuario(user_id))
+    clave = f"usuario:{user_id}:{version}"
+    usuario = cache.get(clave)
+    if usuario is None:
+        metricas.incrementar('sisga_cache_total', cache='usuarios', resultado='fallos')
+        usuario = get_user_model().objects.get(pk=user_id)
+        cache.set(clave, usuario, USUARIO_TTL)
+    else:
+        metricas.incrementar('sisga_cache_total', cache='usuarios', resultado='aciertos')
+    return usuario
+
+
+def invalidar_usuario(user_id):
+    _renovar_version(_clave_version_usuario(user_id))
+    _renovar_version(CLAVE_VERSION_USUARIOS)
+
+
+def version_usuarios():
+    """Cambia con cualquier alta, cambio o baja de ``auth_user``"""
+    return _version(CLAVE_VERSION_USUARIOS)
+
+
+def version_areas():
+    return _version(CLAVE_VERSION_AREAS)
+
+
+def version_directorio():
+    """Cambia con cada sincronización que modifica la copia local del directorio"""
+    return _version(CLAVE_VERSION_DIRECTORIO)
+
+
+def invalidar_directorio():
+    _renovar_version(CLAVE_VERSION_DIRECTORIO)
+
+
+def invalidar_responsable(user_id):
+    _renovar_version(_clave_version_responsable(user_id))
+
+
+def invalidar_areas():
+    _renovar_version(CLAVE_VERSION_AREAS)
+
+
+def version_trabajadores():
+    """Cambia con cada guardado o borrado de un ``Trabajador`` (nombre, área, baja)"""
+    return _version(CLAVE_VERSION_TRABAJADORES)
+
+
+def invalidar_trabajadores():
+    _renovar_version(CLAVE_VERSION_TRABAJADORES)
+
+
+def version_estados():
+    """Cambia con cada guardado o borrado de un ``Estado`` (clave o descripción)"""
+    return _version(CLAVE_VERSION_ESTADOS)
+
+
+def invalidar_estados():
+    _renovar_version(CLAVE_VERSION_ESTADOS)
+
+
+def areas_responsable(request):
+    """
+    Lista de asignaciones del usuario (activas e inactivas) como diccionarios
+    ``{'area_id', 'cod_area', 'nombre', 'activo'}`` ordenados por nombre.
+    """
+    usuario = request.user
+    if not usuario.is_authenticated:
+        return []
+
+    version = f"{_version(_clave_version_responsable(usuario.pk))}:{_version(CLAVE_VERSION_AREAS)}"
+    claim = request.session.get(CLAIM_AREAS)
+    if not claim or claim.get('v') != version:
+        areas = ResponsableArea.objects.filter(usuario=usuario).order_by('area__nombre').values(
+            'area_id', 'activo', cod_area=F('area__cod_area'), nombre=F('area__nombre')
+        )
+        claim = {'v': version, 'areas': list(areas)}
+        request.session[CLAIM_AREAS] = claim
+    return claim['areas']
+
+
+def es_responsable(request, area_id):
+    """Verifica si el usuario es responsable activo de un área"""
+    return any(a['area_id'] == area_id and a['activo'] for a in areas_responsable(request))
+
+
+def areas_editables(request):
+    """
+    Ids de las áreas cuyas incidencias puede modificar el usuario: las que tiene
+    a cargo (activas) y sus hijas directas, como en ``tabla_incidencias``.
+    ``None`` para superusuarios (todas); ser staff no da permiso de edición.
+    """
+    usuario = request.user
+    if usuario.is_superuser:
+        return None
+    activas = [a for a in areas_responsable(request) if a['activo']]
+    ids = {a['area_id'] for a in activas}
+    if activas:
+        ids.update(Area.objects.filter(unidad_padre__in=[a['cod_area'] for a in activas]).values_list('id', flat=True))
+    return ids
@@ -0,0 +1,38 @@
+# signals.py
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import ldap_client, sesion
+from .models import Area, Estado, ResponsableArea, Trabajador
+
+
+@receiver(post_save, sender=User)
+def olvidar_usuario_desconocido(sender, instance, **kwargs):
+    """Un usuario recién creado o reactivado deja de estar en la caché negativa"""
+    ldap_client.olvidar_usuario_desconocido(instance.username)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidar_usuario(sender, instance, **kwargs):
+    sesion.invalidar_usuario(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ResponsableArea)
+def invalidar_responsable(sender, instance, **kwargs):
+    sesion.invalidar_responsable(instance.usuario_id)
+
+
+@receiver([post_save, post_delete], sender=Area)
+def invalidar_areas(sender, instance, **kwargs):
+    sesion.invalidar_areas()
+
+
+@receiver([post_save, post_delete], sender=Trabajador)
+def invalidar_trabajadores(sender, instance, **kwargs):
+    sesion.invalidar_trabajadores()
+
+
+@receiver([post_save, post_delete], sender=Estado)
+def invalidar_estados(sender, instance, **kwargs):
+    sesion.invalidar_estados()
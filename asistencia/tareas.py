@@ -0,0 +1,338 @@
+# tareas.py
+"""
+Cola de tareas en segundo plano sobre la propia base de datos, sin broker.
+
+``encolar(tipo, parametros)`` crea una fila ``Tarea`` pendiente y devuelve
+enseguida; ``manage.py run_workers`` la ejecuta en otro proceso. Cada hilo
+trabajador reclama la siguiente tarea con ``SELECT ... FOR UPDATE SKIP LOCKED``
+(varios procesos y máquinas pueden leer la misma cola sin pisarse ni
+bloquearse) y la marca en curso en la misma transacción.
+
+Las funciones de tarea se registran con ``@registrar('tipo')`` y reciben la
+``Tarea`` y sus parámetros; informan del avance con ``progreso(tarea, %,
+mensaje)`` y lo que devuelven (serializable a JSON) queda en ``resultado``. Si
+lanzan una excepción la tarea vuelve a la cola con un retraso que se duplica en
+cada intento, hasta ``max_intentos``; al fallar definitivamente se llama a su
+``al_fallar`` (p. ej. para borrar archivos temporales). Mientras una tarea está
+en curso su proceso actualiza ``latido``; si un proceso muere, sus tareas se dan
+por huérfanas pasado ``TAREAS['HUERFANA']`` y vuelven a la cola. Un trabajador
+solo guarda el resultado, el reintento o el fallo de una tarea que sigue siendo
+suya: si entretanto se dio por huérfana, lo que guarde el nuevo dueño prevalece.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import asdict, is_dataclass
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import cambios, metricas
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_registro = {}
+_al_fallar = {}
+
+
+class SinReintento(Exception):
+    """La tarea falló por un motivo que no se arregla reintentando (datos no válidos)"""
+
+
+def registrar(tipo, al_fallar=None):
+    """
+    Decorador: ``funcion(tarea, **parametros)`` ejecuta las tareas de ``tipo``;
+    ``al_fallar(tarea, **parametros)`` se llama cuando ya no quedan reintentos.
+    """
+    def decorador(funcion):
+        _registro[tipo] = funcion
+        if al_fallar is not None:
+            _al_fallar[tipo] = al_fallar
+        return funcion
+    return decorador
+
+
+def _fallida(tarea):
+    """Llama al ``al_fallar`` del tipo de ``tarea``, que ya no se reintentará"""
+    funcion = _al_fallar.get(tarea.tipo)
+    if funcion is None:
+        return
+    try:
+        funcion(tarea, **tarea.parametros)
+    except Exception as e:
+        logger.error(f"Tarea {tarea.pk} ({tarea.tipo}): falló la limpieza tras el fallo: {e}")
+
+
+def tipos():
+    return sorted(_registro)
+
+
+def encolar(tipo, parametros=None, usuario=None, prioridad=0, max_intentos=None):
+    if tipo not in _registro:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+    tarea = Tarea.objects.create(
+        tipo=tipo, parametros=parametros or {}, usuario=usuario, prioridad=prioridad,
+        max_intentos=max_intentos or settings.TAREAS['MAX_INTENTOS'],
+    )
+    logger.info(f"Tarea {tarea.pk} ({tipo}) encolada")
+    return tarea
+
+
+def progreso(tarea, porcentaje, mensaje=''):
+    """Guarda el avance de ``tarea`` (como mucho una escritura por segundo, salvo al llegar a 100)"""
+    ahora = time.monotonic()
+    porcentaje = max(0.0, min(100.0, float(porcentaje)))
+    if porcentaje < 100 and ahora - getattr(tarea, '_ultimo_progreso', 0) < 1:
+        return
+    tarea._ultimo_progreso = ahora
+    tarea.progreso = porcentaje
+    tarea.mensaje = str(mensaje)[:255]
+    Tarea.objects.filter(pk=tarea.pk).update(progreso=tarea.progreso, mensaje=tarea.mensaje,
+                                              latido=timezone.now())
+
+
+def reclamar(trabajador, tipos_admitidos=None):
+    """Marca en curso la siguiente tarea disponible y la devuelve (``None`` si no hay)"""
+    ahora = timezone.now()
+    with transaction.atomic():
+        qs = Tarea.objects.select_for_update(skip_locked=True).filter(estado=Tarea.PENDIENTE, disponible__lte=ahora)
+        if tipos_admitidos:
+            qs = qs.filter(tipo__in=tipos_admitidos)
+        tarea = qs.order_by('-prioridad', 'id').first()
+        if tarea is None:
+            return None
+        tarea.estado = Tarea.EN_CURSO
+        tarea.intentos += 1
+        tarea.trabajador = trabajador
+        tarea.iniciada = tarea.latido = ahora
+        tarea.save(update_fields=['estado', 'intentos', 'trabajador', 'iniciada', 'latido'])
+    return tarea
+
+
+def _serializable(valor):
+    if is_dataclass(valor):
+        return asdict(valor)
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea ya reclamada y guarda su resultado, el reintento o el fallo"""
+    inicio = time.monotonic()
+    try:
+        funcion = _registro.get(tarea.tipo)
+        if funcion is None:
+            raise ValueError(f"Tipo de tarea desconocido: {tarea.tipo}")
+        # Los cambios de incidencias que haga la tarea se atribuyen a quien la encoló
+        with cambios.autor(tarea.usuario):
+            resultado = _serializable(funcion(tarea, **tarea.parametros))
+    except Exception as e:
+        error = f"{e.__class__.__name__}: {e}\n{traceback.format_exc()}"
+        if tarea.intentos < tarea.max_intentos and not isinstance(e, SinReintento):
+            retraso = settings.TAREAS['RETRASO_REINTENTO'] * 2 ** (tarea.intentos - 1)
+            if _propia(tarea).update(estado=Tarea.PENDIENTE, error=error, trabajador='',
+                                     disponible=timezone.now() + timedelta(seconds=retraso)):
+                logger.warning(f"Tarea {tarea.pk} ({tarea.tipo}) falló en el intento {tarea.intentos}, "
+                               f"se reintenta en {retraso} s: {e}")
+            else:
+                _ajena(tarea)
+        elif _propia(tarea).update(estado=Tarea.FALLIDA, error=error, terminada=timezone.now()):
+            logger.error(f"Tarea {tarea.pk} ({tarea.tipo}) fallida tras {tarea.intentos} intentos: {e}")
+            _fallida(tarea)
+        else:
+            _ajena(tarea)
+        return False
+    if not _propia(tarea).update(estado=Tarea.TERMINADA, progreso=100, resultado=resultado, error='',
+                                 terminada=timezone.now()):
+        _ajena(tarea)
+        return False
+    logger.info(f"Tarea {tarea.pk} ({tarea.tipo}) terminada en {time.monotonic() - inicio:.1f} s")
+    return True
+
+
+def _propia(tarea):
+    """La fila de ``tarea`` solo si sigue en curso a nombre de quien la reclamó"""
+    return Tarea.objects.filter(pk=tarea.pk, estado=Tarea.EN_CURSO, trabajador=tarea.trabajador)
+
+
+def _ajena(tarea):
+    logger.warning(f"Tarea {tarea.pk} ({tarea.tipo}): se dio por huérfana mientras {tarea.trabajador} la "
+                   f"ejecutaba; su resultado se descarta")
+
+
+def latir(prefijo):
+    """Renueva el latido de las tareas en curso de los trabajadores que empiezan por ``prefijo``"""
+    return Tarea.objects.filter(estado=Tarea.EN_CURSO, trabajador__startswith=prefijo).update(latido=timezone.now())
+
+
+def recuperar_huerfanas():
+    """Devuelve a la cola (o da por fallidas) las tareas en curso cuyo proceso dejó de latir"""
+    limite = timezone.now() - timedelta(seconds=settings.TAREAS['HUERFANA'])
+    huerfanas = Tarea.objects.filter(estado=Tarea.EN_CURSO, latido__lt=limite)
+    agotadas = list(huerfanas.filter(intentos__gte=F('max_intentos')).only('id', 'tipo', 'parametros'))
+    fallidas = huerfanas.filter(pk__in=[t.pk for t in agotadas]).update(
+        estado=Tarea.FALLIDA, error='El proceso que la ejecutaba dejó de responder', terminada=timezone.now())
+    for tarea in agotadas:
+        _fallida(tarea)
+    devueltas = huerfanas.update(estado=Tarea.PENDIENTE, trabajador='', disponible=timezone.now())
+    if fallidas or devueltas:
+        logger.warning(f"Tareas huérfanas: {devueltas} devueltas a la cola, {fallidas} fallidas")
+    return devueltas, fallidas
+
+
+def profundidad():
+    """``{estado: número de tareas}`` de las pendientes y en curso"""
+    return dict(Tarea.objects.filter(estado__in=[Tarea.PENDIENTE, Tarea.EN_CURSO]).order_by()
+                .values_list('estado').annotate(n=Count('id')))
+
+
+def prefijo_proceso():
+    return f"{socket.gethostname()}:{os.getpid()}:"
+
+
+def trabajar(nombre, parar, tipos_admitidos=None, una_vez=False):
+    """
+    Bucle de un hilo trabajador: reclama y ejecuta tareas hasta que se activa
+    ``parar`` (un ``Event``); con ``una_vez`` termina cuando la cola se vacía.
+    """
+    trabajador = f"{prefijo_proceso()}{nombre}"
+    try:
+        while not parar.is_set():
+            close_old_connections()
+            try:
+                tarea = reclamar(trabajador, tipos_admitidos)
+            except Exception as e:
+                logger.error(f"Trabajador {trabajador}: no se pudo reclamar una tarea: {e}")
+                tarea = None
+            if tarea is not None:
+                ejecutar(tarea)
+            elif una_vez:
+                return
+            else:
+                parar.wait(settings.TAREAS['ESPERA'])
+    finally:
+        connections.close_all()  # las del hilo
+
+
+def mantener(parar):
+    """
+    Hilo de mantenimiento de cada proceso: latidos propios, tareas huérfanas de
+    otros, cambios de incidencias que quedaron sin numerar y métricas
+    """
+    prefijo = prefijo_proceso()
+    while not parar.wait(settings.TAREAS['LATIDO']):
+        close_old_connections()
+        try:
+            latir(prefijo)
+            recuperar_huerfanas()
+            cambios.numerar()
+        except Exception as e:
+            logger.error(f"Mantenimiento de tareas: {e}")
+        # Las métricas de este proceso (LDAP, cachés) también llegan a /metrics
+        metricas.volcar()
+    connections.close_all()
+
+
+def ejecutar_proceso(hilos, parar, tipos_admitidos=None, una_vez=False):
+    """Lanza ``hilos`` trabajadores y el de mantenimiento en el proceso actual y espera a que terminen"""
+    mantenimiento = threading.Thread(target=mantener, args=(parar,), daemon=True, name='tareas-mantenimiento')
+    mantenimiento.start()
+    trabajadores = [
+        threading.Thread(target=trabajar, args=(str(n), parar, tipos_admitidos, una_vez), name=f'tareas-{n}')
+        for n in range(hilos)
+    ]
+    for hilo in trabajadores:
+        hilo.start()
+    for hilo in trabajadores:
+        hilo.join()
+
+
+# Tareas de la aplicación ----------------------------------------------------
+
+@registrar('sincronizar_directorio')
+def _sincronizar_directorio(tarea, completo=False):
+    from . import espejo_directorio
+
+    progreso(tarea, 0, 'Consultando el directorio')
+    return espejo_directorio.sincronizar(completo=completo)
+
+
+@registrar('cerrar_mes')
+def _cerrar_mes(tarea, mes, procesos=None, exportar=True):
+    from . import cierre
+
+    inicio = date.fromisoformat(mes).replace(day=1)
+
+    def avance(hechos, total, resultado):
+        # El 10 % final: validación, exportación y congelado
+        progreso(tarea, 90 * hechos / total, f"{hechos} de {total} subárboles")
+
+    try:
+        cerrado = cierre.cerrar(inicio, procesos=procesos, exportar=exportar, progreso=avance)
+    except cierre.MesNoValidado as e:
+        raise SinReintento(str(e))
+    return {'mes': f"{inicio:%Y-%m}", 'estado': cerrado.estado, 'exportado': cerrado.exportado}
+
+
+def _borrar_importacion(tarea, ruta, **parametros):
+    """Sin más reintentos el archivo subido ya no se usará"""
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+@registrar('importar_incidencias', al_fallar=_borrar_importacion)
+def _importar_incidencias(tarea, ruta, nombre, sobrescribir=False, estado_predeterminado=None, area_ids=None):
+    from . import importacion
+
+    tamano = os.path.getsize(ruta) or 1
+    try:
+        with open(ruta, 'rb') as archivo:
+            def avance(resultado):
+                # Posición en el archivo: aproximada (CSV con búfer, XLSX comprimido)
+                progreso(tarea, min(99, 100 * archivo.tell() / tamano), f"{resultado.filas} filas procesadas")
+
+            resultado = importacion.importar(archivo, nombre, sobrescribir=sobrescribir,
+                                             estado_predeterminado=estado_predeterminado, area_ids=area_ids,
+                                             progreso=avance)
+    except importacion.ArchivoNoValido as e:
+        raise SinReintento(str(e))
+    # Ante otros errores (p. ej. de la base de datos) el archivo se conserva para el reintento
+    # y _borrar_importacion lo borra cuando ya no quedan
+    os.remove(ruta)
+    return resultado
+
+
+@registrar('reporte_mensual')
+def _reporte_mensual(tarea, mes, area_id=None):
+    from django.urls import reverse
+
+    from . import reportes
+    from .models import Area
+
+    inicio = date.fromisoformat(mes).replace(day=1)
+
+    def avance(porcentaje, mensaje):
+        progreso(tarea, porcentaje, mensaje)
+
+    if area_id is None:
+        reporte = reportes.generar_paquete(inicio, progreso=avance)
+    else:
+        area = Area.objects.filter(pk=area_id).first()
+        if area is None:
+            raise SinReintento(f"El área {area_id} no existe")
+        reporte = reportes.generar(area, inicio, progreso=avance)
+    return {
+        'informe': reporte.titulo,
+        'version': reporte.version,
+        'enlaces': [reverse('reporte_descargar', args=[f"{inicio:%Y-%m}", nombre]) for nombre in reporte.archivos],
+    }
@@ -0,0 +1,36 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from asistencia import estaticos
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(nombre):
+    """
+    Etiquetas ``<link>``/``<script>`` del paquete ``nombre`` de ``STATIC_BUNDLES``.
+    Con los paquetes activos emite una sola etiqueta con el nombre con hash;
+    en desarrollo emite los archivos sueltos y los JSON como ``<script>`` en línea.
+    """
+    entradas = estaticos.bundles()[nombre]
+    es_css = nombre.endswith('.css')
+
+    if estaticos.bundles_activos():
+        if es_css:
+            return format_html('<link rel="stylesheet" href="{}">', static(nombre))
+        return format_html('<script src="{}"></script>', static(nombre))
+
+    etiquetas = []
+    for entrada in entradas:
+        ruta, variable = estaticos.fuente(entrada)
+        if variable:
+            js = estaticos.json_como_js(estaticos.leer_fuente(ruta), variable).replace('</', '<\\/')
+            etiquetas.append(mark_safe(f"<script>{js}</script>"))
+        elif es_css:
+            etiquetas.append(format_html('<link rel="stylesheet" href="{}">', static(ruta)))
+        else:
+            etiquetas.append(format_html('<script src="{}"></script>', static(ruta)))
+    return format_html_join('\n', '{}', ((e,) for e in etiquetas))
@@ -9,6 +9,7 @@ django.setup()
 
 from django.db import connections
 from asistencia.models import Area, Trabajador, Estado
+from asistencia import nomina
 from django.conf import settings
 
 # Probar conexión a PostgreSQL
@@ -31,11 +32,8 @@ resultados = {
 def coneccion(sql):
     datos = []
     try:
-        with connections['sqlserver'].cursor() as cursor:
-            cursor.execute(sql)
-            datos = cursor.fetchall()
-            cursor.close()
-            # connections.close()
+        # Conexión prestada por el pool de NOMINA (se reutiliza y reconecta si se cae)
+        datos = nomina.consultar(sql)
 
     except Exception as e:
         print(f"❌ Error SQL Server: {e}")
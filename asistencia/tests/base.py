@@ -0,0 +1,46 @@
+# base.py
+"""
+Datos comunes de las pruebas.
+
+Las fechas son fijas (marzo y abril de 2025) para que los resultados no
+dependan del día en que se ejecutan.
+"""
+from datetime import date
+
+from django.contrib.auth.models import User
+
+from ..models import Area, CierreMes, Estado, Incidencia, ResponsableArea, Trabajador
+
+VACACIONES = 112
+CERTIFICADO = 113
+LUNES = date(2025, 3, 3)
+ABRIL = date(2025, 4, 1)
+
+
+class DatosMixin:
+    """Un área hoja con su responsable, dos trabajadores y el catálogo mínimo de estados"""
+
+    @classmethod
+    def crear_datos(cls):
+        for pk, clave, clave_id in [(Estado.ASISTENCIA, 'Asistencia', 'A'), (Estado.SABADO, 'Sábado', 'S'),
+                                    (Estado.DOMINGO, 'Domingo', 'D'), (VACACIONES, 'Vacaciones', 'V'),
+                                    (CERTIFICADO, 'Certificado médico', 'CM')]:
+            Estado.objects.create(pk=pk, clave=clave, clave_id=clave_id)
+        cls.raiz = Area.objects.create(cod_area='T01', nombre='Raíz', unidad_padre='T01')
+        cls.area = Area.objects.create(cod_area='T01.1', nombre='Hoja', unidad_padre='T01')
+        cls.trabajadores = [
+            Trabajador.objects.create(ci=f'8001010000{n}', nombre='Ana', apellidos=f'Pérez {n}', es_baja=False,
+                                      area=cls.area)
+            for n in range(2)
+        ]
+        cls.usuario = User.objects.create_user('resp.t01.1', password='clave')
+        ResponsableArea.objects.create(usuario=cls.usuario, area=cls.area)
+
+    @classmethod
+    def incidencia(cls, fecha, estado_id=Estado.ASISTENCIA, trabajador=0):
+        return Incidencia.objects.create(area=cls.area, trabajador=cls.trabajadores[trabajador],
+                                         estado_id=estado_id, fecha_asistencia=fecha)
+
+    @staticmethod
+    def cerrar(mes):
+        return CierreMes.objects.create(mes=mes, estado=CierreMes.CERRADO)
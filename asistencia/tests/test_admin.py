@@ -0,0 +1,102 @@
+# test_admin.py
+"""Admin de tablas grandes: total estimado en PostgreSQL y conteo exacto en el resto"""
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import admin as admin_sisga
+from ..admin import PaginadorEstimado
+from ..models import Trabajador
+from .base import DatosMixin
+
+
+class CursorFalso:
+    """Cursor que devuelve ``fila`` y guarda las consultas ejecutadas"""
+
+    def __init__(self, fila):
+        self.fila = fila
+        self.consultas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.consultas.append(sql)
+
+    def fetchone(self):
+        return self.fila
+
+
+def postgres(fila):
+    """``connections`` falso con un alias PostgreSQL cuyo cursor devuelve ``fila``"""
+    cursor = CursorFalso(fila)
+    return {'default': mock.Mock(vendor='postgresql', cursor=lambda: cursor)}, cursor
+
+
+class PaginadorEstimadoTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def paginador(self, qs=None):
+        return PaginadorEstimado(qs if qs is not None else Trabajador.objects.order_by('id'), 1)
+
+    def test_otros_motores_cuentan_de_verdad(self):
+        with mock.patch.object(PaginadorEstimado, '_estimar') as estimar:
+            self.assertEqual(self.paginador().count, 2)
+        estimar.assert_not_called()
+
+    def test_tabla_sin_filtros_usa_reltuples(self):
+        conexiones, cursor = postgres((2_000_000,))
+        with mock.patch.object(admin_sisga, 'connections', conexiones):
+            paginador = self.paginador()
+            self.assertEqual(paginador.count, 2_000_000)
+            self.assertEqual(paginador.num_pages, 2_000_000)
+        self.assertEqual(len(cursor.consultas), 1)
+        self.assertIn('pg_class', cursor.consultas[0])
+
+    def test_con_filtros_usa_la_estimacion_de_explain(self):
+        conexiones, cursor = postgres(([{'Plan': {'Plan Rows': 50_000}}],))
+        with mock.patch.object(admin_sisga, 'connections', conexiones):
+            self.assertEqual(self.paginador(Trabajador.objects.filter(es_baja=False)).count, 50_000)
+        self.assertTrue(cursor.consultas[0].startswith('EXPLAIN (FORMAT JSON) SELECT'))
+
+    def test_por_debajo_del_umbral_cuenta_de_verdad(self):
+        conexiones, _ = postgres((PaginadorEstimado.UMBRAL - 1,))
+        with mock.patch.object(admin_sisga, 'connections', conexiones):
+            self.assertEqual(self.paginador().count, 2)
+
+    def test_tabla_sin_analyze_cuenta_de_verdad(self):
+        conexiones, _ = postgres((-1,))
+        with mock.patch.object(admin_sisga, 'connections', conexiones):
+            self.assertEqual(self.paginador().count, 2)
+
+
+# Sin collectstatic no hay manifiesto de estáticos que resolver al renderizar
+@override_settings(STORAGES={**settings.STORAGES,
+                             'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class ListadoTablaGrandeTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.admin = User.objects.create_superuser('admin', password='clave')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_listado_sin_borrado_masivo(self):
+        respuesta = self.client.get(reverse('admin:asistencia_trabajador_changelist'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIsInstance(respuesta.context['cl'].paginator, PaginadorEstimado)
+        acciones = [nombre for nombre, _ in respuesta.context['action_form'].fields['action'].choices]
+        self.assertNotIn('delete_selected', acciones)
+        self.assertIn('dar_baja', acciones)
+        self.assertContains(respuesta, self.trabajadores[0].ci)
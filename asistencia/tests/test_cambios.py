@@ -0,0 +1,118 @@
+# test_cambios.py
+"""Registro de cambios: numeración al confirmar, lectura por cursor y poda"""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from django.test import TestCase
+
+from .. import cambios
+from ..models import CambioIncidencia
+from .base import LUNES, VACACIONES, DatosMixin
+
+
+class FeedCambiosTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def crear(self, dias=1):
+        """Crea ``dias`` incidencias desde ``LUNES`` y confirma (numera) su transacción"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(dias):
+                self.incidencia(LUNES + timedelta(days=n))
+
+    def cambio_sin_numerar(self, pk=None):
+        """Fila registrada sin pasar por ``registrar`` (sin numeración al confirmar)"""
+        trabajador = self.trabajadores[0]
+        return CambioIncidencia.objects.create(pk=pk, incidencia_id=0, trabajador_id=trabajador.pk,
+                                               area_id=self.area.pk, fecha=LUNES, estado_nuevo_id=VACACIONES)
+
+    def test_se_numera_al_confirmar(self):
+        with self.captureOnCommitCallbacks() as pendientes:
+            self.incidencia(LUNES)
+        self.assertFalse(CambioIncidencia.objects.filter(seq__isnull=False).exists())
+        for callback in pendientes:
+            callback()
+        self.assertEqual(list(CambioIncidencia.objects.values_list('seq', flat=True)), [1])
+
+    def test_leer_no_escribe(self):
+        fila = self.cambio_sin_numerar()
+        self.assertEqual(cambios.leer(0)[0], [])
+        fila.refresh_from_db()
+        self.assertIsNone(fila.seq)
+
+    def test_entrega_en_orden_y_pagina_con_cursor(self):
+        self.crear(3)
+        filas, siguiente, hay_mas, podado = cambios.leer(0, limite=2)
+        self.assertEqual(len(filas), 2)
+        self.assertTrue(hay_mas)
+        self.assertFalse(podado)
+        resto, final, hay_mas, _ = cambios.leer(siguiente, limite=2)
+        self.assertEqual(len(resto), 1)
+        self.assertFalse(hay_mas)
+        seqs = [f[0] for f in filas + resto]
+        self.assertEqual(seqs, [1, 2, 3])
+        self.assertEqual(final, 3)
+        self.assertEqual(cambios.leer(final)[0], [])
+
+    def test_confirmacion_tardia_con_id_menor_no_se_pierde(self):
+        self.crear()
+        ultimo = CambioIncidencia.objects.order_by('-id').values_list('id', flat=True).first()
+        self.cambio_sin_numerar(ultimo + 100)
+        cambios.numerar()
+        _, cursor, _, _ = cambios.leer(0)
+
+        # Transacción que empezó antes (id menor) y se confirma ahora
+        tardio = self.cambio_sin_numerar(ultimo + 50)
+        cambios.numerar()
+        filas, _, _, _ = cambios.leer(cursor)
+        self.assertEqual([f[0] for f in filas], [cursor + 1])
+        tardio.refresh_from_db()
+        self.assertEqual(tardio.seq, cursor + 1)
+
+    def test_filtra_por_area(self):
+        self.crear()
+        self.assertEqual(cambios.leer(0, area_ids=[self.area.pk + 1000])[0], [])
+        self.assertEqual(len(cambios.leer(0, area_ids=[self.area.pk])[0]), 1)
+
+    def test_cursor_podado(self):
+        self.crear(3)
+        cambios.podar(2)
+        self.assertTrue(cambios.leer(1)[3])
+        self.assertFalse(cambios.leer(2)[3])
+
+
+class PodarCambiosTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        # seq 1 y 2 de hace 30 días, 3 y 4 de hoy
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(4):
+                self.incidencia(LUNES + timedelta(days=n))
+        CambioIncidencia.objects.filter(seq__lte=2).update(registrado=timezone.now() - timedelta(days=30))
+
+    def podar(self, **opciones):
+        call_command('podar_cambios', stdout=StringIO(), **opciones)
+        return sorted(CambioIncidencia.objects.values_list('seq', flat=True))
+
+    def test_por_retencion(self):
+        self.assertEqual(self.podar(dias=10), [3, 4])
+
+    def test_hasta_seq_sin_filas_antiguas(self):
+        self.assertEqual(self.podar(hasta_seq=3), [4])
+
+    def test_ambos_limites(self):
+        self.assertEqual(self.podar(dias=10, hasta_seq=1), [2, 3, 4])
+        self.assertEqual(self.podar(dias=10, hasta_seq=3), [3, 4])
+        self.assertEqual(self.podar(dias=60, hasta_seq=3), [3, 4])
+
+    def test_numera_los_pendientes_antes_de_podar(self):
+        self.incidencia(LUNES + timedelta(days=10))  # sin confirmar: queda sin seq
+        self.assertEqual(self.podar(hasta_seq=5), [])
@@ -0,0 +1,72 @@
+# test_cierre.py
+"""Cierre mensual: materialización, orden cerrar-exportar-congelar y fallo de la exportación"""
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import ausencias_nomina, cierre, instantaneas
+from ..ausencias_nomina import Diferencias
+from ..models import CierreArea, CierreMes, Estado, Incidencia, InstantaneaArea
+from .base import LUNES, VACACIONES, DatosMixin
+
+MARZO = LUNES.replace(day=1)
+
+
+def en_este_proceso(procesos, tarea, cierre_mes, partes):
+    """``_en_paralelo`` sin pool: los procesos hijos no verían la transacción de la prueba"""
+    for codigos in partes:
+        yield tarea(cierre_mes.pk, codigos)
+
+
+@mock.patch.object(cierre, '_en_paralelo', en_este_proceso)
+@mock.patch.object(ausencias_nomina, 'diferencias', return_value=Diferencias())
+class CerrarMesTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.vacaciones = cls.incidencia(LUNES, VACACIONES)
+
+    def editar(self):
+        self.vacaciones.estado_id = Estado.ASISTENCIA
+        self.vacaciones.save()
+
+    def test_materializa_el_mes_y_lo_congela(self, diferencias):
+        with mock.patch.object(ausencias_nomina, 'aplicar'):
+            cerrado = cierre.cerrar(MARZO)
+        self.assertEqual((cerrado.estado, cerrado.exportado), (CierreMes.CERRADO, True))
+        self.assertEqual(Incidencia.objects.filter(fecha_asistencia__month=3).count(), 2 * 31)
+        self.assertEqual(InstantaneaArea.objects.count(), CierreArea.objects.count())
+        with self.assertRaises(instantaneas.MesCerrado):
+            self.editar()
+
+    def test_cierra_antes_de_exportar_y_congela_despues(self, diferencias):
+        def aplicar(dif, lote=None):
+            self.assertEqual(CierreMes.objects.get(mes=MARZO).estado, CierreMes.CERRADO)
+            self.assertFalse(InstantaneaArea.objects.exists())
+            with self.assertRaises(instantaneas.MesCerrado):
+                self.editar()
+
+        with mock.patch.object(ausencias_nomina, 'aplicar', side_effect=aplicar) as exportar:
+            cierre.cerrar(MARZO)
+        exportar.assert_called_once()
+
+    def test_si_la_exportacion_falla_el_mes_sigue_en_curso(self, diferencias):
+        with mock.patch.object(ausencias_nomina, 'aplicar', side_effect=RuntimeError('NOMINA caída')), \
+                self.assertRaises(RuntimeError), self.assertLogs('asistencia.cierre', 'ERROR'):
+            cierre.cerrar(MARZO)
+        pendiente = CierreMes.objects.get(mes=MARZO)
+        self.assertEqual((pendiente.estado, pendiente.exportado, pendiente.cerrado), (CierreMes.EN_CURSO, False, None))
+        self.assertTrue(CierreArea.objects.filter(cierre=pendiente).exists())
+        self.assertFalse(InstantaneaArea.objects.exists())
+        self.editar()
+
+        with mock.patch.object(ausencias_nomina, 'aplicar'):
+            cerrado = cierre.cerrar(MARZO)
+        self.assertEqual((cerrado.estado, cerrado.exportado), (CierreMes.CERRADO, True))
+
+    def test_sin_exportar(self, diferencias):
+        with mock.patch.object(ausencias_nomina, 'aplicar') as exportar:
+            cerrado = cierre.cerrar(MARZO, exportar=False)
+        exportar.assert_not_called()
+        self.assertEqual((cerrado.estado, cerrado.exportado), (CierreMes.CERRADO, False))
@@ -0,0 +1,69 @@
+# test_conciliacion.py
+"""Conciliación con NOMINA: resumen canónico por trabajador y detalle de los que no coinciden"""
+import hashlib
+from datetime import date
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import conciliacion
+from ..models import Incidencia
+from .base import ABRIL, CERTIFICADO, VACACIONES, DatosMixin
+
+D1, D2, D3 = date(2025, 4, 1), date(2025, 4, 2), date(2025, 4, 3)
+
+
+class DigestoTests(TestCase):
+
+    def test_cadena_canonica_ordenada(self):
+        esperado = hashlib.md5(b'2025-04-01:V,2025-04-02:CM').hexdigest()
+        self.assertEqual(conciliacion.digesto([(D2, 'CM '), (D1, 'V')]), esperado)
+
+    def test_agrupa_por_ci_y_normaliza_fechas(self):
+        resumenes = conciliacion._digestos([('800 ', '2025-04-02 00:00:00', 'CM'), ('800', D1, 'V'), ('900', D1, 'V')])
+        self.assertEqual(resumenes['800'], conciliacion.digesto([(D1, 'V'), (D2, 'CM')]))
+        self.assertEqual(resumenes['900'], conciliacion.digesto([(D1, 'V')]))
+
+
+class CompararTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.incidencia(D1, VACACIONES)
+        cls.incidencia(D2, CERTIFICADO)
+        cls.incidencia(D1, VACACIONES, trabajador=1)
+        cls.ci = [t.ci for t in cls.trabajadores]
+
+    def comparar(self, en_nomina, detalle):
+        claves = ['V', 'CM']
+        with mock.patch.object(conciliacion, 'detalle_nomina', return_value=detalle) as consulta, \
+                mock.patch.object(conciliacion.connections, 'close_all'):
+            resultado = conciliacion._comparar(ABRIL, claves, {'T01.1'}, en_nomina,
+                                               {ci: 'T01.1' for ci in self.ci})
+        return resultado, consulta
+
+    def test_resumenes_iguales_no_consultan_el_detalle(self):
+        en_nomina = {self.ci[0]: conciliacion.digesto([(D1, 'V'), (D2, 'CM')]),
+                     self.ci[1]: conciliacion.digesto([(D1, 'V')])}
+        (trabajadores, coincidentes, discrepancias), consulta = self.comparar(en_nomina, {})
+        self.assertEqual((trabajadores, coincidentes, discrepancias), (2, 2, []))
+        consulta.assert_not_called()
+
+    def test_detalla_solo_los_trabajadores_distintos(self):
+        en_nomina = {self.ci[0]: conciliacion.digesto([(D1, 'V'), (D3, 'CM')]),
+                     self.ci[1]: conciliacion.digesto([(D1, 'V')])}
+        detalle = {(self.ci[0], D1): 'V', (self.ci[0], D3): 'CM'}
+        (trabajadores, coincidentes, discrepancias), consulta = self.comparar(en_nomina, detalle)
+        self.assertEqual((trabajadores, coincidentes), (2, 1))
+        self.assertEqual(consulta.call_args.args[1], {self.ci[0]})
+        self.assertEqual([(d.fecha, d.clave_sisga, d.clave_nomina) for d in discrepancias],
+                         [(D2, 'CM', None), (D3, None, 'CM')])
+
+    def test_ausencias_solo_en_nomina(self):
+        Incidencia.objects.filter(trabajador=self.trabajadores[1]).delete()
+        en_nomina = {self.ci[0]: conciliacion.digesto([(D1, 'V'), (D2, 'CM')]),
+                     self.ci[1]: conciliacion.digesto([(D1, 'V')])}
+        (trabajadores, coincidentes, discrepancias), _ = self.comparar(en_nomina, {(self.ci[1], D1): 'V'})
+        self.assertEqual((trabajadores, coincidentes), (2, 1))
+        self.assertEqual([(d.ci, d.clave_sisga, d.clave_nomina) for d in discrepancias], [(self.ci[1], None, 'V')])
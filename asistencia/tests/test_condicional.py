@@ -0,0 +1,67 @@
+# test_condicional.py
+"""Peticiones condicionales de la tabla de incidencias: 304 y cambios que invalidan el ETag"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import edicion
+from ..models import Estado, Incidencia
+from .base import LUNES, VACACIONES, DatosMixin
+
+
+# Sin collectstatic no hay manifiesto de estáticos que resolver al renderizar
+@override_settings(CONDICIONAL={'ACTIVO': True, 'VERSION': 'pruebas'},
+                   STORAGES={**settings.STORAGES,
+                             'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class TablaCondicionalTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.celda = cls.incidencia(LUNES)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.url = reverse('tabla_incidencias', args=[self.area.pk])
+        self.filtro = {'fecha_inicio': LUNES.isoformat(), 'fecha_fin': (LUNES + timedelta(days=6)).isoformat()}
+
+    def test_304_mientras_nada_cambie(self):
+        primera = self.client.get(self.url, self.filtro)
+        self.assertEqual(primera.status_code, 200)
+        self.assertTrue(primera.has_header('ETag'))
+        segunda = self.client.get(self.url, self.filtro, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.content, b'')
+
+    def test_una_edicion_invalida_el_etag(self):
+        primera = self.client.get(self.url, self.filtro)
+        edicion.cambiar_estado(Incidencia.objects.get(pk=self.celda.pk), VACACIONES, 1)
+        segunda = self.client.get(self.url, self.filtro, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 200)
+        self.assertNotEqual(segunda['ETag'], primera['ETag'])
+
+    def test_otro_rango_de_fechas_tiene_otro_etag(self):
+        primera = self.client.get(self.url, self.filtro)
+        otro = {**self.filtro, 'fecha_fin': (LUNES + timedelta(days=13)).isoformat()}
+
+    def assertInvalida(self, cambio):
+        primera = self.client.get(self.url, self.filtro)
+        cambio()
+        segunda = self.client.get(self.url, self.filtro, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 200)
+
+    def test_renombrar_un_trabajador_invalida_el_etag(self):
+        trabajador = self.trabajadores[0]
+        trabajador.apellidos = 'Gómez'
+        self.assertInvalida(trabajador.save)
+
+    def test_renombrar_el_area_invalida_el_etag(self):
+        self.area.nombre = 'Hoja renombrada'
+        self.assertInvalida(self.area.save)
+
+    def test_cambiar_la_clave_de_un_estado_invalida_el_etag(self):
+        estado = Estado.objects.get(pk=Estado.ASISTENCIA)
+        estado.clave_id = 'AS'
+        self.assertInvalida(estado.save)
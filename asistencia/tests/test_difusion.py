@@ -0,0 +1,118 @@
+# test_difusion.py
+"""Difusión en vivo: reparto a las colas suscritas, clientes lentos y publicación al confirmar"""
+import asyncio
+import json
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .. import difusion
+from ..models import Estado
+from .base import LUNES, VACACIONES, DatosMixin
+
+DIFUSION = {'BROKER': 'local', 'CANAL_PG': 'pruebas', 'MAX_CELDAS': 2, 'COLA': 3, 'KEEPALIVE': 1}
+
+
+@override_settings(DIFUSION=DIFUSION)
+class BrokerLocalTests(SimpleTestCase):
+
+    def test_entrega_a_los_suscriptores_del_canal_desde_otro_hilo(self):
+        broker = difusion.Broker()
+
+        async def escuchar():
+            cola = broker.suscribir(['1:2025-03'])
+            otra = broker.suscribir(['2:2025-03'])
+            hilo = threading.Thread(target=broker.publicar, args=('1:2025-03', 'hola'))
+            hilo.start()
+            hilo.join()
+            recibido = await asyncio.wait_for(cola.get(), timeout=1)
+            await asyncio.sleep(0)
+            return recibido, otra.empty()
+
+        self.assertEqual(asyncio.run(escuchar()), ('hola', True))
+
+    def test_cliente_lento_recibe_recargar(self):
+        broker = difusion.Broker()
+
+        async def saturar():
+            cola = broker.suscribir(['1:2025-03'])
+            for n in range(DIFUSION['COLA'] + 1):
+                broker.publicar('1:2025-03', str(n))
+            await asyncio.sleep(0)
+            return [cola.get_nowait() for _ in range(cola.qsize())]
+
+        self.assertEqual(asyncio.run(saturar()), [difusion.RECARGAR])
+
+    def test_cancelar_deja_de_entregar(self):
+        broker = difusion.Broker()
+
+        async def cancelar():
+            cola = broker.suscribir(['1:2025-03'])
+            broker.cancelar(cola)
+            broker.publicar('1:2025-03', 'hola')
+            await asyncio.sleep(0)
+            return cola.empty()
+
+        self.assertTrue(asyncio.run(cancelar()))
+        self.assertEqual(broker._suscriptores, {})
+
+    def test_eventos_sse(self):
+        broker = difusion.Broker()
+
+        async def leer():
+            flujo = difusion.eventos(['1:2025-03'])
+            inicio = await flujo.__anext__()
+            siguiente = asyncio.ensure_future(flujo.__anext__())
+            await asyncio.sleep(0)
+            broker.publicar('1:2025-03', '{"celdas": []}')
+            evento = await asyncio.wait_for(siguiente, timeout=1)
+            await flujo.aclose()
+            return inicio, evento
+
+        with mock.patch.object(difusion, '_broker', broker):
+            inicio, evento = asyncio.run(leer())
+        self.assertEqual(inicio, 'retry: 5000\n\n')
+        self.assertEqual(evento, 'event: celdas\ndata: {"celdas": []}\n\n')
+        self.assertEqual(broker._suscriptores, {})
+
+
+@override_settings(DIFUSION=DIFUSION)
+class PublicacionTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        self.broker = mock.Mock()
+        parche = mock.patch.object(difusion, '_broker', self.broker)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_publica_la_celda_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=False) as pendientes:
+            incidencia = self.incidencia(LUNES, VACACIONES)
+        self.broker.publicar.assert_not_called()
+        for callback in pendientes:
+            callback()
+        nombre, mensaje = self.broker.publicar.call_args.args
+        self.assertEqual(nombre, f"{self.area.pk}:2025-03")
+        self.assertEqual(json.loads(mensaje), {'celdas': [
+            [incidencia.pk, self.trabajadores[0].pk, LUNES.isoformat(), VACACIONES, 1]]})
+
+    def test_lote_grande_pide_recargar(self):
+        celdas = [(n, 1, self.area.pk, LUNES, Estado.ASISTENCIA, 1) for n in range(DIFUSION['MAX_CELDAS'] + 1)]
+        difusion.publicar_celdas(celdas)
+        self.broker.publicar.assert_called_once_with(f"{self.area.pk}:2025-03", difusion.RECARGAR)
+
+    def test_un_fallo_al_publicar_no_se_propaga(self):
+        self.broker.publicar.side_effect = RuntimeError('sin conexión')
+        with self.assertLogs('asistencia.difusion', 'WARNING'):
+            difusion.publicar_celdas([(1, 1, self.area.pk, LUNES, Estado.ASISTENCIA, 1)])
+
+    @override_settings(DIFUSION={**DIFUSION, 'BROKER': 'ninguno'})
+    def test_desactivada_no_publica(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.incidencia(LUNES, VACACIONES)
+        self.broker.publicar.assert_not_called()
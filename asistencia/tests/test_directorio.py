@@ -0,0 +1,117 @@
+# test_directorio.py
+"""Caché de consultas LDAP: filtros equivalentes, stale-while-revalidate y copia degradada"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import directorio
+from ..directorio import CacheConsultas, normalizar_filtro
+from ..ldap_client import LDAPNoDisponible
+
+
+def clave(uid):
+    return ('ou=personas', f'(uid={uid})', ('uid',))
+
+
+class HiloInmediato:
+    """Sustituto de ``threading.Thread`` que ejecuta el refresco al arrancarlo"""
+
+    def __init__(self, target, args=(), **kwargs):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+
+class NormalizarFiltroTests(SimpleTestCase):
+
+    def test_filtros_equivalentes_comparten_clave(self):
+        self.assertEqual(normalizar_filtro('(&(UID=ana)( objectClass = Trabajador ))'),
+                         normalizar_filtro('(&(objectclass=Trabajador)(uid=ana))'))
+
+    def test_negacion_conserva_el_orden_y_se_anida(self):
+        self.assertEqual(normalizar_filtro('(|(!(CN=b))(cn=a))'), '(|(!(cn=b))(cn=a))')
+
+    def test_filtro_sin_parentesis_o_no_valido(self):
+        self.assertEqual(normalizar_filtro('uid=ana'), '(uid=ana)')
+        self.assertEqual(normalizar_filtro(' (&(uid=ana) '), '(&(uid=ana)')
+
+
+class CacheConsultasTests(SimpleTestCase):
+
+    def setUp(self):
+        self.ahora = 0.0
+        reloj = mock.patch.object(directorio, 'time', mock.Mock(monotonic=lambda: self.ahora))
+        hilos = mock.patch.object(directorio.threading, 'Thread', HiloInmediato)
+        reloj.start()
+        hilos.start()
+        self.addCleanup(reloj.stop)
+        self.addCleanup(hilos.stop)
+        self.cache = CacheConsultas(maximo=2, ttl=10, obsoleto=100)
+        self.respuestas = iter(range(1, 100))
+
+    def consulta(self):
+        return next(self.respuestas)
+
+    def caida(self):
+        raise LDAPNoDisponible('circuito abierto')
+
+    def test_fresca_no_consulta(self):
+        self.assertEqual(self.cache.obtener(clave('k'), self.consulta), 1)
+        self.ahora = 9
+        self.assertEqual(self.cache.obtener(clave('k'), self.consulta), 1)
+        self.assertEqual((self.cache.metricas['fallos'], self.cache.metricas['aciertos']), (1, 1))
+
+    def test_obsoleta_se_sirve_y_se_refresca(self):
+        self.cache.obtener(clave('k'), self.consulta)
+        self.ahora = 50
+        self.assertEqual(self.cache.obtener(clave('k'), self.consulta), 1)
+        self.assertEqual(self.cache.metricas['refrescos'], 1)
+        self.assertEqual(self.cache.obtener(clave('k'), self.consulta), 2)
+
+    def test_caducada_consulta_en_la_llamada(self):
+        self.cache.obtener(clave('k'), self.consulta)
+        self.ahora = 200
+        self.assertEqual(self.cache.obtener(clave('k'), self.consulta), 2)
+        self.assertEqual(self.cache.metricas['fallos'], 2)
+
+    def test_directorio_caido_sirve_la_ultima_copia(self):
+        self.cache.obtener(clave('k'), self.consulta)
+        self.ahora = 10_000
+        with self.assertLogs('asistencia.directorio', 'WARNING'):
+            self.assertEqual(self.cache.obtener(clave('k'), self.caida), 1)
+        self.assertEqual(self.cache.metricas['degradados'], 1)
+        with self.assertRaises(LDAPNoDisponible):
+            self.cache.obtener(clave('otra'), self.caida)
+
+    def test_refresco_fallido_conserva_la_copia(self):
+        self.cache.obtener(clave('k'), self.consulta)
+        self.ahora = 50
+        with self.assertLogs('asistencia.directorio', 'WARNING'):
+            self.assertEqual(self.cache.obtener(clave('k'), self.caida), 1)
+        self.assertEqual(self.cache.metricas['errores'], 1)
+        self.assertEqual(self.cache.obtener(clave('k'), self.consulta), 1)
+
+    def test_descarta_la_menos_usada(self):
+        self.cache.obtener(clave('a'), self.consulta)
+        self.cache.obtener(clave('b'), self.consulta)
+        self.cache.obtener(clave('a'), self.consulta)
+        self.cache.obtener(clave('c'), self.consulta)
+        self.assertEqual(list(self.cache._entradas), [clave('a'), clave('c')])
+        self.assertEqual(self.cache.metricas['desalojos'], 1)
+
+
+class BuscarTests(SimpleTestCase):
+
+    def setUp(self):
+        directorio.cache_consultas.vaciar()
+        self.addCleanup(directorio.cache_consultas.vaciar)
+
+    def test_llamadas_equivalentes_consultan_una_vez(self):
+        entradas = ({'uid': ('ana',), 'correo': ('ana@example.org',)},)
+        with mock.patch.object(directorio, '_consultar', return_value=entradas) as consultar:
+            primera = directorio.buscar('(uid=ana)', ['uid', 'Correo'], base='ou=Personas')
+            segunda = directorio.buscar('( UID=ana )', ['correo', 'uid'], base='OU=personas')
+        consultar.assert_called_once()
+        self.assertEqual(primera, segunda)
+        self.assertEqual(directorio.valor(primera[0], 'Correo'), 'ana@example.org')
@@ -0,0 +1,79 @@
+# test_edicion.py
+"""Edición de celdas: UPDATE condicional por versión y meses cerrados comprobados en la misma transacción"""
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import edicion, instantaneas
+from ..models import CambioIncidencia, Estado, Incidencia
+from .base import CERTIFICADO, LUNES, VACACIONES, DatosMixin
+
+
+class EdicionConcurrenteTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        self.celda = self.incidencia(LUNES)
+
+    def test_cambio_con_version_vigente(self):
+        self.assertEqual(edicion.cambiar_estado(self.celda, VACACIONES, 1), 2)
+        self.celda.refresh_from_db()
+        self.assertEqual((self.celda.estado_id, self.celda.version), (VACACIONES, 2))
+        ultimo = CambioIncidencia.objects.filter(incidencia_id=self.celda.pk).latest('id')
+        self.assertEqual((ultimo.estado_anterior_id, ultimo.estado_nuevo_id), (Estado.ASISTENCIA, VACACIONES))
+
+    def test_version_desfasada_devuelve_conflicto(self):
+        resultado = edicion.cambiar_estado(self.celda, VACACIONES, 0)
+        self.assertEqual(resultado, edicion.Conflicto(self.celda.pk, Estado.ASISTENCIA, 1))
+
+    def test_update_condicional_detecta_la_escritura_concurrente(self):
+        # Los dos editores leyeron la versión 1; el segundo UPDATE no encuentra la fila
+        otra_copia = Incidencia.objects.get(pk=self.celda.pk)
+        edicion.cambiar_estado(self.celda, VACACIONES, 1)
+        resultado = edicion.cambiar_estado(otra_copia, CERTIFICADO, 1)
+        self.assertEqual(resultado, edicion.Conflicto(self.celda.pk, VACACIONES, 2))
+        self.assertEqual(Incidencia.objects.get(pk=self.celda.pk).estado_id, VACACIONES)
+
+    def test_vista_responde_409_con_el_valor_actual(self):
+        self.client.force_login(self.usuario)
+        url = reverse('editar_incidencia', args=[self.celda.pk])
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        respuesta = self.client.post(url, {'estado': VACACIONES, 'version': 1}, **ajax)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['version'], 2)
+        respuesta = self.client.post(url, {'estado': CERTIFICADO, 'version': 1}, **ajax)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['error'], 'conflicto')
+        self.assertEqual((respuesta.json()['estado'], respuesta.json()['version']), (VACACIONES, 2))
+
+    def test_sin_version_es_peticion_no_valida(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(reverse('editar_incidencia', args=[self.celda.pk]), {'estado': VACACIONES},
+                                     HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_mes_cerrado_se_rechaza(self):
+        self.cerrar(LUNES.replace(day=1))
+        with self.assertRaises(instantaneas.MesCerrado):
+            edicion.cambiar_estado(self.celda, VACACIONES, 1)
+        self.assertEqual(Incidencia.objects.get(pk=self.celda.pk).estado_id, Estado.ASISTENCIA)
+
+    def test_comprueba_el_mes_bloqueando_el_cierre(self):
+        with mock.patch.object(instantaneas, 'meses_cerrados', wraps=instantaneas.meses_cerrados) as cerrados:
+            edicion.cambiar_estado(self.celda, VACACIONES, 1)
+            edicion.cambiar_lote([(self.celda.pk, CERTIFICADO, 2)])
+        self.assertEqual([c.kwargs.get('bloquear') for c in cerrados.call_args_list], [True, True])
+
+    def test_lote_separa_celdas_cerradas_conflictos_y_aplicadas(self):
+        abril = self.incidencia(LUNES.replace(month=4), trabajador=1)
+        otra = self.incidencia(LUNES.replace(day=4))
+        self.cerrar(LUNES.replace(month=4, day=1))
+        resultado = edicion.cambiar_lote([(self.celda.pk, VACACIONES, 1), (otra.pk, VACACIONES, 0),
+                                          (abril.pk, VACACIONES, 1), (0, VACACIONES, 1)])
+        self.assertEqual(resultado.aplicadas, [(self.celda.pk, 2)])
+        self.assertEqual(resultado.conflictos, [edicion.Conflicto(otra.pk, Estado.ASISTENCIA, 1)])
+        self.assertEqual((resultado.cerradas, resultado.no_encontradas), ([abril.pk], [0]))
@@ -0,0 +1,83 @@
+# test_espejo_directorio.py
+"""Copia local del directorio: sincronización completa e incremental y búsqueda de personas"""
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import espejo_directorio
+from ..models import EntradaDirectorio
+
+
+def persona(uid, cn, sn, modificado='20250301120000Z', baja='FALSE', ci='80010100000'):
+    return {'type': 'searchResEntry', 'attributes': {
+        'uid': [uid], 'cn': [cn], 'sn': [sn], 'Correo': [f'{uid}@example.org'], 'CI': [ci],
+        'CodigoDelArea': ['T01.1'], 'CodigoDeDependencia': ['T01'], 'EsBaja': [baja], 'modifyTimestamp': [modificado],
+    }}
+
+
+@override_settings(LDAP_CONFIG={'USER_BASE': 'ou=Personas,dc=example,dc=org'})
+class SincronizarTests(TestCase):
+
+    def sincronizar(self, respuestas, completo=False):
+        conn = mock.Mock()
+        conn.extend.standard.paged_search.return_value = iter(respuestas)
+
+        @contextmanager
+        def conexion():
+            yield conn
+
+        with mock.patch.object(espejo_directorio.ldap_client, 'conexion', conexion):
+            resultado = espejo_directorio.sincronizar(completo=completo)
+        return resultado, conn.extend.standard.paged_search.call_args.args[1]
+
+    def test_primera_sincronizacion_es_completa(self):
+        resultado, filtro = self.sincronizar([persona('ana', 'Ana', 'Pérez'), {'type': 'searchResRef'},
+                                              persona('luis', 'Luis', 'Gómez')])
+        self.assertEqual(filtro, espejo_directorio.FILTRO)
+        self.assertEqual((resultado.completo, resultado.leidas, resultado.creadas), (True, 2, 2))
+        ana = EntradaDirectorio.objects.get(uid='ana')
+        self.assertEqual((ana.correo, ana.busqueda), ('ana@example.org', 'ana perez ana 80010100000 ana@example.org'))
+        self.assertEqual(ana.modificado, datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc))
+
+    def test_incremental_pide_solo_lo_modificado_desde_la_ultima(self):
+        self.sincronizar([persona('ana', 'Ana', 'Pérez')])
+        resultado, filtro = self.sincronizar([persona('ana', 'Ana', 'Pérez', modificado='20250302000000Z',
+                                                      baja='TRUE')])
+        self.assertIn('(modifyTimestamp>=20250301120000Z)', filtro)
+        self.assertEqual((resultado.completo, resultado.actualizadas), (False, 1))
+        self.assertTrue(EntradaDirectorio.objects.get(uid='ana').es_baja)
+
+    def test_completa_borra_las_que_ya_no_estan(self):
+        self.sincronizar([persona('ana', 'Ana', 'Pérez'), persona('luis', 'Luis', 'Gómez')])
+        resultado, _ = self.sincronizar([persona('ana', 'Ana', 'Pérez')], completo=True)
+        self.assertEqual(resultado.borradas, 1)
+        self.assertEqual(list(EntradaDirectorio.objects.values_list('uid', flat=True)), ['ana'])
+
+
+class BuscarTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        ahora = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        personas = [('mperez', 'María', 'FALSE'), ('perezj', 'Juan', 'FALSE'), ('pbaja', 'Pedro', 'TRUE')]
+        for n, (uid, cn, baja) in enumerate(personas):
+            datos = persona(uid, cn, 'Pérez', baja=baja, ci=f'8001010000{n}')['attributes']
+            espejo_directorio._entrada(datos, ahora).save()
+
+    def uids(self, texto, **opciones):
+        return [e.uid for e in espejo_directorio.buscar(texto, **opciones)]
+
+    def test_prefijo_primero_y_luego_contenido(self):
+        self.assertEqual(self.uids('perez'), ['perezj', 'mperez'])
+
+    def test_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.uids('MARÍA'), ['mperez'])
+
+    def test_bajas_solo_si_se_piden(self):
+        self.assertNotIn('pbaja', self.uids('pedro'))
+        self.assertEqual(self.uids('pedro', incluir_bajas=True), ['pbaja'])
+
+    def test_texto_vacio(self):
+        self.assertEqual(self.uids('   '), [])
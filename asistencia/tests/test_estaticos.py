@@ -0,0 +1,78 @@
+# test_estaticos.py
+"""Paquetes de estáticos, variantes comprimidas y servicio con caché inmutable"""
+import gzip
+import os
+import tempfile
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from .. import estaticos
+from ..estaticos import ServirEstaticosMiddleware
+
+CSS = 'body { color: red; }\n' * 100  # por encima de TAMANO_MINIMO_COMPRESION
+
+
+class BundleTests(SimpleTestCase):
+    FUENTES = {
+        'styles/icons/iconos.css': '.i { src: url("fonts/i.woff2?v=1"); background: url(data:image/png;base64,x); }\n'
+                                   '/*# sourceMappingURL=iconos.css.map */',
+        'i18n/es.json': '{"buscar": "Buscar:"}',
+    }
+
+    def test_css_con_urls_relativas_al_paquete(self):
+        css = estaticos.construir_bundle('bundles/base.css', ['styles/icons/iconos.css'], self.FUENTES.__getitem__)
+        self.assertIn('url("../styles/icons/fonts/i.woff2?v=1")', css)
+        self.assertIn('url(data:image/png;base64,x)', css)
+        self.assertNotIn('sourceMappingURL', css)
+
+    def test_json_como_variable_global(self):
+        js = estaticos.construir_bundle('bundles/base.js', [('i18n/es.json', 'DATATABLES_ES')],
+                                        self.FUENTES.__getitem__)
+        self.assertIn('window.DATATABLES_ES = {"buscar":"Buscar:"};', js)
+
+
+class ServirEstaticosTests(SimpleTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.raiz = directorio.name
+        for nombre in ('base.0123456789ab.css', 'favicon.css', 'pequeno.css'):
+            with open(os.path.join(self.raiz, nombre), 'w') as archivo:
+                archivo.write('a{}' if nombre == 'pequeno.css' else CSS)
+            estaticos.comprimir(os.path.join(self.raiz, nombre))
+        ajustes = override_settings(SERVIR_ESTATICOS=True, STATIC_ROOT=self.raiz, STATIC_URL='/static/')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.middleware = ServirEstaticosMiddleware(lambda request: HttpResponse('vista'))
+
+    def get(self, ruta, **cabeceras):
+        return self.middleware(RequestFactory().get(ruta, **cabeceras))
+
+    def test_comprime_solo_si_merece_la_pena(self):
+        self.assertTrue(os.path.exists(os.path.join(self.raiz, 'base.0123456789ab.css.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.raiz, 'pequeno.css.gz')))
+
+    def test_variante_gzip_con_cache_inmutable(self):
+        respuesta = self.get('/static/base.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+        self.assertEqual(respuesta['Cache-Control'], ServirEstaticosMiddleware.CACHE_INMUTABLE)
+        self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)).decode(), CSS)
+
+    def test_sin_gzip_y_sin_hash(self):
+        respuesta = self.get('/static/favicon.css')
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+        self.assertEqual(respuesta['Cache-Control'], ServirEstaticosMiddleware.CACHE_CORTA)
+        self.assertEqual(b''.join(respuesta.streaming_content).decode(), CSS)
+
+    def test_no_modificado(self):
+        mtime = os.stat(os.path.join(self.raiz, 'favicon.css')).st_mtime
+        self.assertEqual(self.get('/static/favicon.css', HTTP_IF_MODIFIED_SINCE=http_date(mtime)).status_code, 304)
+
+    def test_fuera_de_static_root_pasa_a_la_vista(self):
+        self.assertEqual(self.get('/static/../settings.py').content, b'vista')
+        self.assertEqual(self.get('/static/no-existe.css').content, b'vista')
+        self.assertEqual(self.get('/otra/').content, b'vista')
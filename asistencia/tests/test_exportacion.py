@@ -0,0 +1,67 @@
+# test_exportacion.py
+"""Exportación de ausencias a NOMINA: diferencias y negativa a exportar meses abiertos"""
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from .. import ausencias_nomina
+from ..ausencias_nomina import Diferencias
+from .base import ABRIL, DatosMixin
+
+CI = '80010100000'
+
+
+class DiferenciasTests(TestCase):
+
+    def comparar(self, deseadas, existentes):
+        with mock.patch.object(ausencias_nomina, 'excepciones_mes', return_value=deseadas), \
+                mock.patch.object(ausencias_nomina, 'registradas_mes', return_value=existentes):
+            return ausencias_nomina.diferencias(ABRIL)
+
+    def test_inserta_actualiza_y_elimina_solo_lo_de_sisga(self):
+        d1, d2, d3, d4 = (date(2025, 4, n) for n in (1, 2, 3, 4))
+        dif = self.comparar(
+            {(CI, d1): 'V', (CI, d2): 'CM', (CI, d3): 'V'},
+            {(CI, d2): ('V', 'SisGA'), (CI, d3): ('V', 'SisGA'), (CI, d4): ('CM', 'SisGA')},
+        )
+        self.assertEqual(dif.insertar, [(CI, d1, 'V')])
+        self.assertEqual(dif.actualizar, [(CI, d2, 'V', 'CM')])
+        self.assertEqual(dif.eliminar, [(CI, d4, 'CM')])
+        self.assertEqual(dif.sin_cambios, 1)
+
+    def test_no_toca_las_filas_cargadas_a_mano(self):
+        d1, d2 = date(2025, 4, 1), date(2025, 4, 2)
+        dif = self.comparar({(CI, d1): 'V'}, {(CI, d1): ('CM', 'RRHH'), (CI, d2): ('V', 'RRHH')})
+        self.assertTrue(dif.vacia)
+        self.assertEqual(dif.conflictos, [(CI, d1, 'CM', 'V')])
+
+
+@mock.patch.object(ausencias_nomina, 'aplicar')
+@mock.patch.object(ausencias_nomina, 'diferencias', return_value=Diferencias(insertar=[(CI, ABRIL, 'V')]))
+class ComandoExportarTests(DatosMixin, TestCase):
+
+    def exportar(self, *args):
+        call_command('exportar_ausencias', '2025-04', *args, stdout=StringIO())
+
+    def test_rechaza_mes_abierto(self, diferencias, aplicar):
+        with self.assertRaisesMessage(CommandError, 'no está cerrado'):
+            self.exportar()
+        diferencias.assert_not_called()
+        aplicar.assert_not_called()
+
+    def test_forzar_exporta_mes_abierto(self, diferencias, aplicar):
+        self.exportar('--forzar')
+        aplicar.assert_called_once()
+
+    def test_dry_run_de_mes_abierto_no_escribe(self, diferencias, aplicar):
+        self.exportar('--dry-run')
+        diferencias.assert_called_once()
+        aplicar.assert_not_called()
+
+    def test_exporta_mes_cerrado(self, diferencias, aplicar):
+        self.cerrar(ABRIL)
+        self.exportar()
+        aplicar.assert_called_once_with(diferencias.return_value, None)
@@ -0,0 +1,89 @@
+# test_importacion.py
+"""Importación de incidencias: upsert por lotes, meses cerrados y cambios concurrentes"""
+import io
+from unittest import mock
+
+from django.db.models import F
+from django.test import TestCase
+
+from .. import importacion
+from ..models import CambioIncidencia, Estado, Incidencia
+from .base import ABRIL, CERTIFICADO, LUNES, VACACIONES, DatosMixin
+
+
+class ImportacionTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def importar(self, *filas, **opciones):
+        texto = 'ci;fecha;estado\n' + ''.join(f"{ci};{fecha:%d/%m/%Y};{clave}\n" for ci, fecha, clave in filas)
+        return importacion.importar(io.BytesIO(texto.encode()), 'reloj.csv', **opciones)
+
+    def fila(self, clave, trabajador=0, fecha=LUNES):
+        return self.trabajadores[trabajador].ci, fecha, clave
+
+    def estado(self, trabajador=0, fecha=LUNES):
+        return Incidencia.objects.get(trabajador=self.trabajadores[trabajador], fecha_asistencia=fecha)
+
+    def test_crea_y_registra_los_cambios(self):
+        resultado = self.importar(self.fila('V'), self.fila('CM', trabajador=1))
+        self.assertEqual((resultado.filas, resultado.creadas), (2, 2))
+        self.assertEqual(self.estado().estado_id, VACACIONES)
+        self.assertEqual(self.estado(1).estado_id, CERTIFICADO)
+        self.assertEqual(CambioIncidencia.objects.filter(estado_anterior_id__isnull=True).count(), 2)
+
+    def test_existentes_solo_se_actualizan_con_sobrescribir(self):
+        self.incidencia(LUNES)
+        omitida = self.importar(self.fila('V'))
+        self.assertEqual((omitida.omitidas, self.estado().estado_id), (1, Estado.ASISTENCIA))
+
+        resultado = self.importar(self.fila('V'), sobrescribir=True)
+        self.assertEqual(resultado.actualizadas, 1)
+        incidencia = self.estado()
+        self.assertEqual((incidencia.estado_id, incidencia.version), (VACACIONES, 2))
+        cambio = CambioIncidencia.objects.get(estado_nuevo_id=VACACIONES)
+        self.assertEqual(cambio.estado_anterior_id, Estado.ASISTENCIA)
+
+        repetida = self.importar(self.fila('V'), sobrescribir=True)
+        self.assertEqual((repetida.sin_cambios, repetida.actualizadas), (1, 0))
+
+    def test_rechaza_filas_de_meses_cerrados(self):
+        self.cerrar(ABRIL)
+        resultado = self.importar(self.fila('V', fecha=ABRIL), self.fila('V'))
+        self.assertEqual((resultado.creadas, resultado.total_errores), (1, 1))
+        self.assertIn('2025-04 está cerrado', resultado.errores[0][1])
+        self.assertFalse(Incidencia.objects.filter(fecha_asistencia=ABRIL).exists())
+
+    def carrera(self, cambio):
+        """Ejecuta ``cambio()`` entre la lectura del lote y su escritura, como otro usuario"""
+        upsert = importacion._upsert
+
+        def con_carrera(incidencias, alias):
+            cambio()
+            return upsert(incidencias, alias)
+        return mock.patch.object(importacion, '_upsert', con_carrera)
+
+    def test_no_pisa_una_edicion_concurrente(self):
+        self.incidencia(LUNES)
+        self.incidencia(LUNES, trabajador=1)
+        def editar():
+            Incidencia.objects.filter(trabajador=self.trabajadores[0]).update(estado_id=CERTIFICADO,
+                                                                              version=F('version') + 1)
+        with self.carrera(editar):
+            resultado = self.importar(self.fila('V'), self.fila('V', trabajador=1), sobrescribir=True)
+        self.assertEqual((resultado.actualizadas, resultado.conflictos), (1, 1))
+        self.assertEqual(self.estado().estado_id, CERTIFICADO)
+        self.assertEqual(self.estado(1).estado_id, VACACIONES)
+        self.assertFalse(CambioIncidencia.objects.filter(trabajador_id=self.trabajadores[0].pk,
+                                                         estado_nuevo_id=VACACIONES).exists())
+
+    def test_no_pisa_una_creacion_concurrente(self):
+        def crear():
+            Incidencia.objects.bulk_create([Incidencia(area=self.area, trabajador=self.trabajadores[0],
+                                                       estado_id=CERTIFICADO, fecha_asistencia=LUNES)])
+        with self.carrera(crear):
+            resultado = self.importar(self.fila('V'), sobrescribir=True)
+        self.assertEqual((resultado.creadas, resultado.conflictos), (0, 1))
+        self.assertEqual(self.estado().estado_id, CERTIFICADO)
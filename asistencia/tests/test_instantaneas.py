@@ -0,0 +1,93 @@
+# test_instantaneas.py
+"""Meses cerrados: escrituras rechazadas, instantáneas y tabla de incidencias con celdas por defecto"""
+from datetime import date, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import instantaneas
+from ..models import CambioIncidencia, CierreArea, Estado, Incidencia
+from .base import ABRIL, CERTIFICADO, VACACIONES, DatosMixin
+
+
+class MesCerradoTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def test_no_se_crean_incidencias(self):
+        self.cerrar(ABRIL)
+        with self.assertRaises(instantaneas.MesCerrado):
+            self.incidencia(ABRIL)
+
+
+    def test_instantanea_conserva_las_celdas(self):
+        celdas = {
+            (self.trabajadores[0].pk, date(2025, 4, 1), Estado.ASISTENCIA),
+            (self.trabajadores[0].pk, date(2025, 4, 30), VACACIONES),
+            (self.trabajadores[1].pk, date(2025, 4, 15), CERTIFICADO),
+        }
+        for trabajador_id, fecha, estado_id in celdas:
+            Incidencia.objects.create(area=self.area, trabajador_id=trabajador_id, estado_id=estado_id,
+                                      fecha_asistencia=fecha)
+        cierre = self.cerrar(ABRIL)
+        instantaneas.congelar(CierreArea.objects.create(cierre=cierre, area=self.area))
+
+        [instantanea] = instantaneas.leer(ABRIL, [self.area.pk])
+        self.assertEqual(instantanea.dias, 30)
+        self.assertEqual(list(instantanea.trabajadores), sorted(t.pk for t in self.trabajadores))
+        self.assertEqual(set(instantanea.celdas()), celdas)
+        self.assertEqual(set(instantanea.celdas(desde=date(2025, 4, 2), hasta=date(2025, 4, 29))),
+                         {(self.trabajadores[1].pk, date(2025, 4, 15), CERTIFICADO)})
+        self.assertEqual(instantanea.conteo(), {Estado.ASISTENCIA: 1, VACACIONES: 1, CERTIFICADO: 1})
+        self.assertTrue(instantaneas.completo(ABRIL))
+
+
+
+
+# Sin collectstatic no hay manifiesto de estáticos que resolver al renderizar
+@override_settings(STORAGES={**settings.STORAGES,
+                             'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class TablaIncidenciasTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.url = reverse('tabla_incidencias', args=[self.area.pk])
+
+    def ver(self, desde, hasta):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.get(self.url, {'fecha_inicio': desde.isoformat(), 'fecha_fin': hasta.isoformat()})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_crea_las_celdas_por_defecto_y_las_registra(self):
+        self.incidencia(date(2025, 3, 31), VACACIONES)
+        self.ver(date(2025, 3, 31), date(2025, 4, 6))  # lunes a domingo
+        self.assertEqual(Incidencia.objects.count(), 14)
+        self.assertEqual(Incidencia.objects.get(trabajador=self.trabajadores[0], fecha_asistencia=date(2025, 3, 31))
+                         .estado_id, VACACIONES)
+        por_dia = dict(Incidencia.objects.filter(trabajador=self.trabajadores[1])
+                       .values_list('fecha_asistencia', 'estado_id'))
+        self.assertEqual(por_dia[date(2025, 4, 4)], Estado.ASISTENCIA)
+        self.assertEqual(por_dia[date(2025, 4, 5)], Estado.SABADO)
+        self.assertEqual(por_dia[date(2025, 4, 6)], Estado.DOMINGO)
+        self.assertEqual(CambioIncidencia.objects.filter(estado_anterior_id__isnull=True).count(), 14)
+        self.assertFalse(CambioIncidencia.objects.filter(seq__isnull=True).exists())
+
+        self.ver(date(2025, 3, 31), date(2025, 4, 6))
+        self.assertEqual(CambioIncidencia.objects.count(), 14)
+
+    def test_no_completa_meses_cerrados_y_los_consulta_una_vez(self):
+        self.cerrar(ABRIL)
+        with mock.patch.object(instantaneas, 'meses_cerrados', wraps=instantaneas.meses_cerrados) as cerrados:
+            self.ver(date(2025, 3, 30), date(2025, 4, 2))
+        cerrados.assert_called_once()
+        self.assertEqual(set(Incidencia.objects.values_list('fecha_asistencia', flat=True)),
+                         {date(2025, 3, 30), date(2025, 3, 31)})
@@ -0,0 +1,51 @@
+# test_instrumentacion.py
+"""Middleware de medición por petición: muestreo, Server-Timing y presupuesto"""
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .. import instrumentacion
+from ..instrumentacion import InstrumentacionMiddleware
+
+MEDIR_TODO = {'SAMPLE_RATE': 1.0, 'BUDGET_MS': 10000, 'BUDGET_QUERIES': 2, 'TOP_SQL': 5, 'SERVER_TIMING': True}
+
+
+def vista(request):
+    for _ in range(3):
+        User.objects.filter(username=f"u{_}").exists()
+    return HttpResponse('ok')
+
+
+class HuellaSQLTests(SimpleTestCase):
+
+    def test_agrupa_las_que_solo_difieren_en_valores(self):
+        self.assertEqual(
+            instrumentacion.huella_sql("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s, %s) LIMIT 21"),
+            instrumentacion.huella_sql("SELECT *  FROM t WHERE a = 'y''z' AND b IN (%s,%s) LIMIT 1"),
+        )
+
+
+class MiddlewareTests(TestCase):
+
+    def peticion(self):
+        return InstrumentacionMiddleware(vista)(RequestFactory().get('/tabla/'))
+
+    @override_settings(INSTRUMENTACION={**MEDIR_TODO, 'SAMPLE_RATE': 0})
+    def test_fuera_de_la_muestra_no_mide(self):
+        self.assertFalse(self.peticion().has_header('Server-Timing'))
+
+    @override_settings(INSTRUMENTACION={**MEDIR_TODO, 'BUDGET_QUERIES': 100})
+    def test_server_timing(self):
+        cabecera = self.peticion()['Server-Timing']
+        self.assertTrue(cabecera.startswith('total;dur='))
+        self.assertIn('db-default;dur=', cabecera)
+        self.assertIn('desc="3 consultas"', cabecera)
+
+    @override_settings(INSTRUMENTACION=MEDIR_TODO)
+    def test_fuera_de_presupuesto_registra_las_consultas_repetidas(self):
+        with self.assertLogs('asistencia.instrumentacion', 'WARNING') as registro:
+            self.peticion()
+        [mensaje] = registro.output
+        self.assertIn('Petición lenta GET /tabla/', mensaje)
+        self.assertIn('3 consultas', mensaje)
+        self.assertIn('3x SELECT', mensaje)
@@ -0,0 +1,122 @@
+# test_ldap.py
+"""Circuit breaker del directorio y caché negativa de ``LDAP3Backend``"""
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import ldap_client
+from ..authentication_backends import LDAP3Backend
+
+
+class CircuitBreakerTests(TestCase):
+
+    def test_abre_tras_el_umbral_y_rechaza_sin_llamar(self):
+        breaker = ldap_client.CircuitBreaker(umbral_fallos=2, tiempo_recuperacion=60)
+        breaker.permitir()
+        breaker.registrar_fallo()
+        self.assertEqual(breaker.estado, breaker.CERRADO)
+        breaker.permitir()
+        breaker.registrar_fallo()
+        self.assertEqual(breaker.estado, breaker.ABIERTO)
+        with self.assertRaises(ldap_client.LDAPNoDisponible):
+            breaker.permitir()
+
+    def test_exito_reinicia_los_fallos_consecutivos(self):
+        breaker = ldap_client.CircuitBreaker(umbral_fallos=2, tiempo_recuperacion=60)
+        breaker.registrar_fallo()
+        breaker.registrar_exito()
+        breaker.registrar_fallo()
+        self.assertEqual(breaker.estado, breaker.CERRADO)
+
+    def test_semiabierto_deja_pasar_una_sola_prueba(self):
+        breaker = ldap_client.CircuitBreaker(umbral_fallos=1, tiempo_recuperacion=0)
+        breaker.registrar_fallo()
+        breaker.permitir()
+        self.assertEqual(breaker.estado, breaker.SEMIABIERTO)
+        with self.assertRaises(ldap_client.LDAPNoDisponible):
+            breaker.permitir()
+        breaker.registrar_exito()
+        self.assertEqual(breaker.estado, breaker.CERRADO)
+        breaker.permitir()
+
+    def test_fallo_de_la_prueba_vuelve_a_abrir(self):
+        breaker = ldap_client.CircuitBreaker(umbral_fallos=3, tiempo_recuperacion=0)
+        for _ in range(3):
+            breaker.registrar_fallo()
+        breaker.permitir()
+        breaker.registrar_fallo()
+        self.assertEqual(breaker.estado, breaker.ABIERTO)
+
+    def test_error_ajeno_a_la_comunicacion_libera_la_prueba(self):
+        breaker = ldap_client.CircuitBreaker(umbral_fallos=1, tiempo_recuperacion=0)
+        breaker.registrar_fallo()
+        conexion = mock.Mock()
+        conexion.bind.side_effect = ValueError('configuración no válida')
+        with mock.patch.object(ldap_client, 'breaker', breaker), \
+                mock.patch.object(ldap_client, 'servidor'), \
+                mock.patch.object(ldap_client, 'Connection', return_value=conexion):
+            with self.assertRaises(ValueError):
+                with ldap_client.conexion('uid=x', 'y'):
+                    pass
+        self.assertEqual(breaker.estado, breaker.SEMIABIERTO)
+        breaker.permitir()  # la siguiente prueba no queda bloqueada
+
+
+class BackendLDAPTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.local = User.objects.create_superuser('admin.local', password='local-clave')
+        cls.directorio = User.objects.create_user('ana.perez')  # sin contraseña local
+
+    def setUp(self):
+        cache.clear()
+        refresco = mock.patch.object(LDAP3Backend, '_update_user_from_ldap')
+        refresco.start()
+        self.addCleanup(refresco.stop)
+
+    def ldap(self, **kwargs):
+        return mock.patch.object(ldap_client, 'autenticar', **kwargs)
+
+    def test_acepta_al_usuario_del_directorio(self):
+        with self.ldap(return_value=True):
+            self.assertEqual(authenticate(None, username='ana.perez', password='x'), self.directorio)
+
+    def test_cuenta_local_sin_entrada_en_el_directorio(self):
+        with self.ldap(return_value=False) as autenticar:
+            for _ in range(2):
+                self.assertEqual(authenticate(None, username='admin.local', password='local-clave'), self.local)
+        self.assertEqual(autenticar.call_count, 2)  # su rechazo no se recuerda
+
+    def test_cuenta_local_con_ldap_caido(self):
+        with self.ldap(side_effect=ldap_client.LDAPNoDisponible('circuito abierto')):
+            self.assertEqual(authenticate(None, username='admin.local', password='local-clave'), self.local)
+
+    def test_rechazo_recordado_no_vuelve_a_ldap(self):
+        with self.ldap(return_value=False) as autenticar:
+            self.assertIsNone(authenticate(None, username='ana.perez', password='mala'))
+            with self.assertNumQueries(0):
+                self.assertIsNone(authenticate(None, username='ana.perez', password='mala'))
+        self.assertEqual(autenticar.call_count, 1)
+        with self.ldap(return_value=True):
+            self.assertEqual(authenticate(None, username='ana.perez', password='buena'), self.directorio)
+
+    def test_usuario_desconocido_recordado_hasta_crearlo(self):
+        with self.ldap(return_value=True) as autenticar:
+            self.assertIsNone(authenticate(None, username='nuevo', password='x'))
+            with self.assertNumQueries(0):
+                self.assertIsNone(authenticate(None, username='nuevo', password='x'))
+            nuevo = User.objects.create_user('nuevo')
+            self.assertEqual(authenticate(None, username='nuevo', password='x'), nuevo)
+        self.assertEqual(autenticar.call_count, 1)
+
+    def test_inactivo_no_queda_bloqueado_al_reactivarlo(self):
+        User.objects.filter(pk=self.directorio.pk).update(is_active=False)
+        with self.ldap(return_value=True):
+            self.assertIsNone(authenticate(None, username='ana.perez', password='x'))
+            # update() no emite post_save: la reactivación no depende de la señal
+            User.objects.filter(pk=self.directorio.pk).update(is_active=True)
+            self.assertEqual(authenticate(None, username='ana.perez', password='x'), self.directorio)
@@ -0,0 +1,107 @@
+# test_metricas.py
+"""Exposición de métricas en formato de Prometheus y acceso sin sesión a /metrics"""
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import metricas, tareas
+
+
+@tareas.registrar('prueba_metricas')
+def _prueba_metricas(tarea):
+    pass
+
+
+@override_settings(METRICAS={**settings.METRICAS, 'DIRECTORIO': ''})
+class ExposicionMetricasTests(TestCase):
+
+    def setUp(self):
+        registro = mock.patch.object(metricas, 'registro', metricas.Registro())
+        registro.start()
+        self.addCleanup(registro.stop)
+
+    def lineas(self):
+        texto = metricas.exposicion()
+        self.assertTrue(texto.endswith('\n'))
+        return texto.splitlines()
+    def test_contador(self):
+        metricas.incrementar('sisga_ldap_fallos_total', tipo='rechazo')
+        metricas.incrementar('sisga_ldap_fallos_total', 2, tipo='rechazo')
+        metricas.incrementar('sisga_ldap_fallos_total', tipo='circuito')
+        lineas = self.lineas()
+        inicio = lineas.index('# TYPE sisga_ldap_fallos_total counter')
+        self.assertTrue(lineas[inicio - 1].startswith('# HELP sisga_ldap_fallos_total '))
+        self.assertEqual(lineas[inicio + 1:inicio + 3], [
+            'sisga_ldap_fallos_total{tipo="circuito"} 1',
+            'sisga_ldap_fallos_total{tipo="rechazo"} 3',
+        ])
+
+    def test_histograma_acumulado(self):
+        for valor in (0.02, 0.3, 30):
+            metricas.observar('sisga_peticion_duracion_segundos', valor, vista='tabla')
+        lineas = self.lineas()
+        self.assertIn('# TYPE sisga_peticion_duracion_segundos histogram', lineas)
+        cubetas = [l for l in lineas if l.startswith('sisga_peticion_duracion_segundos_bucket')]
+        self.assertEqual(len(cubetas), len(metricas.LATENCIA) + 1)
+        self.assertIn('sisga_peticion_duracion_segundos_bucket{vista="tabla",le="0.01"} 0', cubetas)
+        self.assertIn('sisga_peticion_duracion_segundos_bucket{vista="tabla",le="0.025"} 1', cubetas)
+        self.assertIn('sisga_peticion_duracion_segundos_bucket{vista="tabla",le="0.5"} 2', cubetas)
+        self.assertIn('sisga_peticion_duracion_segundos_bucket{vista="tabla",le="10"} 2', cubetas)
+        self.assertEqual(cubetas[-1], 'sisga_peticion_duracion_segundos_bucket{vista="tabla",le="+Inf"} 3')
+        self.assertIn('sisga_peticion_duracion_segundos_sum{vista="tabla"} 30.32', lineas)
+        self.assertIn('sisga_peticion_duracion_segundos_count{vista="tabla"} 3', lineas)
+
+    def test_escapa_las_etiquetas(self):
+        metricas.incrementar('sisga_cache_total', cache='a"b\\c\nd', resultado='aciertos')
+        self.assertIn('sisga_cache_total{cache="a\\"b\\\\c\\nd",resultado="aciertos"} 1', self.lineas())
+
+    def test_incluye_la_cola_de_tareas(self):
+        tareas.encolar('prueba_metricas')
+        lineas = self.lineas()
+        self.assertIn('# TYPE sisga_tareas_cola gauge', lineas)
+        self.assertIn('sisga_tareas_cola{estado="pendiente"} 1', lineas)
+        self.assertIn('sisga_tareas_cola{estado="en_curso"} 0', lineas)
+
+
+class AccesoMetricasTests(TestCase):
+
+    def pedir(self, ip='127.0.0.1', **cabeceras):
+        return self.client.get(reverse('metrics'), REMOTE_ADDR=ip, **cabeceras)
+
+    def metricas(self, **cambios):
+        return override_settings(METRICAS={**settings.METRICAS, 'DIRECTORIO': '', 'TOKEN': '',
+                                           'IPS': ['127.0.0.1'], 'PROXIES': [], **cambios})
+
+    def test_token_correcto(self):
+        with self.metricas(TOKEN='secreto'):
+            respuesta = self.pedir(ip='10.9.9.9', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_token_incorrecto_o_ausente(self):
+        with self.metricas(TOKEN='secreto'):
+            self.assertEqual(self.pedir(HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+            self.assertEqual(self.pedir().status_code, 403)
+
+    def test_ip_permitida_y_denegada(self):
+        with self.metricas():
+            self.assertEqual(self.pedir().status_code, 200)
+            self.assertEqual(self.pedir(ip='10.9.9.9').status_code, 403)
+
+    def test_sin_proxies_no_se_fia_de_x_forwarded_for(self):
+        with self.metricas(IPS=['10.0.0.5']):
+            self.assertEqual(self.pedir(HTTP_X_FORWARDED_FOR='10.0.0.5').status_code, 403)
+
+    def test_detras_de_un_proxy_usa_el_cliente(self):
+        with self.metricas(PROXIES=['127.0.0.1']):
+            self.assertEqual(self.pedir(HTTP_X_FORWARDED_FOR='10.9.9.9').status_code, 403)
+            self.assertEqual(self.pedir().status_code, 403)
+        with self.metricas(IPS=['10.0.0.5'], PROXIES=['127.0.0.1', '10.0.0.1']):
+            self.assertEqual(self.pedir(HTTP_X_FORWARDED_FOR='10.0.0.5, 10.0.0.1').status_code, 200)
+
+    def test_ignora_los_saltos_que_escribe_el_cliente(self):
+        with self.metricas(PROXIES=['10.0.0.1']):
+            respuesta = self.pedir(ip='10.0.0.1', HTTP_X_FORWARDED_FOR='127.0.0.1, 10.9.9.9')
+        self.assertEqual(respuesta.status_code, 403)
@@ -0,0 +1,92 @@
+# test_nomina.py
+"""Pool de conexiones a NOMINA, con conexiones SQLite en memoria como servidor"""
+import sqlite3
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from .. import nomina
+
+CAIDA = Exception('08S01', 'Communication link failure')  # SQLSTATE de conexión perdida (pyodbc)
+
+
+class Fabrica:
+    """Crea conexiones en memoria y recuerda cuántas abrió"""
+
+    def __init__(self):
+        self.creadas = []
+
+    def __call__(self):
+        conexion = sqlite3.connect(':memory:', check_same_thread=False)
+        self.creadas.append(conexion)
+        return conexion
+
+
+class PoolNominaTests(SimpleTestCase):
+
+    def test_reutiliza_la_conexion(self):
+        fabrica = Fabrica()
+        pool = nomina.PoolNomina(fabrica, max_size=2)
+        for _ in range(3):
+            self.assertEqual(pool.consultar('SELECT 1'), [(1,)])
+        self.assertEqual(len(fabrica.creadas), 1)
+
+    def test_descarta_la_conexion_inactiva_que_no_responde(self):
+        fabrica = Fabrica()
+        pool = nomina.PoolNomina(fabrica, max_idle=0)
+        pool.consultar('SELECT 1')
+        fabrica.creadas[0].close()  # el servidor la cortó mientras estaba libre
+        self.assertEqual(pool.consultar('SELECT 1'), [(1,)])
+        self.assertEqual(len(fabrica.creadas), 2)
+
+    def test_renueva_las_conexiones_viejas(self):
+        fabrica = Fabrica()
+        pool = nomina.PoolNomina(fabrica, max_age=0)
+        pool.consultar('SELECT 1')
+        pool.consultar('SELECT 1')
+        self.assertEqual(len(fabrica.creadas), 2)
+
+    def test_agotado(self):
+        pool = nomina.PoolNomina(Fabrica(), max_size=1, timeout=0.01)
+        with pool.conexion():
+            with self.assertRaises(nomina.PoolAgotado):
+                with pool.conexion():
+                    pass
+        with pool.conexion():  # el cupo se devolvió
+            pass
+
+    def test_reintenta_una_vez_tras_perder_la_conexion(self):
+        fabrica = Fabrica()
+        pool = nomina.PoolNomina(fabrica)
+        original = pool._obtener
+        fallos = [CAIDA]
+
+        def obtener():
+            entrada = original()
+            if fallos:
+                # Primera conexión: el servidor se cae durante la consulta
+                entrada.conn = mock.Mock(**{'cursor.return_value.execute.side_effect': fallos.pop()})
+            return entrada
+
+        with mock.patch.object(pool, '_obtener', obtener):
+            self.assertEqual(pool.consultar('SELECT 1'), [(1,)])
+        self.assertEqual(len(pool._libres), 1)  # la caída se descartó, no volvió al pool
+
+    def test_error_de_sql_no_se_reintenta(self):
+        error = Exception('42S02', "Invalid object name 'no_existe'")
+        conexion = mock.Mock(**{'cursor.return_value.execute.side_effect': error})
+        fabrica = mock.Mock(return_value=conexion)
+        pool = nomina.PoolNomina(fabrica)
+        with self.assertRaises(Exception) as contexto:
+            pool.consultar('SELECT * FROM no_existe')
+        self.assertIs(contexto.exception, error)
+        self.assertEqual(fabrica.call_count, 1)
+        self.assertEqual(list(pool._libres)[0].conn, conexion)  # la conexión sigue siendo válida
+
+class BenchmarkConexionesTests(SimpleTestCase):
+
+    def test_iteraciones_no_validas(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_conexiones', iteraciones=0)
@@ -0,0 +1,105 @@
+# test_perfilado.py
+"""Perfilado bajo demanda: quién puede pedirlo, qué se guarda y el búfer circular en disco"""
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from .. import perfilado
+from ..models import Area
+from ..perfilado import PerfiladoMiddleware
+
+
+def vista(request):
+    Area.objects.count()
+    time.sleep(0.05)  # da tiempo al muestreador a tomar alguna pila
+    return HttpResponse('vista')
+
+
+class PerfiladoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.usuario = User.objects.create_user('usuario')
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        ajustes = override_settings(PERFILADO={**settings.PERFILADO, 'DIRECTORIO': self.directorio,
+                                               'MAXIMO': 2, 'INTERVALO_MUESTREO': 0.001})
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.middleware = PerfiladoMiddleware(vista)
+
+    def get(self, ruta='/tabla/', usuario=None, **cabeceras):
+        request = RequestFactory().get(ruta, **cabeceras)
+        request.user = usuario or self.staff
+        return self.middleware(request)
+
+    def test_modo_solicitado(self):
+        factoria = RequestFactory()
+        self.assertIsNone(perfilado.solicitado(factoria.get('/tabla/')))
+        self.assertIsNone(perfilado.solicitado(factoria.get('/tabla/', {'orden': '_perfilar'})))
+        self.assertEqual(perfilado.solicitado(factoria.get('/tabla/', {'_perfilar': '1'})), perfilado.DETERMINISTA)
+        self.assertEqual(perfilado.solicitado(factoria.get('/tabla/', HTTP_X_PERFILAR='Muestreo ')),
+                         perfilado.MUESTREO)
+
+    def test_sin_pedirlo_o_sin_ser_staff_no_perfila(self):
+        self.assertNotIn('X-Perfil', self.get())
+        self.assertNotIn('X-Perfil', self.get('/tabla/?_perfilar=1', usuario=self.usuario))
+        self.assertNotIn('X-Perfil', self.get('/tabla/?_perfilar=1', usuario=AnonymousUser()))
+        self.assertEqual(perfilado.listar(), [])
+
+    def test_perfil_determinista_con_sql(self):
+        respuesta = self.get('/tabla/?_perfilar=1')
+        self.assertEqual(respuesta.content, b'vista')
+        meta = perfilado.obtener(respuesta['X-Perfil'])
+        self.assertEqual((meta['modo'], meta['usuario'], meta['codigo']), (perfilado.DETERMINISTA, 'staff', 200))
+        self.assertEqual(meta['formatos'], ['pstats', 'sql'])
+        self.assertIn('vista', perfilado.resumen(meta['id']))
+        sql = perfilado.consultas(meta['id'])
+        self.assertEqual(meta['consultas'], 1)
+        self.assertIn('COUNT', sql['consultas'][0]['sql'].upper())
+
+    def test_perfil_por_muestreo_en_formato_colapsado(self):
+        respuesta = self.get('/tabla/', HTTP_X_PERFILAR='muestreo')
+        meta = perfilado.obtener(respuesta['X-Perfil'])
+        self.assertEqual(meta['formatos'], ['colapsado', 'sql'])
+        with open(perfilado.ruta_archivo(meta['id'], 'colapsado')) as archivo:
+            lineas = archivo.read().splitlines()
+        self.assertTrue(lineas)
+        self.assertTrue(any('vista (' in linea for linea in lineas))
+        self.assertTrue(all(linea.rsplit(' ', 1)[1].isdigit() for linea in lineas))
+        self.assertIsNone(perfilado.ruta_archivo(meta['id'], 'pstats'))
+
+    def test_conserva_solo_los_mas_recientes(self):
+        ids = [self.get('/tabla/?_perfilar=1')['X-Perfil'] for _ in range(3)]
+        self.assertEqual([p['id'] for p in perfilado.listar()], ids[:0:-1])
+        self.assertIsNone(perfilado.obtener(ids[0]))
+        self.assertFalse(any(nombre.startswith(ids[0]) for nombre in os.listdir(self.directorio)))
+
+    def test_identificadores_invalidos(self):
+        self.assertIsNone(perfilado.obtener('../../etc/passwd'))
+        self.assertIsNone(perfilado.ruta_archivo('00000000000000000000-0123abcd', 'pstats'))
+
+    def test_con_otro_perfil_en_curso_atiende_sin_perfilar(self):
+        with perfilado._en_curso, self.assertLogs(perfilado.logger, 'INFO'):
+            respuesta = self.get('/tabla/?_perfilar=1')
+        self.assertEqual(respuesta.content, b'vista')
+        self.assertNotIn('X-Perfil', respuesta)
+
+    def test_fallo_al_guardar_devuelve_la_respuesta(self):
+        ocupado = os.path.join(self.directorio, 'archivo')
+        with open(ocupado, 'w'):
+            pass
+        with override_settings(PERFILADO={**settings.PERFILADO, 'DIRECTORIO': ocupado}), \
+                self.assertLogs(perfilado.logger, 'ERROR'):
+            respuesta = self.get('/tabla/?_perfilar=1')
+        self.assertEqual(respuesta.content, b'vista')
+        self.assertNotIn('X-Perfil', respuesta)
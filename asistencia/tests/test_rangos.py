@@ -0,0 +1,70 @@
+# test_rangos.py
+"""Asignación de un estado a un rango de días: conteos, celdas respetadas y meses cerrados"""
+from datetime import timedelta
+
+from django.test import TestCase
+
+from .. import instantaneas, rangos
+from ..models import CambioIncidencia, Estado, Incidencia
+from .base import CERTIFICADO, LUNES, VACACIONES, DatosMixin
+
+
+class RangoTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def rango(self, estado_id=VACACIONES, **opciones):
+        # Lunes a domingo: sin fines de semana quedan cinco días por trabajador
+        return rangos.Rango([t.pk for t in self.trabajadores], LUNES, LUNES + timedelta(days=6), estado_id,
+                            excluir_festivos=False, **opciones)
+
+    def assertConteos(self, resultado, celdas, creadas=0, actualizadas=0, sin_cambios=0, omitidas=0):
+        self.assertEqual(
+            (resultado.celdas, resultado.creadas, resultado.actualizadas, resultado.sin_cambios, resultado.omitidas),
+            (celdas, creadas, actualizadas, sin_cambios, omitidas),
+        )
+
+    def test_crea_las_celdas_y_repetirlo_no_cambia_nada(self):
+        self.assertConteos(rangos.aplicar(self.rango()), 10, creadas=10)
+        self.assertEqual(Incidencia.objects.filter(estado_id=VACACIONES).count(), 10)
+        self.assertEqual(CambioIncidencia.objects.count(), 10)
+        self.assertConteos(rangos.aplicar(self.rango()), 10, sin_cambios=10)
+        self.assertEqual(CambioIncidencia.objects.count(), 10)
+
+    def test_respeta_otras_incidencias_sin_sobrescribir(self):
+        por_defecto = self.incidencia(LUNES, Estado.ASISTENCIA)
+        otra = self.incidencia(LUNES + timedelta(days=1), CERTIFICADO, trabajador=1)
+        self.incidencia(LUNES + timedelta(days=5), Estado.SABADO)  # fuera del rango: sábado
+
+        self.assertConteos(rangos.vista_previa(self.rango()), 10, creadas=8, actualizadas=1, omitidas=1)
+        self.assertEqual(Incidencia.objects.count(), 3)
+        self.assertConteos(rangos.aplicar(self.rango()), 10, creadas=8, actualizadas=1, omitidas=1)
+
+        por_defecto.refresh_from_db()
+        otra.refresh_from_db()
+        self.assertEqual((por_defecto.estado_id, por_defecto.version), (VACACIONES, 2))
+        self.assertEqual(otra.estado_id, CERTIFICADO)
+        self.assertEqual(Incidencia.objects.get(fecha_asistencia=LUNES + timedelta(days=5)).estado_id, Estado.SABADO)
+
+        self.assertConteos(rangos.aplicar(self.rango(sobrescribir=True)), 10, actualizadas=1, sin_cambios=9)
+        otra.refresh_from_db()
+        self.assertEqual(otra.estado_id, VACACIONES)
+
+    def test_dias_excluidos(self):
+        resultado = rangos.aplicar(self.rango(dias_excluir=(1, 3)))  # sin lunes ni miércoles
+        self.assertConteos(resultado, 6, creadas=6)
+
+
+# Peticiones condicionales --------------------------------------------------------
+
+# Sin collectstatic no hay manifiesto de estáticos que resolver al renderizar
+
+    def test_rechaza_un_mes_cerrado_intermedio(self):
+        self.cerrar(LUNES.replace(day=1))
+        rango = rangos.Rango([self.trabajadores[0].pk], LUNES - timedelta(days=40), LUNES + timedelta(days=40),
+                             VACACIONES, excluir_festivos=False)
+        with self.assertRaises(instantaneas.MesCerrado):
+            rangos.aplicar(rango)
+        self.assertFalse(Incidencia.objects.exists())
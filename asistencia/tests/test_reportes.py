@@ -0,0 +1,93 @@
+# test_reportes.py
+"""Informes mensuales: versión de los datos y reutilización de los archivos ya generados"""
+import io
+import os
+import tempfile
+import zipfile
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from .. import reportes
+from ..models import Estado
+from .base import ABRIL, CERTIFICADO, VACACIONES, DatosMixin
+
+
+class ReportesTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.vacaciones = cls.incidencia(date(2025, 4, 2), VACACIONES)
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(REPORTES={**settings.REPORTES, 'DIRECTORIO': directorio.name, 'PDF': False})
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def version(self):
+        return reportes.version([self.area.pk], ABRIL)
+
+    def test_version_estable_sin_cambios(self):
+        self.assertEqual(self.version(), self.version())
+        self.assertNotEqual(self.version(), reportes.version([self.area.pk], date(2025, 3, 1)))
+
+    def test_version_cambia_con_los_datos(self):
+        versiones = [self.version()]
+        self.vacaciones.estado_id = CERTIFICADO
+        self.vacaciones.save()
+        versiones.append(self.version())
+        trabajador = self.trabajadores[1]
+        trabajador.apellidos = 'Gómez'
+        trabajador.save()
+        versiones.append(self.version())
+        self.area.nombre = 'Hoja renombrada'
+        self.area.save()
+        versiones.append(self.version())
+        Estado.objects.filter(pk=CERTIFICADO).update(clave_id='C')
+        versiones.append(self.version())
+        self.assertEqual(len(set(versiones)), len(versiones))
+
+    def test_genera_y_reutiliza_el_informe(self):
+        self.assertFalse(reportes.buscar(ABRIL, self.area).listo)
+        reporte = reportes.generar(self.area, ABRIL)
+        self.assertEqual(reporte.archivos, [f"{self.area.pk}-{reporte.version}.html"])
+        with open(reportes.ruta(ABRIL, reporte.archivos[0]), encoding='utf-8') as archivo:
+            html = archivo.read()
+        self.assertIn('Pérez 0', html)
+        self.assertIn('>V<', html.replace(' ', '').replace('\n', ''))
+
+        encontrado = reportes.buscar(ABRIL, self.area)
+        self.assertTrue(encontrado.listo)
+        with mock.patch.object(reportes, '_hojas') as hojas:
+            self.assertEqual(reportes.generar(self.area, ABRIL).archivos, reporte.archivos)
+        hojas.assert_not_called()
+
+    def test_version_nueva_borra_la_anterior(self):
+        anterior = reportes.generar(self.area, ABRIL)
+        self.incidencia(date(2025, 4, 3), CERTIFICADO, trabajador=1)
+        self.assertFalse(reportes.buscar(ABRIL, self.area).listo)
+        nuevo = reportes.generar(self.area, ABRIL)
+        self.assertNotEqual(nuevo.version, anterior.version)
+        self.assertEqual(reportes.generados(ABRIL), nuevo.archivos)
+
+    def test_paquete_de_todas_las_areas(self):
+        reporte = reportes.generar_paquete(ABRIL)
+        self.assertEqual(reporte.clave, reportes.TODAS)
+        self.assertIsNone(reportes.area_archivo(reporte.archivos[0]))
+        with open(reportes.ruta(ABRIL, reporte.archivos[0]), 'rb') as archivo:
+            nombres = zipfile.ZipFile(io.BytesIO(archivo.read())).namelist()
+        self.assertEqual(nombres, ['2025-04/T01.1_Hoja.html'])
+        self.assertTrue(reportes.buscar(ABRIL).listo)
+
+    def test_ruta_solo_de_informes(self):
+        reporte = reportes.generar(self.area, ABRIL)
+        self.assertEqual(reportes.area_archivo(reporte.archivos[0]), self.area.pk)
+        self.assertIsNone(reportes.ruta(ABRIL, '../2025-04/' + reporte.archivos[0]))
+        self.assertIsNone(reportes.ruta(ABRIL, f"{self.area.pk}-0123456789abcdef.html"))
+        os.makedirs(reportes.directorio_mes(ABRIL), exist_ok=True)
+        self.assertIsNone(reportes.ruta(ABRIL, 'otro.txt'))
@@ -0,0 +1,97 @@
+# test_routers.py
+"""Enrutado de NOMINA, de las lecturas pesadas a la réplica y read-your-writes"""
+from unittest import mock
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from .. import routers
+from ..middleware import PrimariaTrasEscrituraMiddleware
+from ..models import EmpleadoNomina, Incidencia
+
+router = routers.DatabaseRouter()
+
+
+class ConReplicaMixin:
+    """Declara la réplica (sin conectarse) con el retraso que indique ``retraso``"""
+    retraso = 0.0
+
+    def setUp(self):
+        super().setUp()
+        for parche in (mock.patch.dict(settings.DATABASES, {routers.REPLICA: {}}),
+                       mock.patch.object(routers.retraso_replica, 'valor', lambda: self.retraso)):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+
+class NominaTests(SimpleTestCase):
+
+    def test_lee_de_nomina(self):
+        self.assertEqual(router.db_for_read(EmpleadoNomina), routers.NOMINA)
+
+    def test_no_escribe_en_nomina(self):
+        with self.assertRaises(routers.EscrituraNominaError):
+            router.db_for_write(EmpleadoNomina)
+
+    def test_solo_migra_default(self):
+        self.assertTrue(router.allow_migrate('default', 'asistencia'))
+        self.assertFalse(router.allow_migrate(routers.NOMINA, 'asistencia'))
+        self.assertFalse(router.allow_migrate(routers.REPLICA, 'asistencia'))
+
+
+class SinReplicaTests(SimpleTestCase):
+
+    def test_lectura_pesada_en_la_primaria(self):
+        with routers.lectura_pesada():
+            self.assertEqual(router.db_for_read(Incidencia), 'default')
+
+
+class ReplicaTests(ConReplicaMixin, SimpleTestCase):
+
+    def test_solo_las_lecturas_pesadas(self):
+        self.assertEqual(router.db_for_read(Incidencia), 'default')
+        with routers.lectura_pesada():
+            self.assertEqual(router.db_for_read(Incidencia), routers.REPLICA)
+            self.assertEqual(router.db_for_read(EmpleadoNomina), routers.NOMINA)
+        self.assertEqual(router.db_for_write(Incidencia), 'default')
+
+    def test_replica_retrasada(self):
+        self.retraso = settings.DB_REPLICA['MAX_LAG'] + 1
+        with routers.lectura_pesada():
+            self.assertEqual(router.db_for_read(Incidencia), 'default')
+
+    def test_la_escritura_fija_la_primaria_en_su_ambito(self):
+        token = routers.fijar_primaria(False)
+        try:
+            with routers.lectura_pesada():
+                self.assertEqual(router.db_for_read(Incidencia), routers.REPLICA)
+                router.db_for_write(Incidencia)
+                self.assertEqual(router.db_for_read(Incidencia), 'default')
+        finally:
+            routers.liberar_primaria(token)
+        with routers.lectura_pesada():
+            self.assertEqual(router.db_for_read(Incidencia), routers.REPLICA)
+
+    def test_escritura_fuera_de_un_ambito_no_fija_nada(self):
+        router.db_for_write(Incidencia)
+        with routers.lectura_pesada():
+            self.assertEqual(router.db_for_read(Incidencia), routers.REPLICA)
+
+
+class PrimariaTrasEscrituraTests(ConReplicaMixin, SimpleTestCase):
+
+    def responder(self, request):
+        with routers.lectura_pesada():
+            return HttpResponse(router.db_for_read(Incidencia))
+
+    def test_post_deja_la_cookie_y_fija_las_lecturas_siguientes(self):
+        middleware = PrimariaTrasEscrituraMiddleware(self.responder)
+        fabrica = RequestFactory()
+        respuesta = middleware(fabrica.post('/'))
+        self.assertIn(PrimariaTrasEscrituraMiddleware.COOKIE, respuesta.cookies)
+
+        self.assertEqual(middleware(fabrica.get('/')).content.decode(), routers.REPLICA)
+        siguiente = fabrica.get('/')
+        siguiente.COOKIES[PrimariaTrasEscrituraMiddleware.COOKIE] = '1'
+        self.assertEqual(middleware(siguiente).content.decode(), 'default')
@@ -0,0 +1,97 @@
+# test_sesion.py
+"""Usuario en caché, áreas a cargo en la sesión y comprobación de la caché compartida"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .. import checks, sesion
+from ..models import Area, ResponsableArea
+from .base import DatosMixin
+
+
+class UsuarioEnCacheTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_segunda_lectura_sin_consultas(self):
+        self.assertEqual(sesion.obtener_usuario(self.usuario.pk), self.usuario)
+        with self.assertNumQueries(0):
+            self.assertEqual(sesion.obtener_usuario(self.usuario.pk), self.usuario)
+
+    def test_guardar_el_usuario_invalida_la_copia(self):
+        sesion.obtener_usuario(self.usuario.pk)
+        self.usuario.first_name = 'Ana'
+        self.usuario.save()
+        self.assertEqual(sesion.obtener_usuario(self.usuario.pk).first_name, 'Ana')
+
+    def test_usuario_borrado(self):
+        sesion.obtener_usuario(self.usuario.pk)
+        User.objects.get(pk=self.usuario.pk).delete()
+        with self.assertRaises(User.DoesNotExist):
+            sesion.obtener_usuario(self.usuario.pk)
+
+
+class AreasEnSesionTests(DatosMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.hija = Area.objects.create(cod_area='T01.1.1', nombre='Nieta', unidad_padre='T01.1')
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.usuario
+        self.request.session = {}
+
+    def test_claim_reutilizado_sin_consultas(self):
+        self.assertEqual([a['area_id'] for a in sesion.areas_responsable(self.request)], [self.area.pk])
+        with self.assertNumQueries(0):
+            self.assertTrue(sesion.es_responsable(self.request, self.area.pk))
+
+    def test_cambio_de_asignacion_renueva_el_claim(self):
+        sesion.areas_responsable(self.request)
+        asignacion = ResponsableArea.objects.get(usuario=self.usuario)
+        asignacion.activo = False
+        asignacion.save()
+        self.assertFalse(sesion.es_responsable(self.request, self.area.pk))
+
+    def test_cambio_de_area_renueva_el_claim(self):
+        sesion.areas_responsable(self.request)
+        self.area.nombre = 'Renombrada'
+        self.area.save()
+        self.assertEqual(sesion.areas_responsable(self.request)[0]['nombre'], 'Renombrada')
+
+    def test_areas_editables(self):
+        self.assertEqual(sesion.areas_editables(self.request), {self.area.pk, self.hija.pk})
+        self.request.user = User.objects.create_user('staff', is_staff=True)
+        self.request.session = {}
+        self.assertEqual(sesion.areas_editables(self.request), set())
+        self.request.user = User.objects.create_superuser('super')
+        self.assertIsNone(sesion.areas_editables(self.request))
+
+
+class CacheCompartidaTests(SimpleTestCase):
+    LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    COMPARTIDA = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+
+    @override_settings(DEBUG=False, CACHES=LOCAL)
+    def test_cache_local_sin_debug(self):
+        self.assertEqual([e.id for e in checks.cache_compartida(None)], ['asistencia.E001'])
+        with self.assertRaises(ImproperlyConfigured):
+            checks.exigir()
+
+    @override_settings(DEBUG=True, CACHES=LOCAL)
+    def test_cache_local_en_desarrollo(self):
+        self.assertEqual(checks.cache_compartida(None), [])
+
+    @override_settings(DEBUG=False, CACHES=COMPARTIDA)
+    def test_cache_compartida(self):
+        self.assertEqual(checks.cache_compartida(None), [])
+        checks.exigir()
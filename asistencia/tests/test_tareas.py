@@ -0,0 +1,177 @@
+# test_tareas.py
+"""Cola de tareas: reclamo por prioridad, reintentos, tareas huérfanas y limpieza al fallar"""
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+
+from .. import importacion, tareas
+from ..models import Tarea
+
+# Cola de tareas -------------------------------------------------------------------
+
+_llamadas = []
+
+
+@tareas.registrar('prueba_falla')
+def _prueba_falla(tarea, veces):
+    _llamadas.append(tarea.intentos)
+    if tarea.intentos <= veces:
+        raise RuntimeError('fallo provocado')
+    return {'intentos': tarea.intentos}
+
+
+@tareas.registrar('prueba_nada')
+def _prueba_nada(tarea):
+    return None
+
+
+class ColaTareasTests(TestCase):
+
+    def setUp(self):
+        _llamadas.clear()
+
+    def test_reclama_por_prioridad_y_luego_por_orden(self):
+        primera = tareas.encolar('prueba_nada')
+        urgente = tareas.encolar('prueba_nada', prioridad=5)
+        self.assertEqual(tareas.reclamar('t1').pk, urgente.pk)
+        reclamada = tareas.reclamar('t1')
+        self.assertEqual(reclamada.pk, primera.pk)
+        self.assertEqual((reclamada.estado, reclamada.intentos, reclamada.trabajador), (Tarea.EN_CURSO, 1, 't1'))
+        self.assertIsNone(tareas.reclamar('t1'))
+
+    def test_filtra_por_tipo(self):
+        tareas.encolar('prueba_nada')
+        self.assertIsNone(tareas.reclamar('t1', tipos_admitidos=['prueba_falla']))
+        self.assertIsNotNone(tareas.reclamar('t1', tipos_admitidos=['prueba_nada']))
+
+    def test_reintento_con_retraso(self):
+        tarea = tareas.encolar('prueba_falla', {'veces': 1})
+        self.assertFalse(tareas.ejecutar(tareas.reclamar('t1')))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.trabajador), (Tarea.PENDIENTE, 1, ''))
+        self.assertIn('fallo provocado', tarea.error)
+        # Con el retraso de reintento aún no se puede reclamar
+        self.assertIsNone(tareas.reclamar('t1'))
+
+    @override_settings(TAREAS={**settings.TAREAS, 'RETRASO_REINTENTO': 0})
+    def test_reintenta_hasta_terminar(self):
+        tarea = tareas.encolar('prueba_falla', {'veces': 1})
+        self.assertFalse(tareas.ejecutar(tareas.reclamar('t1')))
+        self.assertTrue(tareas.ejecutar(tareas.reclamar('t2')))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.resultado), (Tarea.TERMINADA, 2, {'intentos': 2}))
+        self.assertEqual(_llamadas, [1, 2])
+
+    @override_settings(TAREAS={**settings.TAREAS, 'RETRASO_REINTENTO': 0})
+    def test_falla_al_agotar_los_intentos(self):
+        tarea = tareas.encolar('prueba_falla', {'veces': 5}, max_intentos=2)
+        for _ in range(2):
+            tareas.ejecutar(tareas.reclamar('t1'))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), (Tarea.FALLIDA, 2))
+        self.assertIsNone(tareas.reclamar('t1'))
+
+    def test_sin_reintento(self):
+        @tareas.registrar('prueba_sin_reintento')
+        def _sin_reintento(tarea):
+            raise tareas.SinReintento('datos no válidos')
+
+        tarea = tareas.encolar('prueba_sin_reintento')
+        tareas.ejecutar(tareas.reclamar('t1'))
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, Tarea.FALLIDA)
+
+
+    def test_no_guarda_el_resultado_de_una_tarea_que_ya_no_es_suya(self):
+        tarea = tareas.encolar('prueba_nada')
+        reclamada = tareas.reclamar('t1')
+        # Se dio por huérfana y la reclamó otro trabajador mientras t1 la ejecutaba
+        Tarea.objects.filter(pk=tarea.pk).update(trabajador='t2')
+        with self.assertLogs('asistencia.tareas', 'WARNING'):
+            self.assertFalse(tareas.ejecutar(reclamada))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.trabajador), (Tarea.EN_CURSO, 't2'))
+
+    def test_no_reencola_una_tarea_que_ya_no_es_suya(self):
+        tarea = tareas.encolar('prueba_falla', {'veces': 1})
+        reclamada = tareas.reclamar('t1')
+        Tarea.objects.filter(pk=tarea.pk).update(estado=Tarea.TERMINADA, trabajador='t2')
+        with self.assertLogs('asistencia.tareas', 'WARNING'):
+            tareas.ejecutar(reclamada)
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.error), (Tarea.TERMINADA, ''))
+
+
+@override_settings(TAREAS={**settings.TAREAS, 'RETRASO_REINTENTO': 0})
+class ImportacionEnColaTests(TestCase):
+
+    def subir(self, contenido=b'ci;fecha\n'):
+        descriptor, ruta = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(descriptor, 'wb') as archivo:
+            archivo.write(contenido)
+        self.addCleanup(lambda: os.path.exists(ruta) and os.remove(ruta))
+        return ruta
+
+    def test_archivo_no_valido_se_borra_sin_reintentar(self):
+        ruta = self.subir(b'nombre\nAna\n')
+        tareas.encolar('importar_incidencias', {'ruta': ruta, 'nombre': 'reloj.csv'})
+        self.assertFalse(tareas.ejecutar(tareas.reclamar('t1')))
+        self.assertEqual(Tarea.objects.get().estado, Tarea.FALLIDA)
+        self.assertFalse(os.path.exists(ruta))
+
+    def test_el_archivo_se_conserva_hasta_el_ultimo_intento(self):
+        ruta = self.subir()
+        tarea = tareas.encolar('importar_incidencias', {'ruta': ruta, 'nombre': 'reloj.csv'}, max_intentos=2)
+        with mock.patch.object(importacion, 'importar', side_effect=RuntimeError('base de datos caída')), \
+                self.assertLogs('asistencia.tareas', 'WARNING'):
+            self.assertFalse(tareas.ejecutar(tareas.reclamar('t1')))
+            self.assertTrue(os.path.exists(ruta))
+            self.assertFalse(tareas.ejecutar(tareas.reclamar('t1')))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), (Tarea.FALLIDA, 2))
+        self.assertFalse(os.path.exists(ruta))
+
+    def test_huerfana_sin_intentos_borra_el_archivo(self):
+        ruta = self.subir()
+        tarea = tareas.encolar('importar_incidencias', {'ruta': ruta, 'nombre': 'reloj.csv'}, max_intentos=1)
+        tareas.reclamar('t1')
+        Tarea.objects.filter(pk=tarea.pk).update(latido=timezone.now() - timedelta(days=1))
+        with self.assertLogs('asistencia.tareas', 'WARNING'):
+            self.assertEqual(tareas.recuperar_huerfanas(), (0, 1))
+        self.assertEqual(Tarea.objects.get().estado, Tarea.FALLIDA)
+        self.assertFalse(os.path.exists(ruta))
+
+
+class ReclamoConcurrenteTests(TransactionTestCase):
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_salta_la_tarea_bloqueada_por_otro_trabajador(self):
+        bloqueada = tareas.encolar('prueba_nada', prioridad=5)
+        libre = tareas.encolar('prueba_nada')
+        tomada, soltar = threading.Event(), threading.Event()
+
+        def otro_trabajador():
+            try:
+                with transaction.atomic():
+                    Tarea.objects.select_for_update().get(pk=bloqueada.pk)
+                    tomada.set()
+                    soltar.wait(10)
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=otro_trabajador)
+        hilo.start()
+        try:
+            self.assertTrue(tomada.wait(10))
+            self.assertEqual(tareas.reclamar('t1').pk, libre.pk)
+        finally:
+            soltar.set()
+            hilo.join()
+        self.assertEqual(tareas.reclamar('t1').pk, bloqueada.pk)
@@ -6,7 +6,7 @@ import django
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AsistenciaProject.settings')
 django.setup()
-from ldap3 import Server, Connection, ALL
+from asistencia import directorio
 
 
 def obtener_usuarios_ldap3(codigo_area):
@@ -15,33 +15,27 @@ def obtener_usuarios_ldap3(codigo_area):
     ldap_config = settings.LDAP_CONFIG
 
     try:
-        server = Server(ldap_config['SERVER_URI'], get_info=ALL)
-        conn = Connection(server,
-                          user=ldap_config['BIND_DN'],
-                          password=ldap_config['BIND_PASSWORD'],
-                          auto_bind=True)
-
         base_dn = ldap_config['USER_BASE']
         filtro = f"(&(objectClass=Trabajador)(CodigoDeDependencia={codigo_area})(EsBaja=False))"
 
         atributos = ['uid', 'cn', 'sn', 'Correo', 'Area', 'CI', 'CodigoDeDependencia', 'CodigoDelArea', 'Assets', 'EsBaja']
 
-
-        conn.search(base_dn, filtro, attributes=atributos)
+        # Desde la caché de directorio.py: repetir el área no vuelve a consultar LDAP
+        entries = directorio.buscar(filtro, atributos, base=base_dn)
 
         trabajadores = []
-        for entry in conn.entries:
+        for entry in entries:
             usuario = {
-                'uid': str(entry.uid) if entry.uid else '',
-                'cn': str(entry.cn) if entry.cn else '',
-                'sn': str(entry.sn) if entry.sn else '',
-                'email': str(entry.Correo) if entry.Correo else '',
-                'area': str(entry.Area) if entry.Area else '',
-                'ci': str(entry.CI) if entry.CI else '',
-                'dependencia': str(entry.CodigoDeDependencia) if entry.CodigoDeDependencia else '',
-                'codarea': str(entry.CodigoDelArea) if entry.CodigoDelArea else '',
-                'assets': str(entry.Assets) if entry.Assets else '',
-                'baja': str(entry.EsBaja) if entry.EsBaja else '',
+                'uid': directorio.valor(entry, 'uid'),
+                'cn': directorio.valor(entry, 'cn'),
+                'sn': directorio.valor(entry, 'sn'),
+                'email': directorio.valor(entry, 'Correo'),
+                'area': directorio.valor(entry, 'Area'),
+                'ci': directorio.valor(entry, 'CI'),
+                'dependencia': directorio.valor(entry, 'CodigoDeDependencia'),
+                'codarea': directorio.valor(entry, 'CodigoDelArea'),
+                'assets': directorio.valor(entry, 'Assets'),
+                'baja': directorio.valor(entry, 'EsBaja'),
             }
             trabajadores.append(usuario)
 
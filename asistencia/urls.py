@@ -9,7 +9,28 @@ urlpatterns = [
     path('', views.dashboard_view, name='dashboard'),
     # Incidencias
     path('incidencias/<int:area_id>/', views.tabla_incidencias, name='tabla_incidencias'),
+    path('incidencias/<int:area_id>/eventos/', views.eventos_incidencias, name='eventos_incidencias'),
     path('editar/<int:incidencia_id>/', views.editar_incidencia, name='editar_incidencia'),
+    path('editar/lote/', views.editar_incidencias_lote, name='editar_incidencias_lote'),
+    path('incidencias/importar/', views.importar_incidencias, name='incidencia_importar'),
+    path('incidencias/rango/', views.rango_dias, name='incidencia_rango_dias'),
+    path('incidencias/rango/vista-previa/', views.vista_previa_rango, name='vista_previa_rango'),
+    path('incidencias/rango/calcular/', views.calcular_rango, name='calcular_rango'),
+    path('incidencias/rango/dias-mes/', views.obtener_dias_mes, name='obtener_dias_mes'),
+    path('api/cambios/', views.cambios_incidencias, name='cambios_incidencias'),
+    # Tareas en segundo plano
+    path('tareas/', views.tarea_list, name='tarea_list'),
+    path('tareas/<int:tarea_id>/', views.tarea_detalle, name='tarea_detalle'),
+    path('tareas/<int:tarea_id>/estado/', views.tarea_estado, name='tarea_estado'),
+    # Informes mensuales
+    path('reportes/', views.reporte_list, name='reporte_list'),
+    path('reportes/<str:mes>/<str:nombre>', views.reporte_descargar, name='reporte_descargar'),
+    # Perfiles de peticiones (staff)
+    path('perfiles/', views.perfil_list, name='perfil_list'),
+    path('perfiles/<str:perfil_id>/', views.perfil_detalle, name='perfil_detalle'),
+    path('perfiles/<str:perfil_id>/<str:formato>/', views.perfil_descargar, name='perfil_descargar'),
+    # Métricas para Prometheus
+    path('metrics', views.metrics, name='metrics'),
 
     # URLs existentes...
     path('responsables/listar', views.responsables_listar, name='responsables_listar'),
@@ -18,6 +39,7 @@ urlpatterns = [
     path('responsables/asignacion-rapida/', views.asignacion_rapida, name='asignacion_rapida'),
     path('responsables/crear-usuario-ajax/', views.crear_usuario_ajax, name='crear_usuario_ajax'),
     path('responsables/buscar-usuario-ajax/', views.buscar_usuario_ajax, name='buscar_usuario_ajax'),
+    path('responsables/buscar-directorio-ajax/', views.buscar_directorio_ajax, name='buscar_directorio_ajax'),
     path('usuarios/crear/', views.gestion_usuario_completa, name='crear_usuario'),
     path('usuarios/editar/<int:usuario_id>/', views.gestion_usuario_completa, name='editar_usuario'),
     path('responsables/', views.responsable_area_list, name='responsable_area_list'),
@@ -1,42 +1,29 @@
 from django.contrib.auth.models import User
-from ldap3 import Server, Connection, ALL
+from ldap3.utils.conv import escape_filter_chars
+
+from . import directorio
 
 
 def get_user(username):
 
     try:
-        server = Server('ldap.uh.cu', 389, get_info=ALL)
-        conn = Connection(server, 'cn=admin,dc=uh,dc=cu', 'killdirectory')
-
-        if conn.bind():
-            conn.search(
-                'ou=Trabajadores,dc=uh,dc=cu',
-                f'(uid={username})',
-                attributes=['cn', 'sn', 'Correo']
+        entries = directorio.buscar(f'(uid={escape_filter_chars(username)})', ['cn', 'sn', 'Correo'])
+
+        if entries:
+            entry = entries[0]
+            user, created = User.objects.get_or_create(
+                username=username,
+                defaults={
+                    'first_name': directorio.valor(entry, 'cn'),
+                    'last_name': directorio.valor(entry, 'sn'),
+                    'email': directorio.valor(entry, 'Correo'),
+                    'is_active': True
+                }
             )
-
-            if conn.entries:
-                entry = conn.entries[0]
-                user, created = User.objects.get_or_create(
-                    username=username,
-                    defaults={
-                        'first_name': getattr(entry, 'cn', [''])[0],
-                        'last_name': getattr(entry, 'sn', [''])[0],
-                        'email': getattr(entry, 'Correo', [''])[0],
-                        'is_active': True
-                    }
-                )
-                if created:
-                    return user
-
-            else:
-                return  None
-
-            conn.unbind()
+            if created:
+                return user
 
         return None
 
     except Exception as e:
         return f'Erro de consulta: {e}'
-
-
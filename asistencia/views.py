@@ -1,21 +1,35 @@
 # views.py
+from django.conf import settings
 from django.contrib.auth import login, logout, authenticate
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import F
-from django.http import JsonResponse, HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse, Http404
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from datetime import datetime, date, timedelta
-from .models import ResponsableArea, Area, Incidencia, Trabajador, Estado
+from .models import ResponsableArea, Area, Incidencia, Trabajador, Estado, Tarea
 from dateutil.relativedelta import relativedelta
 from .forms import (LDAPAuthenticationForm, ResponsableAreaForm, BuscarCrearUsuarioForm,
-                    AsignacionRapidaForm, UserCreationFlexibleForm, IncidenciaForm, FiltroFechaForm
+                    AsignacionRapidaForm, UserCreationFlexibleForm, IncidenciaForm, FiltroFechaForm,
+                    ImportarIncidenciasForm, RangoDiasForm, ReporteMensualForm, MESES
                     )
+import calendar
+import hmac
 import json
+import os
+import uuid
 from .trabajadores import obtener_usuarios_ldap3
+from . import (cambios, cierre, condicional, difusion, directorio, edicion, espejo_directorio, importacion,
+               instantaneas, metricas, perfilado, rangos, reportes, sesion, tareas)
+from .routers import lectura_pesada
 
 
 def login_view(request):
@@ -28,11 +42,8 @@ def login_view(request):
     if request.method == 'POST':
         form = LDAPAuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-
-            # Autenticar usuario
-            user = authenticate(request, username=username, password=password)
+            # AuthenticationForm ya autenticó al usuario en clean(); no se repite el bind LDAP
+            user = form.get_user()
 
             if user is not None:
                 login(request, user)
@@ -66,13 +77,14 @@ def dashboard_view(request):
     """
     Vista del dashboard después del login
     """
-    usuario = request.user
-    areas = ResponsableArea.objects.filter(usuario=usuario, activo=True).select_related('area').order_by('area__nombre')
+    # Las áreas salen del claim de la sesión, sin consulta por petición
+    areas_responsable = sesion.areas_responsable(request)
+    areas = [area for area in areas_responsable if area['activo']]
 
     return render(request, 'dashboard.html', {
         'user': request.user,
         'areas': areas,
-        'areas_responsable': request.user.areas_responsable.all() if hasattr(request.user, 'areas_responsable') else []
+        'areas_responsable': areas_responsable
     })
 
 
@@ -114,6 +126,13 @@ def responsable_area_list(request):
     """
     Vista para listar todos los responsables de áreas con opciones de gestión
     """
+    partes, ultima = condicional.token_responsables()
+    etiqueta = condicional.etag(request, 'responsables', *partes, sesion.version_usuarios(),
+                                sesion.version_areas(), request.GET.urlencode())
+    no_modificada = condicional.responder(request, etiqueta, ultima)
+    if no_modificada:
+        return no_modificada
+
     # Obtener todos los responsables activos
     responsables = ResponsableArea.objects.filter(activo=True).select_related(
         'usuario', 'area'
@@ -145,14 +164,15 @@ def responsable_area_list(request):
         areas_responsable__activo=True
     ).distinct().order_by('username')
 
-    # Estadísticas
-    total_responsables = responsables.count()
-    areas_con_responsable = Area.objects.filter(
-        responsablearea__activo=True
-    ).distinct().count()
-    usuarios_con_asignaciones = User.objects.filter(
-        areas_responsable__activo=True
-    ).distinct().count()
+    # Estadísticas (se pueden leer de la réplica)
+    with lectura_pesada():
+        total_responsables = responsables.count()
+        areas_con_responsable = Area.objects.filter(
+            responsablearea__activo=True
+        ).distinct().count()
+        usuarios_con_asignaciones = User.objects.filter(
+            areas_responsable__activo=True
+        ).distinct().count()
 
     # Paginación
     page = request.GET.get('page', 1)
@@ -177,7 +197,8 @@ def responsable_area_list(request):
         'filter_usuario': request.GET.get('usuario', ''),
     }
 
-    return render(request, 'responsable_area/responsable_area_list.html', context)
+    return condicional.marcar(render(request, 'responsable_area/responsable_area_list.html', context),
+                              etiqueta, ultima)
 
 
 @login_required
@@ -307,10 +328,11 @@ def buscar_crear_usuario(request):
 
         except User.DoesNotExist:
             if accion == 'crear':
-                # Crear nuevo usuario
+                # Crear nuevo usuario con nombre y correo del directorio (caché de directorio.py)
                 usuario = User.objects.create(
                     username=username,
-                    is_active=True
+                    is_active=True,
+                    **directorio.datos_usuario(username)
                 )
                 usuario.set_unusable_password()  # Para LDAP
                 usuario.save()
@@ -346,7 +368,8 @@ def asignacion_rapida(request):
                     if crear_usuario:
                         usuario = User.objects.create(
                             username=username,
-                            is_active=True
+                            is_active=True,
+                            **directorio.datos_usuario(username)
                         )
                         usuario.set_unusable_password()
                         usuario.save()
@@ -412,6 +435,13 @@ def crear_usuario_ajax(request):
                     'message': f'El usuario {username} ya existe'
                 })
 
+            # Lo que no venga en la petición se completa desde el directorio
+            if not (first_name and last_name and email):
+                datos = directorio.datos_usuario(username)
+                first_name = first_name or datos.get('first_name', '')
+                last_name = last_name or datos.get('last_name', '')
+                email = email or datos.get('email', '')
+
             # Crear nuevo usuario
             usuario = User.objects.create(
                 username=username,
@@ -450,10 +480,16 @@ def buscar_usuario_ajax(request):
     """Busca usuario via AJAX"""
     if request.method == 'GET' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         username = request.GET.get('username', '')
+        # Las búsquedas repetidas se validan sin consultar la base de datos
+        etiqueta = condicional.etag(request, 'buscar_usuario', username, sesion.version_usuarios(),
+                                    sesion.version_directorio())
+        no_modificada = condicional.responder(request, etiqueta)
+        if no_modificada:
+            return no_modificada
 
         try:
             usuario = User.objects.get(username=username, is_active=True)
-            return JsonResponse({
+            return condicional.marcar(JsonResponse({
                 'success': True,
                 'encontrado': True,
                 'usuario': {
@@ -463,13 +499,16 @@ def buscar_usuario_ajax(request):
                     'last_name': usuario.last_name,
                     'email': usuario.email
                 }
-            })
+            }), etiqueta)
         except User.DoesNotExist:
-            return JsonResponse({
+            # Si está en el directorio se devuelven sus datos para crearlo (copia local, sin LDAP)
+            entrada = espejo_directorio.obtener(username)
+            return condicional.marcar(JsonResponse({
                 'success': True,
                 'encontrado': False,
+                'directorio': espejo_directorio.como_dict(entrada) if entrada else None,
                 'message': f'Usuario {username} no encontrado'
-            })
+            }), etiqueta)
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -479,6 +518,28 @@ def buscar_usuario_ajax(request):
     return JsonResponse({'success': False, 'message': 'Método no permitido'})
 
 
+@login_required
+@user_passes_test(is_admin_or_staff)
+def buscar_directorio_ajax(request):
+    """Selector de personas: busca en la copia local del directorio por uid, CI, nombre o correo"""
+    if request.method == 'GET' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        texto = request.GET.get('q', '')
+        etiqueta = condicional.etag(request, 'buscar_directorio', texto, sesion.version_directorio(),
+                                    sesion.version_usuarios())
+        no_modificada = condicional.responder(request, etiqueta)
+        if no_modificada:
+            return no_modificada
+
+        entradas = espejo_directorio.buscar(texto)
+        existentes = set(User.objects.filter(username__in=[e.uid for e in entradas]).values_list('username', flat=True))
+        return condicional.marcar(JsonResponse({
+            'success': True,
+            'resultados': [dict(espejo_directorio.como_dict(e), usuario_existe=e.uid in existentes) for e in entradas],
+        }), etiqueta)
+
+    return JsonResponse({'success': False, 'message': 'Método no permitido'})
+
+
 @login_required
 @user_passes_test(is_admin_or_staff)
 def gestion_usuario_completa(request, usuario_id=None):
@@ -544,15 +605,17 @@ def responsables_listar(request):
 
 @login_required
 def tabla_incidencias(request, area_id):
-    # Verificar si el usuario es responsable de algún área
-    area_responsable = ResponsableArea.objects.get(area=(Area.objects.get(pk=area_id)))
-    areas_hijas = Area.objects.filter(unidad_padre=area_responsable.area.cod_area)
+    # Verificar si el usuario es responsable del área
+    area_principal = get_object_or_404(Area, pk=area_id)
+    es_responsable = sesion.es_responsable(request, area_principal.pk)
 
-    if not area_responsable and not request.user.is_superuser:
+    if not es_responsable and not request.user.is_superuser:
         return render(request, 'error.html', {
             'mensaje': 'No tienes permisos para ver esta página'
         })
 
+    areas_hijas = list(Area.objects.filter(unidad_padre=area_principal.cod_area))
+
     # Formulario de filtro de fechas
     form_filtro = FiltroFechaForm(request.GET or None)
 
@@ -573,6 +636,14 @@ def tabla_incidencias(request, area_id):
         fecha_inicio = hoy.replace(day=1)
         fecha_fin = hoy
 
+    # Petición condicional: si nada cambió desde la última visita, 304 sin construir la tabla
+    area_ids = [area_principal.pk, *(a.pk for a in areas_hijas)]
+    partes, ultima = condicional.token_incidencias(area_ids, fecha_inicio, fecha_fin)
+    etiqueta = condicional.etag(request, *partes, es_responsable)
+    no_modificada = condicional.responder(request, etiqueta, ultima)
+    if no_modificada:
+        return no_modificada
+
     # Generar lista de días en el rango
     dias = []
     current_date = fecha_inicio
@@ -581,37 +652,45 @@ def tabla_incidencias(request, area_id):
         current_date += timedelta(days=1)
         # Obteniendo todas las áreas que pertenecen a una misma área padre.
 
+    # Meses cerrados: solo lectura; los que ya tienen instantáneas se leen de ellas
+    cerrados = instantaneas.meses_cerrados(fecha_inicio, fecha_fin)
+    congelados = {m for m in cerrados if instantaneas.completo(m)}
+    en_instantanea = Q()
+    for m in congelados:
+        en_instantanea |= Q(fecha_asistencia__gte=m, fecha_asistencia__lt=m + relativedelta(months=1))
+
     # Obtener incidencias según permisos
 
     incidencias_qs = Incidencia.objects.filter(
-        area=area_responsable.area,
-        fecha_asistencia__range=[fecha_inicio, fecha_fin])
-    trabajadores = Trabajador.objects.filter(area=area_responsable.area)
+        area=area_principal,
+        fecha_asistencia__range=[fecha_inicio, fecha_fin]).exclude(en_instantanea)
+    trabajadores = Trabajador.objects.filter(area=area_principal)
     for area in areas_hijas:
         incidencias_qs = incidencias_qs.union(Incidencia.objects.filter(
             area=area,
             fecha_asistencia__range=[fecha_inicio, fecha_fin]
-        ))
+        ).exclude(en_instantanea))
         trabajadores = trabajadores.union(Trabajador.objects.filter(area=area))
 
-    for trabajador in trabajadores:
-        for dia in dias:
-            # Verificar si es sábado o domingo
-            if dia.weekday() == 5:
-                estado = Estado.objects.get(id=110)
-            elif dia.weekday() == 6:
-                estado = Estado.objects.get(id=111)
-            else:
-                estado = Estado.objects.get(id=109)
-
-            incidencia, created = Incidencia.objects.get_or_create(
-                trabajador=trabajador,
-                fecha_asistencia=dia,
-                defaults={
-                    'area': trabajador.area,
-                    'estado': estado,
-                }
-            )
+    # Celdas por defecto que faltan fuera de los meses cerrados: en bloque y con su registro de cambios
+    trabajadores = list(trabajadores)
+    dias_abiertos = [dia for dia in dias if dia.replace(day=1) not in cerrados]
+    existentes = set(
+        Incidencia.objects.filter(trabajador_id__in=[t.pk for t in trabajadores],
+                                  fecha_asistencia__range=[fecha_inicio, fecha_fin])
+        .order_by().values_list('trabajador_id', 'fecha_asistencia')
+    )
+    nuevas = [
+        Incidencia(trabajador_id=t.pk, area_id=t.area_id, fecha_asistencia=dia, estado_id=Estado.id_por_defecto(dia))
+        for t in trabajadores for dia in dias_abiertos if (t.pk, dia) not in existentes
+    ]
+    if nuevas:
+        try:
+            with transaction.atomic():
+                cierre.crear_incidencias(nuevas)
+        except IntegrityError:
+            # Una visita simultánea a la misma tabla las creó (y registró) antes
+            pass
 
     # Agrupar por empleado
     empleados_data = {}
@@ -625,9 +704,31 @@ def tabla_incidencias(request, area_id):
             }
         empleados_data[empleado_key]['incidencias'][incidencia.fecha_asistencia] = {
             'id': incidencia.id,
-            'estado': incidencia.estado
+            'estado': incidencia.estado,
+            'version': incidencia.version,
+            'cerrada': incidencia.fecha_asistencia.replace(day=1) in cerrados,
         }
 
+    if congelados:
+        areas_tabla = {area_principal.pk: area_principal, **{a.pk: a for a in areas_hijas}}
+        congeladas = [i for m in sorted(congelados) for i in instantaneas.leer(m, list(areas_tabla))]
+        estados = {e.pk: e for e in Estado.objects.all()}
+        nombres = dict(
+            (pk, f"{nombre} {apellidos}") for pk, nombre, apellidos in Trabajador.objects
+            .filter(pk__in={t for i in congeladas for t in i.trabajadores}).values_list('id', 'nombre', 'apellidos')
+        )
+        for instantanea in congeladas:
+            for trabajador_id, fecha, estado_id in instantanea.celdas(fecha_inicio, fecha_fin):
+                # El trabajador pudo borrarse después del cierre; la instantánea conserva su id
+                empleado_key = nombres.get(trabajador_id, f"#{trabajador_id}")
+                datos = empleados_data.setdefault(empleado_key, {
+                    'trabajador': empleado_key,
+                    'area': areas_tabla[instantanea.area_id].nombre,
+                    'incidencias': {}
+                })
+                datos['incidencias'][fecha] = {'id': None, 'estado': estados.get(estado_id), 'version': None,
+                                               'cerrada': True}
+
     # Preparar datos para la tabla
     tabla_datos = []
     for empleado_key, datos in empleados_data.items():
@@ -643,7 +744,9 @@ def tabla_incidencias(request, area_id):
                 fila['dias'].append({
                     'fecha': dia,
                     'incidencia_id': incidencia_dia['id'],
+                    'version': incidencia_dia['version'],
                     'estado': incidencia_dia['estado'],
+                    'cerrada': incidencia_dia['cerrada'],
                     'tiene_incidencia': True
                 })
             else:
@@ -651,46 +754,628 @@ def tabla_incidencias(request, area_id):
                     'fecha': dia,
                     'incidencia_id': None,
                     'estado': 'No registrado',
+                    # Sin celda en un mes cerrado (no se completa): no hay nada que editar
+                    'cerrada': dia.replace(day=1) in cerrados,
                     'tiene_incidencia': False
                 })
 
         tabla_datos.append(fila)
+    metricas.observar('sisga_tabla_filas', len(tabla_datos))
+    metricas.observar('sisga_tabla_celdas', len(tabla_datos) * len(dias))
 
     context = {
         'areas': areas_hijas,
         'incidencias': incidencias_qs,
-        'area_responsable': area_responsable,
+        'area_responsable': area_principal,
         'trabajadores': trabajadores,
         'tabla_datos': tabla_datos,
         'dias': dias,
         'form_filtro': form_filtro,
         'fecha_inicio': fecha_inicio,
         'fecha_fin': fecha_fin,
-        'es_responsable': area_responsable or request.user.is_superuser,
+        'es_responsable': es_responsable or request.user.is_superuser,
         'opciones_estado': Estado.objects.all(),
         'mes': mes,
+        'url_eventos': _url_eventos(area_principal.pk, fecha_inicio, fecha_fin),
 
     }
 
-    return render(request, 'incidencias/tabla_incidencias.html', context)
+    if nuevas:
+        # La tabla se completó en esta petición: el token anterior ya no la describe
+        partes, ultima = condicional.token_incidencias(area_ids, fecha_inicio, fecha_fin)
+        etiqueta = condicional.etag(request, *partes, es_responsable)
+    return condicional.marcar(render(request, 'incidencias/tabla_incidencias.html', context), etiqueta, ultima)
+
+
+def _url_eventos(area_id, fecha_inicio, fecha_fin):
+    """URL de ``eventos_incidencias`` para los meses del rango mostrado (como mucho 12)"""
+    if not difusion.activa():
+        return None
+    meses = []
+    mes = fecha_inicio.replace(day=1)
+    while mes <= fecha_fin and len(meses) < 12:
+        meses.append(('mes', f"{mes:%Y-%m}"))
+        mes += relativedelta(months=1)
+    return f"{reverse('eventos_incidencias', args=[area_id])}?{urlencode(meses)}"
+
+
+def _areas_tabla(request, area_id):
+    """Ids de las áreas que muestra ``tabla_incidencias`` (el área y sus hijas); ``None`` sin permiso"""
+    area = Area.objects.filter(pk=area_id).first()
+    if area is None or not (sesion.es_responsable(request, area.pk) or request.user.is_superuser):
+        return None
+    return [area.pk, *Area.objects.filter(unidad_padre=area.cod_area).values_list('id', flat=True)]
+
+
+@login_required
+async def eventos_incidencias(request, area_id):
+    """
+    Server-Sent Events con los cambios de celdas de la tabla del área (ver difusion.py):
+    ``?mes=AAAA-MM`` (uno o varios). Requiere servir la aplicación con ASGI.
+    """
+    if not difusion.activa() or not isinstance(request, ASGIRequest):
+        # 204: el navegador deja de reintentar; con WSGI el flujo no terminaría nunca
+        return HttpResponse(status=204)
+    area_ids = await sync_to_async(_areas_tabla)(request, area_id)
+    if area_ids is None:
+        return HttpResponse(status=403)
+    try:
+        meses = [datetime.strptime(m, '%Y-%m').date() for m in request.GET.getlist('mes')]
+    except ValueError:
+        return HttpResponse('Mes no válido', status=400)
+    if not meses or len(meses) > 12:
+        return HttpResponse('Indique de 1 a 12 meses', status=400)
+
+    respuesta = StreamingHttpResponse(
+        difusion.eventos([difusion.canal(a, m) for a in area_ids for m in meses]),
+        content_type='text/event-stream',
+    )
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'  # nginx: no acumular el flujo
+    return respuesta
 
 
 @login_required
 def editar_incidencia(request, incidencia_id):
+    """
+    Cambia el estado de una celda con concurrencia optimista (ver edicion.py): el
+    formulario envía ``estado`` y la ``version`` que se estaba viendo. Con AJAX
+    responde JSON; si otro usuario la cambió antes, 409 con el valor actual.
+    """
     incidencia = get_object_or_404(Incidencia, id=incidencia_id)
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
 
     # Verificar permisos
-
-    es_responsable = ResponsableArea.es_responsable_area(request.user, incidencia.area)
-    if not es_responsable:
+    area_ids = sesion.areas_editables(request)
+    if area_ids is not None and incidencia.area_id not in area_ids:
+        if es_ajax:
+            return JsonResponse({'error': 'No tienes permisos para editar esta incidencia'}, status=403)
         return render(request, 'error.html', {
             'mensaje': 'No tienes permisos para editar esta incidencia'
         })
 
     if request.method == 'POST':
-        form = IncidenciaForm(request.POST, instance=incidencia)
+        form = IncidenciaForm(request.POST)
+        if form.is_valid():
+            try:
+                nueva = edicion.cambiar_estado(incidencia, form.cleaned_data['estado'].pk,
+                                               form.cleaned_data['version'])
+            except instantaneas.MesCerrado as e:
+                if es_ajax:
+                    return JsonResponse({'error': 'mes_cerrado', 'mensaje': str(e)}, status=409)
+                messages.error(request, str(e))
+                return redirect('tabla_incidencias', area_id=incidencia.area_id)
+            if isinstance(nueva, edicion.Conflicto):
+                mensaje = 'Otro usuario modificó esta incidencia; se muestra su valor actual.'
+                if es_ajax:
+                    return JsonResponse({'error': 'conflicto', 'mensaje': mensaje, **nueva.como_dict()}, status=409)
+                messages.warning(request, mensaje)
+            elif es_ajax:
+                return JsonResponse({'id': incidencia.pk, 'estado': incidencia.estado_id, 'version': nueva})
+        elif es_ajax:
+            return JsonResponse({'error': 'Datos no válidos', 'errores': form.errors}, status=400)
+        else:
+            return render(request, 'error.html', {
+                'mensaje': 'Datos no válidos: recarga la tabla e intenta de nuevo'
+            }, status=400)
+
+    return redirect('tabla_incidencias', area_id=incidencia.area_id)
+
+
+@login_required
+def editar_incidencias_lote(request):
+    """
+    Cambios de varias celdas: POST JSON ``{"cambios": [{"id", "estado", "version"}, ...]}``.
+    Cada celda se aplica o se rechaza por separado; con algún rechazo responde 409
+    e incluye en ``conflictos`` el estado y la versión actuales, y en ``cerradas``
+    las celdas de meses cerrados.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    area_ids = sesion.areas_editables(request)
+    if area_ids is not None and not area_ids:
+        return JsonResponse({'error': 'No tienes permisos para editar incidencias'}, status=403)
+    try:
+        peticiones = [(int(c['id']), int(c['estado']), int(c['version']))
+                      for c in json.loads(request.body)['cambios']]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Formato no válido'}, status=400)
+    if len(peticiones) > edicion.MAX_LOTE:
+        return JsonResponse({'error': f"Como máximo {edicion.MAX_LOTE} cambios por petición"}, status=400)
+    estados = {e for _, e, _ in peticiones}
+    if len(estados) != Estado.objects.filter(pk__in=estados).count():
+        return JsonResponse({'error': 'Estado desconocido'}, status=400)
+
+    resultado = edicion.cambiar_lote(peticiones, area_ids)
+    return JsonResponse({
+        'aplicadas': [{'id': pk, 'version': version} for pk, version in resultado.aplicadas],
+        'conflictos': [c.como_dict() for c in resultado.conflictos],
+        'no_encontradas': resultado.no_encontradas,
+        'cerradas': resultado.cerradas,
+    }, status=409 if resultado.conflictos or resultado.cerradas else 200)
+
+
+@login_required
+def importar_incidencias(request):
+    """Importa incidencias desde un CSV/XLSX de reloj o biométrico (ver importacion.py)"""
+    area_ids = sesion.areas_editables(request)
+    if area_ids is not None and not area_ids:
+        return render(request, 'error.html', {
+            'mensaje': 'No tienes permisos para importar incidencias'
+        })
+
+    resultado = None
+    if request.method == 'POST':
+        form = ImportarIncidenciasForm(request.POST, request.FILES)
+        if form.is_valid() and form.cleaned_data['segundo_plano']:
+            archivo = form.cleaned_data['archivo']
+            os.makedirs(settings.TAREAS['DIRECTORIO'], exist_ok=True)
+            ruta = os.path.join(settings.TAREAS['DIRECTORIO'], f"{uuid.uuid4().hex}-{os.path.basename(archivo.name)}")
+            with open(ruta, 'wb') as destino:
+                for trozo in archivo.chunks():
+                    destino.write(trozo)
+            tarea = tareas.encolar('importar_incidencias', {
+                'ruta': ruta,
+                'nombre': archivo.name,
+                'sobrescribir': form.cleaned_data['sobrescribir'],
+                'estado_predeterminado': form.cleaned_data['estado_predeterminado'],
+                'area_ids': None if area_ids is None else list(area_ids),
+            }, usuario=request.user)
+            return redirect('tarea_detalle', tarea_id=tarea.pk)
+        if form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            try:
+                resultado = importacion.importar(
+                    archivo, archivo.name,
+                    sobrescribir=form.cleaned_data['sobrescribir'],
+                    estado_predeterminado=form.cleaned_data['estado_predeterminado'],
+                    area_ids=area_ids,
+                )
+            except importacion.ArchivoNoValido as e:
+                form.add_error('archivo', str(e))
+            else:
+                messages.success(
+                    request,
+                    f"{resultado.filas} filas procesadas: {resultado.creadas} creadas, "
+                    f"{resultado.actualizadas} actualizadas, {resultado.conflictos} en conflicto, "
+                    f"{resultado.total_errores} con errores."
+                )
+    else:
+        form = ImportarIncidenciasForm()
+
+    return render(request, 'incidencias/importar.html', {
+        'form': form,
+        'title': 'Importar Incidencias',
+        'resultado': resultado,
+        'max_mb': settings.IMPORTACION_MAX_MB,
+    })
+
+
+def _rango_del_formulario(form):
+    datos = form.cleaned_data
+    return rangos.Rango(
+        trabajadores=datos['trabajadores'],
+        desde=datos['desde'],
+        hasta=datos['hasta'],
+        estado_id=datos['estado_predeterminado'].pk,
+        excluir_fines_semana=datos['excluir_fines_semana'],
+        excluir_festivos=datos['excluir_festivos'],
+        dias_excluir=datos['dias_excluir'],
+        sobrescribir=datos['sobrescribir_existentes'],
+    )
+
+
+def _sin_permiso_rangos(request):
+    return render(request, 'error.html', {
+        'mensaje': 'No tienes permisos para asignar incidencias'
+    })
+
+
+def _formulario_rango(request, form):
+    return render(request, 'incidencias/rango_dias.html', {
+        'form': form,
+        'title': 'Asignar Estado por Rango de Días',
+        'max_trabajadores': settings.RANGOS['MAX_TRABAJADORES'],
+        'max_celdas': settings.RANGOS['MAX_CELDAS'],
+    })
+
+
+@login_required
+def rango_dias(request):
+    """
+    Asigna un estado a varios trabajadores durante un rango de fechas (ver rangos.py).
+    Con ``X-Requested-With: XMLHttpRequest`` responde JSON con los conteos.
+    """
+    area_ids = sesion.areas_editables(request)
+    if area_ids is not None and not area_ids:
+        return _sin_permiso_rangos(request)
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    if request.method == 'POST':
+        form = RangoDiasForm(request.POST, area_ids=area_ids)
         if form.is_valid():
-            form.save()
-            return redirect('tabla_incidencias', area_id=incidencia.area.pk)
+            try:
+                resultado = rangos.aplicar(_rango_del_formulario(form))
+            except instantaneas.MesCerrado as e:
+                # El mes se cerró entre la validación y la escritura
+                form.add_error(None, str(e))
+                if es_ajax:
+                    return JsonResponse({'success': False, 'errores': form.errors}, status=409)
+                return _formulario_rango(request, form)
+            if es_ajax:
+                return JsonResponse({
+                    'success': True,
+                    'celdas': resultado.celdas,
+                    'creadas': resultado.creadas,
+                    'actualizadas': resultado.actualizadas,
+                    'sin_cambios': resultado.sin_cambios,
+                    'omitidas': resultado.omitidas,
+                })
+            messages.success(
+                request,
+                f"{resultado.creadas} incidencias creadas y {resultado.actualizadas} actualizadas"
+                + (f"; {resultado.omitidas} omitidas por tener otra incidencia." if resultado.omitidas else ".")
+            )
+            return redirect('tabla_incidencias', area_id=form.cleaned_data['area'].pk)
+        if es_ajax:
+            return JsonResponse({'success': False, 'errores': form.errors}, status=400)
+    else:
+        form = RangoDiasForm(area_ids=area_ids)
+
+    return _formulario_rango(request, form)
+
+
+@login_required
+def vista_previa_rango(request):
+    """Muestra lo que haría ``rango_dias`` sin escribir nada"""
+    area_ids = sesion.areas_editables(request)
+    if area_ids is not None and not area_ids:
+        return _sin_permiso_rangos(request)
+    if request.method != 'POST':
+        return redirect('incidencia_rango_dias')
+
+    form = RangoDiasForm(request.POST, area_ids=area_ids)
+    if not form.is_valid():
+        return _formulario_rango(request, form)
+
+    rango = _rango_del_formulario(form)
+    resultado = rangos.vista_previa(rango)
+    fechas = rango.fechas()
+    trabajadores = {t.pk: t for t in Trabajador.objects.filter(pk__in=rango.trabajadores)}
+    estados = {e.pk: e for e in Estado.objects.all()}
+    return render(request, 'incidencias/vista_previa_rango.html', {
+        'title': 'Vista Previa del Rango',
+        'area': form.cleaned_data['area'],
+        'estado_predeterminado': form.cleaned_data['estado_predeterminado'],
+        'total_empleados': len(rango.trabajadores),
+        'total_dias': len(fechas),
+        'total_registros': resultado.creadas + resultado.actualizadas,
+        'resultado': resultado,
+        'empleados_preview': [f"{t.ci} {t.nombre} {t.apellidos}"
+                              for t in (trabajadores[pk] for pk in rango.trabajadores[:5])],
+        'fechas_preview': fechas[:7],
+        'cambios_preview': [
+            {'trabajador': trabajadores[t], 'fecha': f, 'anterior': estados.get(a), 'nuevo': estados.get(n)}
+            for t, f, a, n in resultado.cambios
+        ],
+        # Los mismos datos del formulario para confirmar (incluye valores múltiples)
+        'datos_formulario': [(k, v) for k, valores in request.POST.lists()
+                             if k != 'csrfmiddlewaretoken' for v in valores],
+    })
+
+
+@login_required
+def calcular_rango(request):
+    """Vista previa en JSON: días, celdas y cuántas se crearían, actualizarían u omitirían"""
+    area_ids = sesion.areas_editables(request)
+    if area_ids is not None and not area_ids:
+        return JsonResponse({'success': False, 'error': 'Sin permisos'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+
+    form = RangoDiasForm(request.POST, area_ids=area_ids)
+    if not form.is_valid():
+        errores = [e for lista in form.errors.values() for e in lista]
+        return JsonResponse({'success': False, 'error': ' '.join(errores)}, status=400)
+
+    rango = _rango_del_formulario(form)
+    resultado = rangos.vista_previa(rango)
+    fechas = rango.fechas()
+    return JsonResponse({
+        'success': True,
+        'total_dias': len(fechas),
+        'total_registros': resultado.celdas,
+        'primera_fecha': fechas[0].strftime('%d/%m/%Y') if fechas else None,
+        'ultima_fecha': fechas[-1].strftime('%d/%m/%Y') if fechas else None,
+        'fechas_ejemplo': [f.strftime('%d/%m') for f in fechas[:5]],
+        'creadas': resultado.creadas,
+        'actualizadas': resultado.actualizadas,
+        'sin_cambios': resultado.sin_cambios,
+        'omitidas': resultado.omitidas,
+        'cambios': [[t, f.isoformat(), a, n] for t, f, a, n in resultado.cambios],
+    })
+
+
+@login_required
+def obtener_dias_mes(request):
+    try:
+        mes = int(request.GET.get('mes'))
+        anio = int(request.GET.get('año'))
+        total_dias = calendar.monthrange(anio, mes)[1]
+    except (TypeError, ValueError, calendar.IllegalMonthError):
+        return JsonResponse({'success': False, 'error': 'Mes no válido'}, status=400)
+    return JsonResponse({'success': True, 'nombre_mes': dict(MESES)[mes], 'total_dias': total_dias})
+
+
+@login_required
+@user_passes_test(is_admin_or_staff)
+def cambios_incidencias(request):
+    """
+    Registro de cambios para consumidores externos: ``?since=<seq>&limit=<n>[&area=<id>...]``.
+    Las filas van como listas en el orden de ``campos``; se pide de nuevo con ``since=siguiente``
+    mientras ``hay_mas`` sea cierto. Con ``podado`` el consumidor debe reconstruir su estado.
+    """
+    try:
+        desde = int(request.GET.get('since', 0))
+        limite = min(int(request.GET.get('limit', 0)) or settings.CAMBIOS['LIMITE_LECTURA'],
+                     settings.CAMBIOS['LIMITE_LECTURA'])
+        area_ids = [int(a) for a in request.GET.getlist('area')] or None
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+
+    filas, siguiente, hay_mas, podado = cambios.leer(desde, limite, area_ids)
+    return JsonResponse({
+        'campos': cambios.CAMPOS,
+        'filas': [
+            [seq, incidencia, trabajador, area, fecha.isoformat(), anterior, nuevo, usuario,
+             registrado.isoformat()]
+            for seq, incidencia, trabajador, area, fecha, anterior, nuevo, usuario, registrado in filas
+        ],
+        'siguiente': siguiente,
+        'hay_mas': hay_mas,
+        'podado': podado,
+    })
+
+
+def _tareas_visibles(user):
+    """Staff ve todas las tareas; el resto, las que encoló"""
+    qs = Tarea.objects.all()
+    return qs if is_admin_or_staff(user) else qs.filter(usuario=user)
+
+
+def _tarea_dict(tarea):
+    return {
+        'id': tarea.pk,
+        'tipo': tarea.tipo,
+        'estado': tarea.estado,
+        'estado_display': tarea.get_estado_display(),
+        'progreso': round(tarea.progreso, 1),
+        'mensaje': tarea.mensaje,
+        'intentos': tarea.intentos,
+        'max_intentos': tarea.max_intentos,
+        'resultado': tarea.resultado,
+        'error': tarea.error.splitlines()[0] if tarea.error else '',
+        'creada': tarea.creada.isoformat(),
+        'iniciada': tarea.iniciada.isoformat() if tarea.iniciada else None,
+        'terminada': tarea.terminada.isoformat() if tarea.terminada else None,
+        'activa': tarea.activa,
+    }
+
+
+@login_required
+def tarea_list(request):
+    """Tareas en segundo plano recientes; staff puede encolar sincronizaciones y cierres"""
+    if request.method == 'POST':
+        if not is_admin_or_staff(request.user):
+            return render(request, 'error.html', {'mensaje': 'No tienes permisos para encolar tareas'})
+        tipo = request.POST.get('tipo')
+        parametros = {}
+        if tipo == 'sincronizar_directorio':
+            parametros['completo'] = request.POST.get('completo') == 'on'
+        elif tipo == 'cerrar_mes':
+            try:
+                parametros['mes'] = datetime.strptime(request.POST.get('mes', ''), '%Y-%m').date().isoformat()
+            except ValueError:
+                messages.error(request, 'Mes no válido (AAAA-MM)')
+                return redirect('tarea_list')
+        else:
+            messages.error(request, 'Tipo de tarea no válido')
+            return redirect('tarea_list')
+        tarea = tareas.encolar(tipo, parametros, usuario=request.user)
+        return redirect('tarea_detalle', tarea_id=tarea.pk)
+
+    paginator = Paginator(_tareas_visibles(request.user).select_related('usuario'), 25)
+    return render(request, 'tareas/list.html', {
+        'title': 'Tareas en segundo plano',
+        'page_obj': paginator.get_page(request.GET.get('page')),
+        'cola': tareas.profundidad(),
+        'es_staff': is_admin_or_staff(request.user),
+    })
+
+
+@login_required
+def tarea_detalle(request, tarea_id):
+    tarea = get_object_or_404(_tareas_visibles(request.user), pk=tarea_id)
+    return render(request, 'tareas/detalle.html', {
+        'title': f'Tarea {tarea.pk}: {tarea.tipo}',
+        'tarea': tarea,
+        'datos': _tarea_dict(tarea),
+    })
+
 
-    return redirect('tabla_incidencias', area_id=incidencia.area.pk)
+@login_required
+def tarea_estado(request, tarea_id):
+    """Estado y avance de una tarea (JSON); la página de la tarea lo consulta periódicamente"""
+    tarea = get_object_or_404(_tareas_visibles(request.user), pk=tarea_id)
+    return JsonResponse(_tarea_dict(tarea))
+
+
+@login_required
+@user_passes_test(is_admin_or_staff)
+def perfil_list(request):
+    """Perfiles guardados por ``perfilado`` (``?_perfilar=1`` en cualquier página)"""
+    return render(request, 'perfiles/list.html', {
+        'title': 'Perfiles de peticiones',
+        'perfiles': perfilado.listar(),
+        'parametro': settings.PERFILADO['PARAMETRO'],
+        'maximo': settings.PERFILADO['MAXIMO'],
+    })
+
+
+@login_required
+@user_passes_test(is_admin_or_staff)
+def perfil_detalle(request, perfil_id):
+    perfil = perfilado.obtener(perfil_id)
+    if perfil is None:
+        raise Http404('Perfil no encontrado')
+    if request.method == 'POST':
+        perfilado.borrar(perfil_id)
+        messages.success(request, f'Perfil {perfil_id} eliminado')
+        return redirect('perfil_list')
+    sql = perfilado.consultas(perfil_id)
+    return render(request, 'perfiles/detalle.html', {
+        'title': f"Perfil de {perfil['metodo']} {perfil['vista'] or perfil['ruta']}",
+        'perfil': perfil,
+        'resumen': perfilado.resumen(perfil_id),
+        'consultas': sorted(sql['consultas'], key=lambda c: c['ms'], reverse=True)[:200],
+        'omitidas': sql['omitidas'],
+    })
+
+
+@login_required
+@user_passes_test(is_admin_or_staff)
+def perfil_descargar(request, perfil_id, formato):
+    """Archivo del perfil: ``pstats`` (snakeviz, ``python -m pstats``), ``colapsado`` (flamegraph.pl, speedscope) o ``sql``"""
+    ruta = perfilado.ruta_archivo(perfil_id, formato)
+    if ruta is None:
+        raise Http404('Perfil no encontrado')
+    extension, tipo = perfilado.FORMATOS[formato]
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f"perfil-{perfil_id}.{extension}",
+                        content_type=tipo)
+
+
+def _areas_reporte(request):
+    """Áreas cuyos informes puede pedir el usuario: las que tiene a cargo; ``None`` (todas) para staff"""
+    if is_admin_or_staff(request.user):
+        return None
+    return [a['area_id'] for a in sesion.areas_responsable(request) if a['activo']]
+
+
+@login_required
+def reporte_list(request):
+    """
+    Informes mensuales imprimibles. Si el informe pedido ya está generado con
+    los datos actuales se descarga enseguida; si no, se encola su generación.
+    """
+    area_ids = _areas_reporte(request)
+    if request.method == 'POST':
+        form = ReporteMensualForm(request.POST, area_ids=area_ids)
+        if form.is_valid():
+            mes, area = form.cleaned_data['mes'], form.cleaned_data['area']
+            reporte = reportes.buscar(mes, area)
+            if reporte.listo:
+                return redirect('reporte_descargar', mes=f"{mes:%Y-%m}", nombre=reporte.archivos[0])
+            parametros = {'mes': mes.isoformat(), 'area_id': area.pk if area else None}
+            # Si ya se está generando el mismo informe, se sigue esa tarea
+            tarea = _tareas_visibles(request.user).filter(
+                tipo='reporte_mensual', estado__in=[Tarea.PENDIENTE, Tarea.EN_CURSO],
+                parametros__mes=parametros['mes'], parametros__area_id=parametros['area_id'],
+            ).first() or tareas.encolar('reporte_mensual', parametros, usuario=request.user, prioridad=1)
+            return redirect('tarea_detalle', tarea_id=tarea.pk)
+        mes = timezone.now().date().replace(day=1)
+    else:
+        try:
+            mes = datetime.strptime(request.GET.get('mes', ''), '%Y-%m').date()
+        except ValueError:
+            mes = timezone.now().date().replace(day=1)
+        form = ReporteMensualForm(initial={'mes': mes}, area_ids=area_ids)
+
+    nombres = [n for n in reportes.generados(mes)
+               if area_ids is None or reportes.area_archivo(n) in area_ids]
+    areas = Area.objects.in_bulk({reportes.area_archivo(n) for n in nombres} - {None})
+    generados = []
+    for nombre in nombres:
+        camino = os.path.join(reportes.directorio_mes(mes), nombre)
+        generados.append({
+            'nombre': nombre,
+            'area': areas.get(reportes.area_archivo(nombre)),
+            'formato': nombre.rsplit('.', 1)[1].upper(),
+            'tamano': os.path.getsize(camino),
+            'fecha': datetime.fromtimestamp(os.path.getmtime(camino), tz=timezone.get_current_timezone()),
+        })
+    return render(request, 'reportes/list.html', {
+        'title': 'Informes mensuales de asistencia',
+        'form': form,
+        'mes': mes,
+        'generados': generados,
+        'pdf': reportes.pdf_disponible(),
+    })
+
+
+@login_required
+def reporte_descargar(request, mes, nombre):
+    try:
+        inicio = datetime.strptime(mes, '%Y-%m').date()
+    except ValueError:
+        raise Http404('Mes no válido')
+    camino = reportes.ruta(inicio, nombre)
+    area_id = reportes.area_archivo(nombre)
+    area_ids = _areas_reporte(request)
+    if camino is None or (area_ids is not None and area_id not in area_ids):
+        raise Http404('Informe no encontrado')
+    extension = nombre.rsplit('.', 1)[1]
+    area = Area.objects.filter(pk=area_id).first() if area_id else None
+    descarga = f"asistencia-{mes}{f'-{area.cod_area}' if area else ''}.{extension}"
+    # HTML y PDF se abren en el navegador para imprimir; el ZIP se descarga
+    return FileResponse(open(camino, 'rb'), as_attachment=extension == 'zip', filename=descarga)
+
+
+def _ip_cliente(request):
+    """
+    IP del cliente. Si la petición llega de un proxy de ``METRICAS['PROXIES']``,
+    la última de ``X-Forwarded-For`` que no sea de otro proxy de confianza (las
+    anteriores las escribe el propio cliente); ``None`` si no hay ninguna.
+    """
+    ip = request.META.get('REMOTE_ADDR', '')
+    proxies = settings.METRICAS['PROXIES']
+    if ip not in proxies:
+        return ip
+    saltos = [s.strip() for s in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if s.strip()]
+    return next((s for s in reversed(saltos) if s not in proxies), None)
+
+
+def metrics(request):
+    """
+    Métricas en formato de Prometheus. Sin sesión: con ``METRICAS['TOKEN']`` se
+    exige ``Authorization: Bearer <token>``; sin token, una IP de ``METRICAS['IPS']``
+    (detrás de un proxy inverso hay que declararlo en ``METRICAS['PROXIES']``).
+    """
+    token = settings.METRICAS['TOKEN']
+    if token:
+        permitido = hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                        f'Bearer {token}'.encode())
+    else:
+        permitido = _ip_cliente(request) in settings.METRICAS['IPS']
+    if not permitido:
+        return HttpResponse(status=403)
+    return HttpResponse(metricas.exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')